@@ -6,28 +6,34 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jwt import PyJWTError
 import jwt
-from datetime import datetime, timedelta, UTC
+from typing import Optional
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.usuario import TokenData
 from app.core.enums import RolUsuario
-from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_URL
+from app.core.usuarios import UsuarioAutenticado, cache_usuarios
+from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM, TOKEN_URL
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=TOKEN_URL)
 
-def crear_token_acceso(data: dict, expires_delta: timedelta = None):
-    """Crear un nuevo token de acceso"""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(UTC) + expires_delta
-    else:
-        expire = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-    return encoded_jwt
+def _buscar_usuario(db: Session, username: str) -> Optional[UsuarioAutenticado]:
+    """Buscar el usuario del token en la base de datos"""
+    usuario = db.query(Usuario).filter(Usuario.username == username).first()
+    if usuario is None:
+        return None
+    return UsuarioAutenticado(
+        id=usuario.id,
+        username=usuario.username,
+        email=usuario.email,
+        nombre=usuario.nombre,
+        apellido=usuario.apellido,
+        rol=usuario.rol,
+        activo=usuario.activo,
+        fecha_creacion=usuario.fecha_creacion,
+    )
 
-def get_usuario_actual(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_usuario_actual(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
     """Obtener el usuario autenticado actual"""
     credenciales_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,9 +48,13 @@ def get_usuario_actual(db: Session = Depends(get_db), token: str = Depends(oauth
         token_data = TokenData(username=username, rol=payload.get("rol"))
     except PyJWTError:
         raise credenciales_exception
-    usuario = db.query(Usuario).filter(Usuario.username == token_data.username).first()
+    clave = (token_data.username, payload.get("iat"))
+    usuario = cache_usuarios.get(clave)
     if usuario is None:
-        raise credenciales_exception
+        usuario = await ejecutar_en_sesion(db, _buscar_usuario, token_data.username)
+        if usuario is None:
+            raise credenciales_exception
+        cache_usuarios.set(clave, usuario)
     if not usuario.activo:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
     return usuario
@@ -9,7 +9,7 @@ from pydantic import BaseModel
 
 from app.db.database import get_db
 from app.schemas.usuario import Token
-from app.services.auth_service import authenticate_user, create_access_token
+from app.services.auth_service import authenticate_user_async, create_access_token
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -38,7 +38,7 @@ async def login_for_access_token(
         logger.debug(f"Formulario recibido - username: {form_data.username}, password: {'*' * len(form_data.password) if form_data.password else 'vacío'}")
         
         # Autenticar usuario
-        user = authenticate_user(db, form_data.username, form_data.password)
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
         logger.debug(f"Usuario autenticado: {user.username}, rol: {user.rol}")
         
         # Crear token
@@ -69,7 +69,7 @@ async def login_json(
         logger.debug(f"Login JSON - username: {login_data.username}")
         
         # Autenticar usuario
-        user = authenticate_user(db, login_data.username, login_data.password)
+        user = await authenticate_user_async(db, login_data.username, login_data.password)
         logger.debug(f"Usuario autenticado: {user.username}, rol: {user.rol}")
         
         # Crear token
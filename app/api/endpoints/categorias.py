@@ -2,13 +2,13 @@
 Endpoints de gestión de categorías.
 """
 from typing import List
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.categoria import CategoriaCreate, CategoriaUpdate, CategoriaResponse
-from app.services import categoria_service
+from app.services import categoria_service, menu_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual, get_camarero_actual
 
 router = APIRouter(
@@ -17,7 +17,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=CategoriaResponse, status_code=status.HTTP_201_CREATED)
-def create_categoria(
+async def create_categoria(
     categoria: CategoriaCreate,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -25,32 +25,37 @@ def create_categoria(
     """
     Crear una nueva categoría. (Admin only)
     """
-    return categoria_service.create_categoria(db=db, categoria=categoria)
+    return await ejecutar_en_sesion(db, categoria_service.create_categoria, categoria=categoria, esquema=CategoriaResponse)
 
-@router.get("/", response_model=List[CategoriaResponse])
-def read_categorias(
+@router.get("/", response_model=List[CategoriaResponse], responses={304: {"description": "Sin cambios"}})
+async def read_categorias(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """
-    Obtener todas las categorías.
+    Obtener todas las categorías, desde el menú en memoria.
+    Admite If-None-Match: si el listado no ha cambiado se responde 304 sin cuerpo.
     """
-    categorias = categoria_service.get_categorias(db, skip=skip, limit=limit)
-    return categorias
+    cuerpo, etag = await ejecutar_en_sesion(db, menu_service.listar_categorias_json, skip=skip, limit=limit)
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
 
 @router.get("/{categoria_id}", response_model=CategoriaResponse)
-def read_categoria(
+async def read_categoria(
     categoria_id: int,
     db: Session = Depends(get_db)
 ):
     """
     Obtener una categoría específica por ID.
     """
-    return categoria_service.get_categoria_by_id(db, categoria_id=categoria_id)
+    return await ejecutar_en_sesion(db, categoria_service.get_categoria_by_id, categoria_id=categoria_id, esquema=CategoriaResponse)
 
 @router.put("/{categoria_id}", response_model=CategoriaResponse)
-def update_categoria(
+async def update_categoria(
     categoria_id: int,
     categoria: CategoriaUpdate,
     db: Session = Depends(get_db),
@@ -59,10 +64,12 @@ def update_categoria(
     """
     Actualizar una categoría. (Admin only)
     """
-    return categoria_service.update_categoria(db=db, categoria_id=categoria_id, categoria=categoria)
+    return await ejecutar_en_sesion(
+        db, categoria_service.update_categoria, categoria_id=categoria_id, categoria=categoria, esquema=CategoriaResponse
+    )
 
 @router.delete("/{categoria_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_categoria(
+async def delete_categoria(
     categoria_id: int,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -70,5 +77,5 @@ def delete_categoria(
     """
     Eliminar una categoría. (Admin only)
     """
-    categoria_service.delete_categoria(db=db, categoria_id=categoria_id)
+    await ejecutar_en_sesion(db, categoria_service.delete_categoria, categoria_id=categoria_id)
     return {} 
\ No newline at end of file
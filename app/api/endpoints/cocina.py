@@ -0,0 +1,32 @@
+"""
+Endpoints de la pantalla de cocina.
+"""
+from fastapi import APIRouter, Depends, Request, Response, status
+from sqlalchemy.orm import Session
+
+from app.db.database import get_db, ejecutar_en_sesion
+from app.models.usuario import Usuario
+from app.schemas.cocina import SnapshotCocina
+from app.services import cocina_service
+from app.api.dependencies.auth import get_cocinero_actual
+
+router = APIRouter(
+    prefix="/cocina",
+    tags=["cocina"]
+)
+
+@router.get("/snapshot", response_model=SnapshotCocina, responses={304: {"description": "Sin cambios"}})
+async def read_snapshot(
+    request: Request,
+    db: Session = Depends(get_db),
+    cocinero: Usuario = Depends(get_cocinero_actual)
+):
+    """
+    Obtener todos los pedidos activos (recibido, en preparación o listo) con sus líneas.
+    Admite If-None-Match: si la instantánea no ha cambiado se responde 304 sin cuerpo.
+    """
+    cuerpo, etag = await ejecutar_en_sesion(db, cocina_service.get_snapshot)
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
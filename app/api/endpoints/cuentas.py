@@ -1,16 +1,19 @@
 """
 Endpoints de gestión de cuentas.
 """
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import Iterator, List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion, abrir_sesion_independiente
 from app.models.usuario import Usuario
 from app.schemas.cuenta import CuentaCreate, CuentaUpdate, CuentaResponse
 from app.services import cuenta_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual, get_camarero_actual
+from app.core.paginacion import CABECERA_CURSOR
+from app.core.enums import FormatoExportacion
 
 router = APIRouter(
     prefix="/cuentas",
@@ -19,7 +22,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=CuentaResponse, status_code=status.HTTP_201_CREATED)
-def create_cuenta(
+async def create_cuenta(
     cuenta: CuentaCreate,
     db: Session = Depends(get_db),
     camarero: Usuario = Depends(get_camarero_actual)
@@ -27,16 +30,20 @@ def create_cuenta(
     """
     Crear una nueva cuenta. (Camareros/Administradores solo)
     """
-    return cuenta_service.create_cuenta(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        cuenta_service.create_cuenta,
         cuenta=cuenta, 
-        camarero_id=camarero.id
+        camarero_id=camarero.id,
+        esquema=CuentaResponse
     )
 
-@router.get("/", response_model=List[CuentaResponse])
-def read_cuentas(
+# El cuerpo se construye sin pasar por response_model: el esquema solo se declara en la documentación
+@router.get("/", response_model=None, responses={200: {"model": List[CuentaResponse], "description": "Página de cuentas"}})
+async def read_cuentas(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
     mesa_id: Optional[int] = None,
@@ -48,20 +55,26 @@ def read_cuentas(
     Obtener todas las cuentas con filtros opcionales.
     - Los camareros solo pueden ver sus propias cuentas
     - Los administradores pueden ver todas las cuentas o filtrar por camarero
+    - cursor: continuar tras la última fila de la página anterior (cabecera X-Next-Cursor); sustituye a skip
     """
-    return cuenta_service.get_cuentas(
-        db=db, 
+    # El cuerpo llega ya serializado: la lista de productos se copia tal como está guardada
+    cuerpo, cursor_siguiente = await ejecutar_en_sesion(
+        db,
+        cuenta_service.listar_cuentas_json,
         skip=skip, 
         limit=limit,
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
         mesa_id=mesa_id,
         camarero_id=camarero_id,
-        current_user=current_user
+        current_user=current_user,
+        cursor=cursor
     )
+    cabeceras = {CABECERA_CURSOR: cursor_siguiente} if cursor_siguiente is not None else None
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
 
 @router.get("/resumen", response_model=Dict[str, Any])
-def get_resumen_cuentas(
+async def get_resumen_cuentas(
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
     db: Session = Depends(get_db),
@@ -70,15 +83,65 @@ def get_resumen_cuentas(
     """
     Obtener resumen estadístico de cuentas e ingresos. (Solo Administradores)
     """
-    return cuenta_service.get_resumen_cuentas(
-        db=db,
+    return await ejecutar_en_sesion(
+        db,
+        cuenta_service.get_resumen_cuentas,
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
         current_user=admin
     )
 
+# Tipo de contenido y extensión de cada formato de exportación
+_TIPOS_EXPORTACION = {
+    FormatoExportacion.NDJSON: ("application/x-ndjson", "ndjson"),
+    FormatoExportacion.CSV: ("text/csv; charset=utf-8", "csv"),
+}
+
+def _cerrar_al_terminar(trozos: Iterator[str], sesion: Session) -> Iterator[str]:
+    """Recorrer la exportación y cerrar su sesión al terminar o si el cliente se desconecta"""
+    try:
+        yield from trozos
+    finally:
+        sesion.close()
+
+@router.get("/exportar")
+async def exportar_cuentas(
+    formato: FormatoExportacion = FormatoExportacion.NDJSON,
+    desglosar: bool = False,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    mesa_id: Optional[int] = None,
+    camarero_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_usuario_actual)
+):
+    """
+    Exportar el historial de cuentas en NDJSON o CSV, en streaming y por orden de cobro.
+    - Los camareros solo exportan sus propias cuentas
+    - desglosar: una línea por producto de cada cuenta en lugar de una por cuenta
+    - Sin paginación: la respuesta se genera por lotes mientras se lee, con memoria constante
+    """
+    # La sesión de la petición se cierra antes de enviar el cuerpo: la exportación usa una propia
+    sesion = abrir_sesion_independiente(db)
+    trozos = cuenta_service.exportar_cuentas(
+        sesion,
+        formato=formato,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        mesa_id=mesa_id,
+        camarero_id=camarero_id,
+        desglosar=desglosar,
+        current_user=current_user
+    )
+    tipo, extension = _TIPOS_EXPORTACION[formato]
+    return StreamingResponse(
+        _cerrar_al_terminar(trozos, sesion),
+        media_type=tipo,
+        headers={"Content-Disposition": f'attachment; filename="cuentas.{extension}"'}
+    )
+
 @router.get("/{cuenta_id}", response_model=CuentaResponse)
-def read_cuenta(
+async def read_cuenta(
     cuenta_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -88,14 +151,16 @@ def read_cuenta(
     - Los camareros solo pueden ver sus propias cuentas
     - Los administradores pueden ver cualquier cuenta
     """
-    return cuenta_service.get_cuenta_by_id(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        cuenta_service.get_cuenta_by_id,
         cuenta_id=cuenta_id, 
-        current_user=current_user
+        current_user=current_user,
+        esquema=CuentaResponse
     )
 
 @router.put("/{cuenta_id}", response_model=CuentaResponse)
-def update_cuenta(
+async def update_cuenta(
     cuenta_id: int,
     cuenta: CuentaUpdate,
     db: Session = Depends(get_db),
@@ -106,31 +171,37 @@ def update_cuenta(
     - Los camareros solo pueden actualizar sus propias cuentas
     - Los administradores pueden actualizar cualquier cuenta
     """
-    return cuenta_service.update_cuenta(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        cuenta_service.update_cuenta,
         cuenta_id=cuenta_id, 
         cuenta_update=cuenta, 
-        current_user=current_user
+        current_user=current_user,
+        esquema=CuentaResponse
     )
 
 @router.get("/generar/mesa/{mesa_id}", response_model=Dict[str, Any])
-def generar_cuenta_mesa(
+async def generar_cuenta_mesa(
     mesa_id: int,
+    agrupar: bool = False,
     db: Session = Depends(get_db),
     camarero: Usuario = Depends(get_camarero_actual)
 ):
     """
     Generar datos para una cuenta a partir de los pedidos de una mesa.
     No crea la cuenta en la base de datos, solo devuelve los datos calculados.
+    - agrupar: una línea por producto y precio en lugar de una por línea de pedido
     """
-    return cuenta_service.generar_cuenta_desde_pedidos(
-        db=db,
+    return await ejecutar_en_sesion(
+        db,
+        cuenta_service.generar_cuenta_desde_pedidos,
         mesa_id=mesa_id,
-        camarero_id=camarero.id
+        camarero_id=camarero.id,
+        agrupar=agrupar
     )
 
 @router.delete("/{cuenta_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_cuenta(
+async def delete_cuenta(
     cuenta_id: int,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -138,8 +209,9 @@ def delete_cuenta(
     """
     Eliminar una cuenta del sistema. Solo administradores pueden realizar esta acción.
     """
-    cuenta_service.delete_cuenta(
-        db=db,
+    await ejecutar_en_sesion(
+        db,
+        cuenta_service.delete_cuenta,
         cuenta_id=cuenta_id,
         current_user=admin
     )
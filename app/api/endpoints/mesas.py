@@ -5,14 +5,12 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, status, Query, HTTPException
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.mesa import MesaCreate, MesaUpdate, MesaResponse
-from app.services import mesa_service
+from app.services import mesa_service, reserva_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual, get_camarero_actual
 from app.core.enums import EstadoMesa, RolUsuario
-from app.models.reserva import Reserva
-from app.core.enums import EstadoReserva
 from app.schemas.reserva import ReservaResponse
 
 router = APIRouter(
@@ -22,7 +20,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=MesaResponse, status_code=status.HTTP_201_CREATED)
-def create_mesa(
+async def create_mesa(
     mesa: MesaCreate,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -30,10 +28,10 @@ def create_mesa(
     """
     Crear una nueva mesa. (Administradores)
     """
-    return mesa_service.create_mesa(db=db, mesa=mesa, current_user=admin)
+    return await ejecutar_en_sesion(db, mesa_service.create_mesa, mesa=mesa, current_user=admin, esquema=MesaResponse)
 
 @router.get("/", response_model=List[MesaResponse])
-def read_mesas(
+async def read_mesas(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     estado: Optional[EstadoMesa] = None,
@@ -43,16 +41,18 @@ def read_mesas(
     """
     Obtener todas las mesas con filtros opcionales.
     """
-    mesas = mesa_service.get_mesas(
-        db, 
+    mesas = await ejecutar_en_sesion(
+        db,
+        mesa_service.get_mesas,
         skip=skip, 
         limit=limit,
-        estado=estado
+        estado=estado,
+        esquema=List[MesaResponse]
     )
     return mesas
 
 @router.get("/{mesa_id}", response_model=MesaResponse)
-def read_mesa(
+async def read_mesa(
     mesa_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -69,7 +69,7 @@ def read_mesa(
             )
             
         # Obtener la mesa con manejo de errores mejorado
-        mesa = mesa_service.get_mesa_by_id(db=db, mesa_id=mesa_id)
+        mesa = await ejecutar_en_sesion(db, mesa_service.get_mesa_by_id, mesa_id=mesa_id, esquema=MesaResponse)
         return mesa
     except HTTPException as e:
         # Re-lanzar excepciones HTTP conocidas
@@ -84,7 +84,7 @@ def read_mesa(
         )
 
 @router.get("/{mesa_id}/reserva-activa", response_model=ReservaResponse)
-def get_reserva_activa(
+async def get_reserva_activa(
     mesa_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -92,15 +92,9 @@ def get_reserva_activa(
     """
     Obtener la reserva activa para una mesa específica.
     """
-    from datetime import datetime, timedelta, UTC
-    
-    # Buscar reservas pendientes o confirmadas para esta mesa
-    reservas = db.query(Reserva).filter(
-        Reserva.mesa_id == mesa_id,
-        Reserva.estado.in_([EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA]),
-        Reserva.fecha > datetime.now(UTC) - timedelta(hours=2),  # Incluir reservas de hasta 2 horas antes
-        Reserva.fecha < datetime.now(UTC) + timedelta(hours=2)   # Solo reservas recientes o próximas
-    ).order_by(Reserva.fecha).first()
+    reservas = await ejecutar_en_sesion(
+        db, reserva_service.get_reserva_activa_mesa, mesa_id=mesa_id, esquema=ReservaResponse
+    )
     
     if not reservas:
         raise HTTPException(status_code=404, detail="No hay reservas activas para esta mesa")
@@ -108,7 +102,7 @@ def get_reserva_activa(
     return reservas
 
 @router.put("/{mesa_id}", response_model=MesaResponse)
-def update_mesa(
+async def update_mesa(
     mesa_id: int,
     mesa: MesaUpdate,
     db: Session = Depends(get_db),
@@ -119,10 +113,12 @@ def update_mesa(
     - Camareros pueden cambiar el estado
     - Administradores pueden cambiar cualquier campo
     """
-    return mesa_service.update_mesa(db=db, mesa_id=mesa_id, mesa=mesa, current_user=current_user)
+    return await ejecutar_en_sesion(
+        db, mesa_service.update_mesa, mesa_id=mesa_id, mesa=mesa, current_user=current_user, esquema=MesaResponse
+    )
 
 @router.delete("/{mesa_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_mesa(
+async def delete_mesa(
     mesa_id: int,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -131,5 +127,5 @@ def delete_mesa(
     Eliminar una mesa. (Administradores)
     La mesa no debe tener pedidos activos ni reservas futuras.
     """
-    mesa_service.delete_mesa(db=db, mesa_id=mesa_id, current_user=admin)
+    await ejecutar_en_sesion(db, mesa_service.delete_mesa, mesa_id=mesa_id, current_user=admin)
     return None 
\ No newline at end of file
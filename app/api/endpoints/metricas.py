@@ -0,0 +1,21 @@
+"""
+Endpoint de métricas internas de la aplicación.
+"""
+from typing import Any, Dict
+from fastapi import APIRouter, Depends
+
+from app.core.metrics import obtener_metricas
+from app.models.usuario import Usuario
+from app.api.dependencies.auth import get_admin_actual
+
+router = APIRouter(
+    prefix="/metricas",
+    tags=["métricas"]
+)
+
+@router.get("/", response_model=Dict[str, Any])
+def read_metricas(admin: Usuario = Depends(get_admin_actual)):
+    """
+    Obtener una instantánea de las métricas internas. (Admin only)
+    """
+    return obtener_metricas()
@@ -2,11 +2,11 @@
 Endpoints de gestión de pedidos.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, status, Query, HTTPException
+from fastapi import APIRouter, Depends, status, Query, HTTPException, Response
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.pedido import (
     PedidoCreate, PedidoUpdate, PedidoResponse, PedidoDetallado,
@@ -15,6 +15,7 @@ from app.schemas.pedido import (
 from app.services import pedido_service
 from app.api.dependencies.auth import get_usuario_actual, get_camarero_actual, get_cocinero_actual
 from app.core.enums import EstadoPedido
+from app.core.paginacion import fijar_cursor_siguiente
 
 router = APIRouter(
     prefix="/pedidos",
@@ -23,7 +24,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=PedidoDetallado, status_code=status.HTTP_201_CREATED)
-def create_pedido(
+async def create_pedido(
     pedido: PedidoCreate,
     db: Session = Depends(get_db),
     camarero: Usuario = Depends(get_camarero_actual)
@@ -31,12 +32,16 @@ def create_pedido(
     """
     Crear un nuevo pedido con detalles. (Camareros/Administradores solo)
     """
-    return pedido_service.create_pedido(db=db, pedido=pedido, camarero_id=camarero.id)
+    return await ejecutar_en_sesion(
+        db, pedido_service.create_pedido, pedido=pedido, camarero_id=camarero.id, esquema=PedidoDetallado
+    )
 
 @router.get("/", response_model=List[PedidoResponse])
-def read_pedidos(
+async def read_pedidos(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     estado: Optional[EstadoPedido] = None,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
@@ -52,6 +57,7 @@ def read_pedidos(
     - Los administradores pueden ver todos los pedidos o filtrar por camarero
     - Los cocineros pueden ver todos los pedidos
     - Si activos=True, solo se muestran pedidos en estado distinto a ENTREGADO y CANCELADO
+    - cursor: continuar tras la última fila de la página anterior (cabecera X-Next-Cursor); sustituye a skip
     """
     if activos is True:
         estados_activos = [estado for estado in EstadoPedido if estado not in [EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO]]
@@ -60,8 +66,9 @@ def read_pedidos(
         elif estado is None:
             estado = None
     
-    pedidos = pedido_service.get_pedidos(
-        db, 
+    pedidos = await ejecutar_en_sesion(
+        db,
+        pedido_service.get_pedidos,
         skip=skip, 
         limit=limit,
         estado=estado,
@@ -69,8 +76,12 @@ def read_pedidos(
         fecha_fin=fecha_fin,
         mesa_id=mesa_id,
         camarero_id=camarero_id,
-        current_user=current_user
+        current_user=current_user,
+        cursor=cursor,
+        esquema=List[PedidoResponse]
     )
+    # El cursor se calcula sobre la página completa, antes del filtro de activos
+    fijar_cursor_siguiente(response, pedidos, pedido_service.CLAVE_PAGINACION, limit)
     
     if activos is True and estado is None:
         pedidos = [p for p in pedidos if p.estado not in [EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO]]
@@ -78,7 +89,7 @@ def read_pedidos(
     return pedidos
 
 @router.get("/{pedido_id}", response_model=PedidoDetallado)
-def read_pedido(
+async def read_pedido(
     pedido_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -90,7 +101,9 @@ def read_pedido(
     """
     try:
         # Llamada al servicio con manejo adecuado de errores
-        pedido = pedido_service.get_pedido_by_id(db, pedido_id=pedido_id, current_user=current_user)
+        pedido = await ejecutar_en_sesion(
+            db, pedido_service.get_pedido_by_id, pedido_id=pedido_id, current_user=current_user, esquema=PedidoDetallado
+        )
         return pedido
     except HTTPException as e:
         # Re-lanzar excepciones HTTP ya manejadas
@@ -105,7 +118,7 @@ def read_pedido(
         )
 
 @router.put("/{pedido_id}", response_model=PedidoResponse)
-def update_pedido(
+async def update_pedido(
     pedido_id: int,
     pedido: PedidoUpdate,
     db: Session = Depends(get_db),
@@ -117,15 +130,17 @@ def update_pedido(
     - Los cocineros solo pueden cambiar el estado a 'en_preparacion' o 'listo'
     - Los administradores pueden actualizar cualquier pedido
     """
-    return pedido_service.update_pedido(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        pedido_service.update_pedido,
         pedido_id=pedido_id, 
         pedido=pedido, 
-        current_user=current_user
+        current_user=current_user,
+        esquema=PedidoResponse
     )
 
 @router.post("/{pedido_id}/detalles/", response_model=DetallePedidoResponse, status_code=status.HTTP_201_CREATED)
-def create_detalle_pedido(
+async def create_detalle_pedido(
     pedido_id: int,
     detalle: DetallePedidoCreate,
     db: Session = Depends(get_db),
@@ -134,15 +149,17 @@ def create_detalle_pedido(
     """
     Añadir un nuevo elemento a un pedido existente. (Camareros/Administradores solo)
     """
-    return pedido_service.create_detalle_pedido(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        pedido_service.create_detalle_pedido,
         pedido_id=pedido_id, 
         detalle=detalle, 
-        current_user=camarero
+        current_user=camarero,
+        esquema=DetallePedidoResponse
     )
 
 @router.put("/{pedido_id}/detalles/{detalle_id}", response_model=DetallePedidoResponse)
-def update_detalle_pedido(
+async def update_detalle_pedido(
     pedido_id: int,
     detalle_id: int,
     detalle: DetallePedidoUpdate,
@@ -155,16 +172,18 @@ def update_detalle_pedido(
     - Los cocineros solo pueden cambiar el estado a 'en_preparacion' o 'listo'
     - Los administradores pueden actualizar cualquier detalle
     """
-    return pedido_service.update_detalle_pedido(
-        db=db, 
+    return await ejecutar_en_sesion(
+        db,
+        pedido_service.update_detalle_pedido,
         pedido_id=pedido_id, 
         detalle_id=detalle_id, 
         detalle=detalle, 
-        current_user=current_user
+        current_user=current_user,
+        esquema=DetallePedidoResponse
     )
 
 @router.delete("/{pedido_id}/detalles/{detalle_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_detalle_pedido(
+async def delete_detalle_pedido(
     pedido_id: int,
     detalle_id: int,
     db: Session = Depends(get_db),
@@ -173,8 +192,9 @@ def delete_detalle_pedido(
     """
     Eliminar un elemento de un pedido. (Camareros/Administradores solo)
     """
-    pedido_service.delete_detalle_pedido(
-        db=db, 
+    await ejecutar_en_sesion(
+        db,
+        pedido_service.delete_detalle_pedido,
         pedido_id=pedido_id, 
         detalle_id=detalle_id, 
         current_user=camarero
@@ -182,7 +202,7 @@ def delete_detalle_pedido(
     return {}
 
 @router.delete("/{pedido_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_pedido(
+async def delete_pedido(
     pedido_id: int,
     db: Session = Depends(get_db),
     camarero: Usuario = Depends(get_camarero_actual)
@@ -191,8 +211,9 @@ def delete_pedido(
     Eliminar un pedido completo. (Camareros/Administradores solo)
     Solo se pueden eliminar pedidos que no estén en estado ENTREGADO.
     """
-    pedido_service.delete_pedido(
-        db=db, 
+    await ejecutar_en_sesion(
+        db,
+        pedido_service.delete_pedido,
         pedido_id=pedido_id, 
         current_user=camarero
     )
@@ -2,15 +2,16 @@
 Endpoints de gestión de productos.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, status, Query
+from fastapi import APIRouter, Depends, status, Query, Request, Response
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.producto import ProductoCreate, ProductoUpdate, ProductoResponse, ProductoDetallado
-from app.services import producto_service
+from app.services import producto_service, menu_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual, get_camarero_actual
 from app.core.enums import TipoProducto
+from app.core.paginacion import CABECERA_CURSOR
 
 router = APIRouter(
     prefix="/productos",
@@ -18,7 +19,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=ProductoResponse, status_code=status.HTTP_201_CREATED)
-def create_producto(
+async def create_producto(
     producto: ProductoCreate,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -26,42 +27,53 @@ def create_producto(
     """
     Crear un nuevo producto. (Admin only)
     """
-    return producto_service.create_producto(db=db, producto=producto)
+    return await ejecutar_en_sesion(db, producto_service.create_producto, producto=producto, esquema=ProductoResponse)
 
-@router.get("/", response_model=List[ProductoResponse])
-def read_productos(
+@router.get("/", response_model=List[ProductoResponse], responses={304: {"description": "Sin cambios"}})
+async def read_productos(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     categoria_id: Optional[int] = None,
     tipo: Optional[TipoProducto] = None,
     disponible: Optional[bool] = None,
     db: Session = Depends(get_db)
 ):
     """
-    Obtener todos los productos con filtros opcionales.
+    Obtener todos los productos con filtros opcionales, desde el menú en memoria.
+    - cursor: continuar tras la última fila de la página anterior (cabecera X-Next-Cursor); sustituye a skip
+    Admite If-None-Match: si el listado no ha cambiado se responde 304 sin cuerpo.
     """
-    productos = producto_service.get_productos(
-        db, 
+    cuerpo, etag, siguiente = await ejecutar_en_sesion(
+        db,
+        menu_service.listar_productos_json,
         skip=skip, 
         limit=limit,
         categoria_id=categoria_id,
         tipo=tipo,
-        disponible=disponible
+        disponible=disponible,
+        cursor=cursor
     )
-    return productos
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if siguiente is not None:
+        cabeceras[CABECERA_CURSOR] = siguiente
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
 
 @router.get("/{producto_id}", response_model=ProductoDetallado)
-def read_producto(
+async def read_producto(
     producto_id: int,
     db: Session = Depends(get_db)
 ):
     """
     Obtener un producto específico por ID incluyendo su categoría.
     """
-    return producto_service.get_producto_by_id(db, producto_id=producto_id)
+    return await ejecutar_en_sesion(db, producto_service.get_producto_by_id, producto_id=producto_id, esquema=ProductoDetallado)
 
 @router.put("/{producto_id}", response_model=ProductoResponse)
-def update_producto(
+async def update_producto(
     producto_id: int,
     producto: ProductoUpdate,
     db: Session = Depends(get_db),
@@ -70,10 +82,12 @@ def update_producto(
     """
     Actualizar un producto. (Admin only)
     """
-    return producto_service.update_producto(db=db, producto_id=producto_id, producto=producto)
+    return await ejecutar_en_sesion(
+        db, producto_service.update_producto, producto_id=producto_id, producto=producto, esquema=ProductoResponse
+    )
 
 @router.delete("/{producto_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_producto(
+async def delete_producto(
     producto_id: int,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -81,5 +95,5 @@ def delete_producto(
     """
     Eliminar un producto. (Admin only)
     """
-    producto_service.delete_producto(db=db, producto_id=producto_id)
+    await ejecutar_en_sesion(db, producto_service.delete_producto, producto_id=producto_id)
     return {} 
\ No newline at end of file
@@ -2,16 +2,17 @@
 Endpoints de gestión de reservas.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, status, Response
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.reserva import ReservaCreate, ReservaUpdate, ReservaResponse, ReservaDetallada
 from app.services import reserva_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual, get_camarero_actual
 from app.core.enums import EstadoReserva
+from app.core.paginacion import fijar_cursor_siguiente
 
 router = APIRouter(
     prefix="/reservas",
@@ -20,7 +21,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=ReservaResponse, status_code=status.HTTP_201_CREATED)
-def create_reserva(
+async def create_reserva(
     reserva: ReservaCreate,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -28,12 +29,14 @@ def create_reserva(
     """
     Crear una nueva reserva.
     """
-    return reserva_service.create_reserva(db=db, reserva=reserva)
+    return await ejecutar_en_sesion(db, reserva_service.create_reserva, reserva=reserva, esquema=ReservaResponse)
 
 @router.get("/", response_model=List[ReservaResponse])
-def read_reservas(
+async def read_reservas(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     estado: Optional[EstadoReserva] = None,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
@@ -43,19 +46,25 @@ def read_reservas(
 ):
     """
     Obtener todas las reservas con filtros opcionales.
+    - cursor: continuar tras la última fila de la página anterior (cabecera X-Next-Cursor); sustituye a skip
     """
-    return reserva_service.get_reservas(
-        db, 
+    reservas = await ejecutar_en_sesion(
+        db,
+        reserva_service.get_reservas,
         skip=skip, 
         limit=limit,
         estado=estado,
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
-        mesa_id=mesa_id
+        mesa_id=mesa_id,
+        cursor=cursor,
+        esquema=List[ReservaResponse]
     )
+    fijar_cursor_siguiente(response, reservas, reserva_service.CLAVE_PAGINACION, limit)
+    return reservas
 
 @router.get("/{reserva_id}", response_model=ReservaDetallada)
-def read_reserva(
+async def read_reserva(
     reserva_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -63,10 +72,10 @@ def read_reserva(
     """
     Obtener una reserva específica por ID.
     """
-    return reserva_service.get_reserva_by_id(db, reserva_id=reserva_id)
+    return await ejecutar_en_sesion(db, reserva_service.get_reserva_by_id, reserva_id=reserva_id, esquema=ReservaDetallada)
 
 @router.put("/{reserva_id}", response_model=ReservaResponse)
-def update_reserva(
+async def update_reserva(
     reserva_id: int,
     reserva: ReservaUpdate,
     db: Session = Depends(get_db),
@@ -75,10 +84,12 @@ def update_reserva(
     """
     Actualizar una reserva.
     """
-    return reserva_service.update_reserva(db=db, reserva_id=reserva_id, reserva=reserva)
+    return await ejecutar_en_sesion(
+        db, reserva_service.update_reserva, reserva_id=reserva_id, reserva=reserva, esquema=ReservaResponse
+    )
 
 @router.delete("/{reserva_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_reserva(
+async def delete_reserva(
     reserva_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_camarero_actual)
@@ -86,5 +97,5 @@ def delete_reserva(
     """
     Eliminar una reserva. (Camareros y administradores)
     """
-    reserva_service.delete_reserva(db=db, reserva_id=reserva_id)
+    await ejecutar_en_sesion(db, reserva_service.delete_reserva, reserva_id=reserva_id)
     return {} 
\ No newline at end of file
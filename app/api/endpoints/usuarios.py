@@ -1,16 +1,18 @@
 """
 Endpoints de gestión de usuarios.
 """
-from typing import List
-from fastapi import APIRouter, Depends, status, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, status, HTTPException, Response
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.db.database import get_db, ejecutar_en_sesion
 from app.models.usuario import Usuario
 from app.schemas.usuario import UsuarioCreate, UsuarioUpdate, UsuarioResponse
 from app.services import usuario_service
 from app.api.dependencies.auth import get_usuario_actual, get_admin_actual
 from app.core.enums import RolUsuario
+from app.core.security import get_password_hash_async
+from app.core.paginacion import fijar_cursor_siguiente
 
 router = APIRouter(
     prefix="/usuarios",
@@ -19,7 +21,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=UsuarioResponse, status_code=status.HTTP_201_CREATED)
-def create_usuario(
+async def create_usuario(
     usuario: UsuarioCreate,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -27,19 +29,29 @@ def create_usuario(
     """
     Crear un nuevo usuario. (Admin only)
     """
-    return usuario_service.create_usuario(db=db, usuario=usuario)
+    # bcrypt se calcula en su propio pool para no bloquear el bucle de eventos
+    hashed_password = await get_password_hash_async(usuario.password)
+    return await ejecutar_en_sesion(
+        db, usuario_service.create_usuario, usuario=usuario, hashed_password=hashed_password, esquema=UsuarioResponse
+    )
 
 @router.get("/", response_model=List[UsuarioResponse])
-def read_usuarios(
+async def read_usuarios(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
 ):
     """
     Obtener todos los usuarios. (Admin only)
+    - cursor: continuar tras la última fila de la página anterior (cabecera X-Next-Cursor); sustituye a skip
     """
-    usuarios = usuario_service.get_usuarios(db, skip=skip, limit=limit)
+    usuarios = await ejecutar_en_sesion(
+        db, usuario_service.get_usuarios, skip=skip, limit=limit, cursor=cursor, esquema=List[UsuarioResponse]
+    )
+    fijar_cursor_siguiente(response, usuarios, usuario_service.CLAVE_PAGINACION, limit)
     return usuarios
 
 @router.get("/me", response_model=UsuarioResponse)
@@ -50,7 +62,7 @@ def read_user_me(current_user: Usuario = Depends(get_usuario_actual)):
     return current_user
 
 @router.get("/{usuario_id}", response_model=UsuarioResponse)
-def read_usuario(
+async def read_usuario(
     usuario_id: int,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_usuario_actual)
@@ -64,14 +76,14 @@ def read_usuario(
     if current_user.id != usuario_id and current_user.rol != RolUsuario.ADMIN:
         return get_admin_actual(current_user)
     
-    usuario = usuario_service.get_usuario_by_id(db, usuario_id=usuario_id)
+    usuario = await ejecutar_en_sesion(db, usuario_service.get_usuario_by_id, usuario_id=usuario_id, esquema=UsuarioResponse)
     if usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
     return usuario
 
 @router.put("/{usuario_id}", response_model=UsuarioResponse)
-def update_usuario(
+async def update_usuario(
     usuario_id: int,
     usuario: UsuarioUpdate,
     db: Session = Depends(get_db),
@@ -83,16 +95,22 @@ def update_usuario(
     - Los administradores pueden actualizar la información de cualquier usuario
     """
     is_admin = current_user.rol == RolUsuario.ADMIN
-    return usuario_service.update_usuario(
-        db=db, 
+    hashed_password = None
+    if usuario.password is not None:
+        hashed_password = await get_password_hash_async(usuario.password)
+    return await ejecutar_en_sesion(
+        db,
+        usuario_service.update_usuario,
         usuario_id=usuario_id, 
         usuario=usuario, 
         current_user_id=current_user.id, 
-        is_admin=is_admin
+        is_admin=is_admin,
+        hashed_password=hashed_password,
+        esquema=UsuarioResponse
     )
 
 @router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
-def delete_usuario(
+async def delete_usuario(
     usuario_id: int,
     db: Session = Depends(get_db),
     admin: Usuario = Depends(get_admin_actual)
@@ -100,5 +118,5 @@ def delete_usuario(
     """
     Eliminar un usuario. (Admin only)
     """
-    usuario_service.delete_usuario(db=db, usuario_id=usuario_id)
+    await ejecutar_en_sesion(db, usuario_service.delete_usuario, usuario_id=usuario_id)
     return {}  # Devolver un diccionario vacío en lugar de None para evitar errores de validación 
\ No newline at end of file
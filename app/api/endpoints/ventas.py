@@ -0,0 +1,72 @@
+"""
+Endpoints de informes de ventas.
+Leen solo los agregados de ingresos por hora y por día, nunca la tabla de cuentas.
+"""
+from typing import List, Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.db.database import get_db, ejecutar_en_sesion
+from app.models.usuario import Usuario
+from app.schemas.venta import IngresoAgregadoResponse, TotalVentasResponse
+from app.services import venta_service
+from app.core.enums import DimensionVentas, GranularidadVentas
+from app.api.dependencies.auth import get_admin_actual
+
+router = APIRouter(
+    prefix="/ventas",
+    tags=["ventas"]
+)
+
+@router.get("/{dimension}", response_model=List[IngresoAgregadoResponse])
+async def read_ingresos(
+    dimension: DimensionVentas,
+    granularidad: GranularidadVentas = GranularidadVentas.DIA,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    clave: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    admin: Usuario = Depends(get_admin_actual)
+):
+    """
+    Obtener los ingresos por hora o por día de cada camarero, mesa, producto o método de pago. (Solo Administradores)
+    - clave: id del camarero o del producto, número de mesa o método de pago
+    - Por defecto, los últimos 30 días
+    """
+    return await ejecutar_en_sesion(
+        db,
+        venta_service.get_ingresos,
+        dimension=dimension,
+        granularidad=granularidad,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        clave=clave,
+        skip=skip,
+        limit=limit,
+        current_user=admin,
+        esquema=List[IngresoAgregadoResponse]
+    )
+
+@router.get("/{dimension}/totales", response_model=List[TotalVentasResponse])
+async def read_totales(
+    dimension: DimensionVentas,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    admin: Usuario = Depends(get_admin_actual)
+):
+    """
+    Obtener los ingresos acumulados en el periodo de cada camarero, mesa, producto o método de pago,
+    ordenados de mayor a menor. (Solo Administradores)
+    """
+    return await ejecutar_en_sesion(
+        db,
+        venta_service.get_totales,
+        dimension=dimension,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        current_user=admin
+    )
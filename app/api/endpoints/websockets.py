@@ -1,12 +1,14 @@
 """
 WebSocket endpoints.
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, status
-from app.core.websockets import manager
+from typing import Iterable, List, Optional
+from fastapi import APIRouter, WebSocket, Depends, Query, status
+from app.core.websockets import codificacion_disponible, crear_canales, manager
 from app.api.dependencies.auth import get_usuario_actual
 from app.models.usuario import Usuario
-from app.core.enums import RolUsuario
+from app.core.enums import CodificacionWebSocket, RolUsuario, TipoProducto
 from fastapi.responses import JSONResponse
+from starlette.websockets import WebSocketState
 import jwt
 from app.core.config import JWT_SECRET_KEY, JWT_ALGORITHM
 
@@ -14,7 +16,10 @@ router = APIRouter(tags=["websockets"])
 
 # Función auxiliar para verificar token WebSocket
 async def verificar_token_websocket(token: str, roles_permitidos: list):
-    """Verificar token y rol para conexiones WebSocket"""
+    """
+    Verificar token y rol para conexiones WebSocket.
+    Devuelve (True, nombre de usuario) o (False, motivo del rechazo).
+    """
     try:
         # Decodificar token
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
@@ -24,63 +29,113 @@ async def verificar_token_websocket(token: str, roles_permitidos: list):
         if not username or rol not in roles_permitidos:
             return False, "No autorizado"
             
-        return True, rol
+        return True, username
     except Exception as e:
         return False, str(e)
 
+async def atender_conexion(
+    websocket: WebSocket,
+    client_type: str,
+    since: Optional[int] = None,
+    canales: Iterable[str] = (),
+    usuario: Optional[str] = None,
+    codificacion: CodificacionWebSocket = CodificacionWebSocket.JSON,
+    epoca: Optional[str] = None
+):
+    """
+    Registrar la conexión y atender sus mensajes hasta que el cliente se desconecte o el gestor
+    la expulse; en ambos casos se quita del gestor y se detiene su tarea escritora.
+    - since, epoca: último seq recibido y su época; al reconectar al mismo proceso se reenvían los
+      eventos perdidos y, si no, se pide resincronizar
+    - canales: filtros de suscripción; sin filtros se reciben todos los eventos del grupo
+    - usuario: usuario autenticado, para limitar sus conexiones simultáneas
+    - codificacion: "json" (tramas de texto) o "msgpack" (tramas binarias MessagePack)
+    Los mensajes del cliente, de texto o binarios (p. ej. la respuesta al ping), solo cuentan como
+    actividad: no se responden.
+    """
+    if not codificacion_disponible(codificacion):
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="MessagePack no está disponible")
+        return
+    await manager.connect(
+        websocket, client_type, since=since, canales=canales, usuario=usuario, codificacion=codificacion,
+        epoca=epoca
+    )
+    try:
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+            manager.registrar_actividad(websocket, client_type)
+    except RuntimeError:
+        # El gestor cerró el socket mientras se atendía un mensaje (cliente expulsado)
+        if websocket.application_state != WebSocketState.DISCONNECTED:
+            raise
+    finally:
+        manager.disconnect(websocket, client_type)
+
 @router.websocket("/ws/cocina")
-async def websocket_cocina(websocket: WebSocket, token: str = Query(...)):
-    """Conexión WebSocket para el personal de la cocina (Cocineros y Administradores)"""
+async def websocket_cocina(
+    websocket: WebSocket,
+    token: str = Query(...),
+    since: Optional[int] = Query(None, ge=0),
+    epoca: Optional[str] = Query(None),
+    codificacion: CodificacionWebSocket = Query(CodificacionWebSocket.JSON),
+    tipos: List[TipoProducto] = Query([])
+):
+    """
+    Conexión WebSocket para el personal de la cocina (Cocineros y Administradores)
+    - tipos: tipos de producto del puesto (?tipos=bebida para la barra); solo recibe los pedidos que los incluyen
+    """
     # Verificar token antes de conectar
-    autorizado, mensaje = await verificar_token_websocket(token, [RolUsuario.COCINERO, RolUsuario.ADMIN])
+    autorizado, usuario = await verificar_token_websocket(token, [RolUsuario.COCINERO, RolUsuario.ADMIN])
     
     if not autorizado:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=mensaje)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=usuario)
         return
         
-    await manager.connect(websocket, "cocina")
-    try:
-        while True:
-            # Esperar mensajes del cliente
-            data = await websocket.receive_text()
-            await manager.send_personal_message(f"Mensaje recibido: {data}", websocket)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "cocina")
+    await atender_conexion(websocket, "cocina", since, crear_canales(tipos=tipos), usuario, codificacion, epoca)
 
 @router.websocket("/ws/camareros")
-async def websocket_camareros(websocket: WebSocket, token: str = Query(...)):
-    """Conexión WebSocket para los camareros (Camareros y Administradores)"""
+async def websocket_camareros(
+    websocket: WebSocket,
+    token: str = Query(...),
+    since: Optional[int] = Query(None, ge=0),
+    epoca: Optional[str] = Query(None),
+    codificacion: CodificacionWebSocket = Query(CodificacionWebSocket.JSON),
+    mesas: List[int] = Query([]),
+    camarero_id: Optional[int] = Query(None)
+):
+    """
+    Conexión WebSocket para los camareros (Camareros y Administradores)
+    - mesas: números de las mesas que atiende (?mesas=3&mesas=7); solo recibe sus eventos
+    - camarero_id: recibe los eventos de los pedidos de ese camarero
+    """
     # Verificar token antes de conectar
-    autorizado, mensaje = await verificar_token_websocket(token, [RolUsuario.CAMARERO, RolUsuario.ADMIN])
+    autorizado, usuario = await verificar_token_websocket(token, [RolUsuario.CAMARERO, RolUsuario.ADMIN])
     
     if not autorizado:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=mensaje)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=usuario)
         return
         
-    await manager.connect(websocket, "camareros")
-    try:
-        while True:
-            # Esperar mensajes del cliente
-            data = await websocket.receive_text()
-            await manager.send_personal_message(f"Mensaje recibido: {data}", websocket)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "camareros")
+    await atender_conexion(
+        websocket, "camareros", since, crear_canales(mesas=mesas, camareros=(camarero_id,)), usuario, codificacion,
+        epoca
+    )
 
 @router.websocket("/ws/admin")
-async def websocket_admin(websocket: WebSocket, token: str = Query(...)):
+async def websocket_admin(
+    websocket: WebSocket,
+    token: str = Query(...),
+    since: Optional[int] = Query(None, ge=0),
+    epoca: Optional[str] = Query(None),
+    codificacion: CodificacionWebSocket = Query(CodificacionWebSocket.JSON)
+):
     """Conexión WebSocket para los administradores"""
     # Verificar token antes de conectar
-    autorizado, mensaje = await verificar_token_websocket(token, [RolUsuario.ADMIN])
+    autorizado, usuario = await verificar_token_websocket(token, [RolUsuario.ADMIN])
     
     if not autorizado:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=mensaje)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=usuario)
         return
         
-    await manager.connect(websocket, "admin")
-    try:
-        while True:
-            # Esperar mensajes del cliente
-            data = await websocket.receive_text()
-            await manager.send_personal_message(f"Mensaje recibido: {data}", websocket)
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "admin") 
\ No newline at end of file
+    await atender_conexion(websocket, "admin", since, usuario=usuario, codificacion=codificacion, epoca=epoca) 
\ No newline at end of file
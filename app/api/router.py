@@ -2,7 +2,7 @@
 Router principal de la API.
 """
 from fastapi import APIRouter
-from app.api.endpoints import auth, usuarios, categorias, productos, mesas, pedidos, reservas, cuentas, websockets
+from app.api.endpoints import auth, usuarios, categorias, productos, mesas, pedidos, reservas, cuentas, websockets, metricas, cocina, ventas
 
 api_router = APIRouter()
 
@@ -15,4 +15,7 @@ api_router.include_router(mesas.router)
 api_router.include_router(pedidos.router)
 api_router.include_router(reservas.router)
 api_router.include_router(cuentas.router)
-api_router.include_router(websockets.router) 
\ No newline at end of file
+api_router.include_router(websockets.router) 
+api_router.include_router(metricas.router)
+api_router.include_router(cocina.router)
+api_router.include_router(ventas.router)
@@ -0,0 +1,167 @@
+"""
+Backplane de eventos WebSocket entre procesos.
+
+Con varios workers (uvicorn --workers N), cada proceso tiene su propio ConnectionManager y solo
+conoce sus conexiones. El backplane reenvía cada evento difundido en un proceso a los demás, que lo
+entregan a sus clientes sin volver a publicarlo.
+
+- BackplaneUnixSocket: implementación local sin servicios externos. Cada proceso escucha en un
+  socket Unix de datagramas dentro de un directorio compartido y publica enviando un datagrama a
+  los sockets del resto de procesos.
+- Un broker externo (p. ej. Redis pub/sub) solo tiene que implementar la interfaz Backplane:
+  publicar en un canal y, al recibir, llamar a la función de entrega.
+"""
+import asyncio
+import errno
+import json
+import logging
+import os
+import socket
+import stat
+from typing import Callable, Iterable, Optional, Sequence
+
+from app.core import metrics
+
+logger = logging.getLogger("restaurante")
+
+# Función de entrega local: (trama, grupos, clave de coalescencia, canales de suscripción)
+Entrega = Callable[[str, Sequence[str], Optional[str], Sequence[str]], None]
+
+# Tamaño máximo de un evento publicado por datagrama
+TAMANO_MAXIMO_DATAGRAMA = 64 * 1024
+
+class Backplane:
+    """
+    Interfaz de un backplane de eventos.
+    - iniciar: empezar a recibir los eventos de otros procesos y entregarlos con `entregar`
+    - publicar: enviar un evento ya codificado al resto de procesos, sin bloquear el bucle de eventos;
+      el proceso que publica no lo recibe de vuelta (ya lo ha entregado a sus clientes)
+    - detener: dejar de recibir y liberar los recursos
+    """
+
+    async def iniciar(self, entregar: Entrega):
+        raise NotImplementedError
+
+    def publicar(self, trama: str, grupos: Sequence[str], clave: Optional[str] = None, canales: Iterable[str] = ()):
+        raise NotImplementedError
+
+    async def detener(self):
+        raise NotImplementedError
+
+def codificar_datagrama(trama: str, grupos: Sequence[str], clave: Optional[str], canales: Iterable[str] = ()) -> bytes:
+    """Cabecera JSON con los grupos, la clave y los canales en la primera línea, seguida de la trama tal cual"""
+    return f"{json.dumps([list(grupos), clave, sorted(canales)])}\n{trama}".encode("utf-8")
+
+def decodificar_datagrama(datos: bytes):
+    cabecera, trama = datos.decode("utf-8").split("\n", 1)
+    grupos, clave, canales = json.loads(cabecera)
+    return trama, grupos, clave, canales
+
+class BackplaneUnixSocket(Backplane):
+    """
+    Backplane entre procesos de la misma máquina mediante sockets Unix de datagramas.
+    Los procesos se descubren listando el directorio compartido; los sockets de procesos que ya
+    no existen se eliminan al fallar el envío.
+    Cualquiera que pueda escribir en el directorio puede inyectar eventos o suplantar a un worker,
+    así que se crea con permisos 0700 y se rechaza uno existente que no sea un directorio del usuario
+    del proceso o en el que puedan escribir el grupo u otros usuarios.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self.ruta: Optional[str] = None
+        self._socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._entregar: Optional[Entrega] = None
+
+    async def iniciar(self, entregar: Entrega):
+        comprobar_directorio(self.directorio)
+        self.ruta = os.path.join(self.directorio, f"{os.getpid()}.sock")
+        if os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.ruta)
+        self._entregar = entregar
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._socket.fileno(), self._recibir)
+        logger.info(f"Backplane WebSocket escuchando en {self.ruta}")
+
+    def _pares(self):
+        """Rutas de los sockets del resto de procesos"""
+        with os.scandir(self.directorio) as entradas:
+            return [
+                entrada.path for entrada in entradas
+                if entrada.name.endswith(".sock") and entrada.path != self.ruta
+            ]
+
+    def publicar(self, trama: str, grupos: Sequence[str], clave: Optional[str] = None, canales: Iterable[str] = ()):
+        datos = codificar_datagrama(trama, grupos, clave, canales)
+        if len(datos) > TAMANO_MAXIMO_DATAGRAMA:
+            logger.warning(f"Evento de {len(datos)} bytes demasiado grande para el backplane; no se publica")
+            metrics.contador("backplane_eventos_descartados").incrementar()
+            return
+        for ruta in self._pares():
+            try:
+                self._socket.sendto(datos, ruta)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # El proceso que escuchaba en ese socket ya no existe
+                try:
+                    os.unlink(ruta)
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                # Cola de recepción del otro proceso llena: se descarta antes que bloquear el bucle
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    raise
+                metrics.contador("backplane_eventos_descartados").incrementar()
+        metrics.contador("backplane_eventos_publicados").incrementar()
+
+    def _recibir(self):
+        """Leer todos los datagramas disponibles y entregarlos a las conexiones de este proceso"""
+        while True:
+            try:
+                datos = self._socket.recv(TAMANO_MAXIMO_DATAGRAMA)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                trama, grupos, clave, canales = decodificar_datagrama(datos)
+            except (ValueError, UnicodeDecodeError):
+                logger.warning("Datagrama del backplane no válido; se ignora")
+                continue
+            metrics.contador("backplane_eventos_recibidos").incrementar()
+            self._entregar(trama, grupos, clave, canales)
+
+    async def detener(self):
+        if self._socket is None:
+            return
+        self._loop.remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self.ruta)
+        except FileNotFoundError:
+            pass
+
+def comprobar_directorio(directorio: str):
+    """Crear el directorio de los sockets solo para el usuario del proceso, o comprobar que lo es si ya existe"""
+    try:
+        os.makedirs(directorio, 0o700)
+    except FileExistsError:
+        pass
+    # lstat: un enlace simbólico puede apuntar a un directorio de otro usuario
+    estado = os.lstat(directorio)
+    if not stat.S_ISDIR(estado.st_mode):
+        raise PermissionError(f"{directorio} no es un directorio")
+    if estado.st_uid != os.getuid():
+        raise PermissionError(f"El directorio del backplane {directorio} pertenece a otro usuario")
+    if estado.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"El directorio del backplane {directorio} es modificable por otros usuarios")
+
+def crear_backplane(tipo: str, directorio: str) -> Optional[Backplane]:
+    """Crear el backplane configurado ("unix"), o None si no se usa (un solo proceso)"""
+    if not tipo:
+        return None
+    if tipo == "unix":
+        return BackplaneUnixSocket(directorio)
+    raise ValueError(f"Backplane WebSocket desconocido: {tipo}")
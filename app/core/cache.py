@@ -0,0 +1,60 @@
+"""
+Cachés en memoria del proceso.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from app.core import metrics
+
+class TTLCache:
+    """
+    Caché LRU con caducidad por entrada, segura entre hilos.
+    Los aciertos y fallos se publican en las métricas como <nombre>_aciertos y <nombre>_fallos.
+    """
+
+    def __init__(self, nombre: str, max_entradas: int = 1024, ttl_segundos: float = 60.0):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = metrics.contador(f"{nombre}_aciertos")
+        self._fallos = metrics.contador(f"{nombre}_fallos")
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        """Devuelve el valor cacheado o None si no existe o ha caducado"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                valor, caduca = entrada
+                if caduca > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    self._aciertos.incrementar()
+                    return valor
+                del self._datos[clave]
+        self._fallos.incrementar()
+        return None
+
+    def set(self, clave: Hashable, valor: Any):
+        """Guarda un valor, expulsando la entrada menos usada si se supera el tamaño máximo"""
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, predicado: Callable[[Hashable], bool]):
+        """Elimina las entradas cuya clave cumple el predicado"""
+        with self._lock:
+            for clave in [clave for clave in self._datos if predicado(clave)]:
+                del self._datos[clave]
+
+    def limpiar(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
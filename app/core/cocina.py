@@ -0,0 +1,100 @@
+"""
+Índice en memoria de los pedidos activos para la pantalla de cocina.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.enums import EstadoPedido
+from app.schemas.cocina import PedidoCocina
+
+ESTADOS_ACTIVOS = (EstadoPedido.RECIBIDO, EstadoPedido.EN_PREPARACION, EstadoPedido.LISTO)
+
+class IndiceCocina:
+    """
+    Mantiene los pedidos activos ya serializados, indexados por ID.
+    Se actualiza de forma incremental en los mismos puntos de mutación que notifican por WebSocket,
+    de modo que la instantánea se sirve sin consultar la base de datos. Cada cambio incrementa la
+    versión; el cuerpo JSON y su ETag se calculan una sola vez por versión.
+    El índice es propio de cada proceso: con varios workers, los eventos de cocina que llegan de otro
+    proceso por el backplane lo invalidan (ver cocina_service.invalidar_por_evento_remoto).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pedidos: Dict[int, dict] = {}
+        self._version = 0
+        self._cargado = False
+        self._cache: Optional[Tuple[int, bytes, str]] = None
+
+    @property
+    def cargado(self) -> bool:
+        return self._cargado
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def cargar(self, pedidos: Iterable, version: int):
+        """
+        Reconstruir el índice completo a partir de los pedidos activos. version es la que había antes
+        de consultar la base de datos: si un cambio la ha modificado mientras tanto, los pedidos
+        cargados pueden no incluirlo, así que se usan pero no se dan por cargados.
+        """
+        serializados = {pedido.id: self._serializar(pedido) for pedido in pedidos}
+        with self._lock:
+            self._pedidos = serializados
+            self._cargado = version == self._version
+            self._version += 1
+
+    def actualizar(self, pedido_id: int, pedido=None):
+        """Guardar el estado actual de un pedido, o quitarlo si ya no está activo o no existe"""
+        if pedido is None or pedido.estado not in ESTADOS_ACTIVOS:
+            self.quitar(pedido_id)
+            return
+        serializado = self._serializar(pedido)
+        with self._lock:
+            if self._cargado:
+                self._pedidos[pedido_id] = serializado
+            # Sin cargar, el cambio de versión descarta una carga que esté en curso
+            self._version += 1
+
+    def quitar(self, pedido_id: int):
+        """Quitar un pedido del índice (entregado, cancelado o eliminado)"""
+        with self._lock:
+            if self._pedidos.pop(pedido_id, None) is not None or not self._cargado:
+                self._version += 1
+
+    def invalidar(self):
+        """Forzar una recarga completa en la próxima instantánea (p. ej. tras cambios en el menú)"""
+        with self._lock:
+            self._cargado = False
+            self._version += 1
+
+    def reiniciar(self):
+        """Vaciar el índice (útil en pruebas)"""
+        with self._lock:
+            self._pedidos = {}
+            self._cargado = False
+            self._version += 1
+            self._cache = None
+
+    def snapshot(self) -> Tuple[bytes, str]:
+        """Devuelve el cuerpo JSON de la instantánea y su ETag, recalculándolos solo si cambió la versión"""
+        with self._lock:
+            if self._cache is not None and self._cache[0] == self._version:
+                return self._cache[1], self._cache[2]
+            version = self._version
+            pedidos = sorted(self._pedidos.values(), key=lambda p: (p["fecha_creacion"], p["id"]))
+            cuerpo = json.dumps({"version": version, "pedidos": pedidos}).encode("utf-8")
+            etag = f'"{hashlib.sha1(cuerpo).hexdigest()}"'
+            self._cache = (version, cuerpo, etag)
+            return cuerpo, etag
+
+    @staticmethod
+    def _serializar(pedido) -> dict:
+        return PedidoCocina.model_validate(pedido).model_dump(mode="json")
+
+# Instancia única del índice de cocina
+indice_cocina = IndiceCocina()
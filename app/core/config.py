@@ -1,7 +1,9 @@
 """
 Configuration settings for the application.
 """
-from typing import List
+import os
+import tempfile
+from typing import List, Optional
 from datetime import timedelta
 
 # API configuration
@@ -16,15 +18,76 @@ ALLOWED_METHODS: List[str] = ["*"]
 ALLOWED_HEADERS: List[str] = ["*"]
 
 # Database configuration
-SQLALCHEMY_DATABASE_URL: str = "sqlite:///./restaurante.db"
+SQLALCHEMY_DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./restaurante.db")
 SQLALCHEMY_TEST_DATABASE_URL: str = "sqlite:///./test_restaurante.db"
 
+# Modo de acceso a la base de datos: "sync" (threadpool) o "async" (AsyncSession + aiosqlite/asyncpg)
+DB_MODE: str = os.getenv("DB_MODE", "sync")
+DB_ASYNC_MODE: bool = DB_MODE == "async"
+
+def get_async_database_url(url: str) -> str:
+    """Traduce una URL síncrona de SQLAlchemy a su driver asíncrono equivalente."""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+SQLALCHEMY_ASYNC_DATABASE_URL: str = os.getenv(
+    "ASYNC_DATABASE_URL", get_async_database_url(SQLALCHEMY_DATABASE_URL)
+)
+
 # Authentication configuration
 JWT_SECRET_KEY: str = "ASDFGHIJKLMNOPQRSTUVWXYZ1234567890"  
 JWT_ALGORITHM: str = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 horas
 TOKEN_URL: str = "/token" 
 
+# Número de hilos dedicados a bcrypt (hash y verificación de contraseñas)
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Caché de usuarios autenticados en get_usuario_actual
+PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRADAS: int = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRADAS", "1024"))
+
+# Caché del menú (productos y categorías): se recarga tras cada cambio, también los de otros workers
+# si hay backplane (WS_BACKPLANE), y como mucho cada MENU_CACHE_TTL_SECONDS
+MENU_CACHE_TTL_SECONDS: float = float(os.getenv("MENU_CACHE_TTL_SECONDS", "60"))
+
+# Estrategia de carga del grafo de pedidos (PedidoDetallado): "selectin", "joined" o vacío (carga perezosa)
+PEDIDO_ESTRATEGIA_CARGA: Optional[str] = os.getenv("PEDIDO_ESTRATEGIA_CARGA", "selectin") or None
+
+# Envío WebSocket: cola acotada por conexión, política cuando se llena
+# ("descartar_antiguos", "descartar_nuevos" o "desconectar") y tiempo máximo de un envío
+WS_TAMANO_COLA: int = int(os.getenv("WS_TAMANO_COLA", "100"))
+WS_POLITICA_DESBORDAMIENTO: str = os.getenv("WS_POLITICA_DESBORDAMIENTO", "descartar_antiguos")
+WS_TIMEOUT_ENVIO_SECONDS: float = float(os.getenv("WS_TIMEOUT_ENVIO_SECONDS", "10"))
+
+# Latido WebSocket: cada cuántos segundos se envía {"tipo": "ping"} (0 lo desactiva) y tras cuántos segundos
+# sin recibir nada del cliente se cierra su conexión
+WS_INTERVALO_PING_SECONDS: float = float(os.getenv("WS_INTERVALO_PING_SECONDS", "30"))
+WS_TIMEOUT_INACTIVIDAD_SECONDS: float = float(os.getenv("WS_TIMEOUT_INACTIVIDAD_SECONDS", "90"))
+
+# Conexiones WebSocket simultáneas por usuario; al superarlo se cierra la más antigua
+WS_MAX_CONEXIONES_POR_USUARIO: int = int(os.getenv("WS_MAX_CONEXIONES_POR_USUARIO", "5"))
+
+# Eventos guardados por tipo de cliente para reenviarlos a los clientes que se reconectan (?since=<seq>)
+WS_HISTORIAL_EVENTOS: int = int(os.getenv("WS_HISTORIAL_EVENTOS", "500"))
+
+# Despachador de eventos: máximo de eventos en espera de difundir y eventos difundidos por lote
+WS_DESPACHO_CAPACIDAD: int = int(os.getenv("WS_DESPACHO_CAPACIDAD", "10000"))
+WS_DESPACHO_TAMANO_LOTE: int = int(os.getenv("WS_DESPACHO_TAMANO_LOTE", "100"))
+
+# Ventana de agrupación: los cambios de un mismo pedido que llegan con menos de WS_VENTANA_AGRUPACION_MS
+# entre sí se envían en una sola trama (0 la desactiva); el primero nunca espera más de
+# WS_LATENCIA_MAXIMA_AGRUPACION_MS
+WS_VENTANA_AGRUPACION_MS: float = float(os.getenv("WS_VENTANA_AGRUPACION_MS", "0"))
+WS_LATENCIA_MAXIMA_AGRUPACION_MS: float = float(os.getenv("WS_LATENCIA_MAXIMA_AGRUPACION_MS", "50"))
+
+# Backplane de eventos WebSocket entre workers: vacío (un solo proceso) o "unix" (sockets Unix en WS_BACKPLANE_DIR)
+WS_BACKPLANE: str = os.getenv("WS_BACKPLANE", "")
+WS_BACKPLANE_DIR: str = os.getenv("WS_BACKPLANE_DIR", os.path.join(tempfile.gettempdir(), "restaurante-ws"))
+
 def create_tables():
     """Create database tables."""
     from app.db.database import Base, engine
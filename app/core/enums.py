@@ -39,4 +39,32 @@ class TipoProducto(str, Enum):
     BEBIDA = "bebida"
     POSTRE = "postre"
     ENTRADA = "entrada"
-    COMPLEMENTO = "complemento" 
\ No newline at end of file
+    COMPLEMENTO = "complemento"
+
+class DimensionVentas(str, Enum):
+    """Dimensiones de los agregados de ingresos"""
+    CAMARERO = "camarero"
+    MESA = "mesa"
+    PRODUCTO = "producto"
+    METODO_PAGO = "metodo_pago"
+
+class GranularidadVentas(str, Enum):
+    """Periodos de los agregados de ingresos"""
+    HORA = "hora"
+    DIA = "dia"
+
+class FormatoExportacion(str, Enum):
+    """Formatos de exportación del historial de cuentas"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class CodificacionWebSocket(str, Enum):
+    """Codificación de las tramas que recibe un cliente WebSocket"""
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+class PoliticaDesbordamiento(str, Enum):
+    """Qué hacer con un mensaje WebSocket cuando la cola de envío de un cliente lento está llena"""
+    DESCARTAR_ANTIGUOS = "descartar_antiguos"
+    DESCARTAR_NUEVOS = "descartar_nuevos"
+    DESCONECTAR = "desconectar"
@@ -0,0 +1,148 @@
+"""
+Caché en memoria del menú (productos y categorías).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from app.core.config import MENU_CACHE_TTL_SECONDS
+from app.schemas.categoria import CategoriaResponse
+from app.schemas.producto import ProductoResponse
+
+# Respuestas ya serializadas que se guardan por versión (combinaciones distintas de filtros y página)
+MAX_RESPUESTAS = 256
+
+class MenuCache:
+    """
+    Mantiene el menú ya serializado: productos por ID, por categoría y por tipo, y las categorías.
+    Cada mutación de productos o categorías llama a invalidar(), que incrementa la versión y fuerza
+    una recarga en la siguiente lectura. Los listados se serializan y se les calcula el ETag una sola
+    vez por versión y combinación de parámetros.
+    El menú es propio de cada proceso: con varios workers, los cambios hechos en otro proceso llegan
+    por el backplane (ver menu_service.invalidar_por_evento_remoto); sin backplane, se ven como mucho
+    tras ttl_segundos.
+    """
+
+    def __init__(self, ttl_segundos: float = MENU_CACHE_TTL_SECONDS, max_respuestas: int = MAX_RESPUESTAS):
+        self.ttl = ttl_segundos
+        self.max_respuestas = max_respuestas
+        self._lock = threading.Lock()
+        self._version = 0
+        self._cargado = False
+        self._caduca = 0.0
+        # Cambia con cada carga o invalidación: una respuesta construida con datos ya sustituidos no se guarda
+        self._generacion = 0
+        self._productos: Dict[int, dict] = {}
+        self._por_categoria: Dict[int, List[dict]] = {}
+        self._por_tipo: Dict[str, List[dict]] = {}
+        self._categorias: List[dict] = []
+        self._respuestas: "OrderedDict[Hashable, Tuple]" = OrderedDict()
+
+    @property
+    def cargado(self) -> bool:
+        return self._cargado and self._caduca > time.monotonic()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def cargar(self, productos: Iterable, categorias: Iterable, version: int):
+        """
+        Reconstruir el menú completo. version es la que había antes de consultar la base de datos:
+        si una mutación la ha cambiado mientras tanto, los datos se usan pero no se dan por cargados.
+        """
+        por_id = {}
+        por_categoria: Dict[int, List[dict]] = {}
+        por_tipo: Dict[str, List[dict]] = {}
+        for producto in sorted(productos, key=lambda p: p.id):
+            serializado = ProductoResponse.model_validate(producto).model_dump(mode="json")
+            por_id[serializado["id"]] = serializado
+            por_categoria.setdefault(serializado["categoria_id"], []).append(serializado)
+            por_tipo.setdefault(serializado["tipo"], []).append(serializado)
+        serializadas = [
+            CategoriaResponse.model_validate(categoria).model_dump(mode="json")
+            for categoria in sorted(categorias, key=lambda c: c.id)
+        ]
+        with self._lock:
+            self._productos = por_id
+            self._por_categoria = por_categoria
+            self._por_tipo = por_tipo
+            self._categorias = serializadas
+            self._respuestas.clear()
+            self._cargado = version == self._version
+            self._caduca = time.monotonic() + self.ttl
+            self._generacion += 1
+
+    def invalidar(self):
+        """Marcar el menú como modificado: nueva versión y recarga en la próxima lectura"""
+        with self._lock:
+            self._cargado = False
+            self._version += 1
+            self._generacion += 1
+            self._respuestas.clear()
+
+    def reiniciar(self):
+        """Vaciar el menú (útil en pruebas)"""
+        with self._lock:
+            self._productos = {}
+            self._por_categoria = {}
+            self._por_tipo = {}
+            self._categorias = []
+            self._respuestas.clear()
+            self._cargado = False
+            self._version += 1
+            self._generacion += 1
+
+    def producto(self, producto_id: int) -> Optional[dict]:
+        return self._productos.get(producto_id)
+
+    def productos(
+        self,
+        categoria_id: Optional[int] = None,
+        tipo: Optional[str] = None,
+        disponible: Optional[bool] = None
+    ) -> List[dict]:
+        """Productos en orden de id, partiendo del índice más selectivo de los filtros indicados"""
+        if categoria_id is not None:
+            candidatos = self._por_categoria.get(categoria_id, [])
+        elif tipo is not None:
+            candidatos = self._por_tipo.get(tipo, [])
+        else:
+            candidatos = list(self._productos.values())
+        return [
+            producto for producto in candidatos
+            if (tipo is None or producto["tipo"] == tipo)
+            and (disponible is None or producto["disponible"] == disponible)
+        ]
+
+    def categorias(self) -> List[dict]:
+        return self._categorias
+
+    def respuesta(
+        self, clave: Hashable, construir: Callable[[], Tuple[list, Optional[str]]]
+    ) -> Tuple[bytes, str, Optional[str]]:
+        """
+        Cuerpo JSON, ETag y cursor siguiente de un listado, serializados solo la primera vez por versión.
+        construir devuelve las filas de la página y el cursor de la siguiente (o None).
+        """
+        with self._lock:
+            guardada = self._respuestas.get(clave)
+            if guardada is not None:
+                self._respuestas.move_to_end(clave)
+                return guardada
+            generacion = self._generacion
+        filas, cursor = construir()
+        cuerpo = json.dumps(filas, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        guardada = (cuerpo, f'"{hashlib.sha1(cuerpo).hexdigest()}"', cursor)
+        with self._lock:
+            if generacion == self._generacion:
+                self._respuestas[clave] = guardada
+                while len(self._respuestas) > self.max_respuestas:
+                    self._respuestas.popitem(last=False)
+        return guardada
+
+# Instancia única del menú
+menu = MenuCache()
@@ -0,0 +1,147 @@
+"""
+Métricas internas de la aplicación (contadores, medidores y tasas) expuestas en /metricas.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any
+
+class Contador:
+    """Contador monótono seguro entre hilos"""
+
+    def __init__(self):
+        self._valor = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad: int = 1):
+        with self._lock:
+            self._valor += cantidad
+
+    @property
+    def valor(self) -> int:
+        return self._valor
+
+    def reiniciar(self):
+        with self._lock:
+            self._valor = 0
+
+class Medidor:
+    """Valor instantáneo que puede subir y bajar (gauge)"""
+
+    def __init__(self):
+        self._valor = 0
+        self._lock = threading.Lock()
+
+    def establecer(self, valor):
+        with self._lock:
+            self._valor = valor
+
+    def incrementar(self, cantidad=1):
+        with self._lock:
+            self._valor += cantidad
+
+    def decrementar(self, cantidad=1):
+        with self._lock:
+            self._valor -= cantidad
+
+    @property
+    def valor(self):
+        return self._valor
+
+    def reiniciar(self):
+        self.establecer(0)
+
+class Tasa:
+    """Número de eventos en una ventana deslizante (por defecto, último minuto)"""
+
+    def __init__(self, ventana_segundos: float = 60.0):
+        self.ventana = ventana_segundos
+        self._eventos = deque()
+        self._lock = threading.Lock()
+
+    def registrar(self):
+        ahora = time.monotonic()
+        with self._lock:
+            self._eventos.append(ahora)
+            self._purgar(ahora)
+
+    def _purgar(self, ahora: float):
+        limite = ahora - self.ventana
+        while self._eventos and self._eventos[0] < limite:
+            self._eventos.popleft()
+
+    @property
+    def valor(self) -> int:
+        with self._lock:
+            self._purgar(time.monotonic())
+            return len(self._eventos)
+
+    def reiniciar(self):
+        with self._lock:
+            self._eventos.clear()
+
+class Duracion:
+    """Acumula duraciones (segundos) para calcular media y máximo"""
+
+    def __init__(self):
+        self._total = 0.0
+        self._cuenta = 0
+        self._maximo = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos: float):
+        with self._lock:
+            self._total += segundos
+            self._cuenta += 1
+            self._maximo = max(self._maximo, segundos)
+
+    @property
+    def valor(self) -> Dict[str, float]:
+        with self._lock:
+            media = self._total / self._cuenta if self._cuenta else 0.0
+            return {"cuenta": self._cuenta, "media_ms": media * 1000, "max_ms": self._maximo * 1000}
+
+    def reiniciar(self):
+        with self._lock:
+            self._total = 0.0
+            self._cuenta = 0
+            self._maximo = 0.0
+
+# Registro global de métricas por nombre
+_registro: Dict[str, Any] = {}
+_registro_lock = threading.Lock()
+
+def _obtener(nombre: str, fabrica: Callable[[], Any]):
+    with _registro_lock:
+        if nombre not in _registro:
+            _registro[nombre] = fabrica()
+        return _registro[nombre]
+
+def contador(nombre: str) -> Contador:
+    """Obtener (o crear) un contador por nombre"""
+    return _obtener(nombre, Contador)
+
+def medidor(nombre: str) -> Medidor:
+    """Obtener (o crear) un medidor por nombre"""
+    return _obtener(nombre, Medidor)
+
+def tasa(nombre: str, ventana_segundos: float = 60.0) -> Tasa:
+    """Obtener (o crear) una tasa por nombre"""
+    return _obtener(nombre, lambda: Tasa(ventana_segundos))
+
+def duracion(nombre: str) -> Duracion:
+    """Obtener (o crear) un acumulador de duraciones por nombre"""
+    return _obtener(nombre, Duracion)
+
+def obtener_metricas() -> Dict[str, Any]:
+    """Instantánea de todas las métricas registradas"""
+    with _registro_lock:
+        metricas = dict(_registro)
+    return {nombre: metrica.valor for nombre, metrica in sorted(metricas.items())}
+
+def reiniciar_metricas():
+    """Reiniciar todas las métricas (útil en pruebas)"""
+    with _registro_lock:
+        metricas = list(_registro.values())
+    for metrica in metricas:
+        metrica.reiniciar()
@@ -0,0 +1,84 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+En lugar de offset(skip), cada página continúa a partir de la clave de ordenación de la última
+fila de la anterior, por ejemplo (fecha_creacion, id). La consulta salta directamente a esa
+posición del índice, así que el coste de una página no depende de lo profunda que sea, y las
+inserciones concurrentes no desplazan las páginas siguientes.
+
+El cursor es opaco para el cliente: la clave de la última fila en JSON codificada en base64url.
+Los endpoints lo devuelven en la cabecera X-Next-Cursor cuando puede haber más resultados.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import DateTime, tuple_
+from sqlalchemy.orm import Query
+
+CABECERA_CURSOR = "X-Next-Cursor"
+
+def _a_json(valor: Any) -> Any:
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    """Codificar la clave de ordenación de una fila como cursor opaco"""
+    contenido = json.dumps([_a_json(valor) for valor in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(contenido.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor: str, columnas: Sequence) -> List[Any]:
+    """Decodificar un cursor y convertir cada valor al tipo de su columna"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError("número de valores incorrecto")
+        return [
+            datetime.fromisoformat(valor) if isinstance(columna.type, DateTime) else int(valor)
+            for valor, columna in zip(valores, columnas)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+def paginar(
+    query: Query,
+    columnas: Sequence,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    descendente: bool = True
+) -> Query:
+    """
+    Ordenar por la clave de paginación y aplicar el cursor o, si no se indica, el offset.
+    La última columna de la clave debe ser única (el id) para que el orden sea total.
+    """
+    orden = [columna.desc() if descendente else columna.asc() for columna in columnas]
+    query = query.order_by(*orden)
+    if cursor is None:
+        return query.offset(skip).limit(limit)
+
+    valores = decodificar_cursor(cursor, columnas)
+    if len(columnas) == 1:
+        condicion = columnas[0] < valores[0] if descendente else columnas[0] > valores[0]
+    else:
+        clave, posicion = tuple_(*columnas), tuple_(*valores)
+        condicion = clave < posicion if descendente else clave > posicion
+    return query.filter(condicion).limit(limit)
+
+def siguiente_cursor(filas: Sequence[Any], columnas: Sequence, limit: int) -> Optional[str]:
+    """
+    Cursor de la página siguiente, o None si esta página no se ha llenado (no hay más resultados).
+    Acepta objetos ORM o esquemas de respuesta: lee los atributos con el nombre de cada columna.
+    """
+    if len(filas) < limit or not filas:
+        return None
+    ultima = filas[-1]
+    return codificar_cursor([getattr(ultima, columna.key) for columna in columnas])
+
+def fijar_cursor_siguiente(response: Response, filas: Sequence[Any], columnas: Sequence, limit: int):
+    """Añadir la cabecera X-Next-Cursor a la respuesta de un listado si puede haber más resultados"""
+    cursor = siguiente_cursor(filas, columnas, limit)
+    if cursor is not None:
+        response.headers[CABECERA_CURSOR] = cursor
@@ -1,7 +1,15 @@
 """
 Utilidades de seguridad.
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from functools import lru_cache
+
 import bcrypt
+import jwt
+
+from app.core.config import PASSWORD_HASH_WORKERS, JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 
 def verificar_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -13,4 +21,37 @@ def get_password_hash(password: str) -> str:
     """
     Hashea una contraseña usando bcrypt.
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8') 
\ No newline at end of file
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def crear_token_acceso(data: dict, expires_delta: timedelta = None):
+    """Crear un nuevo token de acceso"""
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.now(UTC) + expires_delta
+    else:
+        expire = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": datetime.now(UTC)})
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    return encoded_jwt
+
+@lru_cache(maxsize=None)
+def get_password_executor() -> ThreadPoolExecutor:
+    """
+    Pool acotado de hilos para bcrypt. bcrypt libera el GIL mientras calcula,
+    así que los hilos trabajan en paralelo sin bloquear el bucle de eventos.
+    """
+    return ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+async def verificar_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifica una contraseña en el pool de bcrypt sin bloquear el bucle de eventos.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), verificar_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hashea una contraseña en el pool de bcrypt sin bloquear el bucle de eventos.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), get_password_hash, password)
@@ -0,0 +1,50 @@
+"""
+Caché en memoria de los usuarios autenticados.
+
+La caché es propia de cada proceso. Con varios workers y backplane (WS_BACKPLANE), invalidar un usuario
+avisa a los demás procesos, que lo eliminan también de su caché; sin backplane, los demás ven el cambio
+como mucho tras PRINCIPAL_CACHE_TTL_SECONDS.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+from app.core.cache import TTLCache
+from app.core.config import PRINCIPAL_CACHE_MAX_ENTRADAS, PRINCIPAL_CACHE_TTL_SECONDS
+from app.core.websockets import notificar_procesos
+
+@dataclass(frozen=True)
+class UsuarioAutenticado:
+    """
+    Copia inmutable de los datos del usuario autenticado.
+    Se cachea en lugar del objeto ORM para no compartir instancias entre sesiones.
+    """
+    id: int
+    username: str
+    email: str
+    nombre: str
+    apellido: str
+    rol: str
+    activo: bool
+    fecha_creacion: Optional[datetime]
+
+# Caché de usuarios autenticados por (sub, iat) del token
+cache_usuarios = TTLCache(
+    "cache_usuarios", max_entradas=PRINCIPAL_CACHE_MAX_ENTRADAS, ttl_segundos=PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+def _quitar_usuario(username: str):
+    cache_usuarios.invalidar(lambda clave: clave[0] == username)
+
+def invalidar_usuario_cache(username: str):
+    """
+    Eliminar de la caché todas las entradas de un usuario (cualquier token), en este proceso y en los
+    demás: un usuario desactivado o con otro rol no debe conservar sus permisos en ningún worker
+    """
+    _quitar_usuario(username)
+    notificar_procesos({"tipo": "usuario_actualizado", "username": username})
+
+def invalidar_por_evento_remoto(datos: Dict[str, Any], client_types: Sequence[str]):
+    """Eliminar de la caché un usuario que otro proceso ha modificado o eliminado"""
+    if datos.get("tipo") == "usuario_actualizado":
+        _quitar_usuario(datos.get("username"))
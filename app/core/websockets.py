@@ -4,10 +4,32 @@ Gestión de conexiones WebSocket.
 import json
 import asyncio
 import logging
-from typing import Dict, List, Any
-from fastapi import WebSocket
+import secrets
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Any, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from fastapi import WebSocket, status
 from datetime import datetime, UTC
 
+from app.core import metrics
+from app.core.config import (
+    WS_TAMANO_COLA, WS_POLITICA_DESBORDAMIENTO, WS_TIMEOUT_ENVIO_SECONDS, WS_HISTORIAL_EVENTOS,
+    WS_DESPACHO_CAPACIDAD, WS_DESPACHO_TAMANO_LOTE, WS_INTERVALO_PING_SECONDS, WS_TIMEOUT_INACTIVIDAD_SECONDS,
+    WS_MAX_CONEXIONES_POR_USUARIO, WS_VENTANA_AGRUPACION_MS, WS_LATENCIA_MAXIMA_AGRUPACION_MS
+)
+from app.core.enums import CodificacionWebSocket, PoliticaDesbordamiento, TipoProducto
+from app.core.backplane import Backplane
+
+try:
+    import orjson
+except ImportError:  # Opcional: sin orjson los eventos se codifican con json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Opcional: sin msgpack los clientes solo pueden recibir JSON
+    msgpack = None
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,50 +37,703 @@ logging.basicConfig(
 )
 logger = logging.getLogger("restaurante")
 
+# Mensajes que sustituyen a uno anterior del mismo tipo y entidad: si un cliente lento aún no ha
+# recibido el anterior, solo se le envía el más reciente (coalescencia)
+_CLAVES_COALESCENCIA = {
+    "actualizacion_pedido": "pedido_id",
+    "actualizacion_detalle": "detalle_id",
+    "actualizacion_reserva": "reserva_id",
+}
+
+# Cambios de un pedido que el despachador puede agrupar en una sola trama "lote_pedido"
+TIPOS_AGRUPABLES = frozenset({"actualizacion_pedido", "actualizacion_detalle", "nuevo_detalle", "eliminar_detalle"})
+
+def clave_coalescencia(message: Dict[str, Any]) -> Optional[str]:
+    """Clave con la que un mensaje sustituye a otro pendiente, o None si todos deben entregarse"""
+    campo = _CLAVES_COALESCENCIA.get(message.get("tipo"))
+    if campo is None or message.get(campo) is None:
+        return None
+    return f"{message['tipo']}:{message[campo]}"
+
+# Canal de las conexiones sin filtros de suscripción: reciben todos los eventos de su grupo
+CANAL_TODOS = "*"
+
+def crear_canales(
+    mesas: Iterable[int] = (),
+    camareros: Iterable[Optional[int]] = (),
+    tipos: Iterable[Union[TipoProducto, str]] = ()
+) -> FrozenSet[str]:
+    """
+    Canales de suscripción de un evento o de una conexión: "mesa:<número>", "camarero:<id>" y
+    "tipo:<tipo de producto>". Una conexión con filtros solo recibe los eventos de sus canales.
+    """
+    canales = {f"mesa:{numero}" for numero in mesas if numero is not None}
+    canales.update(f"camarero:{camarero_id}" for camarero_id in camareros if camarero_id is not None)
+    canales.update(f"tipo:{TipoProducto(tipo).value}" for tipo in tipos if tipo is not None)
+    return frozenset(canales)
+
+def codificar_evento(datos: Dict[str, Any]) -> str:
+    """Serializar los datos de un evento como JSON, con orjson si está instalado"""
+    if orjson is not None:
+        return orjson.dumps(datos).decode("utf-8")
+    return json.dumps(datos)
+
+def decodificar_evento(trama: str) -> Dict[str, Any]:
+    """Leer los datos de una trama JSON, con orjson si está instalado"""
+    return orjson.loads(trama) if orjson is not None else json.loads(trama)
+
+def codificacion_disponible(codificacion: CodificacionWebSocket) -> bool:
+    """Si el servidor puede enviar tramas con esa codificación"""
+    return codificacion != CodificacionWebSocket.MSGPACK or msgpack is not None
+
+def codificar_msgpack(trama: str) -> bytes:
+    """
+    Convertir una trama JSON ya numerada a MessagePack.
+    Se hace una vez por evento para todas las conexiones binarias, y solo si hay alguna.
+    """
+    return msgpack.packb(decodificar_evento(trama))
+
+def numerar_trama(seq: int, trama: str, epoca: Optional[str] = None) -> str:
+    """
+    Añadir el número de secuencia (y la época del proceso que lo asigna) a una trama JSON ya
+    codificada, sin volver a codificarla
+    """
+    cabecera = f'"seq": {seq}' if epoca is None else f'"seq": {seq}, "epoca": "{epoca}"'
+    resto = trama[1:].lstrip()
+    return f'{{{cabecera}}}' if resto.startswith("}") else f'{{{cabecera}, {resto}'
+
+class EventoWebSocket:
+    """
+    Evento a difundir por WebSocket: tipo, datos, clave de coalescencia y canales de suscripción.
+    La trama JSON se codifica una sola vez, la primera vez que se necesita, y la misma cadena
+    se entrega a todos los destinatarios de todos los grupos.
+    Un evento sin canales llega a todas las conexiones de sus grupos.
+    """
+    __slots__ = ("datos", "tipo", "clave", "canales", "_trama")
+
+    def __init__(self, datos: Dict[str, Any], canales: Iterable[str] = ()):
+        self.datos = datos
+        self.tipo: str = datos.get("tipo", "desconocido")
+        self.clave = clave_coalescencia(datos)
+        self.canales: FrozenSet[str] = frozenset(canales)
+        self._trama: Optional[str] = None
+
+    @property
+    def trama(self) -> str:
+        if self._trama is None:
+            self._trama = codificar_evento(self.datos)
+        return self._trama
+
+class ConexionWebSocket:
+    """
+    Una conexión WebSocket con su cola de envío acotada y su tarea escritora.
+    Encolar nunca bloquea: la tarea escritora envía los mensajes en orden, de modo que un
+    cliente lento solo se retrasa a sí mismo.
+    - canales: filtros de suscripción; sin canales la conexión recibe todo su grupo
+    - usuario: usuario autenticado, para limitar sus conexiones simultáneas
+    - binaria: recibe las tramas en MessagePack (bytes) en lugar de JSON (texto)
+    - ultima_actividad: instante (monotónico) del último mensaje recibido del cliente
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_type: str,
+        tamano_cola: int,
+        politica: PoliticaDesbordamiento,
+        canales: FrozenSet[str] = frozenset(),
+        usuario: Optional[str] = None,
+        codificacion: CodificacionWebSocket = CodificacionWebSocket.JSON
+    ):
+        self.websocket = websocket
+        self.client_type = client_type
+        self.canales = canales
+        self.usuario = usuario
+        self.binaria = codificacion == CodificacionWebSocket.MSGPACK
+        self.ultima_actividad = time.monotonic()
+        self.tamano_cola = tamano_cola
+        self.politica = politica
+        self.tarea: Optional[asyncio.Task] = None
+        # Entradas [clave, mensaje]; las que tienen clave se indexan para poder sustituirlas
+        self._pendientes: Deque[list] = deque()
+        self._por_clave: Dict[str, list] = {}
+        self._hay_mensajes = asyncio.Event()
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._pendientes)
+
+    def suscrita(self, canales: FrozenSet[str]) -> bool:
+        """Si esta conexión debe recibir un evento con esos canales"""
+        return not canales or not self.canales or not self.canales.isdisjoint(canales)
+
+    def adaptar(self, trama: str) -> Union[str, bytes]:
+        """La trama JSON en la codificación de esta conexión (para mensajes sueltos; los eventos se convierten una vez)"""
+        return codificar_msgpack(trama) if self.binaria else trama
+
+    def encolar(self, message: Union[str, bytes], clave: Optional[str] = None) -> bool:
+        """
+        Encolar un mensaje para esta conexión.
+        Un mensaje con la clave de otro pendiente lo sustituye: el anterior sale de la cola y el nuevo
+        se añade al final, para que los eventos sigan llegando en orden de seq.
+        Devuelve False si la cola está llena y la política es desconectar al cliente.
+        """
+        if clave is not None and clave in self._por_clave:
+            self._pendientes.remove(self._por_clave.pop(clave))
+            metrics.contador("websocket_mensajes_coalescidos").incrementar()
+
+        if len(self._pendientes) >= self.tamano_cola:
+            if self.politica == PoliticaDesbordamiento.DESCONECTAR:
+                return False
+            metrics.contador("websocket_mensajes_descartados").incrementar()
+            if self.politica == PoliticaDesbordamiento.DESCARTAR_NUEVOS:
+                return True
+            clave_antigua, _ = self._pendientes.popleft()
+            self._por_clave.pop(clave_antigua, None)
+
+        entrada = [clave, message]
+        self._pendientes.append(entrada)
+        if clave is not None:
+            self._por_clave[clave] = entrada
+        self._hay_mensajes.set()
+        return True
+
+    async def escribir(self, timeout_envio: float):
+        """Enviar los mensajes pendientes según llegan; termina con una excepción si el envío falla o excede el tiempo"""
+        while True:
+            await self._hay_mensajes.wait()
+            while self._pendientes:
+                clave, message = self._pendientes.popleft()
+                if clave is not None:
+                    del self._por_clave[clave]
+                async with asyncio.timeout(timeout_envio):
+                    if isinstance(message, bytes):
+                        await self.websocket.send_bytes(message)
+                    else:
+                        await self.websocket.send_text(message)
+            self._hay_mensajes.clear()
+
 class ConnectionManager:
-    """Gestiona las conexiones WebSocket para diferentes tipos de clientes"""
+    """
+    Gestiona las conexiones WebSocket para diferentes tipos de clientes.
+    Cada conexión tiene una cola acotada y una tarea que escribe en su socket, así que un broadcast
+    solo encola y los envíos a distintos clientes ocurren en paralelo. Cuando la cola de un cliente
+    lento se llena se aplica la política de desbordamiento, y las conexiones cuyo envío falla o
+    excede el tiempo máximo se expulsan.
+    
+    Cada evento recibe un número de secuencia creciente ("seq") y se guarda en un historial acotado
+    por tipo de cliente, para reenviar a un cliente que se reconecta los eventos que se ha perdido.
+    La secuencia es propia de cada gestor (cada proceso numera también los eventos que le llegan por
+    el backplane), así que cada trama lleva además la época del gestor ("epoca"), aleatoria y distinta
+    en cada arranque: un cursor de otro proceso, o de antes de un reinicio, no es comparable y siempre
+    se responde con "resync_requerido".
+
+    Las conexiones pueden suscribirse a canales (sus mesas, su camarero, los tipos de producto de
+    su puesto de cocina). Un índice canal → conexiones por tipo de cliente resuelve los
+    destinatarios de un evento con canales sin recorrer las conexiones que no lo esperan.
+
+    Mientras haya conexiones, una tarea de latido envía {"tipo": "ping"} cada `intervalo_ping`
+    segundos y cierra las conexiones de las que no se recibe nada (ni la respuesta al ping) en
+    `timeout_inactividad` segundos, como las conexiones TCP medio abiertas. Cada usuario tiene como
+    máximo `max_conexiones_usuario` conexiones: al superarlo se cierra la más antigua.
+    """
     
-    def __init__(self):
-        """Inicializa el administrador de conexiones con listas vacías para cada tipo de cliente"""
-        self.active_connections: Dict[str, List[WebSocket]] = {
-            "cocina": [],
-            "camareros": [],
-            "admin": []
+    def __init__(
+        self,
+        tamano_cola: int = WS_TAMANO_COLA,
+        politica: PoliticaDesbordamiento = PoliticaDesbordamiento(WS_POLITICA_DESBORDAMIENTO),
+        timeout_envio: float = WS_TIMEOUT_ENVIO_SECONDS,
+        tamano_historial: int = WS_HISTORIAL_EVENTOS,
+        intervalo_ping: float = WS_INTERVALO_PING_SECONDS,
+        timeout_inactividad: float = WS_TIMEOUT_INACTIVIDAD_SECONDS,
+        max_conexiones_usuario: int = WS_MAX_CONEXIONES_POR_USUARIO
+    ):
+        """Inicializa el administrador de conexiones sin conexiones para cada tipo de cliente"""
+        self.tamano_cola = tamano_cola
+        self.politica = politica
+        self.timeout_envio = timeout_envio
+        self.intervalo_ping = intervalo_ping
+        self.timeout_inactividad = timeout_inactividad
+        self.max_conexiones_usuario = max_conexiones_usuario
+        self._latido: Optional[asyncio.Task] = None
+        # Conexiones de cada usuario, de la más antigua a la más reciente
+        self._por_usuario: Dict[str, List[ConexionWebSocket]] = {}
+        # Reenvía los eventos a los demás procesos (uvicorn --workers N); None con un solo proceso
+        self.backplane: Optional[Backplane] = None
+        # Funciones a las que se avisa (con los datos y los grupos) de cada evento recibido de otro proceso
+        self._suscriptores_remotos: List[Callable[[Dict[str, Any], Sequence[str]], None]] = []
+        self.active_connections: Dict[str, Dict[WebSocket, ConexionWebSocket]] = {
+            "cocina": {},
+            "camareros": {},
+            "admin": {}
         }
+        # Por tipo de cliente, canal → conexiones suscritas (CANAL_TODOS: conexiones sin filtros)
+        self.suscripciones: Dict[str, Dict[str, Set[ConexionWebSocket]]] = {
+            client_type: {} for client_type in self.active_connections
+        }
+        # Época de la secuencia, último número asignado; por tipo de cliente, los últimos eventos
+        # (seq, trama, canales) y el seq más alto que ya ha salido del historial
+        self.epoca = secrets.token_hex(4)
+        self.seq = 0
+        self.historial: Dict[str, Deque[Tuple[int, str, FrozenSet[str]]]] = {
+            client_type: deque(maxlen=tamano_historial) for client_type in self.active_connections
+        }
+        self._seq_olvidado: Dict[str, int] = {client_type: 0 for client_type in self.active_connections}
 
-    async def connect(self, websocket: WebSocket, client_type: str):
-        """Acepta y almacena una nueva conexión WebSocket"""
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_type: str,
+        since: Optional[int] = None,
+        canales: Iterable[str] = (),
+        usuario: Optional[str] = None,
+        codificacion: CodificacionWebSocket = CodificacionWebSocket.JSON,
+        epoca: Optional[str] = None
+    ):
+        """
+        Acepta y almacena una nueva conexión WebSocket y arranca su tarea escritora.
+        - since, epoca: último seq recibido antes de reconectar y su época; se reenvían los eventos
+          posteriores o, si ya no están en el historial o la época no es la de este gestor, un
+          mensaje "resync_requerido"
+        - canales: canales a los que se suscribe; sin canales recibe todos los eventos del grupo
+        - usuario: si ya tiene el máximo de conexiones, se cierra la más antigua
+        - codificacion: JSON (tramas de texto) o MessagePack (tramas binarias)
+        """
         await websocket.accept()
         if client_type in self.active_connections:
-            self.active_connections[client_type].append(websocket)
+            conexion = ConexionWebSocket(
+                websocket, client_type, self.tamano_cola, self.politica, frozenset(canales), usuario, codificacion
+            )
+            conexion.tarea = asyncio.create_task(self._escritor(conexion))
+            # Registrar y reenviar sin ceder el bucle: ningún evento se pierde ni se duplica entre ambos
+            self.active_connections[client_type][websocket] = conexion
+            indice = self.suscripciones[client_type]
+            for canal in conexion.canales or (CANAL_TODOS,):
+                indice.setdefault(canal, set()).add(conexion)
+            if since is not None:
+                self._reenviar(conexion, since, epoca)
+            self._actualizar_medidores(conexion, 1)
             logger.info(f"Nueva conexión WebSocket: {client_type}")
 
+            if usuario is not None:
+                propias = self._por_usuario.setdefault(usuario, [])
+                propias.append(conexion)
+                while len(propias) > self.max_conexiones_usuario:
+                    self._expulsar(propias[0], "límite de conexiones por usuario", status.WS_1008_POLICY_VIOLATION)
+            if self.intervalo_ping > 0 and (self._latido is None or self._latido.done()):
+                self._latido = asyncio.create_task(self._latir())
+
+    def _actualizar_medidores(self, conexion: ConexionWebSocket, cambio: int):
+        """Medidores de conexiones vivas: total, por tipo de cliente y por canal de suscripción"""
+        metrics.medidor("websocket_conexiones").incrementar(cambio)
+        metrics.medidor(f"websocket_conexiones_{conexion.client_type}").incrementar(cambio)
+        for canal in conexion.canales:
+            metrics.medidor(f"websocket_conexiones_{conexion.client_type}_{canal}").incrementar(cambio)
+
+    def registrar_actividad(self, websocket: WebSocket, client_type: str):
+        """Anotar que se ha recibido un mensaje del cliente (respuesta al ping o cualquier otro)"""
+        conexion = self.active_connections.get(client_type, {}).get(websocket)
+        if conexion is not None:
+            conexion.ultima_actividad = time.monotonic()
+
+    async def _latir(self):
+        """Tarea de latido: revisar las conexiones cada intervalo mientras quede alguna"""
+        while any(self.active_connections.values()):
+            await asyncio.sleep(self.intervalo_ping)
+            self.latir()
+
+    def latir(self, ahora: Optional[float] = None):
+        """Enviar un ping a cada conexión y cerrar las que llevan demasiado tiempo sin dar señales"""
+        ahora = time.monotonic() if ahora is None else ahora
+        ping = codificar_evento({"tipo": "ping"})
+        ping_binario = None
+        for conexiones in self.active_connections.values():
+            for conexion in list(conexiones.values()):
+                if ahora - conexion.ultima_actividad > self.timeout_inactividad:
+                    metrics.contador("websocket_conexiones_inactivas").incrementar()
+                    self._expulsar(conexion, "sin actividad", status.WS_1001_GOING_AWAY)
+                    continue
+                if conexion.binaria and ping_binario is None:
+                    ping_binario = codificar_msgpack(ping)
+                # Con la misma clave, un ping aún sin enviar se sustituye en lugar de acumularse
+                if not conexion.encolar(ping_binario if conexion.binaria else ping, "ping"):
+                    self._expulsar(conexion, "cola de envío llena")
+
+    def eventos_desde(
+        self, client_type: str, since: int, canales: FrozenSet[str] = frozenset(), epoca: Optional[str] = None
+    ) -> Optional[List[str]]:
+        """
+        Tramas de los eventos de un tipo de cliente posteriores a `since` (solo los de `canales`,
+        si se indican), o None si no se pueden reconstruir: la época no es la de este gestor (el seq
+        lo asignó otro proceso o un arranque anterior) o el hueco ya ha salido del historial.
+        """
+        if epoca != self.epoca or since > self.seq or since < self._seq_olvidado.get(client_type, 0):
+            return None
+        return [
+            trama for seq, trama, canales_evento in self.historial.get(client_type, ())
+            if seq > since and (not canales or not canales_evento or not canales.isdisjoint(canales_evento))
+        ]
+
+    def _reenviar(self, conexion: ConexionWebSocket, since: int, epoca: Optional[str] = None):
+        eventos = self.eventos_desde(conexion.client_type, since, conexion.canales, epoca)
+        if eventos is None or len(eventos) > self.tamano_cola:
+            metrics.contador("websocket_resync_requeridos").incrementar()
+            conexion.encolar(conexion.adaptar(codificar_evento(
+                {"tipo": "resync_requerido", "seq": self.seq, "epoca": self.epoca}
+            )))
+            return
+        for trama in eventos:
+            conexion.encolar(conexion.adaptar(trama))
+        metrics.contador("websocket_eventos_reenviados").incrementar(len(eventos))
+
     def disconnect(self, websocket: WebSocket, client_type: str):
-        """Elimina una conexión WebSocket"""
-        if client_type in self.active_connections:
-            if websocket in self.active_connections[client_type]:
-                self.active_connections[client_type].remove(websocket)
-                logger.info(f"Desconexión WebSocket: {client_type}")
+        """Elimina una conexión WebSocket y detiene su tarea escritora"""
+        conexion = self.active_connections.get(client_type, {}).pop(websocket, None)
+        if conexion is None:
+            return
+        indice = self.suscripciones[client_type]
+        for canal in conexion.canales or (CANAL_TODOS,):
+            suscritas = indice.get(canal)
+            if suscritas is not None:
+                suscritas.discard(conexion)
+                if not suscritas:
+                    del indice[canal]
+        if conexion.usuario is not None:
+            propias = self._por_usuario.get(conexion.usuario, [])
+            if conexion in propias:
+                propias.remove(conexion)
+            if not propias:
+                self._por_usuario.pop(conexion.usuario, None)
+        if conexion.tarea is not None and conexion.tarea is not asyncio.current_task():
+            conexion.tarea.cancel()
+        self._actualizar_medidores(conexion, -1)
+        logger.info(f"Desconexión WebSocket: {client_type}")
+
+    async def _escritor(self, conexion: ConexionWebSocket):
+        """Tarea escritora de una conexión: si el envío falla o se bloquea, la conexión se expulsa"""
+        try:
+            await conexion.escribir(self.timeout_envio)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._expulsar(conexion, f"envío fallido ({type(e).__name__})")
+
+    def _expulsar(self, conexion: ConexionWebSocket, motivo: str, codigo: int = status.WS_1013_TRY_AGAIN_LATER):
+        """Quitar una conexión muerta, demasiado lenta o sobrante y cerrar su socket sin esperar"""
+        if conexion.websocket not in self.active_connections.get(conexion.client_type, {}):
+            return
+        logger.warning(f"Conexión WebSocket expulsada ({conexion.client_type}): {motivo}")
+        metrics.contador("websocket_conexiones_expulsadas").incrementar()
+        self.disconnect(conexion.websocket, conexion.client_type)
+        asyncio.get_running_loop().create_task(self._cerrar(conexion.websocket, codigo))
+
+    async def _cerrar(self, websocket: WebSocket, codigo: int = status.WS_1013_TRY_AGAIN_LATER):
+        try:
+            await asyncio.wait_for(websocket.close(code=codigo), self.timeout_envio)
+        except Exception:
+            pass  # El socket ya estaba cerrado o no responde
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Envía un mensaje a un WebSocket específico"""
+        """Envía un mensaje a un WebSocket específico (por su cola, si está registrado)"""
+        for conexiones in self.active_connections.values():
+            conexion = conexiones.get(websocket)
+            if conexion is not None:
+                if not conexion.encolar(message):
+                    self._expulsar(conexion, "cola de envío llena")
+                return
         await websocket.send_text(message)
 
-    async def broadcast(self, message: str, client_type: str):
-        """Envía un mensaje a todos los WebSockets de un tipo de cliente específico"""
+    def _destinatarios(self, client_type: str, canales: FrozenSet[str]) -> List[ConexionWebSocket]:
+        """
+        Conexiones de un grupo que deben recibir un evento: todas si no tiene canales y, si los tiene,
+        las suscritas a alguno de ellos más las que no tienen filtros
+        """
+        if not canales:
+            return list(self.active_connections.get(client_type, {}).values())
+        indice = self.suscripciones.get(client_type, {})
+        conexiones = set(indice.get(CANAL_TODOS, ()))
+        for canal in canales:
+            suscritas = indice.get(canal)
+            if suscritas:
+                conexiones.update(suscritas)
+        return list(conexiones)
+
+    def _encolar(
+        self, trama: str, client_types: Iterable[str], clave: Optional[str], canales: FrozenSet[str] = frozenset()
+    ) -> int:
+        """Encolar una trama ya codificada para las conexiones de los grupos que la esperan; devuelve cuántas la reciben"""
+        destinatarios = 0
+        binaria: Optional[bytes] = None
+        for client_type in client_types:
+            for conexion in self._destinatarios(client_type, canales):
+                mensaje = trama
+                if conexion.binaria:
+                    if binaria is None:
+                        binaria = codificar_msgpack(trama)
+                    mensaje = binaria
+                if conexion.encolar(mensaje, clave):
+                    destinatarios += 1
+                else:
+                    self._expulsar(conexion, "cola de envío llena")
+        return destinatarios
+
+    async def iniciar_backplane(self, backplane: Backplane):
+        """Conectar el gestor a un backplane para enviar y recibir los eventos de otros procesos"""
+        await backplane.iniciar(self._entregar_remoto)
+        self.backplane = backplane
+
+    async def detener_backplane(self):
+        if self.backplane is not None:
+            await self.backplane.detener()
+            self.backplane = None
+
+    def suscribir_eventos_remotos(self, funcion: Callable[[Dict[str, Any], Sequence[str]], None]):
+        """
+        Avisar a `funcion` de cada evento que llega de otro proceso, con sus datos y sus grupos, p. ej.
+        para invalidar el estado en memoria de este proceso que el otro ha modificado
+        """
+        if funcion not in self._suscriptores_remotos:
+            self._suscriptores_remotos.append(funcion)
+
+    def _entregar_remoto(
+        self, trama: str, client_types: Sequence[str], clave: Optional[str], canales: Iterable[str] = ()
+    ):
+        """Entregar un evento publicado por otro proceso a las conexiones de este (sin volver a publicarlo)"""
+        if self._suscriptores_remotos:
+            try:
+                datos = decodificar_evento(trama)
+            except ValueError:
+                logger.warning("Evento del backplane no válido; se ignora")
+                return
+            for funcion in self._suscriptores_remotos:
+                funcion(datos, client_types)
+        if client_types:
+            self._entregar_evento(trama, client_types, clave, frozenset(canales))
+
+    def _entregar_evento(
+        self, trama: str, client_types: Sequence[str], clave: Optional[str], canales: FrozenSet[str] = frozenset()
+    ) -> int:
+        """Numerar un evento, guardarlo en el historial de cada grupo y encolarlo para sus conexiones"""
+        self.seq += 1
+        trama = numerar_trama(self.seq, trama, self.epoca)
+        for client_type in client_types:
+            historial = self.historial.get(client_type)
+            if historial is None:
+                continue
+            if len(historial) == historial.maxlen:
+                self._seq_olvidado[client_type] = historial[0][0]
+            historial.append((self.seq, trama, canales))
+        return self._encolar(trama, client_types, clave, canales)
+
+    def difundir(self, evento: EventoWebSocket, client_types: Sequence[str]) -> int:
+        """
+        Encolar un evento para los WebSockets de uno o varios tipos de cliente suscritos a sus canales.
+        El evento se codifica una vez para todos; devuelve el número de conexiones que lo reciben.
+        Sin grupos, el evento solo se publica a los demás procesos (ver notificar_procesos).
+        """
+        destinatarios = 0
+        if client_types:
+            destinatarios = self._entregar_evento(evento.trama, client_types, evento.clave, evento.canales)
+        if self.backplane is not None:
+            self.backplane.publicar(evento.trama, client_types, evento.clave, evento.canales)
+        logger.info(f"Mensaje enviado a {', '.join(client_types)}: {evento.tipo} ({destinatarios} conexiones)")
+        return destinatarios
+
+    async def broadcast(self, message: str, client_type: str, clave: Optional[str] = None):
+        """
+        Encola un mensaje ya codificado para todos los WebSockets de un tipo de cliente específico.
+        - clave: los mensajes con la misma clave sustituyen al pendiente en la cola de cada cliente
+        """
         if client_type in self.active_connections:
-            for connection in self.active_connections[client_type]:
-                await connection.send_text(message)
-            
-            # Registrar broadcast en logs
+            self._encolar(message, (client_type,), clave)
+            logger.info(f"Mensaje enviado a {client_type}")
+
+class _VentanaAgrupacion:
+    """
+    Cambios de un pedido pendientes de enviar juntos, con el temporizador que cierra la ventana y la
+    unión de los canales de los cambios (vacía si alguno va a todo el grupo)
+    """
+    __slots__ = ("inicio", "eventos", "canales", "temporizador")
+
+    def __init__(self, inicio: float):
+        self.inicio = inicio
+        self.eventos: List[EventoWebSocket] = []
+        self.canales: Optional[FrozenSet[str]] = None
+        self.temporizador: Optional[asyncio.TimerHandle] = None
+
+class DespachadorEventos:
+    """
+    Lleva al bucle de eventos los eventos difundidos desde cualquier hilo.
+    Los servicios síncronos se ejecutan en el threadpool, donde no hay bucle en ejecución y el
+    gestor de conexiones no se puede usar. Publicar solo añade el evento a una cola segura entre
+    hilos (deque: append y popleft son atómicos) y, si el consumidor está dormido, lo despierta con
+    call_soon_threadsafe. Una única tarea consumidora en el bucle vacía la cola por lotes y entrega
+    cada evento al gestor, en el orden de publicación.
+
+    Con una ventana de agrupación, los cambios de un mismo pedido (TIPOS_AGRUPABLES) para los mismos
+    grupos se retienen mientras sigan llegando con menos de `ventana_agrupacion_ms` entre sí, sin
+    que el primero espere más de `latencia_maxima_agrupacion_ms`, y se envían en una sola trama
+    {"tipo": "lote_pedido", "pedido_id": ..., "cambios": [...]} con la unión de sus canales: las
+    líneas de un pedido con productos de varios tipos van en la misma ventana. Un cambio que llega
+    solo se envía tal cual.
+    """
+
+    def __init__(
+        self,
+        gestor: ConnectionManager,
+        capacidad: int = WS_DESPACHO_CAPACIDAD,
+        tamano_lote: int = WS_DESPACHO_TAMANO_LOTE,
+        ventana_agrupacion_ms: float = WS_VENTANA_AGRUPACION_MS,
+        latencia_maxima_agrupacion_ms: float = WS_LATENCIA_MAXIMA_AGRUPACION_MS
+    ):
+        self.gestor = gestor
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.ventana_agrupacion = ventana_agrupacion_ms / 1000
+        self.latencia_maxima_agrupacion = latencia_maxima_agrupacion_ms / 1000
+        # Entradas (instante de publicación, evento, grupos)
+        self._cola: Deque[Tuple[float, EventoWebSocket, Sequence[str]]] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hay_eventos: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        # Ventanas abiertas por (grupos, pedido_id)
+        self._ventanas: Dict[Tuple[Tuple[str, ...], Any], _VentanaAgrupacion] = {}
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._cola)
+
+    async def iniciar(self):
+        """Arrancar la tarea consumidora en el bucle actual"""
+        self._loop = asyncio.get_running_loop()
+        self._hay_eventos = asyncio.Event()
+        self._tarea = self._loop.create_task(self._consumir())
+
+    async def detener(self):
+        """Detener la tarea consumidora entregando antes los eventos que quedan en la cola"""
+        if self._tarea is None:
+            return
+        self._loop = None
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+        # Las ventanas abiertas tienen eventos anteriores a los que siguen en la cola
+        for clave in list(self._ventanas):
+            self._cerrar_ventana(clave)
+        while self._cola:
+            self._entregar_lote()
+
+    def publicar(self, evento: EventoWebSocket, client_types: Sequence[str]):
+        """Encolar un evento para difundirlo desde el bucle de eventos; se puede llamar desde cualquier hilo"""
+        loop = self._loop
+        if loop is None:
+            # Sin consumidor (scripts, pruebas sin lifespan): se entrega directamente si hay un bucle
+            # en este hilo; si no, no hay nadie conectado a quien entregarlo
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                metrics.contador("websocket_despacho_descartados").incrementar()
+                return
+            self.gestor.difundir(evento, client_types)
+            return
+
+        if len(self._cola) >= self.capacidad:
+            logger.warning(f"Cola del despachador de eventos llena; se descarta {evento.tipo}")
+            metrics.contador("websocket_despacho_descartados").incrementar()
+            return
+        self._cola.append((time.monotonic(), evento, client_types))
+        metrics.medidor("websocket_despacho_pendientes").establecer(len(self._cola))
+        # Si el aviso ya está activo, el consumidor aún no ha empezado a vaciar la cola y verá este evento
+        if not self._hay_eventos.is_set():
             try:
-                msg_data = json.loads(message)
-                logger.info(f"Mensaje enviado a {client_type}: {msg_data.get('tipo')}")
-            except json.JSONDecodeError:
-                logger.info(f"Mensaje enviado a {client_type}")
+                en_el_bucle = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                en_el_bucle = False
+            if en_el_bucle:
+                self._hay_eventos.set()
+            else:
+                try:
+                    loop.call_soon_threadsafe(self._hay_eventos.set)
+                except RuntimeError:
+                    pass  # El bucle ya se ha cerrado: no quedan clientes a los que entregarlo
+
+    async def _consumir(self):
+        """Tarea consumidora: vaciar la cola por lotes, cediendo el bucle entre lote y lote"""
+        while True:
+            await self._hay_eventos.wait()
+            self._hay_eventos.clear()
+            while self._cola:
+                self._entregar_lote()
+                await asyncio.sleep(0)
+
+    def _entregar_lote(self):
+        retraso = metrics.duracion("websocket_despacho_retraso")
+        for _ in range(min(len(self._cola), self.tamano_lote)):
+            instante, evento, client_types = self._cola.popleft()
+            retraso.registrar(time.monotonic() - instante)
+            self._entregar(evento, client_types)
+        metrics.medidor("websocket_despacho_pendientes").establecer(len(self._cola))
 
-# Crear la instancia del administrador de conexiones
+    def _entregar(self, evento: EventoWebSocket, client_types: Sequence[str]):
+        pedido_id = evento.datos.get("pedido_id")
+        if self.ventana_agrupacion > 0 and self._loop is not None and pedido_id is not None:
+            if evento.tipo in TIPOS_AGRUPABLES:
+                self._agrupar(evento, client_types, pedido_id)
+                return
+            # Un evento no agrupable del pedido (p. ej. pedido_eliminado) no adelanta a sus cambios pendientes
+            for clave in [clave for clave in self._ventanas if clave[1] == pedido_id]:
+                self._cerrar_ventana(clave)
+        self._difundir(evento, client_types)
+
+    def _difundir(self, evento: EventoWebSocket, client_types: Sequence[str]):
+        try:
+            self.gestor.difundir(evento, client_types)
+        except Exception:
+            # Un evento que no se puede entregar no debe detener al consumidor
+            logger.exception(f"Error al difundir el evento {evento.tipo}")
+
+    def _agrupar(self, evento: EventoWebSocket, client_types: Sequence[str], pedido_id: Any):
+        """Añadir un cambio a la ventana de su pedido y aplazar su cierre sin superar la latencia máxima"""
+        clave = (tuple(client_types), pedido_id)
+        ahora = self._loop.time()
+        ventana = self._ventanas.get(clave)
+        if ventana is None:
+            ventana = self._ventanas[clave] = _VentanaAgrupacion(ahora)
+        else:
+            ventana.temporizador.cancel()
+        ventana.eventos.append(evento)
+        if ventana.canales is None:
+            ventana.canales = evento.canales
+        elif ventana.canales and evento.canales:
+            ventana.canales = ventana.canales | evento.canales
+        else:
+            ventana.canales = frozenset()
+        cierre = min(ahora + self.ventana_agrupacion, ventana.inicio + self.latencia_maxima_agrupacion)
+        ventana.temporizador = self._loop.call_at(cierre, self._cerrar_ventana, clave)
+
+    def _cerrar_ventana(self, clave: Tuple[Tuple[str, ...], Any]):
+        """Enviar los cambios retenidos en una ventana: uno solo tal cual, varios en una trama de lote"""
+        ventana = self._ventanas.pop(clave, None)
+        if ventana is None:
+            return
+        ventana.temporizador.cancel()
+        client_types, pedido_id = clave
+        if len(ventana.eventos) == 1:
+            evento = ventana.eventos[0]
+        else:
+            evento = EventoWebSocket(
+                {"tipo": "lote_pedido", "pedido_id": pedido_id, "cambios": [e.datos for e in ventana.eventos]},
+                ventana.canales
+            )
+            metrics.contador("websocket_eventos_agrupados").incrementar(len(ventana.eventos))
+        self._difundir(evento, client_types)
+
+# Crear la instancia del administrador de conexiones y su despachador de eventos
 manager = ConnectionManager()
+despachador = DespachadorEventos(manager)
 
 def log_event(message: str, level: str = "info"):
     """
@@ -78,24 +753,36 @@ def log_event(message: str, level: str = "info"):
     # También imprimimos en consola para desarrollo
     print(f"[{timestamp}] {message}")
 
-def safe_broadcast(message: Dict[str, Any], client_type: str):
-    """
-    Envía un mensaje a todos los clientes WebSocket de un tipo específico de manera segura.
-    Funciona en ambos contextos sincrónicos y asincrónicos.
-    """
-    try:
-        # Registrar el evento en logs
-        tipo = message.get("tipo", "desconocido")
-        if tipo == "actualizacion_pedido":
-            log_event(f"Pedido #{message.get('pedido_id')}: cambio a {message.get('estado')} (Mesa: {message.get('mesa')})")
-        elif tipo == "actualizacion_detalle":
-            log_event(f"Detalle #{message.get('detalle_id')} del Pedido #{message.get('pedido_id')}: producto {message.get('producto')} cambió a {message.get('estado')}")
-        elif tipo == "nueva_reserva":
-            log_event(f"Nueva reserva #{message.get('reserva_id')} para {message.get('cliente')} en Mesa {message.get('mesa')}")
-        
-        # Intentar obtener el bucle en ejecución y crear una tarea
-        loop = asyncio.get_running_loop()
-        loop.create_task(manager.broadcast(json.dumps(message), client_type))
-    except RuntimeError:
-        # Si no hay bucle en ejecución, simplemente pasa - estamos en un contexto de prueba o sincrónico
-        pass 
\ No newline at end of file
+def safe_broadcast(
+    message: Union[Dict[str, Any], EventoWebSocket],
+    client_types: Union[str, Sequence[str]],
+    canales: Iterable[str] = ()
+):
+    """
+    Envía un mensaje a los clientes WebSocket de uno o varios tipos de manera segura.
+    El mensaje se codifica una sola vez aunque vaya a varios grupos.
+    - canales: canales del evento (ver crear_canales); los clientes con filtros solo lo reciben
+      si están suscritos a alguno
+    Funciona desde el bucle de eventos y desde los hilos del threadpool: el evento pasa por el
+    despachador, que lo difunde desde el bucle.
+    """
+    evento = message if isinstance(message, EventoWebSocket) else EventoWebSocket(message, canales)
+    grupos = (client_types,) if isinstance(client_types, str) else tuple(client_types)
+    
+    # Registrar el evento en logs
+    datos = evento.datos
+    if evento.tipo == "actualizacion_pedido":
+        log_event(f"Pedido #{datos.get('pedido_id')}: cambio a {datos.get('estado')} (Mesa: {datos.get('mesa')})")
+    elif evento.tipo == "actualizacion_detalle":
+        log_event(f"Detalle #{datos.get('detalle_id')} del Pedido #{datos.get('pedido_id')}: producto {datos.get('producto')} cambió a {datos.get('estado')}")
+    elif evento.tipo == "nueva_reserva":
+        log_event(f"Nueva reserva #{datos.get('reserva_id')} para {datos.get('cliente')} en Mesa {datos.get('mesa')}")
+    
+    despachador.publicar(evento, grupos)
+
+def notificar_procesos(datos: Dict[str, Any]):
+    """
+    Avisar a los demás procesos, por el backplane, de un cambio que invalida su estado en memoria,
+    sin enviarlo a ningún WebSocket. Como safe_broadcast, se puede llamar desde cualquier hilo.
+    """
+    despachador.publicar(EventoWebSocket(datos), ())
@@ -1,14 +1,20 @@
 """
 Configuración de la base de datos.
 """
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from pydantic import TypeAdapter
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 
-from app.core.config import SQLALCHEMY_DATABASE_URL
+from app.core.config import SQLALCHEMY_DATABASE_URL, SQLALCHEMY_ASYNC_DATABASE_URL, DB_ASYNC_MODE
 
 # Crear motor de base de datos
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
+    SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}  # SQLite, solo para desarrollo
 )
 
@@ -24,4 +30,57 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker():
+    """
+    Crear (una sola vez) el motor asíncrono y su fábrica de sesiones.
+    Se crea de forma perezosa para no requerir aiosqlite/asyncpg en modo síncrono.
+    """
+    async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL)
+    return async_sessionmaker(async_engine, autoflush=False)
+
+async def get_async_db():
+    """Dependencia para obtener una sesión asíncrona de base de datos."""
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+# En modo asíncrono, todos los endpoints reciben una AsyncSession
+if DB_ASYNC_MODE:
+    get_db = get_async_db
+
+def abrir_sesion_independiente(db) -> Session:
+    """
+    Abrir una sesión síncrona propia sobre la misma base de datos que la sesión de la petición.
+    Para trabajo que continúa después de que el endpoint devuelva la respuesta (respuestas en
+    streaming): la sesión de get_db se cierra antes de enviar el cuerpo. Quien la abre la cierra.
+    - Con una Session se enlaza al mismo motor o conexión (en los tests, la de la transacción del test).
+    - Con una AsyncSession se usa el motor síncrono, para poder recorrer el resultado desde el threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return SessionLocal()
+    return Session(bind=db.get_bind(), autoflush=False)
+
+@lru_cache(maxsize=None)
+def _get_type_adapter(esquema: Any) -> TypeAdapter:
+    """TypeAdapter cacheado por esquema de respuesta"""
+    return TypeAdapter(esquema)
+
+async def ejecutar_en_sesion(db, funcion: Callable, *args, esquema: Optional[Any] = None, **kwargs):
+    """
+    Ejecuta una función de servicio síncrona sobre la sesión de la petición sin bloquear el bucle de eventos.
+    - Con una Session síncrona se ejecuta en el threadpool de Starlette.
+    - Con una AsyncSession se ejecuta con run_sync (greenlet en el propio bucle, sin hilos).
+    Si se indica un esquema, el resultado se serializa dentro del mismo contexto para que las
+    cargas perezosas de relaciones ocurran allí y no en el bucle de eventos.
+    """
+    def llamar(sesion):
+        resultado = funcion(sesion, *args, **kwargs)
+        if esquema is not None and resultado is not None:
+            return _get_type_adapter(esquema).validate_python(resultado, from_attributes=True)
+        return resultado
+
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(llamar)
+    return await run_in_threadpool(llamar, db)
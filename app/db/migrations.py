@@ -0,0 +1,231 @@
+"""
+Migraciones del esquema de la base de datos.
+
+Base.metadata.create_all solo crea las tablas que no existen, así que los cambios sobre tablas
+ya creadas (índices, columnas, datos) se entregan como migraciones numeradas. La versión aplicada
+se guarda en la tabla schema_version y cada migración se ejecuta una sola vez.
+
+Las migraciones se escriben para SQLite y PostgreSQL: SQL común o construcciones de SQLAlchemy, y
+ramas por dialecto donde hace falta.
+
+Las migraciones se aplican en un paso explícito del despliegue, antes de arrancar los workers, y no
+al importar la aplicación. Aun así, cada migración toma el bloqueo de escritura de la base de datos
+(BEGIN IMMEDIATE en SQLite, un bloqueo consultivo en PostgreSQL) y vuelve a leer schema_version
+dentro de esa transacción, así que dos procesos que migran a la vez no aplican la misma versión dos
+veces. Los rellenos de datos confirman cada lote en su propia transacción para no retener el
+bloqueo durante todo el recorrido; son idempotentes si se interrumpen y se vuelven a ejecutar.
+
+Uso:
+    python -m app.db.migrations
+"""
+import json
+import logging
+from datetime import datetime, UTC
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Clave del bloqueo consultivo de PostgreSQL que serializa las migraciones entre procesos
+CLAVE_BLOQUEO_MIGRACIONES = 7_301_985
+
+# INSERT ... ON CONFLICT por dialecto, para los rellenos que pueden repetirse
+_INSERT_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def _bloquear(conexion: Connection):
+    """
+    Empezar una transacción con el bloqueo de escritura de la base de datos tomado, antes de leer nada.
+    Se libera al confirmar o deshacer la transacción.
+    """
+    dialecto = conexion.dialect.name
+    if dialecto == "sqlite":
+        conexion.exec_driver_sql("BEGIN IMMEDIATE")
+    elif dialecto == "postgresql":
+        conexion.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": CLAVE_BLOQUEO_MIGRACIONES})
+
+def _confirmar_lote(conexion: Connection):
+    """Confirmar el lote de un relleno de datos y seguir con el siguiente en una transacción nueva"""
+    conexion.commit()
+    _bloquear(conexion)
+
+def _m001_indices_filtros(conexion: Connection):
+    """Índices compuestos para las columnas de filtrado de pedidos, reservas y cuentas"""
+    sentencias = [
+        # get_pedidos: listado por fecha y filtros por estado / camarero; comprobaciones por mesa
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_fecha_creacion ON pedidos (fecha_creacion)",
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_estado_fecha_creacion ON pedidos (estado, fecha_creacion)",
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_camarero_fecha_creacion ON pedidos (camarero_id, fecha_creacion)",
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_mesa_estado ON pedidos (mesa_id, estado)",
+        # Carga de las líneas de un pedido y búsqueda por producto en delete_producto
+        "CREATE INDEX IF NOT EXISTS ix_detalles_pedido_pedido_id ON detalles_pedido (pedido_id)",
+        "CREATE INDEX IF NOT EXISTS ix_detalles_pedido_producto_id ON detalles_pedido (producto_id)",
+        # get_reservas y comprobación de conflictos por mesa
+        "CREATE INDEX IF NOT EXISTS ix_reservas_fecha ON reservas (fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_reservas_estado_fecha ON reservas (estado, fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_reservas_mesa_estado_fecha ON reservas (mesa_id, estado, fecha)",
+        # get_cuentas: historial ordenado por fecha de cobro
+        "CREATE INDEX IF NOT EXISTS ix_cuentas_fecha_cobro ON cuentas (fecha_cobro)",
+        "CREATE INDEX IF NOT EXISTS ix_cuentas_camarero_fecha_cobro ON cuentas (camarero_id, fecha_cobro)",
+        "CREATE INDEX IF NOT EXISTS ix_cuentas_mesa_fecha_cobro ON cuentas (mesa_id, fecha_cobro)",
+    ]
+    for sentencia in sentencias:
+        conexion.execute(text(sentencia))
+
+def _m002_indice_resumen_cuentas(conexion: Connection):
+    """Índice que cubre las columnas que agrega el resumen de ingresos"""
+    # get_resumen_cuentas agrupa por día, hora, método de pago y camarero dentro de un rango de
+    # fecha_cobro; con todas las columnas en el índice no se leen las filas (ni el JSON de detalles)
+    conexion.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_cuentas_resumen "
+        "ON cuentas (fecha_cobro, metodo_pago, camarero_id, nombre_camarero, total)"
+    ))
+
+def _m003_agregados_ventas(conexion: Connection):
+    """Crear la tabla de agregados de ingresos y rellenarla desde el historial de cuentas"""
+    from app.models.venta import IngresoAgregado
+    from app.services.venta_service import reconstruir_agregados
+
+    IngresoAgregado.__table__.create(conexion, checkfirst=True)
+    reconstruir_agregados(conexion, TAMANO_LOTE_MIGRACION, lambda: _confirmar_lote(conexion))
+
+# Filas leídas y reescritas por lote en las migraciones de datos
+TAMANO_LOTE_MIGRACION = 1000
+
+def _lotes_detalles_cuentas(conexion: Connection):
+    """
+    Recorrer las cuentas por lotes en orden de id, como listas de (id, detalles guardados), y confirmar
+    cada lote al pedir el siguiente: la memoria usada no depende del tamaño del historial.
+    SQLite devuelve el texto JSON de la columna, que se decodifica aquí; PostgreSQL, el valor ya decodificado.
+    """
+    decodificar = conexion.dialect.name == "sqlite"
+    ultimo_id = 0
+    while True:
+        filas = conexion.execute(
+            text("SELECT id, detalles FROM cuentas WHERE id > :id ORDER BY id LIMIT :lote"),
+            {"id": ultimo_id, "lote": TAMANO_LOTE_MIGRACION}
+        ).all()
+        if not filas:
+            return
+        ultimo_id = filas[-1][0]
+        lote = []
+        for cuenta_id, valor in filas:
+            if decodificar:
+                try:
+                    valor = json.loads(valor) if valor else None
+                except json.JSONDecodeError:
+                    valor = None
+            lote.append((cuenta_id, valor))
+        yield lote
+        _confirmar_lote(conexion)
+
+def _m004_detalles_cuentas_json(conexion: Connection):
+    """
+    Reescribir como JSON nativo los detalles de cuenta guardados como cadena JSON (doble codificación),
+    con los valores por defecto de DetalleCuentaItem en cada línea (normalizar_detalles)
+    """
+    from app.services.cuenta_service import normalizar_detalles
+
+    # Las filas que ya son una lista JSON completa no se tocan
+    for lote in _lotes_detalles_cuentas(conexion):
+        cambios = []
+        for cuenta_id, valor in lote:
+            normalizado = normalizar_detalles(valor)
+            if normalizado != valor:
+                cambios.append({"id": cuenta_id, "detalles": json.dumps(normalizado, ensure_ascii=False)})
+        if cambios:
+            conexion.execute(text("UPDATE cuentas SET detalles = :detalles WHERE id = :id"), cambios)
+
+def _m005_indice_productos_cuentas(conexion: Connection):
+    """Crear el índice inverso cuenta → producto y rellenarlo desde el historial de cuentas"""
+    from app.models.cuenta import CuentaProducto
+    from app.services.cuenta_service import process_detalles_field
+
+    tabla = CuentaProducto.__table__
+    tabla.create(conexion, checkfirst=True)
+    conexion.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_cuentas_productos_producto_id ON cuentas_productos (producto_id)"
+    ))
+    # Las filas que ya están en el índice se ignoran: el relleno se puede repetir si se interrumpe
+    insertar = _INSERT_UPSERT[conexion.dialect.name](tabla).on_conflict_do_nothing()
+    for lote in _lotes_detalles_cuentas(conexion):
+        filas = [
+            {"cuenta_id": cuenta_id, "producto_id": producto_id}
+            for cuenta_id, valor in lote
+            for producto_id in dict.fromkeys(
+                linea.get("producto_id") for linea in process_detalles_field(valor) if isinstance(linea, dict)
+            )
+            if producto_id is not None
+        ]
+        if filas:
+            conexion.execute(insertar, filas)
+
+# Lista ordenada de migraciones: (versión, descripción, función)
+MIGRACIONES: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Índices compuestos para las columnas de filtrado", _m001_indices_filtros),
+    (2, "Índice cubriente para el resumen de ingresos", _m002_indice_resumen_cuentas),
+    (3, "Agregados de ingresos por hora y día", _m003_agregados_ventas),
+    (4, "Detalles de cuenta como JSON nativo", _m004_detalles_cuentas_json),
+    (5, "Índice inverso de productos de las cuentas", _m005_indice_productos_cuentas),
+    # La migración 4 ya normaliza las líneas; se repite para las bases de datos que aplicaron la versión anterior
+    (6, "Valores por defecto en las líneas de las cuentas", _m004_detalles_cuentas_json),
+]
+
+def _asegurar_tabla_version(engine: Engine):
+    with engine.begin() as conexion:
+        conexion.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, "
+            "descripcion VARCHAR NOT NULL, "
+            "fecha_aplicacion TIMESTAMP NOT NULL)"
+        ))
+
+def _leer_version(conexion: Connection) -> int:
+    return conexion.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def get_version_actual(engine: Engine) -> int:
+    """Obtener la última versión de esquema aplicada (0 si no hay ninguna)"""
+    _asegurar_tabla_version(engine)
+    with engine.connect() as conexion:
+        return _leer_version(conexion)
+
+def migraciones_pendientes(engine: Engine) -> List[int]:
+    """Versiones de MIGRACIONES que aún no se han aplicado"""
+    version_actual = get_version_actual(engine)
+    return [version for version, _, _ in MIGRACIONES if version > version_actual]
+
+def aplicar_migraciones(engine: Engine) -> List[int]:
+    """
+    Aplicar las migraciones pendientes en orden.
+    Cada migración empieza con el bloqueo tomado y la versión releída: si otro proceso ya la ha
+    aplicado, se omite. La versión se registra en la misma transacción que el último lote.
+    Devuelve las versiones aplicadas en esta llamada.
+    """
+    _asegurar_tabla_version(engine)
+    aplicadas = []
+    for version, descripcion, migracion in MIGRACIONES:
+        with engine.connect() as conexion:
+            _bloquear(conexion)
+            if _leer_version(conexion) >= version:
+                conexion.rollback()
+                continue
+            migracion(conexion)
+            conexion.execute(
+                text("INSERT INTO schema_version (version, descripcion, fecha_aplicacion) VALUES (:v, :d, :f)"),
+                {"v": version, "d": descripcion, "f": datetime.now(UTC)}
+            )
+            conexion.commit()
+        logger.info(f"Migración {version} aplicada: {descripcion}")
+        aplicadas.append(version)
+    return aplicadas
+
+if __name__ == "__main__":
+    from app.db.database import Base, engine
+    import app.models  # noqa: F401  (registrar todos los modelos)
+
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    aplicadas = aplicar_migraciones(engine)
+    print(f"Migraciones aplicadas: {aplicadas or 'ninguna'} (versión actual: {get_version_actual(engine)})")
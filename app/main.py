@@ -1,6 +1,7 @@
 """
 Main entry point for the application.
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
@@ -8,9 +9,14 @@ import sys
 
 from app.core.config import (
     PROJECT_NAME, DESCRIPTION, VERSION, 
-    ALLOWED_ORIGINS, ALLOWED_METHODS, ALLOWED_HEADERS
+    ALLOWED_ORIGINS, ALLOWED_METHODS, ALLOWED_HEADERS, WS_BACKPLANE, WS_BACKPLANE_DIR
 )
+from app.core.backplane import crear_backplane
+from app.core.usuarios import invalidar_por_evento_remoto as invalidar_usuarios_por_evento_remoto
+from app.core.websockets import despachador, manager
 from app.db.database import engine, Base
+from app.db.migrations import migraciones_pendientes
+from app.services import cocina_service, menu_service
 
 # Configurar logging
 logging.basicConfig(
@@ -26,11 +32,36 @@ logger.debug("Iniciando aplicación")
 # Import all models to ensure they are registered for table creation
 from app.models import *
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arrancar el despachador de eventos WebSocket y conectar el gestor al backplane entre workers,
+    si está configurado. Los eventos de cocina o de pedidos de otros workers invalidan el índice de cocina local,
+    los cambios del menú, el menú en memoria, y los cambios de usuarios, la caché de usuarios autenticados.
+    Las migraciones no se aplican al arrancar (cada worker lo haría a la vez): se avisa si hay pendientes.
+    """
+    pendientes = migraciones_pendientes(engine)
+    if pendientes:
+        logger.warning(
+            f"Migraciones pendientes: {pendientes}. Aplicarlas con 'python -m app.db.migrations' antes de arrancar"
+        )
+    await despachador.iniciar()
+    backplane = crear_backplane(WS_BACKPLANE, WS_BACKPLANE_DIR)
+    if backplane is not None:
+        manager.suscribir_eventos_remotos(cocina_service.invalidar_por_evento_remoto)
+        manager.suscribir_eventos_remotos(menu_service.invalidar_por_evento_remoto)
+        manager.suscribir_eventos_remotos(invalidar_usuarios_por_evento_remoto)
+        await manager.iniciar_backplane(backplane)
+    yield
+    await despachador.detener()
+    await manager.detener_backplane()
+
 # Create FastAPI application
 app = FastAPI(
     title=PROJECT_NAME,
     description=DESCRIPTION,
-    version=VERSION
+    version=VERSION,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -40,6 +71,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=ALLOWED_METHODS,
     allow_headers=ALLOWED_HEADERS,
+    # Cabeceras de respuesta que los clientes del navegador necesitan leer
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Create database tables
@@ -48,7 +81,7 @@ logger.debug("Tablas de base de datos creadas")
 
 # Import and include routers
 from app.api.endpoints import (
-    usuarios, categorias, productos, mesas, pedidos, reservas, cuentas, auth, websockets
+    usuarios, categorias, productos, mesas, pedidos, reservas, cuentas, auth, websockets, metricas, cocina, ventas
 )
 
 app.include_router(auth.router)
@@ -60,6 +93,9 @@ app.include_router(pedidos.router)
 app.include_router(reservas.router)
 app.include_router(cuentas.router)
 app.include_router(websockets.router)
+app.include_router(metricas.router)
+app.include_router(cocina.router)
+app.include_router(ventas.router)
 logger.debug("Routers configurados")
 
 @app.get("/")
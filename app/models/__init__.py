@@ -7,4 +7,5 @@ from app.models.categoria import Categoria
 from app.models.producto import Producto
 from app.models.pedido import Pedido, DetallePedido
 from app.models.reserva import Reserva
-from app.models.cuenta import Cuenta 
\ No newline at end of file
+from app.models.cuenta import Cuenta, CuentaProducto
+from app.models.venta import IngresoAgregado
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 Modelo de Cuenta para la base de datos.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 
@@ -22,15 +22,40 @@ class Cuenta(Base):
     nombre_camarero = Column(String, nullable=False)  # Guardamos el nombre para referencia histórica
     
     # Información temporal
-    fecha_cobro = Column(DateTime, default=datetime.now(UTC), nullable=False)
+    fecha_cobro = Column(DateTime, default=lambda: datetime.now(UTC), nullable=False)
     
     # Información económica
     total = Column(Float, nullable=False)
     metodo_pago = Column(String, nullable=True)
     
-    # Detalle de la cuenta (IDs de pedidos, productos, cantidades, precios)
+    # Detalle de la cuenta (IDs de pedidos, productos, cantidades, precios), como lista JSON nativa
     detalles = Column(JSON, nullable=False)
     
     # Relaciones (opcionales, si la entidad existe)
     mesa = relationship("Mesa", backref="cuentas_historicas")
-    camarero = relationship("Usuario", backref="cuentas_cobradas") 
\ No newline at end of file
+    camarero = relationship("Usuario", backref="cuentas_cobradas")
+    # Índice inverso de los productos de la cuenta (se elimina con ella)
+    productos = relationship("CuentaProducto", cascade="all, delete-orphan")
+    
+    # Índices para el historial de cuentas ordenado por fecha de cobro y para el resumen de ingresos
+    __table_args__ = (
+        Index("ix_cuentas_fecha_cobro", "fecha_cobro"),
+        Index("ix_cuentas_camarero_fecha_cobro", "camarero_id", "fecha_cobro"),
+        Index("ix_cuentas_mesa_fecha_cobro", "mesa_id", "fecha_cobro"),
+        Index("ix_cuentas_resumen", "fecha_cobro", "metodo_pago", "camarero_id", "nombre_camarero", "total"),
+    )
+
+class CuentaProducto(Base):
+    """
+    Índice inverso de las líneas de cada cuenta a sus productos: una fila por producto distinto de la
+    cuenta. Permite localizar las cuentas que contienen un producto sin leer el JSON de todo el historial.
+    """
+    __tablename__ = "cuentas_productos"
+    
+    cuenta_id = Column(Integer, ForeignKey("cuentas.id", ondelete="CASCADE"), primary_key=True)
+    # Sin clave foránea: el producto puede eliminarse y la cuenta conserva su id en el historial
+    producto_id = Column(Integer, primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_cuentas_productos_producto_id", "producto_id"),
+    )
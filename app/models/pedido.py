@@ -1,7 +1,7 @@
 """
 Modelos de Pedido y DetallePedido para la base de datos.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 
@@ -16,8 +16,8 @@ class Pedido(Base):
     mesa_id = Column(Integer, ForeignKey("mesas.id"), nullable=True)
     camarero_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
     estado = Column(String, default=EstadoPedido.RECIBIDO)
-    fecha_creacion = Column(DateTime, default=datetime.now(UTC))
-    fecha_actualizacion = Column(DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    fecha_creacion = Column(DateTime, default=lambda: datetime.now(UTC))
+    fecha_actualizacion = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
     total = Column(Float, default=0)
     observaciones = Column(String, nullable=True)
     
@@ -25,6 +25,14 @@ class Pedido(Base):
     mesa = relationship("Mesa", back_populates="pedidos")
     camarero = relationship("Usuario", back_populates="pedidos")
     detalles = relationship("DetallePedido", back_populates="pedido", cascade="all, delete-orphan")
+    
+    # Índices para los filtros de get_pedidos (ordenados por fecha) y las comprobaciones por mesa
+    __table_args__ = (
+        Index("ix_pedidos_fecha_creacion", "fecha_creacion"),
+        Index("ix_pedidos_estado_fecha_creacion", "estado", "fecha_creacion"),
+        Index("ix_pedidos_camarero_fecha_creacion", "camarero_id", "fecha_creacion"),
+        Index("ix_pedidos_mesa_estado", "mesa_id", "estado"),
+    )
 
 class DetallePedido(Base):
     """Modelo que representa un detalle de línea en un pedido"""
@@ -41,4 +49,9 @@ class DetallePedido(Base):
     
     # Relaciones
     pedido = relationship("Pedido", back_populates="detalles")
-    producto = relationship("Producto", back_populates="detalles_pedido") 
\ No newline at end of file
+    producto = relationship("Producto", back_populates="detalles_pedido")
+    
+    __table_args__ = (
+        Index("ix_detalles_pedido_pedido_id", "pedido_id"),
+        Index("ix_detalles_pedido_producto_id", "producto_id"),
+    ) 
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 Modelo de Reserva para la base de datos.
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 
@@ -23,7 +23,14 @@ class Reserva(Base):
     estado = Column(String, default=EstadoReserva.PENDIENTE)
     mesa_id = Column(Integer, ForeignKey("mesas.id"), nullable=True)
     observaciones = Column(String, nullable=True)
-    fecha_creacion = Column(DateTime, default=datetime.now(UTC))
+    fecha_creacion = Column(DateTime, default=lambda: datetime.now(UTC))
     
     # Relaciones
-    mesa = relationship("Mesa", back_populates="reservas") 
\ No newline at end of file
+    mesa = relationship("Mesa", back_populates="reservas")
+    
+    # Índices para el listado por fecha y la comprobación de conflictos por mesa
+    __table_args__ = (
+        Index("ix_reservas_fecha", "fecha"),
+        Index("ix_reservas_estado_fecha", "estado", "fecha"),
+        Index("ix_reservas_mesa_estado_fecha", "mesa_id", "estado", "fecha"),
+    ) 
\ No newline at end of file
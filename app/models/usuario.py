@@ -20,7 +20,7 @@ class Usuario(Base):
     apellido = Column(String)
     rol = Column(String)
     activo = Column(Boolean, default=True)
-    fecha_creacion = Column(DateTime, default=datetime.now(UTC))
+    fecha_creacion = Column(DateTime, default=lambda: datetime.now(UTC))
     
     # Relaciones
     pedidos = relationship("Pedido", back_populates="camarero") 
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Modelo de los agregados de ingresos para los informes de ventas.
+"""
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
+
+from app.db.database import Base
+
+class IngresoAgregado(Base):
+    """
+    Ingresos acumulados de un periodo (hora o día) para un camarero, una mesa, un producto o un método de pago.
+    Se mantiene de forma incremental al crear, actualizar o eliminar cuentas.
+    """
+    __tablename__ = "ingresos_agregados"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Qué se agrega: DimensionVentas y GranularidadVentas
+    dimension = Column(String, nullable=False)
+    granularidad = Column(String, nullable=False)
+
+    # Inicio de la hora o del día (UTC)
+    periodo = Column(DateTime, nullable=False)
+
+    # Identificador dentro de la dimensión (id del camarero o del producto, número de mesa, método de pago)
+    # y nombre legible guardado para referencia histórica
+    clave = Column(String, nullable=False)
+    nombre = Column(String, nullable=False)
+
+    # Cuentas en las que aparece, unidades vendidas e ingresos
+    cuentas = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0)
+
+    # Clave única de cada agregado (los incrementos se aplican con upsert) y consultas por rango de periodo
+    __table_args__ = (
+        Index("ux_ingresos_agregados_periodo_clave", "dimension", "granularidad", "periodo", "clave", unique=True),
+    )
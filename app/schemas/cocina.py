@@ -0,0 +1,20 @@
+"""
+Esquemas Pydantic para la vista de cocina.
+"""
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.schemas.mesa import MesaResponse
+from app.schemas.pedido import PedidoResponse, DetallePedidoDetallado
+
+class PedidoCocina(PedidoResponse):
+    """Pedido activo tal como lo ve la cocina: con su mesa y sus líneas"""
+    mesa: Optional[MesaResponse] = None
+    detalles: List[DetallePedidoDetallado]
+
+    model_config = {"from_attributes": True}
+
+class SnapshotCocina(BaseModel):
+    """Instantánea de todos los pedidos activos (recibido, en preparación o listo)"""
+    version: int
+    pedidos: List[PedidoCocina]
@@ -16,6 +16,7 @@ class DetalleCuentaItem(BaseModel):
     subtotal: float
     observaciones: Optional[str] = None
     producto_eliminado: Optional[bool] = False
+    nombre_producto_original: Optional[str] = None
 
 class CuentaBase(BaseModel):
     """Esquema base para datos de cuenta"""
@@ -0,0 +1,30 @@
+"""
+Esquemas Pydantic para los informes de ventas.
+"""
+from datetime import datetime
+from pydantic import BaseModel, field_validator
+
+class IngresoAgregadoResponse(BaseModel):
+    """Ingresos de un periodo (hora o día) para una clave de la dimensión"""
+    periodo: datetime
+    clave: str
+    nombre: str
+    cuentas: int
+    unidades: int
+    total: float
+
+    model_config = {"from_attributes": True}
+
+    @field_validator('total')
+    def redondear_total(cls, v):
+        """Los incrementos se acumulan en coma flotante: redondear a céntimos"""
+        return round(v, 2)
+
+class TotalVentasResponse(BaseModel):
+    """Ingresos acumulados de una clave de la dimensión en todo el periodo consultado"""
+    clave: str
+    nombre: str
+    cuentas: int
+    unidades: int
+    total: float
+    promedio: float
@@ -1,16 +1,25 @@
 """
 Servicio para operaciones de autenticación.
 """
+import time
 from datetime import timedelta
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.models.usuario import Usuario
-from app.api.dependencies.auth import crear_token_acceso
-from app.core.security import verificar_password
+from app.core import metrics
+from app.core.security import crear_token_acceso, verificar_password, verificar_password_async
+from app.db.database import ejecutar_en_sesion
 from app.services.usuario_service import get_usuario_by_username
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
 
+def _credenciales_incorrectas() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Nombre de usuario o contraseña incorrectos",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def authenticate_user(db: Session, username: str, password: str) -> Usuario:
     """
     Autentica a un usuario verificando nombre de usuario y contraseña.
@@ -19,18 +28,10 @@ def authenticate_user(db: Session, username: str, password: str) -> Usuario:
     """
     user = get_usuario_by_username(db, username)
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Nombre de usuario o contraseña incorrectos",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credenciales_incorrectas()
     
     if not verificar_password(password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Nombre de usuario o contraseña incorrectos",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credenciales_incorrectas()
     
     if not user.activo:
         raise HTTPException(
@@ -40,6 +41,38 @@ def authenticate_user(db: Session, username: str, password: str) -> Usuario:
     
     return user
 
+async def authenticate_user_async(db: Session, username: str, password: str) -> Usuario:
+    """
+    Variante de authenticate_user para los endpoints asíncronos.
+    La consulta va por la sesión (threadpool o AsyncSession) y bcrypt se ejecuta en su
+    pool acotado, de modo que una ráfaga de logins no bloquea el bucle de eventos.
+    Registra las métricas de login (intentos, éxitos, fallos, tasa y duración).
+    """
+    metrics.contador("login_intentos").incrementar()
+    metrics.tasa("login_por_minuto").registrar()
+    inicio = time.perf_counter()
+    try:
+        user = await ejecutar_en_sesion(db, get_usuario_by_username, username)
+        if not user:
+            raise _credenciales_incorrectas()
+
+        if not await verificar_password_async(password, user.hashed_password):
+            raise _credenciales_incorrectas()
+
+        if not user.activo:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Usuario inactivo"
+            )
+    except HTTPException:
+        metrics.contador("login_fallidos").incrementar()
+        raise
+    finally:
+        metrics.duracion("login_duracion").registrar(time.perf_counter() - inicio)
+
+    metrics.contador("login_exitosos").incrementar()
+    return user
+
 def create_access_token(username: str, rol: str, expires_delta: timedelta = None) -> str:
     """
     Crea un nuevo token de acceso JWT para el usuario autenticado.
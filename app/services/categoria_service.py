@@ -8,6 +8,8 @@ from sqlalchemy.orm import Session
 from app.models.categoria import Categoria
 from app.models.producto import Producto
 from app.schemas.categoria import CategoriaCreate, CategoriaUpdate
+from app.core.menu import menu
+from app.core.websockets import notificar_procesos
 
 def get_categorias(db: Session, skip: int = 0, limit: int = 100) -> List[Categoria]:
     """Obtener todas las categorías con paginación"""
@@ -36,6 +38,8 @@ def create_categoria(db: Session, categoria: CategoriaCreate) -> Categoria:
     db.add(db_categoria)
     db.commit()
     db.refresh(db_categoria)
+    menu.invalidar()
+    notificar_procesos({"tipo": "actualizacion_menu", "accion": "crear_categoria", "categoria_id": db_categoria.id})
     return db_categoria
 
 def update_categoria(db: Session, categoria_id: int, categoria: CategoriaUpdate) -> Categoria:
@@ -58,6 +62,8 @@ def update_categoria(db: Session, categoria_id: int, categoria: CategoriaUpdate)
     
     db.commit()
     db.refresh(db_categoria)
+    menu.invalidar()
+    notificar_procesos({"tipo": "actualizacion_menu", "accion": "actualizar_categoria", "categoria_id": db_categoria.id})
     return db_categoria
 
 def delete_categoria(db: Session, categoria_id: int) -> None:
@@ -76,4 +82,6 @@ def delete_categoria(db: Session, categoria_id: int) -> None:
         )
     
     db.delete(db_categoria)
-    db.commit() 
\ No newline at end of file
+    db.commit()
+    menu.invalidar()
+    notificar_procesos({"tipo": "actualizacion_menu", "accion": "eliminar_categoria", "categoria_id": categoria_id}) 
\ No newline at end of file
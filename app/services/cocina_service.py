@@ -0,0 +1,37 @@
+"""
+Servicio para la vista de cocina.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+from sqlalchemy.orm import Session
+
+from app.models.pedido import Pedido
+from app.core.cocina import indice_cocina, ESTADOS_ACTIVOS
+from app.services.pedido_service import opciones_carga_pedido
+
+def get_pedidos_activos(db: Session) -> List[Pedido]:
+    """Obtener todos los pedidos activos con su mesa, líneas y productos"""
+    return (
+        db.query(Pedido)
+        .options(*opciones_carga_pedido("selectin"))
+        .filter(Pedido.estado.in_(ESTADOS_ACTIVOS))
+        .all()
+    )
+
+def get_snapshot(db: Session) -> Tuple[bytes, str]:
+    """
+    Obtener la instantánea de cocina (cuerpo JSON y ETag).
+    Solo consulta la base de datos si el índice aún no está cargado o fue invalidado.
+    """
+    if not indice_cocina.cargado:
+        version = indice_cocina.version
+        indice_cocina.cargar(get_pedidos_activos(db), version)
+    return indice_cocina.snapshot()
+
+def invalidar_por_evento_remoto(datos: Dict[str, Any], client_types: Sequence[str]):
+    """
+    Invalidar el índice de cocina cuando llega de otro proceso (por el backplane) un evento para la
+    cocina o de un pedido, vaya al grupo que vaya (los cambios de un cocinero solo se avisan a los
+    camareros): el pedido ha cambiado en otro worker y este índice ya no lo refleja.
+    """
+    if "cocina" in client_types or datos.get("pedido_id") is not None:
+        indice_cocina.invalidar()
@@ -1,20 +1,45 @@
 """
 Servicio para operaciones de Cuenta.
 """
-from typing import List, Optional, Dict, Any
+from typing import Iterable, Iterator, List, Optional, Dict, Any, Tuple
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import Text, func, select, type_coerce
 from datetime import datetime, UTC, timedelta
+import csv
+import io
 import json
 
-from app.models.cuenta import Cuenta
+from app.models.cuenta import Cuenta, CuentaProducto
 from app.models.mesa import Mesa
 from app.models.usuario import Usuario
 from app.models.pedido import Pedido, DetallePedido
 from app.models.producto import Producto
-from app.schemas.cuenta import CuentaCreate, CuentaUpdate
-from app.core.enums import RolUsuario
+from app.schemas.cuenta import CuentaCreate, CuentaUpdate, DetalleCuentaItem
+from app.core.enums import EstadoPedido, FormatoExportacion, RolUsuario
+from app.services.venta_service import aplicar_contribuciones, contribuciones_cuenta
+from app.core.paginacion import paginar, siguiente_cursor
+
+# Clave de ordenación de los listados: más recientes primero, desempate por id
+CLAVE_PAGINACION = (Cuenta.fecha_cobro, Cuenta.id)
+
+# Listado y exportación: columnas de cada cuenta (detalles al final, como texto JSON) y campos de cada
+# producto al desglosar
+TAMANO_LOTE_EXPORTACION = 1000
+COLUMNAS_EXPORTACION = (
+    Cuenta.id, Cuenta.mesa_id, Cuenta.numero_mesa, Cuenta.camarero_id, Cuenta.nombre_camarero,
+    Cuenta.fecha_cobro, Cuenta.total, Cuenta.metodo_pago,
+    type_coerce(Cuenta.detalles, Text).label("detalles")
+)
+POSICION_FECHA_EXPORTACION = [columna.key for columna in COLUMNAS_EXPORTACION].index("fecha_cobro")
+CAMPOS_DETALLE_EXPORTACION = list(DetalleCuentaItem.model_fields)
+
+# Columnas de cada línea al generar la cuenta de una mesa, con los nombres de DetalleCuentaItem
+COLUMNAS_LINEA_CUENTA = (
+    Pedido.id.label("pedido_id"), Producto.id.label("producto_id"), Producto.nombre.label("nombre_producto"),
+    DetallePedido.cantidad, DetallePedido.precio_unitario, DetallePedido.subtotal, DetallePedido.observaciones
+)
+CAMPOS_LINEA_CUENTA = [columna.key for columna in COLUMNAS_LINEA_CUENTA]
 
 def get_cuentas(
     db: Session, 
@@ -24,39 +49,142 @@ def get_cuentas(
     fecha_fin: Optional[datetime] = None,
     mesa_id: Optional[int] = None,
     camarero_id: Optional[int] = None,
-    current_user: Usuario = None
+    current_user: Usuario = None,
+    cursor: Optional[str] = None
 ) -> List[Cuenta]:
-    """Obtener cuentas con filtros opcionales"""
+    """Obtener cuentas con filtros opcionales, paginadas por offset o por cursor sobre (fecha_cobro, id)"""
+    query = db.query(Cuenta).filter(
+        *_filtros_cuentas(fecha_inicio, fecha_fin, mesa_id, camarero_id, current_user)
+    )
+    
+    # Ordenar por fecha de cobro (últimos primero)
+    return paginar(query, CLAVE_PAGINACION, skip, limit, cursor).all()
+
+def listar_cuentas_json(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    mesa_id: Optional[int] = None,
+    camarero_id: Optional[int] = None,
+    current_user: Usuario = None,
+    cursor: Optional[str] = None
+) -> Tuple[str, Optional[str]]:
+    """
+    Página de cuentas de get_cuentas ya serializada como array JSON, para GET /cuentas/.
+    La lista de productos de cada cuenta se guarda como JSON nativo y se copia como texto en la
+    respuesta, sin decodificarla ni validarla fila a fila.
+    Devuelve el cuerpo y el cursor de la página siguiente (None si no hay más resultados).
+    """
+    query = db.query(*COLUMNAS_EXPORTACION).filter(
+        *_filtros_cuentas(fecha_inicio, fecha_fin, mesa_id, camarero_id, current_user)
+    )
+    filas = paginar(query, CLAVE_PAGINACION, skip, limit, cursor).all()
+    
+    campos = [columna.key for columna in COLUMNAS_EXPORTACION[:-1]]
+    cuentas = []
+    for *cuenta, detalles in filas:
+        cuenta[POSICION_FECHA_EXPORTACION] = cuenta[POSICION_FECHA_EXPORTACION].isoformat()
+        linea = json.dumps(dict(zip(campos, cuenta)), ensure_ascii=False)
+        cuentas.append(f'{linea[:-1]}, "detalles": {_detalles_en_texto(detalles)}}}')
+    return f"[{', '.join(cuentas)}]", siguiente_cursor(filas, CLAVE_PAGINACION, limit)
+
+def _filtros_cuentas(
+    fecha_inicio: Optional[datetime],
+    fecha_fin: Optional[datetime],
+    mesa_id: Optional[int],
+    camarero_id: Optional[int],
+    current_user: Usuario
+) -> list:
+    """Filtros de los listados de cuentas; los camareros solo ven sus propias cuentas"""
     # Verificar permisos - solo administradores pueden ver todas las cuentas
     if current_user.rol != RolUsuario.ADMIN:
         # Si no es admin, solo puede ver sus propias cuentas
         camarero_id = current_user.id
     
-    query = db.query(Cuenta)
-    
-    # Aplicar filtros
+    filtros = []
     if fecha_inicio is not None:
-        query = query.filter(Cuenta.fecha_cobro >= fecha_inicio)
-    
+        filtros.append(Cuenta.fecha_cobro >= fecha_inicio)
     if fecha_fin is not None:
-        query = query.filter(Cuenta.fecha_cobro <= fecha_fin)
-    
+        filtros.append(Cuenta.fecha_cobro <= fecha_fin)
     if mesa_id is not None:
-        query = query.filter(Cuenta.mesa_id == mesa_id)
-    
+        filtros.append(Cuenta.mesa_id == mesa_id)
     if camarero_id is not None:
-        query = query.filter(Cuenta.camarero_id == camarero_id)
-    
-    # Ordenar por fecha de cobro (últimos primero)
-    query = query.order_by(desc(Cuenta.fecha_cobro))
-    
-    cuentas = query.offset(skip).limit(limit).all()
-    
-    # Procesar el campo detalles para cada cuenta
-    for cuenta in cuentas:
-        cuenta.detalles = process_detalles_field(cuenta.detalles)
-    
-    return cuentas
+        filtros.append(Cuenta.camarero_id == camarero_id)
+    return filtros
+
+def exportar_cuentas(
+    db: Session,
+    formato: FormatoExportacion = FormatoExportacion.NDJSON,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    mesa_id: Optional[int] = None,
+    camarero_id: Optional[int] = None,
+    desglosar: bool = False,
+    current_user: Usuario = None,
+    tamano_lote: int = TAMANO_LOTE_EXPORTACION
+) -> Iterator[str]:
+    """
+    Exportar el historial de cuentas en NDJSON o CSV, de la más antigua a la más reciente.
+    Los permisos y filtros se aplican al llamarla; devuelve un generador que recorre el resultado
+    con yield_per (cursor del servidor) y produce un trozo de texto por lote, así que la memoria
+    usada depende del tamaño del lote y no del rango de fechas.
+    - desglosar: una línea por producto de la cuenta en lugar de una por cuenta
+    """
+    sentencia = (
+        select(*COLUMNAS_EXPORTACION)
+        .where(*_filtros_cuentas(fecha_inicio, fecha_fin, mesa_id, camarero_id, current_user))
+        .order_by(Cuenta.fecha_cobro, Cuenta.id)
+        .execution_options(yield_per=tamano_lote)
+    )
+    return _generar_exportacion(db, sentencia, formato, desglosar)
+
+def _detalles_en_texto(texto: Optional[str]) -> str:
+    """
+    Texto JSON de la lista de productos de una cuenta tal como está guardado, sin decodificarlo.
+    Solo se normaliza si no es una lista (p. ej. una cuenta guardada como cadena JSON antes de la migración 4).
+    """
+    if texto and texto.lstrip().startswith("["):
+        return texto
+    return json.dumps(normalizar_detalles(json.loads(texto) if texto else None), ensure_ascii=False)
+
+def _generar_exportacion(db: Session, sentencia, formato: FormatoExportacion, desglosar: bool) -> Iterator[str]:
+    campos = [columna.key for columna in COLUMNAS_EXPORTACION[:-1]]
+    buffer = io.StringIO()
+
+    if formato == FormatoExportacion.CSV:
+        escritor = csv.writer(buffer, lineterminator="\n")
+        escritor.writerow(campos + (CAMPOS_DETALLE_EXPORTACION if desglosar else ["detalles"]))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    for lote in db.execute(sentencia).partitions():
+        for *cuenta, detalles in lote:
+            cuenta[POSICION_FECHA_EXPORTACION] = cuenta[POSICION_FECHA_EXPORTACION].isoformat()
+
+            if not desglosar:
+                # La lista de productos se copia como texto JSON, sin decodificarla y volver a codificarla
+                detalles = _detalles_en_texto(detalles)
+                if formato == FormatoExportacion.CSV:
+                    escritor.writerow(cuenta + [detalles])
+                else:
+                    linea = json.dumps(dict(zip(campos, cuenta)), ensure_ascii=False)
+                    buffer.write(f'{linea[:-1]}, "detalles": {detalles}}}\n')
+                continue
+
+            # Las cuentas sin productos se exportan igualmente, con los campos del producto vacíos
+            for item in json.loads(_detalles_en_texto(detalles)) or [{}]:
+                valores = cuenta + [item.get(campo) for campo in CAMPOS_DETALLE_EXPORTACION]
+                if formato == FormatoExportacion.CSV:
+                    escritor.writerow(valores)
+                else:
+                    fila = dict(zip(campos + CAMPOS_DETALLE_EXPORTACION, valores))
+                    buffer.write(json.dumps(fila, ensure_ascii=False) + "\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
 
 def get_cuenta_by_id(db: Session, cuenta_id: int, current_user: Usuario = None) -> Cuenta:
     """Obtener una cuenta específica por ID"""
@@ -71,9 +199,6 @@ def get_cuenta_by_id(db: Session, cuenta_id: int, current_user: Usuario = None)
             detail="No tiene permisos para ver esta cuenta"
         )
     
-    # Procesar el campo detalles
-    cuenta.detalles = process_detalles_field(cuenta.detalles)
-    
     return cuenta
 
 def process_detalles_field(detalles_field):
@@ -110,6 +235,26 @@ def process_detalles_field(detalles_field):
     # Por defecto, devolver lista vacía
     return []
 
+# Valores por defecto de los campos opcionales de una línea de cuenta
+VALORES_POR_DEFECTO_DETALLE = {
+    nombre: campo.default for nombre, campo in DetalleCuentaItem.model_fields.items() if not campo.is_required()
+}
+
+def normalizar_detalles(detalles_field) -> List[Any]:
+    """
+    Lista de productos de una cuenta tal como se guarda: un array JSON cuyas líneas tienen todos los
+    campos de DetalleCuentaItem, con sus valores por defecto. Así GET /cuentas/ puede copiar el texto
+    guardado y devolver lo mismo que GET /cuentas/{id}.
+    """
+    return [
+        {**VALORES_POR_DEFECTO_DETALLE, **detalle} if isinstance(detalle, dict) else detalle
+        for detalle in process_detalles_field(detalles_field)
+    ]
+
+def indice_productos(producto_ids: Iterable[int]) -> List[CuentaProducto]:
+    """Filas del índice inverso cuenta → producto para los productos de una cuenta, sin repetir"""
+    return [CuentaProducto(producto_id=producto_id) for producto_id in dict.fromkeys(producto_ids)]
+
 def create_cuenta(
     db: Session,
     cuenta: CuentaCreate,
@@ -128,9 +273,6 @@ def create_cuenta(
         if mesa is None:
             raise HTTPException(status_code=404, detail="Mesa no encontrada")
     
-    # Convertir lista de detalles a JSON
-    detalles_json = json.dumps([item.model_dump() for item in cuenta.detalles])
-    
     # Crear la nueva cuenta
     db_cuenta = Cuenta(
         mesa_id=cuenta.mesa_id,
@@ -139,16 +281,19 @@ def create_cuenta(
         nombre_camarero=cuenta.nombre_camarero,
         total=cuenta.total,
         metodo_pago=cuenta.metodo_pago,
-        detalles=detalles_json
+        detalles=normalizar_detalles([item.model_dump() for item in cuenta.detalles]),
+        productos=indice_productos(item.producto_id for item in cuenta.detalles)
     )
     
     db.add(db_cuenta)
+    db.flush()
+    
+    # Sumar la cuenta a los agregados de ventas en la misma transacción
+    aplicar_contribuciones(db, contribuciones_cuenta(db_cuenta))
+    
     db.commit()
     db.refresh(db_cuenta)
     
-    # Deserializar detalles antes de devolver
-    db_cuenta.detalles = process_detalles_field(db_cuenta.detalles)
-    
     return db_cuenta
 
 def update_cuenta(
@@ -159,26 +304,52 @@ def update_cuenta(
 ) -> Cuenta:
     """Actualizar una cuenta existente"""
     db_cuenta = get_cuenta_by_id(db, cuenta_id, current_user)
+    anteriores = contribuciones_cuenta(db_cuenta)
     
     # Solo se permite actualizar el método de pago
     if cuenta_update.metodo_pago is not None:
         db_cuenta.metodo_pago = cuenta_update.metodo_pago
     
+    # Mover la cuenta entre los agregados afectados por el cambio
+    aplicar_contribuciones(db, contribuciones_cuenta(db_cuenta), anteriores)
+    
     db.commit()
     db.refresh(db_cuenta)
     
-    # Deserializar detalles antes de devolver
-    db_cuenta.detalles = process_detalles_field(db_cuenta.detalles)
-    
     return db_cuenta
 
+def _estadisticas(total: float, cuentas: int) -> Dict[str, Any]:
+    """Total, número de cuentas y promedio de un grupo"""
+    return {
+        "total": round(total, 2),
+        "cuentas": cuentas,
+        "promedio": round(total / cuentas, 2) if cuentas > 0 else 0
+    }
+
+def _acumular(grupos: Dict[Any, list], clave: Any, cuentas: int, total: float):
+    """Sumar número de cuentas y total a un grupo del desglose"""
+    grupo = grupos.setdefault(clave, [0, 0.0])
+    grupo[0] += cuentas
+    grupo[1] += total
+
+# Día (AAAA-MM-DD) y hora (HH) de una fecha como texto, por dialecto (strftime solo existe en SQLite)
+_DIA_Y_HORA = {
+    "sqlite": lambda fecha: (func.strftime("%Y-%m-%d", fecha), func.strftime("%H", fecha)),
+    "postgresql": lambda fecha: (func.to_char(fecha, "YYYY-MM-DD"), func.to_char(fecha, "HH24")),
+}
+
 def get_resumen_cuentas(
     db: Session,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
     current_user: Usuario = None
 ) -> Dict[str, Any]:
-    """Obtener resumen de ingresos en un período"""
+    """
+    Obtener resumen de ingresos en un período.
+    La base de datos agrega con SUM/COUNT/GROUP BY por día, hora, método de pago y camarero en una
+    sola pasada sobre el índice ix_cuentas_resumen; solo viajan las filas agregadas, así que la
+    memoria usada no depende del número de cuentas del período.
+    """
     # Verificar permisos - solo administradores pueden ver el resumen
     if current_user.rol != RolUsuario.ADMIN:
         raise HTTPException(
@@ -194,52 +365,58 @@ def get_resumen_cuentas(
     if fecha_fin is None:
         fecha_fin = datetime.now(UTC)
     
-    # Query base
-    query = db.query(Cuenta).filter(
-        Cuenta.fecha_cobro >= fecha_inicio,
-        Cuenta.fecha_cobro <= fecha_fin
+    dia, hora = _DIA_Y_HORA[db.get_bind().dialect.name](Cuenta.fecha_cobro)
+    claves = (dia, hora, Cuenta.metodo_pago, Cuenta.camarero_id, Cuenta.nombre_camarero)
+    filas = (
+        db.query(*claves, func.count(Cuenta.id), func.sum(Cuenta.total))
+        .filter(Cuenta.fecha_cobro >= fecha_inicio, Cuenta.fecha_cobro <= fecha_fin)
+        .group_by(*claves)
+        .order_by(*claves)
     )
     
-    # Calcular total de ingresos
-    total_ingresos = sum(cuenta.total for cuenta in query.all())
-    
-    # Contar cuentas
-    total_cuentas = query.count()
-    
-    # Obtener promedio por cuenta
-    promedio_por_cuenta = total_ingresos / total_cuentas if total_cuentas > 0 else 0
-    
-    # Agrupar por camarero para ver rendimiento
-    ingresos_por_camarero = {}
-    for cuenta in query.all():
-        if cuenta.nombre_camarero in ingresos_por_camarero:
-            ingresos_por_camarero[cuenta.nombre_camarero]["total"] += cuenta.total
-            ingresos_por_camarero[cuenta.nombre_camarero]["cuentas"] += 1
-        else:
-            ingresos_por_camarero[cuenta.nombre_camarero] = {
-                "total": cuenta.total,
-                "cuentas": 1
-            }
+    # Cada desglose se obtiene sumando los grupos de la consulta
+    por_dia, por_hora, por_metodo, por_camarero = {}, {}, {}, {}
+    ids_camarero = {}
+    for dia_cobro, hora_cobro, metodo_pago, camarero_id, nombre_camarero, cuentas, total in filas:
+        _acumular(por_dia, dia_cobro, cuentas, total)
+        _acumular(por_hora, hora_cobro, cuentas, total)
+        _acumular(por_metodo, metodo_pago or "sin_especificar", cuentas, total)
+        # Las cuentas de camareros eliminados (id nulo) se suman bajo su nombre histórico
+        _acumular(por_camarero, nombre_camarero, cuentas, total)
+        ids_camarero[nombre_camarero] = ids_camarero.get(nombre_camarero) or camarero_id
     
-    # Calcular promedios por camarero
-    for camarero, datos in ingresos_por_camarero.items():
-        datos["promedio"] = datos["total"] / datos["cuentas"]
+    total_cuentas = sum(cuentas for cuentas, _ in por_dia.values())
+    total_ingresos = sum(total for _, total in por_dia.values())
     
     return {
         "fecha_inicio": fecha_inicio,
         "fecha_fin": fecha_fin,
-        "total_ingresos": total_ingresos,
+        "total_ingresos": round(total_ingresos, 2),
         "total_cuentas": total_cuentas,
-        "promedio_por_cuenta": promedio_por_cuenta,
-        "ingresos_por_camarero": ingresos_por_camarero
+        "promedio_por_cuenta": round(total_ingresos / total_cuentas, 2) if total_cuentas > 0 else 0,
+        # Agrupar por camarero para ver rendimiento
+        "ingresos_por_camarero": {
+            nombre: {"camarero_id": ids_camarero[nombre], **_estadisticas(total, cuentas)}
+            for nombre, (cuentas, total) in por_camarero.items()
+        },
+        "ingresos_por_dia": {clave: _estadisticas(t, c) for clave, (c, t) in por_dia.items()},
+        # Hora del día (00-23), para detectar las horas punta
+        "ingresos_por_hora": {clave: _estadisticas(t, c) for clave, (c, t) in sorted(por_hora.items())},
+        "ingresos_por_metodo_pago": {clave: _estadisticas(t, c) for clave, (c, t) in por_metodo.items()}
     }
 
 def generar_cuenta_desde_pedidos(
     db: Session,
     mesa_id: int,
-    camarero_id: int
+    camarero_id: int,
+    agrupar: bool = False
 ) -> Dict[str, Any]:
-    """Generar datos para una cuenta a partir de los pedidos de una mesa"""
+    """
+    Generar datos para una cuenta a partir de los pedidos de una mesa.
+    Las líneas salen de una sola consulta sobre pedidos ⨝ detalles_pedido ⨝ productos que se recorre
+    fila a fila, así que el número de consultas no depende de cuántos pedidos o líneas tenga la mesa.
+    - agrupar: sumar en una línea las unidades del mismo producto al mismo precio
+    """
     try:
         # Verificar que la mesa existe
         mesa = db.query(Mesa).filter(Mesa.id == mesa_id).first()
@@ -251,49 +428,11 @@ def generar_cuenta_desde_pedidos(
         if camarero is None:
             raise HTTPException(status_code=404, detail="Camarero no encontrado")
         
-        # Obtener todos los pedidos activos de la mesa
-        pedidos = db.query(Pedido).filter(
-            Pedido.mesa_id == mesa_id,
-            Pedido.estado != "cancelado"
-        ).all()
-        
-        # Calcular total y preparar detalles
-        total = 0
-        detalles = []
+        detalles = lineas_cuenta_mesa(db, mesa_id, agrupar)
         
-        # Si no hay pedidos, devolver una cuenta vacía pero válida
-        if not pedidos:
+        # Si no hay pedidos, la cuenta queda vacía pero válida
+        if not detalles:
             print(f"No hay pedidos activos para la mesa {mesa_id}")
-            datos_cuenta = {
-                "mesa_id": mesa_id,
-                "numero_mesa": mesa.numero,
-                "camarero_id": camarero_id,
-                "nombre_camarero": f"{camarero.nombre} {camarero.apellido}",
-                "total": 0,
-                "detalles": []
-            }
-            return datos_cuenta
-        
-        for pedido in pedidos:
-            # Verificar que el pedido tenga detalles
-            if not pedido.detalles:
-                continue
-                
-            # Obtener detalles del pedido
-            for detalle in pedido.detalles:
-                producto = db.query(Producto).filter(Producto.id == detalle.producto_id).first()
-                if producto:
-                    item = {
-                        "pedido_id": pedido.id,
-                        "producto_id": producto.id,
-                        "nombre_producto": producto.nombre,
-                        "cantidad": detalle.cantidad,
-                        "precio_unitario": detalle.precio_unitario,
-                        "subtotal": detalle.subtotal,
-                        "observaciones": detalle.observaciones
-                    }
-                    detalles.append(item)
-                    total += detalle.subtotal
         
         # Preparar datos para la cuenta
         datos_cuenta = {
@@ -301,7 +440,7 @@ def generar_cuenta_desde_pedidos(
             "numero_mesa": mesa.numero,
             "camarero_id": camarero_id,
             "nombre_camarero": f"{camarero.nombre} {camarero.apellido}",
-            "total": total,
+            "total": sum(item["subtotal"] for item in detalles),
             "detalles": detalles
         }
         
@@ -319,6 +458,43 @@ def generar_cuenta_desde_pedidos(
             "detalles": []
         }
 
+def lineas_cuenta_mesa(db: Session, mesa_id: int, agrupar: bool = False) -> List[Dict[str, Any]]:
+    """
+    Líneas de la cuenta de todos los pedidos activos de la mesa, en el orden en que se pidieron,
+    con los campos de DetalleCuentaItem. Una sola consulta, recorrida fila a fila.
+    """
+    filas = db.execute(
+        select(*COLUMNAS_LINEA_CUENTA)
+        .join(DetallePedido, DetallePedido.pedido_id == Pedido.id)
+        .join(Producto, Producto.id == DetallePedido.producto_id)
+        .where(Pedido.mesa_id == mesa_id, Pedido.estado != EstadoPedido.CANCELADO)
+        .order_by(Pedido.id, DetallePedido.id)
+    )
+    if agrupar:
+        return _agrupar_lineas(filas)
+    return [dict(zip(CAMPOS_LINEA_CUENTA, fila)) for fila in filas]
+
+def _agrupar_lineas(filas) -> List[Dict[str, Any]]:
+    """
+    Sumar cantidades y subtotales de las líneas del mismo producto y precio unitario (un cambio de
+    precio entre rondas deja líneas separadas). Cada línea agrupada conserva el pedido donde apareció
+    el producto por primera vez y las observaciones distintas, separadas por "; ".
+    """
+    lineas: Dict[tuple, Dict[str, Any]] = {}
+    for fila in filas:
+        item = dict(zip(CAMPOS_LINEA_CUENTA, fila))
+        clave = (item["producto_id"], item["precio_unitario"])
+        linea = lineas.get(clave)
+        if linea is None:
+            lineas[clave] = item
+            continue
+        linea["cantidad"] += item["cantidad"]
+        linea["subtotal"] += item["subtotal"]
+        observaciones = item["observaciones"]
+        if observaciones and observaciones not in (linea["observaciones"] or "").split("; "):
+            linea["observaciones"] = f"{linea['observaciones']}; {observaciones}" if linea["observaciones"] else observaciones
+    return list(lineas.values())
+
 def delete_cuenta(db: Session, cuenta_id: int, current_user: Usuario) -> None:
     """Eliminar una cuenta por su ID"""
     # Obtener la cuenta y verificar permisos
@@ -331,7 +507,8 @@ def delete_cuenta(db: Session, cuenta_id: int, current_user: Usuario) -> None:
             detail="Solo los administradores pueden eliminar cuentas"
         )
     
-    # Eliminar la cuenta
+    # Eliminar la cuenta y restarla de los agregados de ventas
+    aplicar_contribuciones(db, {}, contribuciones_cuenta(db_cuenta))
     db.delete(db_cuenta)
     db.commit()
     
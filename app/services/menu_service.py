@@ -0,0 +1,81 @@
+"""
+Servicio del menú en memoria (productos y categorías).
+"""
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.categoria import Categoria
+from app.models.producto import Producto
+from app.core.enums import TipoProducto
+from app.core.menu import menu, MenuCache
+from app.core.paginacion import codificar_cursor, decodificar_cursor
+from app.services.producto_service import CLAVE_PAGINACION
+
+def get_menu(db: Session) -> MenuCache:
+    """Obtener el menú, consultando la base de datos solo si no está cargado, fue invalidado o caducó"""
+    if not menu.cargado:
+        version = menu.version
+        menu.cargar(db.query(Producto).all(), db.query(Categoria).all(), version)
+    return menu
+
+def invalidar_por_evento_remoto(datos: Dict[str, Any], client_types: Sequence[str]):
+    """
+    Invalidar el menú cuando otro proceso avisa (por el backplane) de que ha cambiado un producto o una
+    categoría: la siguiente lectura lo recarga y, con el mismo contenido, los listados tienen el mismo ETag
+    en todos los procesos.
+    """
+    if datos.get("tipo") == "actualizacion_menu":
+        menu.invalidar()
+
+def get_productos_disponibles(db: Session, producto_ids: Iterable[int]) -> Dict[int, dict]:
+    """Productos disponibles indicados (datos de ProductoResponse), indexados por ID, sin consultar la base de datos"""
+    cache = get_menu(db)
+    productos = {}
+    for producto_id in set(producto_ids):
+        producto = cache.producto(producto_id)
+        if producto is not None and producto["disponible"]:
+            productos[producto_id] = producto
+    return productos
+
+def get_producto_disponible(db: Session, producto_id: int) -> dict:
+    """Obtener un producto disponible del menú o responder 404"""
+    producto = get_productos_disponibles(db, (producto_id,)).get(producto_id)
+    if producto is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado o no disponible")
+    return producto
+
+def listar_productos_json(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    categoria_id: Optional[int] = None,
+    tipo: Optional[TipoProducto] = None,
+    disponible: Optional[bool] = None,
+    cursor: Optional[str] = None
+) -> Tuple[bytes, str, Optional[str]]:
+    """
+    Listado de productos desde el menú en memoria: cuerpo JSON, ETag y cursor de la página siguiente.
+    Mismo orden y paginación que get_productos (por id, offset o cursor sobre el id).
+    """
+    cache = get_menu(db)
+    # Validar el cursor antes de buscar la respuesta guardada, para responder 400 también en los aciertos
+    despues_de = decodificar_cursor(cursor, CLAVE_PAGINACION)[0] if cursor is not None else None
+
+    def construir():
+        productos = cache.productos(categoria_id, tipo, disponible)
+        if despues_de is not None:
+            pagina = [producto for producto in productos if producto["id"] > despues_de][:limit]
+        else:
+            pagina = productos[skip:skip + limit]
+        siguiente = codificar_cursor([pagina[-1]["id"]]) if pagina and len(pagina) == limit else None
+        return pagina, siguiente
+
+    clave = ("productos", skip, limit, categoria_id, tipo, disponible, despues_de)
+    return cache.respuesta(clave, construir)
+
+def listar_categorias_json(db: Session, skip: int = 0, limit: int = 100) -> Tuple[bytes, str]:
+    """Listado de categorías desde el menú en memoria: cuerpo JSON y ETag"""
+    cache = get_menu(db)
+    cuerpo, etag, _ = cache.respuesta(("categorias", skip, limit), lambda: (cache.categorias()[skip:skip + limit], None))
+    return cuerpo, etag
@@ -3,18 +3,21 @@ Servicio para operaciones de Mesa.
 """
 from typing import List, Optional
 from fastapi import HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from datetime import datetime, UTC
 
+from app.models.cuenta import Cuenta
 from app.models.mesa import Mesa
 from app.models.usuario import Usuario
 from app.models.pedido import Pedido
 from app.models.reserva import Reserva
 from app.schemas.mesa import MesaCreate, MesaUpdate
 from app.core.enums import EstadoMesa, EstadoPedido, EstadoReserva, RolUsuario
-from app.core.websockets import log_event, safe_broadcast
-from app.services.cuenta_service import generar_cuenta_desde_pedidos, create_cuenta
-from app.schemas.cuenta import CuentaCreate, DetalleCuentaItem
+from app.core.websockets import crear_canales, log_event, safe_broadcast
+from app.core.cocina import indice_cocina
+from app.services.cuenta_service import indice_productos, lineas_cuenta_mesa, normalizar_detalles
+from app.services.venta_service import aplicar_contribuciones, contribuciones_cuenta
 
 def get_mesas(
     db: Session, 
@@ -74,164 +77,97 @@ def create_mesa(db: Session, mesa: MesaCreate, current_user: Usuario) -> Mesa:
 def update_mesa(db: Session, mesa_id: int, mesa: MesaUpdate, current_user: Usuario) -> Mesa:
     """Actualizar una mesa existente"""
     db_mesa = get_mesa_by_id(db, mesa_id)
+    # Pedidos entregados al cerrar la mesa (salen de la vista de cocina tras el commit)
+    pedidos_cerrados = []
     
-    # Definir permisos por rol
-    if current_user.rol == RolUsuario.ADMIN:
-        # Los administradores pueden cambiar todos los campos
-        if mesa.capacidad is not None:
-            db_mesa.capacidad = mesa.capacidad
-        
-        if mesa.estado is not None:
-            old_estado = db_mesa.estado
-            db_mesa.estado = mesa.estado
-            
-            # Si la mesa pasa de ocupada a libre, registrar una cuenta
-            if old_estado == EstadoMesa.OCUPADA and mesa.estado == EstadoMesa.LIBRE:
-                try:
-                    print(f"Cerrando mesa {mesa_id}: generando cuenta final...")
-                    # Generar datos para la cuenta
-                    datos_cuenta = generar_cuenta_desde_pedidos(
-                        db=db,
-                        mesa_id=mesa_id,
-                        camarero_id=current_user.id
-                    )
-                    
-                    # Crear ítems de detalle
-                    detalles = []
-                    if datos_cuenta.get("detalles"):
-                        for item in datos_cuenta["detalles"]:
-                            detalle = DetalleCuentaItem(
-                                pedido_id=item["pedido_id"],
-                                producto_id=item["producto_id"],
-                                nombre_producto=item["nombre_producto"],
-                                cantidad=item["cantidad"],
-                                precio_unitario=item["precio_unitario"],
-                                subtotal=item["subtotal"],
-                                observaciones=item.get("observaciones")
-                            )
-                            detalles.append(detalle)
-                    
-                    # Crear la cuenta
-                    if datos_cuenta["total"] > 0:
-                        cuenta_create = CuentaCreate(
-                            mesa_id=mesa_id,
-                            numero_mesa=datos_cuenta["numero_mesa"],
-                            nombre_camarero=datos_cuenta["nombre_camarero"],
-                            total=datos_cuenta["total"],
-                            metodo_pago=mesa.metodo_pago,
-                            detalles=detalles
-                        )
-                        
-                        create_cuenta(
-                            db=db,
-                            cuenta=cuenta_create,
-                            camarero_id=current_user.id
-                        )
-                        print(f"Cuenta creada para mesa {mesa_id} con total {datos_cuenta['total']}")
-                    else:
-                        print(f"No se creó cuenta para mesa {mesa_id} porque el total es 0")
-                    
-                    # Desvincular los pedidos de la mesa para que no aparezcan en futuras cuentas
-                    pedidos = db.query(Pedido).filter(
-                        Pedido.mesa_id == mesa_id,
-                        Pedido.estado != EstadoPedido.CANCELADO
-                    ).all()
-                    
-                    for pedido in pedidos:
-                        pedido.estado = EstadoPedido.ENTREGADO
-                        pedido.mesa_id = None  # Desvincular el pedido de la mesa
-                        print(f"Pedido {pedido.id} marcado como entregado y desvinculado")
-                    
-                except Exception as e:
-                    # No fallamos si hay error al crear la cuenta, solo lo registramos
-                    print(f"Error al crear cuenta para mesa {mesa_id}: {str(e)}")
-                    # Registrar error detalladamente
-                    import traceback
-                    print(traceback.format_exc())
-        
-        if mesa.ubicacion is not None:
-            db_mesa.ubicacion = mesa.ubicacion
-            
-    elif current_user.rol == RolUsuario.CAMARERO:
-        # Los camareros solo pueden cambiar el estado
-        if mesa.estado is not None:
-            old_estado = db_mesa.estado
-            db_mesa.estado = mesa.estado
-            
-            # Si la mesa pasa de ocupada a libre, registrar una cuenta
-            if old_estado == EstadoMesa.OCUPADA and mesa.estado == EstadoMesa.LIBRE:
-                try:
-                    print(f"Cerrando mesa {mesa_id}: generando cuenta final...")
-                    # Generar datos para la cuenta
-                    datos_cuenta = generar_cuenta_desde_pedidos(
-                        db=db,
-                        mesa_id=mesa_id,
-                        camarero_id=current_user.id
-                    )
-                    
-                    # Crear ítems de detalle
-                    detalles = []
-                    if datos_cuenta.get("detalles"):
-                        for item in datos_cuenta["detalles"]:
-                            detalle = DetalleCuentaItem(
-                                pedido_id=item["pedido_id"],
-                                producto_id=item["producto_id"],
-                                nombre_producto=item["nombre_producto"],
-                                cantidad=item["cantidad"],
-                                precio_unitario=item["precio_unitario"],
-                                subtotal=item["subtotal"],
-                                observaciones=item.get("observaciones")
-                            )
-                            detalles.append(detalle)
-                    
-                    # Crear la cuenta
-                    if datos_cuenta["total"] > 0:
-                        cuenta_create = CuentaCreate(
-                            mesa_id=mesa_id,
-                            numero_mesa=datos_cuenta["numero_mesa"],
-                            nombre_camarero=datos_cuenta["nombre_camarero"],
-                            total=datos_cuenta["total"],
-                            metodo_pago=mesa.metodo_pago,
-                            detalles=detalles
-                        )
-                        
-                        create_cuenta(
-                            db=db,
-                            cuenta=cuenta_create,
-                            camarero_id=current_user.id
-                        )
-                        print(f"Cuenta creada para mesa {mesa_id} con total {datos_cuenta['total']}")
-                    else:
-                        print(f"No se creó cuenta para mesa {mesa_id} porque el total es 0")
-                    
-                    # Desvincular los pedidos de la mesa para que no aparezcan en futuras cuentas
-                    pedidos = db.query(Pedido).filter(
-                        Pedido.mesa_id == mesa_id,
-                        Pedido.estado != EstadoPedido.CANCELADO
-                    ).all()
-                    
-                    for pedido in pedidos:
-                        pedido.estado = EstadoPedido.ENTREGADO
-                        pedido.mesa_id = None  # Desvincular el pedido de la mesa
-                        print(f"Pedido {pedido.id} marcado como entregado y desvinculado")
-                    
-                except Exception as e:
-                    # No fallamos si hay error al crear la cuenta, solo lo registramos
-                    print(f"Error al crear cuenta para mesa {mesa_id}: {str(e)}")
-                    # Registrar error detalladamente
-                    import traceback
-                    print(traceback.format_exc())
-    else:
+    # Definir permisos por rol: los camareros solo pueden cambiar el estado
+    if current_user.rol not in (RolUsuario.ADMIN, RolUsuario.CAMARERO):
         raise HTTPException(
             status_code=403,
             detail="No tiene permisos para actualizar mesas"
         )
     
+    if current_user.rol == RolUsuario.ADMIN and mesa.capacidad is not None:
+        db_mesa.capacidad = mesa.capacidad
+    
+    if mesa.estado is not None:
+        # Si la mesa pasa de ocupada a libre, se cierra registrando su cuenta
+        if db_mesa.estado == EstadoMesa.OCUPADA and mesa.estado == EstadoMesa.LIBRE:
+            pedidos_cerrados = cerrar_mesa(db, db_mesa, current_user, mesa.metodo_pago)
+        else:
+            db_mesa.estado = mesa.estado
+    
+    if current_user.rol == RolUsuario.ADMIN and mesa.ubicacion is not None:
+        db_mesa.ubicacion = mesa.ubicacion
+    
     db.commit()
     db.refresh(db_mesa)
+    if pedidos_cerrados:
+        for pedido_id in pedidos_cerrados:
+            indice_cocina.quitar(pedido_id)
+        # Avisar del cierre: sus pedidos salen de la cocina también en los demás workers
+        mensaje = {
+            "tipo": "mesa_cerrada",
+            "mesa": db_mesa.numero,
+            "pedidos": pedidos_cerrados,
+            "hora": datetime.now(UTC).isoformat()
+        }
+        safe_broadcast(mensaje, ("camareros", "cocina"), crear_canales(mesas=[db_mesa.numero]))
     
     return db_mesa
 
+def cerrar_mesa(db: Session, db_mesa: Mesa, camarero: Usuario, metodo_pago: Optional[str] = None) -> List[int]:
+    """
+    Cerrar una mesa ocupada: liberarla, registrar la cuenta de sus pedidos activos y marcar esos
+    pedidos como entregados y desvinculados de la mesa. No hace commit: todo queda en la transacción
+    de quien la llama, que se confirma o se revierte entera.
+    
+    La mesa se reclama con un UPDATE condicional (solo si sigue ocupada). Si dos dispositivos cierran
+    la misma mesa a la vez, el segundo espera al bloqueo de escritura del primero, no encuentra la
+    mesa ocupada y no hace nada: nunca se registran dos cuentas.
+    Devuelve los ids de los pedidos cerrados (vacío si otro cierre se adelantó).
+    """
+    reclamada = db.execute(
+        update(Mesa)
+        .where(Mesa.id == db_mesa.id, Mesa.estado == EstadoMesa.OCUPADA)
+        .values(estado=EstadoMesa.LIBRE)
+    ).rowcount
+    if not reclamada:
+        print(f"La mesa {db_mesa.id} ya estaba cerrada; no se genera otra cuenta")
+        return []
+    
+    # La cuenta se calcula dentro de la transacción, con los pedidos que se van a cerrar
+    detalles = lineas_cuenta_mesa(db, db_mesa.id)
+    total = sum(item["subtotal"] for item in detalles)
+    if total > 0:
+        detalles = normalizar_detalles(detalles)
+        db_cuenta = Cuenta(
+            mesa_id=db_mesa.id,
+            numero_mesa=db_mesa.numero,
+            camarero_id=camarero.id,
+            nombre_camarero=f"{camarero.nombre} {camarero.apellido}",
+            total=total,
+            metodo_pago=metodo_pago,
+            detalles=detalles,
+            productos=indice_productos(item["producto_id"] for item in detalles)
+        )
+        db.add(db_cuenta)
+        db.flush()
+        # Sumar la cuenta a los agregados de ventas en la misma transacción
+        aplicar_contribuciones(db, contribuciones_cuenta(db_cuenta))
+        print(f"Cuenta creada para mesa {db_mesa.id} con total {total}")
+    else:
+        print(f"No se creó cuenta para mesa {db_mesa.id} porque el total es 0")
+    
+    # Marcar como entregados y desvincular de la mesa todos sus pedidos activos en una sola sentencia,
+    # para que no aparezcan en futuras cuentas
+    return list(db.scalars(
+        update(Pedido)
+        .where(Pedido.mesa_id == db_mesa.id, Pedido.estado != EstadoPedido.CANCELADO)
+        .values(estado=EstadoPedido.ENTREGADO, mesa_id=None)
+        .returning(Pedido.id)
+    ))
+
 def delete_mesa(db: Session, mesa_id: int, current_user: Usuario) -> None:
     """Eliminar una mesa"""
     # Solo administradores pueden eliminar mesas
@@ -3,8 +3,8 @@ Servicio para operaciones de Pedido.
 """
 from typing import List, Optional
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, insert
 from datetime import datetime, UTC
 
 from app.models.pedido import Pedido, DetallePedido
@@ -13,7 +13,38 @@ from app.models.usuario import Usuario
 from app.models.producto import Producto
 from app.schemas.pedido import PedidoCreate, PedidoUpdate, DetallePedidoCreate, DetallePedidoUpdate
 from app.core.enums import EstadoPedido, EstadoMesa, RolUsuario
-from app.core.websockets import safe_broadcast, log_event
+from app.core.websockets import crear_canales, safe_broadcast, log_event
+from app.core.config import PEDIDO_ESTRATEGIA_CARGA
+from app.core.cocina import indice_cocina
+from app.core.paginacion import paginar
+from app.services.menu_service import get_producto_disponible, get_productos_disponibles
+
+# Clave de ordenación de los listados: más recientes primero, desempate por id
+CLAVE_PAGINACION = (Pedido.fecha_creacion, Pedido.id)
+
+def opciones_carga_pedido(estrategia: Optional[str]) -> list:
+    """
+    Opciones de carga para construir el grafo de PedidoDetallado (mesa, camarero, detalles y
+    sus productos) en un número fijo de consultas, sin cargas perezosas por línea.
+    - "selectin": mesa y camarero en la misma consulta; detalles y productos con un SELECT ... IN cada uno (3 consultas)
+    - "joined": todo en una sola consulta con JOINs
+    - None: sin carga anticipada
+    """
+    if estrategia is None:
+        return []
+    if estrategia == "selectin":
+        return [
+            joinedload(Pedido.mesa),
+            joinedload(Pedido.camarero),
+            selectinload(Pedido.detalles).selectinload(DetallePedido.producto),
+        ]
+    if estrategia == "joined":
+        return [
+            joinedload(Pedido.mesa),
+            joinedload(Pedido.camarero),
+            joinedload(Pedido.detalles).joinedload(DetallePedido.producto),
+        ]
+    raise ValueError(f"Estrategia de carga no válida: {estrategia}")
 
 def get_pedidos(
     db: Session, 
@@ -24,10 +55,16 @@ def get_pedidos(
     fecha_fin: Optional[datetime] = None,
     mesa_id: Optional[int] = None,
     camarero_id: Optional[int] = None,
-    current_user: Usuario = None
+    current_user: Usuario = None,
+    estrategia_carga: Optional[str] = None,
+    cursor: Optional[str] = None
 ) -> List[Pedido]:
-    """Obtener pedidos con filtros opcionales"""
-    query = db.query(Pedido)
+    """
+    Obtener pedidos con filtros opcionales.
+    Con estrategia_carga ("selectin" o "joined") se cargan también mesa, camarero, detalles y productos.
+    Con cursor se pagina por (fecha_creacion, id) en lugar de por offset.
+    """
+    query = db.query(Pedido).options(*opciones_carga_pedido(estrategia_carga))
     
     # Aplicar filtros
     if estado is not None:
@@ -53,14 +90,22 @@ def get_pedidos(
             # Los administradores pueden filtrar por camarero específico
             query = query.filter(Pedido.camarero_id == camarero_id)
     
-    # Ordenar por fecha de creación (últimos primero)
-    query = query.order_by(Pedido.fecha_creacion.desc())
-    
-    return query.offset(skip).limit(limit).all()
+    # Ordenar por fecha de creación (últimos primero) y paginar por offset o por cursor
+    return paginar(query, CLAVE_PAGINACION, skip, limit, cursor).all()
 
-def get_pedido_by_id(db: Session, pedido_id: int, current_user: Usuario = None) -> Pedido:
-    """Obtener un pedido específico por ID"""
-    pedido = db.query(Pedido).filter(Pedido.id == pedido_id).first()
+def get_pedido_by_id(
+    db: Session,
+    pedido_id: int,
+    current_user: Usuario = None,
+    estrategia_carga: Optional[str] = PEDIDO_ESTRATEGIA_CARGA
+) -> Pedido:
+    """Obtener un pedido específico por ID con su grafo completo cargado según estrategia_carga"""
+    pedido = (
+        db.query(Pedido)
+        .options(*opciones_carga_pedido(estrategia_carga))
+        .filter(Pedido.id == pedido_id)
+        .first()
+    )
     if pedido is None:
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
     
@@ -83,6 +128,28 @@ def get_pedido_by_id(db: Session, pedido_id: int, current_user: Usuario = None)
     
     return pedido
 
+def _sincronizar_cocina(db: Session, pedido_id: int):
+    """Reflejar en el índice de cocina el estado ya confirmado de un pedido"""
+    if not indice_cocina.cargado:
+        # Nadie ha pedido aún la instantánea: se cargará completa cuando se solicite. Invalidar cambia
+        # la versión, así que una carga en curso que puede no incluir este cambio no se da por buena
+        indice_cocina.invalidar()
+        return
+    pedido = (
+        db.query(Pedido)
+        .options(*opciones_carga_pedido("selectin"))
+        .filter(Pedido.id == pedido_id)
+        .first()
+    )
+    indice_cocina.actualizar(pedido_id, pedido)
+
+def _canales_pedido(db: Session, pedido_id: int, mesa_numero: Optional[int], camarero_id: Optional[int]):
+    """Canales de los eventos de un pedido completo: su mesa, su camarero y los tipos de sus productos"""
+    tipos = db.query(Producto.tipo).join(DetallePedido, DetallePedido.producto_id == Producto.id).filter(
+        DetallePedido.pedido_id == pedido_id
+    ).distinct()
+    return crear_canales(mesas=(mesa_numero,), camareros=(camarero_id,), tipos=[tipo for (tipo,) in tipos])
+
 def create_pedido(db: Session, pedido: PedidoCreate, camarero_id: int) -> Pedido:
     """Crear un nuevo pedido"""
     # Verificar si la mesa existe
@@ -97,63 +164,71 @@ def create_pedido(db: Session, pedido: PedidoCreate, camarero_id: int) -> Pedido
     # Verificar si el pedido tiene productos
     if not pedido.detalles:
         raise HTTPException(status_code=400, detail="El pedido debe tener al menos un producto")
+
+    # Resolver todos los productos del pedido en el menú en memoria (sin consultas si ya está cargado)
+    productos = get_productos_disponibles(db, [detalle.producto_id for detalle in pedido.detalles])
+
+    # Validar todas las líneas antes de escribir nada en la base de datos
+    for detalle in pedido.detalles:
+        if detalle.producto_id not in productos:
+            raise HTTPException(status_code=404, detail=f"Producto {detalle.producto_id} no encontrado o no disponible")
+
+    # Calcular las líneas del pedido a partir de los productos ya resueltos
+    lineas = []
+    total_pedido = 0.0
+    for detalle in pedido.detalles:
+        producto = productos[detalle.producto_id]
+        subtotal = producto["precio"] * detalle.cantidad
+        lineas.append({
+            "producto_id": detalle.producto_id,
+            "cantidad": detalle.cantidad,
+            "precio_unitario": producto["precio"],
+            "subtotal": subtotal,
+            "observaciones": detalle.observaciones
+        })
+        total_pedido += subtotal
     
-    # Crear pedido
     db_pedido = Pedido(
         mesa_id=pedido.mesa_id,
         camarero_id=camarero_id,
-        observaciones=pedido.observaciones
+        observaciones=pedido.observaciones,
+        total=total_pedido
     )
-    db.add(db_pedido)
-    db.commit()
-    db.refresh(db_pedido)
-    
-    # Establecer la mesa como ocupada
-    mesa.estado = EstadoMesa.OCUPADA
-    db.commit()
     
-    # Agregar detalles del pedido
-    total_pedido = 0.0
-    for detalle in pedido.detalles:
-        db_producto = db.query(Producto).filter(
-            Producto.id == detalle.producto_id,
-            Producto.disponible == True
-        ).first()
-        
-        if db_producto is None:
-            # Si el producto no existe o no está disponible, eliminar el pedido
-            db.delete(db_pedido)
-            db.commit()
-            raise HTTPException(status_code=404, detail=f"Producto {detalle.producto_id} no encontrado o no disponible")
-        
-        # Crear detalle del pedido
-        subtotal = db_producto.precio * detalle.cantidad
-        db_detalle = DetallePedido(
-            pedido_id=db_pedido.id,
-            producto_id=detalle.producto_id,
-            cantidad=detalle.cantidad,
-            precio_unitario=db_producto.precio,
-            subtotal=subtotal,
-            observaciones=detalle.observaciones
-        )
-        db.add(db_detalle)
-        total_pedido += subtotal
+    # Guardar los datos de la notificación antes de que el commit expire los objetos
+    # (el camarero suele estar ya en la sesión por la dependencia de autenticación)
+    camarero = db.get(Usuario, camarero_id)
+    nombre_camarero = f"{camarero.nombre} {camarero.apellido}"
+    mesa_numero = mesa.numero
+    canales = crear_canales(
+        mesas=(mesa_numero,), camareros=(camarero_id,), tipos={producto["tipo"] for producto in productos.values()}
+    )
     
-    # Actualizar total del pedido
-    db_pedido.total = total_pedido
-    db.commit()
+    # Establecer la mesa como ocupada e insertar pedido y detalles en una única transacción
+    mesa.estado = EstadoMesa.OCUPADA
+    db.add(db_pedido)
+    try:
+        db.flush()
+        for linea in lineas:
+            linea["pedido_id"] = db_pedido.id
+        # Inserción masiva de los detalles (executemany en un solo round-trip)
+        db.execute(insert(DetallePedido), lineas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     db.refresh(db_pedido)
+    _sincronizar_cocina(db, db_pedido.id)
     
     # Notificar a la cocina sobre el nuevo pedido
-    camarero = db.query(Usuario).filter(Usuario.id == camarero_id).first()
     mensaje = {
         "tipo": "nuevo_pedido",
         "pedido_id": db_pedido.id,
-        "mesa": mesa.numero,
-        "camarero": f"{camarero.nombre} {camarero.apellido}",
+        "mesa": mesa_numero,
+        "camarero": nombre_camarero,
         "hora": datetime.now(UTC).isoformat()
     }
-    safe_broadcast(mensaje, "cocina")
+    safe_broadcast(mensaje, "cocina", canales)
     
     return db_pedido
 
@@ -184,6 +259,7 @@ def update_pedido(db: Session, pedido_id: int, pedido: PedidoUpdate, current_use
     
     db.commit()
     db.refresh(db_pedido)
+    _sincronizar_cocina(db, db_pedido.id)
     
     # Notificar sobre la actualización del pedido
     mensaje = {
@@ -193,13 +269,14 @@ def update_pedido(db: Session, pedido_id: int, pedido: PedidoUpdate, current_use
         "mesa": db_pedido.mesa.numero,
         "hora": datetime.now(UTC).isoformat()
     }
+    canales = _canales_pedido(db, db_pedido.id, db_pedido.mesa.numero, db_pedido.camarero_id)
     
     if current_user.rol == RolUsuario.COCINERO:
         # Si el cocinero cambia el estado, notificar a los camareros
-        safe_broadcast(mensaje, "camareros")
+        safe_broadcast(mensaje, "camareros", canales)
     else:
         # Si el camarero o el administrador cambia el estado, notificar a la cocina
-        safe_broadcast(mensaje, "cocina")
+        safe_broadcast(mensaje, "cocina", canales)
     
     return db_pedido
 
@@ -282,6 +359,7 @@ def update_detalle_pedido(
     
     db.commit()
     db.refresh(db_detalle)
+    _sincronizar_cocina(db, pedido_id)
     
     # Notificar sobre la actualización del detalle
     mensaje = {
@@ -293,11 +371,14 @@ def update_detalle_pedido(
         "mesa": db_pedido.mesa.numero,
         "hora": datetime.now(UTC).isoformat()
     }
+    canales = crear_canales(
+        mesas=(db_pedido.mesa.numero,), camareros=(db_pedido.camarero_id,), tipos=(db_detalle.producto.tipo,)
+    )
     
     if current_user.rol == RolUsuario.COCINERO:
-        safe_broadcast(mensaje, "camareros")
+        safe_broadcast(mensaje, "camareros", canales)
     else:
-        safe_broadcast(mensaje, "cocina")
+        safe_broadcast(mensaje, "cocina", canales)
     
     return db_detalle
 
@@ -327,22 +408,16 @@ def create_detalle_pedido(
             detail="No se puede modificar un pedido entregado o cancelado"
         )
     
-    # Verificar si el producto existe y está disponible
-    db_producto = db.query(Producto).filter(
-        Producto.id == detalle.producto_id,
-        Producto.disponible == True
-    ).first()
-    
-    if db_producto is None:
-        raise HTTPException(status_code=404, detail="Producto no encontrado o no disponible")
+    # Verificar si el producto existe y está disponible (en el menú en memoria)
+    producto = get_producto_disponible(db, detalle.producto_id)
     
     # Crear detalle del pedido
-    subtotal = db_producto.precio * detalle.cantidad
+    subtotal = producto["precio"] * detalle.cantidad
     db_detalle = DetallePedido(
         pedido_id=pedido_id,
         producto_id=detalle.producto_id,
         cantidad=detalle.cantidad,
-        precio_unitario=db_producto.precio,
+        precio_unitario=producto["precio"],
         subtotal=subtotal,
         observaciones=detalle.observaciones
     )
@@ -356,18 +431,22 @@ def create_detalle_pedido(
     
     db.commit()
     db.refresh(db_detalle)
+    _sincronizar_cocina(db, pedido_id)
     
     # Notificar a la cocina sobre el nuevo detalle
     mensaje = {
         "tipo": "nuevo_detalle",
         "pedido_id": db_pedido.id,
         "detalle_id": db_detalle.id,
-        "producto": db_producto.nombre,
+        "producto": producto["nombre"],
         "cantidad": detalle.cantidad,
         "mesa": db_pedido.mesa.numero,
         "hora": datetime.now(UTC).isoformat()
     }
-    safe_broadcast(mensaje, "cocina")
+    canales = crear_canales(
+        mesas=(db_pedido.mesa.numero,), camareros=(db_pedido.camarero_id,), tipos=(producto["tipo"],)
+    )
+    safe_broadcast(mensaje, "cocina", canales)
     
     return db_detalle
 
@@ -423,6 +502,9 @@ def delete_detalle_pedido(
     # Guardar información para la notificación
     producto_nombre = db_detalle.producto.nombre
     mesa_numero = db_pedido.mesa.numero
+    canales = crear_canales(
+        mesas=(mesa_numero,), camareros=(db_pedido.camarero_id,), tipos=(db_detalle.producto.tipo,)
+    )
     
     # Eliminar detalle
     db.delete(db_detalle)
@@ -431,6 +513,7 @@ def delete_detalle_pedido(
     db_pedido.fecha_actualizacion = datetime.now(UTC)
     
     db.commit()
+    _sincronizar_cocina(db, pedido_id)
     
     # Notificar a la cocina sobre la eliminación del detalle
     mensaje = {
@@ -441,7 +524,7 @@ def delete_detalle_pedido(
         "mesa": mesa_numero,
         "hora": datetime.now(UTC).isoformat()
     }
-    safe_broadcast(mensaje, "cocina")
+    safe_broadcast(mensaje, "cocina", canales)
 
 def delete_pedido(db: Session, pedido_id: int, current_user: Usuario) -> None:
     """Eliminar un pedido completo (solo para pedidos no entregados)"""
@@ -462,6 +545,11 @@ def delete_pedido(db: Session, pedido_id: int, current_user: Usuario) -> None:
             detail="No se puede eliminar un pedido ya entregado"
         )
     
+    # Canales de la notificación, antes de borrar los detalles
+    canales = _canales_pedido(
+        db, pedido_id, db_pedido.mesa.numero if db_pedido.mesa else None, db_pedido.camarero_id
+    )
+    
     # Si el pedido tiene mesa asignada, actualizarla a LIBRE si no hay otros pedidos activos
     if db_pedido.mesa_id is not None:
         mesa = db.query(Mesa).filter(Mesa.id == db_pedido.mesa_id).first()
@@ -484,6 +572,7 @@ def delete_pedido(db: Session, pedido_id: int, current_user: Usuario) -> None:
     # Eliminar el pedido
     db.delete(db_pedido)
     db.commit()
+    indice_cocina.quitar(pedido_id)
     
     # Notificar a los usuarios sobre la eliminación del pedido
     mensaje = {
@@ -493,8 +582,7 @@ def delete_pedido(db: Session, pedido_id: int, current_user: Usuario) -> None:
     }
     
     # Notificar a todos los usuarios
-    safe_broadcast(mensaje, "camareros")
-    safe_broadcast(mensaje, "cocina")
+    safe_broadcast(mensaje, ("camareros", "cocina"), canales)
     
     # Registrar el evento
     log_event(f"Pedido #{pedido_id} eliminado por {current_user.nombre} {current_user.apellido} (rol: {current_user.rol})") 
\ No newline at end of file
@@ -3,13 +3,26 @@ Servicio para operaciones de Producto.
 """
 from typing import List, Optional
 from fastapi import HTTPException
+from sqlalchemy import case, delete, func, select, update
 from sqlalchemy.orm import Session
 
 from app.models.producto import Producto
+from app.models.pedido import DetallePedido, Pedido
+from app.models.cuenta import Cuenta, CuentaProducto
 from app.models.categoria import Categoria
 from app.schemas.producto import ProductoCreate, ProductoUpdate
-from app.core.enums import TipoProducto
+from app.core.enums import EstadoPedido, TipoProducto
 from app.core.websockets import safe_broadcast
+from app.core.cocina import indice_cocina
+from app.core.menu import menu
+from app.core.paginacion import paginar
+from app.services.cuenta_service import normalizar_detalles
+
+# Clave de ordenación de los listados: por id, en orden de creación
+CLAVE_PAGINACION = (Producto.id,)
+
+# Cuentas históricas reescritas por sentencia al eliminar un producto
+TAMANO_LOTE_CUENTAS = 500
 
 def get_productos(
     db: Session, 
@@ -17,9 +30,10 @@ def get_productos(
     limit: int = 100,
     categoria_id: Optional[int] = None,
     tipo: Optional[TipoProducto] = None,
-    disponible: Optional[bool] = None
+    disponible: Optional[bool] = None,
+    cursor: Optional[str] = None
 ) -> List[Producto]:
-    """Obtener productos con filtros opcionales"""
+    """Obtener productos con filtros opcionales, paginados por offset o por cursor sobre el id"""
     query = db.query(Producto)
     
     if categoria_id is not None:
@@ -31,7 +45,7 @@ def get_productos(
     if disponible is not None:
         query = query.filter(Producto.disponible == disponible)
     
-    return query.offset(skip).limit(limit).all()
+    return paginar(query, CLAVE_PAGINACION, skip, limit, cursor, descendente=False).all()
 
 def get_producto_by_id(db: Session, producto_id: int) -> Producto:
     """Obtener un producto específico por ID"""
@@ -52,6 +66,7 @@ def create_producto(db: Session, producto: ProductoCreate) -> Producto:
     db.add(db_producto)
     db.commit()
     db.refresh(db_producto)
+    menu.invalidar()
     
     # Notificar via WebSockets
     mensaje = {
@@ -59,8 +74,7 @@ def create_producto(db: Session, producto: ProductoCreate) -> Producto:
         "accion": "crear",
         "producto_id": db_producto.id
     }
-    safe_broadcast(mensaje, "camareros")
-    safe_broadcast(mensaje, "cocina")
+    safe_broadcast(mensaje, ("camareros", "cocina"))
     
     return db_producto
 
@@ -80,6 +94,9 @@ def update_producto(db: Session, producto_id: int, producto: ProductoUpdate) ->
     
     db.commit()
     db.refresh(db_producto)
+    menu.invalidar()
+    # Las líneas de los pedidos activos muestran los datos del producto
+    indice_cocina.invalidar()
     
     # Notificar via WebSockets
     mensaje = {
@@ -87,8 +104,7 @@ def update_producto(db: Session, producto_id: int, producto: ProductoUpdate) ->
         "accion": "actualizar",
         "producto_id": db_producto.id
     }
-    safe_broadcast(mensaje, "camareros")
-    safe_broadcast(mensaje, "cocina")
+    safe_broadcast(mensaje, ("camareros", "cocina"))
     
     return db_producto
 
@@ -97,9 +113,6 @@ def delete_producto(db: Session, producto_id: int) -> None:
     db_producto = get_producto_by_id(db, producto_id)
     
     # Verificar si el producto está en pedidos activos
-    from app.models.pedido import DetallePedido, Pedido
-    from app.core.enums import EstadoPedido
-    
     pedidos_activos = db.query(DetallePedido).join(Pedido).filter(
         DetallePedido.producto_id == producto_id,
         Pedido.estado.in_([EstadoPedido.RECIBIDO, EstadoPedido.EN_PREPARACION])
@@ -111,63 +124,34 @@ def delete_producto(db: Session, producto_id: int) -> None:
             detail=f"No se puede eliminar el producto porque está en {pedidos_activos} pedidos activos"
         )
     
-    # Para pedidos históricos (entregados o cancelados), mantener la referencia pero evitar errores de FK
-    detalles_historicos = db.query(DetallePedido).join(Pedido).filter(
-        DetallePedido.producto_id == producto_id,
-        Pedido.estado.in_([EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO, EstadoPedido.LISTO])
-    ).all()
-    
-    # Conservar información del producto para pedidos históricos
-    nombre_producto = db_producto.nombre
-    precio_producto = db_producto.precio
-    tipo_producto = db_producto.tipo
-    
-    # Crear una nota para cada detalle histórico
-    for detalle in detalles_historicos:
-        detalle_obs = detalle.observaciones or ""
-        detalle.observaciones = f"{detalle_obs}\n[Producto eliminado: {nombre_producto}, ${precio_producto}]".strip()
-        db.add(detalle)
+    # Para pedidos históricos (entregados o cancelados), mantener la referencia pero evitar errores de FK:
+    # se conserva la información del producto con una nota en cada línea, en un solo UPDATE
+    nota = f"[Producto eliminado: {db_producto.nombre}, ${db_producto.precio}]"
+    db.execute(
+        update(DetallePedido)
+        .where(
+            DetallePedido.producto_id == producto_id,
+            DetallePedido.pedido_id.in_(
+                select(Pedido.id).where(
+                    Pedido.estado.in_([EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO, EstadoPedido.LISTO])
+                )
+            )
+        )
+        .values(observaciones=case(
+            (func.coalesce(DetallePedido.observaciones, "") == "", nota),
+            else_=DetallePedido.observaciones + "\n" + nota
+        ))
+        .execution_options(synchronize_session=False)
+    )
     
     # Gestionar la referencia en el historial de cuentas
-    from app.models.cuenta import Cuenta
-    import json
-    
-    # Obtener todas las cuentas que podrían contener referencias al producto
-    cuentas = db.query(Cuenta).all()
-    for cuenta in cuentas:
-        # Procesar detalles de la cuenta (convertir de JSON si es necesario)
-        if isinstance(cuenta.detalles, str):
-            try:
-                detalles = json.loads(cuenta.detalles)
-            except json.JSONDecodeError:
-                detalles = []
-        else:
-            detalles = cuenta.detalles if cuenta.detalles else []
-        
-        # Verificar si hay cambios que hacer
-        modificado = False
-        
-        # Si detalles es una lista, procesar cada elemento
-        if isinstance(detalles, list):
-            for detalle in detalles:
-                # Si el detalle contiene el producto a eliminar, conservar la información
-                if isinstance(detalle, dict) and detalle.get('producto_id') == producto_id:
-                    # Marcar el producto como eliminado pero mantener sus datos
-                    detalle['producto_eliminado'] = True
-                    detalle['nombre_producto_original'] = nombre_producto
-                    modificado = True
-        
-        # Si hubo modificaciones, guardar los cambios
-        if modificado:
-            cuenta.detalles = json.dumps(detalles)
-            db.add(cuenta)
-    
-    # Guardar los cambios en las cuentas y detalles antes de eliminar el producto
-    db.commit()
+    marcar_producto_eliminado_en_cuentas(db, producto_id, db_producto.nombre)
     
-    # Eliminar producto
+    # Eliminar producto en la misma transacción que las notas del historial
     db.delete(db_producto)
     db.commit()
+    menu.invalidar()
+    indice_cocina.invalidar()
     
     # Notificar via WebSockets
     mensaje = {
@@ -175,5 +159,38 @@ def delete_producto(db: Session, producto_id: int) -> None:
         "accion": "eliminar",
         "producto_id": producto_id
     }
-    safe_broadcast(mensaje, "camareros")
-    safe_broadcast(mensaje, "cocina") 
\ No newline at end of file
+    safe_broadcast(mensaje, ("camareros", "cocina"))
+
+def marcar_producto_eliminado_en_cuentas(
+    db: Session,
+    producto_id: int,
+    nombre_producto: str,
+    tamano_lote: int = TAMANO_LOTE_CUENTAS
+) -> int:
+    """
+    Marcar como eliminado un producto en las líneas de las cuentas históricas que lo contienen,
+    conservando sus datos (producto_eliminado y nombre_producto_original).
+    Las cuentas se localizan con el índice inverso cuentas_productos, así que solo se leen las
+    afectadas y no todo el historial; se reescriben por lotes con un UPDATE por clave primaria.
+    Las filas del índice del producto se eliminan. Devuelve el número de cuentas modificadas.
+    """
+    cuenta_ids = db.scalars(
+        select(CuentaProducto.cuenta_id).where(CuentaProducto.producto_id == producto_id)
+    ).all()
+    for inicio in range(0, len(cuenta_ids), tamano_lote):
+        cambios = []
+        filas = db.execute(
+            select(Cuenta.id, Cuenta.detalles).where(Cuenta.id.in_(cuenta_ids[inicio:inicio + tamano_lote]))
+        )
+        for cuenta_id, detalles in filas:
+            detalles = normalizar_detalles(detalles)
+            for detalle in detalles:
+                # Si el detalle contiene el producto a eliminar, conservar la información
+                if isinstance(detalle, dict) and detalle.get("producto_id") == producto_id:
+                    detalle["producto_eliminado"] = True
+                    detalle["nombre_producto_original"] = nombre_producto
+            cambios.append({"id": cuenta_id, "detalles": detalles})
+        if cambios:
+            db.execute(update(Cuenta), cambios)
+    db.execute(delete(CuentaProducto).where(CuentaProducto.producto_id == producto_id))
+    return len(cuenta_ids)
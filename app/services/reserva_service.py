@@ -11,6 +11,10 @@ from app.models.mesa import Mesa
 from app.schemas.reserva import ReservaCreate, ReservaUpdate
 from app.core.enums import EstadoReserva, EstadoMesa
 from app.core.websockets import safe_broadcast
+from app.core.paginacion import paginar
+
+# Clave de ordenación de los listados: más recientes primero, desempate por id
+CLAVE_PAGINACION = (Reserva.fecha, Reserva.id)
 
 def get_reservas(
     db: Session, 
@@ -19,9 +23,10 @@ def get_reservas(
     estado: Optional[EstadoReserva] = None,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None,
-    mesa_id: Optional[int] = None
+    mesa_id: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> List[Reserva]:
-    """Obtener reservas con filtros opcionales"""
+    """Obtener reservas con filtros opcionales, paginadas por offset o por cursor sobre (fecha, id)"""
     query = db.query(Reserva)
     
     if estado is not None:
@@ -37,9 +42,7 @@ def get_reservas(
         query = query.filter(Reserva.mesa_id == mesa_id)
     
     # Order by date (newest first)
-    query = query.order_by(Reserva.fecha.desc())
-    
-    return query.offset(skip).limit(limit).all()
+    return paginar(query, CLAVE_PAGINACION, skip, limit, cursor).all()
 
 def get_reserva_by_id(db: Session, reserva_id: int) -> Reserva:
     """Obtener una reserva específica por ID"""
@@ -48,6 +51,16 @@ def get_reserva_by_id(db: Session, reserva_id: int) -> Reserva:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
     return reserva
 
+def get_reserva_activa_mesa(db: Session, mesa_id: int) -> Optional[Reserva]:
+    """Obtener la reserva pendiente o confirmada más próxima de una mesa (±2 horas)"""
+    ahora = datetime.now(UTC)
+    return db.query(Reserva).filter(
+        Reserva.mesa_id == mesa_id,
+        Reserva.estado.in_([EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA]),
+        Reserva.fecha > ahora - timedelta(hours=2),  # Incluir reservas de hasta 2 horas antes
+        Reserva.fecha < ahora + timedelta(hours=2)   # Solo reservas recientes o próximas
+    ).order_by(Reserva.fecha).first()
+
 def create_reserva(db: Session, reserva: ReservaCreate) -> Reserva:
     """Crear una nueva reserva"""
     # Verificar si la fecha de reserva es en el futuro
@@ -9,10 +9,16 @@ from app.models.usuario import Usuario
 from app.schemas.usuario import UsuarioCreate, UsuarioUpdate
 from app.core.security import get_password_hash
 from app.core.enums import RolUsuario
+from app.core.usuarios import invalidar_usuario_cache
+from app.core.paginacion import paginar
+from app.services.venta_service import reasignar_camarero_eliminado
 
-def get_usuarios(db: Session, skip: int = 0, limit: int = 100) -> List[Usuario]:
-    """Obtener todos los usuarios con paginación"""
-    return db.query(Usuario).offset(skip).limit(limit).all()
+# Clave de ordenación de los listados: por id, en orden de creación
+CLAVE_PAGINACION = (Usuario.id,)
+
+def get_usuarios(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Usuario]:
+    """Obtener todos los usuarios con paginación por offset o por cursor sobre el id"""
+    return paginar(db.query(Usuario), CLAVE_PAGINACION, skip, limit, cursor, descendente=False).all()
 
 def get_usuario_by_id(db: Session, usuario_id: int) -> Optional[Usuario]:
     """Obtener un usuario específico por ID"""
@@ -26,8 +32,11 @@ def get_usuario_by_email(db: Session, email: str) -> Optional[Usuario]:
     """Obtener un usuario específico por email"""
     return db.query(Usuario).filter(Usuario.email == email).first()
 
-def create_usuario(db: Session, usuario: UsuarioCreate) -> Usuario:
-    """Crear un nuevo usuario"""
+def create_usuario(db: Session, usuario: UsuarioCreate, hashed_password: Optional[str] = None) -> Usuario:
+    """
+    Crear un nuevo usuario.
+    Si se recibe hashed_password (calculado en el pool de bcrypt) no se vuelve a hashear.
+    """
     # Verificar si el nombre de usuario ya existe
     db_usuario = get_usuario_by_username(db, usuario.username)
     if db_usuario:
@@ -39,7 +48,8 @@ def create_usuario(db: Session, usuario: UsuarioCreate) -> Usuario:
         raise HTTPException(status_code=400, detail="El email ya está registrado")
     
     # Hashear la contraseña
-    hashed_password = get_password_hash(usuario.password)
+    if hashed_password is None:
+        hashed_password = get_password_hash(usuario.password)
     
     # Crear el usuario
     db_usuario = Usuario(
@@ -55,8 +65,12 @@ def create_usuario(db: Session, usuario: UsuarioCreate) -> Usuario:
     db.refresh(db_usuario)
     return db_usuario
 
-def update_usuario(db: Session, usuario_id: int, usuario: UsuarioUpdate, current_user_id: int, is_admin: bool) -> Usuario:
-    """Actualizar un usuario"""
+def update_usuario(db: Session, usuario_id: int, usuario: UsuarioUpdate, current_user_id: int, is_admin: bool,
+                   hashed_password: Optional[str] = None) -> Usuario:
+    """
+    Actualizar un usuario.
+    Si se recibe hashed_password (calculado en el pool de bcrypt) no se vuelve a hashear.
+    """
     db_usuario = get_usuario_by_id(db, usuario_id)
     if db_usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -84,7 +98,7 @@ def update_usuario(db: Session, usuario_id: int, usuario: UsuarioUpdate, current
     
     # Actualizar la contraseña si se proporciona
     if usuario.password is not None:
-        db_usuario.hashed_password = get_password_hash(usuario.password)
+        db_usuario.hashed_password = hashed_password or get_password_hash(usuario.password)
     
     # Actualizar otros campos
     if usuario.nombre is not None:
@@ -102,6 +116,8 @@ def update_usuario(db: Session, usuario_id: int, usuario: UsuarioUpdate, current
             db_usuario.activo = usuario.activo
     
     db.commit()
+    # Las peticiones siguientes deben ver el rol, el estado activo y el perfil actualizados
+    invalidar_usuario_cache(db_usuario.username)
     db.refresh(db_usuario)
     return db_usuario
 
@@ -117,5 +133,9 @@ def delete_usuario(db: Session, usuario_id: int) -> None:
         if admin_count <= 1:
             raise HTTPException(status_code=400, detail="No se puede eliminar al último administrador")
     
+    username = db_usuario.username
+    # Sus cuentas quedan sin camarero: sus agregados pasan a la clave por nombre en la misma transacción
+    reasignar_camarero_eliminado(db, db_usuario.id)
     db.delete(db_usuario)
-    db.commit() 
\ No newline at end of file
+    db.commit()
+    invalidar_usuario_cache(username) 
\ No newline at end of file
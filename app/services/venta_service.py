@@ -0,0 +1,312 @@
+"""
+Servicio de informes de ventas: agregados de ingresos por hora y por día.
+
+Los agregados se actualizan de forma incremental en la misma transacción que crea, actualiza o
+elimina una cuenta, de modo que las consultas de informes leen solo la tabla ingresos_agregados
+y nunca recorren las cuentas ni decodifican su JSON de detalles.
+
+Reconstrucción desde el historial:
+    python -m app.services.venta_service [tamaño_lote]
+"""
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.cuenta import Cuenta
+from app.models.usuario import Usuario
+from app.models.venta import IngresoAgregado
+from app.core.enums import DimensionVentas, GranularidadVentas, RolUsuario
+
+# (dimensión, granularidad, periodo, clave) -> [nombre, cuentas, unidades, total]
+Contribuciones = Dict[Tuple[str, str, datetime, str], list]
+
+TAMANO_LOTE_RECONSTRUCCION = 5000
+
+# INSERT ... ON CONFLICT por dialecto, para acumular los incrementos en una sola sentencia
+_INSERT_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_tabla = IngresoAgregado.__table__
+
+def _truncar(fecha: datetime, granularidad: GranularidadVentas) -> datetime:
+    """Inicio de la hora o del día de una fecha, en UTC y sin zona horaria (como se guarda en la base de datos)"""
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(UTC).replace(tzinfo=None)
+    fecha = fecha.replace(minute=0, second=0, microsecond=0)
+    if granularidad == GranularidadVentas.DIA:
+        fecha = fecha.replace(hour=0)
+    return fecha
+
+def _sumar(contribuciones: Contribuciones, granularidad, periodo, dimension, clave, nombre, cuentas, unidades, total):
+    """Acumular una contribución en el diccionario"""
+    acumulado = contribuciones.setdefault(
+        (dimension.value, granularidad.value, periodo, str(clave)), [nombre, 0, 0, 0.0]
+    )
+    acumulado[1] += cuentas
+    acumulado[2] += unidades
+    acumulado[3] += total
+
+def contribuciones_cuenta(cuenta: Any) -> Contribuciones:
+    """
+    Calcular lo que una cuenta aporta a cada agregado.
+    Acepta una Cuenta o una fila con sus mismas columnas.
+    """
+    from app.services.cuenta_service import process_detalles_field
+
+    # Unidades e ingresos por producto dentro de la cuenta
+    productos = {}
+    for item in process_detalles_field(cuenta.detalles):
+        producto = productos.setdefault(item["producto_id"], [item["nombre_producto"], 0, 0.0])
+        producto[1] += item["cantidad"]
+        producto[2] += item["subtotal"]
+    unidades = sum(producto[1] for producto in productos.values())
+
+    # Las cuentas sin camarero (eliminado) se agrupan por su nombre histórico
+    clave_camarero = cuenta.camarero_id if cuenta.camarero_id is not None else cuenta.nombre_camarero
+    metodo_pago = cuenta.metodo_pago or "sin_especificar"
+
+    contribuciones = {}
+    for granularidad in GranularidadVentas:
+        fila = (contribuciones, granularidad, _truncar(cuenta.fecha_cobro, granularidad))
+        _sumar(*fila, DimensionVentas.CAMARERO, clave_camarero, cuenta.nombre_camarero, 1, unidades, cuenta.total)
+        _sumar(*fila, DimensionVentas.MESA, cuenta.numero_mesa, f"Mesa {cuenta.numero_mesa}", 1, unidades, cuenta.total)
+        _sumar(*fila, DimensionVentas.METODO_PAGO, metodo_pago, metodo_pago, 1, unidades, cuenta.total)
+        for producto_id, (nombre, cantidad, subtotal) in productos.items():
+            _sumar(*fila, DimensionVentas.PRODUCTO, producto_id, nombre, 1, cantidad, subtotal)
+    return contribuciones
+
+def _acumular(destino: Contribuciones, contribuciones: Contribuciones):
+    """Sumar unas contribuciones a otras"""
+    for clave, (nombre, cuentas, unidades, total) in contribuciones.items():
+        acumulado = destino.setdefault(clave, [nombre, 0, 0, 0.0])
+        acumulado[1] += cuentas
+        acumulado[2] += unidades
+        acumulado[3] += total
+
+def _dialecto(db) -> str:
+    """Nombre del dialecto de una Session o de una Connection"""
+    return db.get_bind().dialect.name if isinstance(db, Session) else db.dialect.name
+
+def aplicar_contribuciones(db, nuevas: Contribuciones, anteriores: Optional[Contribuciones] = None):
+    """
+    Aplicar a los agregados la diferencia entre las contribuciones nuevas y las anteriores.
+    - Crear una cuenta: solo nuevas.
+    - Actualizar una cuenta: nuevas y anteriores (solo cambian los agregados afectados).
+    - Eliminar una cuenta: solo anteriores.
+    No hace commit: se ejecuta dentro de la transacción de la operación sobre la cuenta.
+    """
+    incrementos = {clave: list(valor) for clave, valor in nuevas.items()}
+    for clave, (nombre, cuentas, unidades, total) in (anteriores or {}).items():
+        incremento = incrementos.setdefault(clave, [nombre, 0, 0, 0.0])
+        incremento[1] -= cuentas
+        incremento[2] -= unidades
+        incremento[3] -= total
+
+    filas = [
+        {
+            "dimension": dimension, "granularidad": granularidad, "periodo": periodo, "clave": clave,
+            "nombre": nombre, "cuentas": cuentas, "unidades": unidades, "total": total
+        }
+        for (dimension, granularidad, periodo, clave), (nombre, cuentas, unidades, total) in incrementos.items()
+        if cuentas or unidades or total
+    ]
+    if not filas:
+        return
+
+    sentencia = _INSERT_UPSERT[_dialecto(db)](_tabla)
+    db.execute(
+        sentencia.on_conflict_do_update(
+            index_elements=["dimension", "granularidad", "periodo", "clave"],
+            set_={
+                "nombre": sentencia.excluded.nombre,
+                "cuentas": _tabla.c.cuentas + sentencia.excluded.cuentas,
+                "unidades": _tabla.c.unidades + sentencia.excluded.unidades,
+                "total": _tabla.c.total + sentencia.excluded.total,
+            }
+        ),
+        filas
+    )
+
+    # Los agregados que se quedan sin cuentas se eliminan
+    vaciados = [fila for fila in filas if fila["cuentas"] < 0]
+    if vaciados:
+        db.execute(
+            delete(_tabla).where(
+                _tabla.c.dimension == bindparam("dimension"),
+                _tabla.c.granularidad == bindparam("granularidad"),
+                _tabla.c.periodo == bindparam("periodo"),
+                _tabla.c.clave == bindparam("clave"),
+                _tabla.c.cuentas <= 0
+            ),
+            vaciados
+        )
+
+def reconstruir_agregados(
+    db, tamano_lote: int = TAMANO_LOTE_RECONSTRUCCION, confirmar_lote: Optional[Callable[[], None]] = None
+) -> int:
+    """
+    Vaciar los agregados y volver a calcularlos desde el historial de cuentas.
+    Las cuentas se leen por lotes ordenados por id (paginación por clave), de modo que la memoria
+    usada depende del tamaño del lote y no del tamaño del historial. No hace commit: si se indica
+    confirmar_lote, se llama tras vaciar y tras cada lote para confirmarlos por separado. Solo se
+    recorren las cuentas que ya existían al vaciar: las creadas después suman sus contribuciones al crearse.
+    Las modificaciones de cuentas aún no recorridas se contarían dos veces, así que la reconstrucción
+    por lotes se hace con la aplicación detenida (como las migraciones).
+    Devuelve el número de cuentas procesadas.
+    """
+    db.execute(delete(_tabla))
+    hasta_id = db.execute(select(func.max(Cuenta.id))).scalar() or 0
+    if confirmar_lote is not None:
+        confirmar_lote()
+    columnas = (
+        Cuenta.id, Cuenta.fecha_cobro, Cuenta.camarero_id, Cuenta.nombre_camarero,
+        Cuenta.numero_mesa, Cuenta.total, Cuenta.metodo_pago, Cuenta.detalles
+    )
+    procesadas = 0
+    ultimo_id = 0
+    while True:
+        lote = db.execute(
+            select(*columnas).where(Cuenta.id > ultimo_id, Cuenta.id <= hasta_id).order_by(Cuenta.id).limit(tamano_lote)
+        ).all()
+        if not lote:
+            return procesadas
+        contribuciones = {}
+        for cuenta in lote:
+            _acumular(contribuciones, contribuciones_cuenta(cuenta))
+        aplicar_contribuciones(db, contribuciones)
+        procesadas += len(lote)
+        ultimo_id = lote[-1].id
+        if confirmar_lote is not None:
+            confirmar_lote()
+
+def reasignar_camarero_eliminado(db, camarero_id: int, tamano_lote: int = TAMANO_LOTE_RECONSTRUCCION):
+    """
+    Pasar los agregados de un camarero que se va a eliminar de la clave por su id a la de su nombre
+    histórico, que es la que usan sus cuentas cuando camarero_id queda a NULL. Así, modificar o eliminar
+    después una de esas cuentas resta de la misma fila en la que se sumó.
+    Recorre las cuentas del camarero por lotes. No hace commit: se llama dentro de la transacción que
+    elimina al usuario, antes de eliminarlo.
+    """
+    camarero = DimensionVentas.CAMARERO.value
+    columnas = (
+        Cuenta.id, Cuenta.fecha_cobro, Cuenta.camarero_id, Cuenta.nombre_camarero,
+        Cuenta.numero_mesa, Cuenta.total, Cuenta.metodo_pago, Cuenta.detalles
+    )
+    ultimo_id = 0
+    while True:
+        lote = db.execute(
+            select(*columnas).where(Cuenta.camarero_id == camarero_id, Cuenta.id > ultimo_id)
+            .order_by(Cuenta.id).limit(tamano_lote)
+        ).all()
+        if not lote:
+            return
+        anteriores, nuevas = {}, {}
+        for cuenta in lote:
+            sin_camarero = SimpleNamespace(**{**cuenta._asdict(), "camarero_id": None})
+            _acumular(anteriores, contribuciones_cuenta(cuenta))
+            _acumular(nuevas, contribuciones_cuenta(sin_camarero))
+        aplicar_contribuciones(
+            db,
+            {clave: valor for clave, valor in nuevas.items() if clave[0] == camarero},
+            {clave: valor for clave, valor in anteriores.items() if clave[0] == camarero}
+        )
+        ultimo_id = lote[-1].id
+
+def _comprobar_admin(current_user: Usuario):
+    if current_user.rol != RolUsuario.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Solo los administradores pueden ver los informes de ventas"
+        )
+
+def _filtros_periodo(
+    dimension: DimensionVentas,
+    granularidad: GranularidadVentas,
+    fecha_inicio: Optional[datetime],
+    fecha_fin: Optional[datetime]
+) -> list:
+    """Filtros por dimensión, granularidad y rango de periodos (por defecto, los últimos 30 días)"""
+    if fecha_fin is None:
+        fecha_fin = datetime.now(UTC)
+    if fecha_inicio is None:
+        fecha_inicio = fecha_fin - timedelta(days=30)
+    return [
+        IngresoAgregado.dimension == dimension.value,
+        IngresoAgregado.granularidad == granularidad.value,
+        IngresoAgregado.periodo >= _truncar(fecha_inicio, granularidad),
+        IngresoAgregado.periodo <= _truncar(fecha_fin, granularidad)
+    ]
+
+def get_ingresos(
+    db: Session,
+    dimension: DimensionVentas,
+    granularidad: GranularidadVentas = GranularidadVentas.DIA,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    clave: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 500,
+    current_user: Usuario = None
+) -> List[IngresoAgregado]:
+    """Obtener la serie de ingresos por hora o por día de una dimensión, ordenada por periodo"""
+    _comprobar_admin(current_user)
+    query = db.query(IngresoAgregado).filter(*_filtros_periodo(dimension, granularidad, fecha_inicio, fecha_fin))
+    if clave is not None:
+        query = query.filter(IngresoAgregado.clave == clave)
+    return query.order_by(IngresoAgregado.periodo, IngresoAgregado.clave).offset(skip).limit(limit).all()
+
+def get_totales(
+    db: Session,
+    dimension: DimensionVentas,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    current_user: Usuario = None
+) -> List[Dict[str, Any]]:
+    """
+    Obtener los ingresos acumulados de cada clave de una dimensión en un periodo, de mayor a menor.
+    Se suman los agregados por hora, así que el periodo tiene una resolución de una hora.
+    """
+    _comprobar_admin(current_user)
+    total = func.sum(IngresoAgregado.total)
+    filas = (
+        db.query(
+            IngresoAgregado.clave,
+            func.max(IngresoAgregado.nombre),
+            func.sum(IngresoAgregado.cuentas),
+            func.sum(IngresoAgregado.unidades),
+            total
+        )
+        .filter(*_filtros_periodo(dimension, GranularidadVentas.HORA, fecha_inicio, fecha_fin))
+        .group_by(IngresoAgregado.clave)
+        .order_by(total.desc())
+        .all()
+    )
+    return [
+        {
+            "clave": clave,
+            "nombre": nombre,
+            "cuentas": cuentas,
+            "unidades": unidades,
+            "total": round(total, 2),
+            "promedio": round(total / cuentas, 2) if cuentas > 0 else 0
+        }
+        for clave, nombre, cuentas, unidades, total in filas
+    ]
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from app.db.database import Base, engine
+    import app.models  # noqa: F401  (registrar todos los modelos)
+
+    tamano_lote = int(sys.argv[1]) if len(sys.argv) > 1 else TAMANO_LOTE_RECONSTRUCCION
+    Base.metadata.create_all(bind=engine)
+    inicio = time.perf_counter()
+    with engine.begin() as conexion:
+        procesadas = reconstruir_agregados(conexion, tamano_lote)
+    print(f"Agregados reconstruidos a partir de {procesadas} cuentas en {time.perf_counter() - inicio:.1f} s")
@@ -2,8 +2,9 @@
 Archivo de configuración de Pytest con fixtures para testing.
 """
 import pytest
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, UTC
 
@@ -13,6 +14,9 @@ from app.core.config import SQLALCHEMY_TEST_DATABASE_URL
 from app.models.usuario import Usuario
 from app.core.enums import RolUsuario
 from app.core.security import get_password_hash
+from app.core.usuarios import cache_usuarios
+from app.core.cocina import indice_cocina
+from app.core.menu import menu
 
 # Configuración de la base de datos de prueba
 engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False})
@@ -68,12 +72,41 @@ def client(db):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    # Cada prueba parte de una base de datos limpia: descartar usuarios cacheados, el índice de cocina y el menú
+    cache_usuarios.limpiar()
+    indice_cocina.reiniciar()
+    menu.reiniciar()
     with TestClient(app) as test_client:
         yield test_client
     
     # Limpiar reemplazos después de la prueba
     app.dependency_overrides.clear()
 
+@pytest.fixture
+def limite_consultas(db):
+    """
+    Devuelve un context manager que falla si el bloque ejecuta más sentencias SQL que el presupuesto.
+    Vacía antes el identity map de la sesión para medir como en una petición real (sin objetos ya cargados).
+    """
+    @contextmanager
+    def limite(maximo: int):
+        consultas = []
+
+        def registrar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+
+        db.expunge_all()
+        event.listen(engine, "before_cursor_execute", registrar)
+        try:
+            yield consultas
+        finally:
+            event.remove(engine, "before_cursor_execute", registrar)
+        assert len(consultas) <= maximo, (
+            f"Se ejecutaron {len(consultas)} consultas (presupuesto: {maximo}):\n" + "\n".join(consultas)
+        )
+
+    return limite
+
 @pytest.fixture
 def admin_user(db, client):
     """Crear un usuario administrador y devolver su ID y token."""
@@ -1,12 +1,18 @@
 """
 Tests para los endpoints de autenticación.
 """
+import asyncio
+import time
+
+import bcrypt
 import pytest
 from fastapi import status
 from sqlalchemy.orm import Session
 from app.models.usuario import Usuario
 from app.core.enums import RolUsuario
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash, verificar_password_async
+from app.core.websockets import ConnectionManager
+from app.core.metrics import reiniciar_metricas
 from datetime import datetime, UTC
 
 @pytest.fixture
@@ -71,4 +77,73 @@ class TestAuthentication:
             headers={"Authorization": f"Bearer {admin_user['token']}"}
         )
         assert response.status_code == status.HTTP_200_OK
-        assert response.json()["username"] == "admin" 
\ No newline at end of file
+        assert response.json()["username"] == "admin"
+
+    def test_metricas_de_login(self, client, admin_user):
+        """Probar que los intentos de login quedan registrados en /metricas."""
+        reiniciar_metricas()
+        client.post("/login", json={"username": "admin", "password": "admin123"})
+        client.post("/login", json={"username": "admin", "password": "wrong_password"})
+
+        response = client.get("/metricas/", headers={"Authorization": f"Bearer {admin_user['token']}"})
+        assert response.status_code == status.HTTP_200_OK
+        metricas = response.json()
+        assert metricas["login_intentos"] == 2
+        assert metricas["login_exitosos"] == 1
+        assert metricas["login_fallidos"] == 1
+        assert metricas["login_por_minuto"] == 2
+        assert metricas["login_duracion"]["cuenta"] == 2
+
+    def test_metricas_solo_admin(self, client, camarero_user):
+        """Probar que solo los administradores pueden consultar las métricas."""
+        response = client.get("/metricas/", headers={"Authorization": f"Bearer {camarero_user['token']}"})
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class _WebSocketFalso:
+    """WebSocket mínimo que registra el instante de cada mensaje recibido"""
+
+    def __init__(self):
+        self.instantes = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, mensaje: str):
+        self.instantes.append(time.perf_counter())
+
+
+class TestLoginConcurrente:
+    def test_broadcasts_fluyen_durante_rafaga_de_logins(self):
+        """Probar que una ráfaga de verificaciones bcrypt no detiene los broadcasts WebSocket."""
+        hashed = bcrypt.hashpw(b"admin123", bcrypt.gensalt(rounds=10)).decode("utf-8")
+        gestor = ConnectionManager()
+        cocina = _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(cocina, "cocina")
+            terminado = asyncio.Event()
+
+            async def emisor():
+                while not terminado.is_set():
+                    await gestor.broadcast('{"tipo": "latido"}', "cocina")
+                    await asyncio.sleep(0.005)
+
+            tarea = asyncio.create_task(emisor())
+            inicio = time.perf_counter()
+            resultados = await asyncio.gather(
+                *(verificar_password_async("admin123", hashed) for _ in range(16))
+            )
+            duracion = time.perf_counter() - inicio
+            terminado.set()
+            await tarea
+            return resultados, duracion
+
+        resultados, duracion = asyncio.run(escenario())
+
+        assert all(resultados)
+        assert len(cocina.instantes) >= duracion / 0.05
+        huecos = [b - a for a, b in zip(cocina.instantes, cocina.instantes[1:])]
+        # Si bcrypt corriera en el bucle, el hueco máximo sería del orden de toda la ráfaga
+        assert max(huecos) < 0.1
+        assert max(huecos) < duracion / 2
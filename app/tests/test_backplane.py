@@ -0,0 +1,229 @@
+"""
+Tests del backplane de eventos WebSocket entre procesos.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+
+import pytest
+
+from app.core.backplane import Backplane, BackplaneUnixSocket, codificar_datagrama, comprobar_directorio, crear_backplane, decodificar_datagrama
+from app.core.websockets import ConnectionManager, EventoWebSocket
+
+ESPERA_MAXIMA = 10.0
+
+class _WebSocketFalso:
+    """WebSocket mínimo que guarda los mensajes recibidos"""
+
+    def __init__(self):
+        self.mensajes = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, mensaje: str):
+        self.mensajes.append(mensaje)
+
+    async def close(self, code: int = 1000):
+        pass
+
+def _sin_seq(trama: str) -> dict:
+    """Datos de un evento sin su número de secuencia ni su época, que asigna cada proceso"""
+    datos = json.loads(trama)
+    assert isinstance(datos.pop("seq"), int)
+    assert isinstance(datos.pop("epoca"), str)
+    return datos
+
+class _BackplaneEnMemoria(Backplane):
+    """Backplane dentro de un mismo proceso: entrega cada evento al resto de gestores conectados"""
+
+    def __init__(self, red: list):
+        self.red = red
+        self.entregar = None
+
+    async def iniciar(self, entregar):
+        self.entregar = entregar
+        self.red.append(self)
+
+    def publicar(self, trama, grupos, clave=None, canales=()):
+        for otro in self.red:
+            if otro is not self:
+                otro.entregar(trama, list(grupos), clave, sorted(canales))
+
+    async def detener(self):
+        self.red.remove(self)
+
+def _worker(directorio, listo, resultados):
+    """
+    Proceso worker: una conexión de cocina y otra de administración conectadas a su propio gestor.
+    Difunde un evento propio al recibir el primero y devuelve lo que ha recibido cada conexión.
+    """
+    async def escenario():
+        gestor = ConnectionManager()
+        cocina, admin = _WebSocketFalso(), _WebSocketFalso()
+        await gestor.connect(cocina, "cocina")
+        await gestor.connect(admin, "admin")
+        await gestor.iniciar_backplane(BackplaneUnixSocket(directorio))
+        listo.set()
+
+        fin = time.monotonic() + ESPERA_MAXIMA
+        while not cocina.mensajes and time.monotonic() < fin:
+            await asyncio.sleep(0.01)
+        gestor.difundir(EventoWebSocket({"tipo": "respuesta", "pid": os.getpid()}), ("camareros",))
+        await asyncio.sleep(0.3)  # dar tiempo a que lleguen duplicados, si los hubiera
+        await gestor.detener_backplane()
+        return {"cocina": cocina.mensajes, "admin": admin.mensajes}
+
+    resultados.put(asyncio.run(escenario()))
+
+@pytest.fixture
+def directorio():
+    # Ruta corta: las rutas de los sockets Unix están limitadas a ~100 caracteres
+    return tempfile.mkdtemp(prefix="ws-bp-")
+
+class TestBackplaneUnixSocket:
+    def test_evento_llega_a_los_demas_procesos(self, directorio):
+        """Probar que un evento difundido en un proceso llega a los clientes de los demás, una sola vez."""
+        contexto = multiprocessing.get_context("spawn")
+        resultados = contexto.Queue()
+        listos = [contexto.Event() for _ in range(2)]
+        workers = [contexto.Process(target=_worker, args=(directorio, listo, resultados)) for listo in listos]
+        for worker in workers:
+            worker.start()
+        try:
+            assert all(listo.wait(ESPERA_MAXIMA * 3) for listo in listos)
+
+            async def escenario():
+                gestor = ConnectionManager()
+                cocina, camareros = _WebSocketFalso(), _WebSocketFalso()
+                await gestor.connect(cocina, "cocina")
+                await gestor.connect(camareros, "camareros")
+                await gestor.iniciar_backplane(BackplaneUnixSocket(directorio))
+                gestor.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": 1}), ("cocina",))
+                fin = time.monotonic() + ESPERA_MAXIMA
+                while len(camareros.mensajes) < 2 and time.monotonic() < fin:
+                    await asyncio.sleep(0.01)
+                await gestor.detener_backplane()
+                return cocina.mensajes, camareros.mensajes
+
+            cocina_local, camareros_local = asyncio.run(escenario())
+            remotos = [resultados.get(timeout=ESPERA_MAXIMA) for _ in workers]
+        finally:
+            for worker in workers:
+                worker.join(ESPERA_MAXIMA)
+                if worker.is_alive():
+                    worker.terminate()
+
+        # El proceso que publica entrega localmente y no recibe su propio evento de vuelta
+        assert len(cocina_local) == 1
+        for remoto in remotos:
+            assert [_sin_seq(m) for m in remoto["cocina"]] == [{"tipo": "nuevo_pedido", "pedido_id": 1}]
+            assert remoto["admin"] == []
+        # Las respuestas de ambos workers llegan al proceso principal
+        assert sorted(json.loads(m)["pid"] for m in camareros_local) == sorted(w.pid for w in workers)
+        assert not [nombre for nombre in os.listdir(directorio) if nombre.endswith(".sock")]
+
+    def test_socket_de_proceso_muerto_se_elimina(self, directorio):
+        """Probar que publicar a un proceso que ya no existe elimina su socket sin fallar."""
+        huerfano = os.path.join(directorio, "99999999.sock")
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        s.bind(huerfano)
+        s.close()
+
+        async def escenario():
+            backplane = BackplaneUnixSocket(directorio)
+            await backplane.iniciar(lambda *args: None)
+            backplane.publicar('{"tipo": "latido"}', ("cocina",))
+            await backplane.detener()
+
+        asyncio.run(escenario())
+        assert not os.path.exists(huerfano)
+
+    def test_datagrama_ida_y_vuelta(self):
+        """Probar que la trama, los grupos, la clave y los canales se conservan en el datagrama."""
+        trama = '{"tipo": "actualizacion_pedido", "nota": "línea\\nnueva"}'
+        datos = codificar_datagrama(
+            trama, ("camareros", "cocina"), "actualizacion_pedido:3", frozenset({"mesa:4", "tipo:bebida"})
+        )
+        assert decodificar_datagrama(datos) == (
+            trama, ["camareros", "cocina"], "actualizacion_pedido:3", ["mesa:4", "tipo:bebida"]
+        )
+
+    def test_cursor_de_otro_gestor_pide_resincronizar(self):
+        """Probar que un since de otro gestor (otra época) pide resincronizar aunque el número exista aquí."""
+        gestor_a, gestor_b = ConnectionManager(), ConnectionManager()
+        cliente_a, cliente_b = _WebSocketFalso(), _WebSocketFalso()
+
+        async def esperar(condicion):
+            fin = time.monotonic() + ESPERA_MAXIMA
+            while not condicion() and time.monotonic() < fin:
+                await asyncio.sleep(0.01)
+
+        async def escenario():
+            red = []
+            await gestor_a.iniciar_backplane(_BackplaneEnMemoria(red))
+            await gestor_b.iniciar_backplane(_BackplaneEnMemoria(red))
+            await gestor_a.connect(cliente_a, "cocina")
+            # B ya ha numerado eventos propios: sus seq no coinciden con los de A
+            gestor_b.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": 1}), ("camareros",))
+            for pedido_id in (2, 3):
+                gestor_a.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": pedido_id}), ("cocina",))
+            await esperar(lambda: len(cliente_a.mensajes) == 2)
+
+            # El cliente de A se reconecta a B con el cursor de A
+            ultimo = json.loads(cliente_a.mensajes[0])
+            await gestor_b.connect(cliente_b, "cocina", since=ultimo["seq"], epoca=ultimo["epoca"])
+            await esperar(lambda: cliente_b.mensajes)
+            reanudado = _WebSocketFalso()
+            await gestor_b.connect(reanudado, "cocina", since=gestor_b.seq - 2, epoca=gestor_b.epoca)
+            await esperar(lambda: len(reanudado.mensajes) == 2)
+            await gestor_a.detener_backplane()
+            await gestor_b.detener_backplane()
+            return reanudado.mensajes
+
+        reanudado = asyncio.run(escenario())
+        assert gestor_a.epoca != gestor_b.epoca
+        assert [json.loads(m) for m in cliente_b.mensajes] == [
+            {"tipo": "resync_requerido", "seq": gestor_b.seq, "epoca": gestor_b.epoca}
+        ]
+        # Los eventos recibidos por el backplane se numeran con la secuencia y la época de B
+        assert [json.loads(m) for m in reanudado] == [
+            {"seq": 2, "epoca": gestor_b.epoca, "tipo": "nuevo_pedido", "pedido_id": 2},
+            {"seq": 3, "epoca": gestor_b.epoca, "tipo": "nuevo_pedido", "pedido_id": 3},
+        ]
+
+    def test_crear_backplane(self, directorio):
+        """Probar que sin configurar no hay backplane y que un tipo desconocido es un error."""
+        assert crear_backplane("", directorio) is None
+        assert isinstance(crear_backplane("unix", directorio), BackplaneUnixSocket)
+        with pytest.raises(ValueError):
+            crear_backplane("redis", directorio)
+
+    def test_directorio_nuevo_solo_para_el_usuario(self, directorio):
+        """Probar que el directorio de los sockets se crea con permisos 0700."""
+        nuevo = os.path.join(directorio, "nuevo")
+        comprobar_directorio(nuevo)
+        assert os.stat(nuevo).st_mode & 0o777 == 0o700
+
+    def test_directorio_inseguro_se_rechaza(self, directorio, monkeypatch):
+        """Probar que se rechaza un directorio modificable por otros, de otro usuario o que no es un directorio."""
+        compartido = os.path.join(directorio, "compartido")
+        os.mkdir(compartido)
+        os.chmod(compartido, 0o777)
+        with pytest.raises(PermissionError, match="otros usuarios"):
+            asyncio.run(BackplaneUnixSocket(compartido).iniciar(lambda *args: None))
+        assert os.listdir(compartido) == []
+
+        enlace = os.path.join(directorio, "enlace")
+        os.symlink(directorio, enlace)
+        with pytest.raises(PermissionError, match="no es un directorio"):
+            comprobar_directorio(enlace)
+
+        uid = os.getuid()
+        monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+        with pytest.raises(PermissionError, match="otro usuario"):
+            comprobar_directorio(directorio)
@@ -183,4 +183,18 @@ class TestCategorias:
             f"/categorias/{categoria['id']}",
             headers={"Authorization": f"Bearer {camarero_user['token']}"}
         )
-        assert response.status_code == status.HTTP_403_FORBIDDEN 
\ No newline at end of file
+        assert response.status_code == status.HTTP_403_FORBIDDEN 
+
+    def test_listado_etag_304(self, client, admin_user, categoria):
+        """Probar que el listado sin cambios devuelve 304 y que crear una categoría genera un ETag nuevo."""
+        etag = client.get("/categorias/").headers["ETag"]
+        assert client.get("/categorias/", headers={"If-None-Match": etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+        client.post(
+            "/categorias/",
+            json={"nombre": "Postres", "descripcion": "Dulces"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        response = client.get("/categorias/", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert [c["nombre"] for c in response.json()] == ["Test Categoria", "Postres"]
@@ -0,0 +1,237 @@
+"""
+Tests para la instantánea de la pantalla de cocina.
+"""
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import status
+from app.core.cocina import IndiceCocina, indice_cocina
+from app.core.enums import EstadoPedido, TipoProducto
+from app.core.websockets import ConnectionManager, manager
+from app.models.pedido import Pedido
+from app.services import cocina_service, pedido_service
+from app.tests.test_backplane import _BackplaneEnMemoria
+
+@pytest.fixture
+def mesa(client, admin_user):
+    """Crear una mesa de prueba y devolver sus datos."""
+    response = client.post(
+        "/mesas/",
+        json={"numero": 7, "capacidad": 4, "ubicacion": "Terraza"},
+        headers={"Authorization": f"Bearer {admin_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+@pytest.fixture
+def producto(client, admin_user):
+    """Crear una categoría y un producto de prueba y devolver los datos del producto."""
+    categoria = client.post(
+        "/categorias/",
+        json={"nombre": "Principales", "descripcion": "Platos principales"},
+        headers={"Authorization": f"Bearer {admin_user['token']}"}
+    ).json()
+    response = client.post(
+        "/productos/",
+        json={
+            "nombre": "Paella",
+            "precio": 14.5,
+            "tiempo_preparacion": 25,
+            "categoria_id": categoria["id"],
+            "tipo": TipoProducto.COMIDA,
+            "disponible": True
+        },
+        headers={"Authorization": f"Bearer {admin_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+def _crear_pedido(client, camarero_user, mesa, producto, cantidad=1):
+    response = client.post(
+        "/pedidos/",
+        json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": cantidad}]},
+        headers={"Authorization": f"Bearer {camarero_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+class TestSnapshotCocina:
+    def test_snapshot_pedidos_activos(self, client, admin_user, camarero_user, cocinero_user, mesa, producto):
+        """Probar que la instantánea incluye los pedidos activos con sus líneas y excluye los cancelados."""
+        activo = _crear_pedido(client, camarero_user, mesa, producto, cantidad=2)
+        cancelado = _crear_pedido(client, camarero_user, mesa, producto)
+        client.put(
+            f"/pedidos/{cancelado['id']}",
+            json={"estado": EstadoPedido.CANCELADO},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+
+        response = client.get("/cocina/snapshot", headers={"Authorization": f"Bearer {cocinero_user['token']}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"]
+        pedidos = response.json()["pedidos"]
+        assert [p["id"] for p in pedidos] == [activo["id"]]
+        assert pedidos[0]["mesa"]["numero"] == 7
+        assert pedidos[0]["detalles"][0]["cantidad"] == 2
+        assert pedidos[0]["detalles"][0]["producto"]["nombre"] == "Paella"
+
+    def test_snapshot_etag_304(self, client, camarero_user, cocinero_user, mesa, producto):
+        """Probar que un re-sondeo sin cambios devuelve 304 y que un cambio genera un ETag nuevo."""
+        _crear_pedido(client, camarero_user, mesa, producto)
+        cabeceras = {"Authorization": f"Bearer {cocinero_user['token']}"}
+        etag = client.get("/cocina/snapshot", headers=cabeceras).headers["ETag"]
+
+        response = client.get("/cocina/snapshot", headers={**cabeceras, "If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+        _crear_pedido(client, camarero_user, mesa, producto)
+        response = client.get("/cocina/snapshot", headers={**cabeceras, "If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] != etag
+        assert len(response.json()["pedidos"]) == 2
+
+    def test_snapshot_actualizacion_incremental(
+        self, client, camarero_user, cocinero_user, mesa, producto, limite_consultas
+    ):
+        """Probar que los cambios de estado se reflejan sin recargar y que re-sondear no consulta la base de datos."""
+        pedido = _crear_pedido(client, camarero_user, mesa, producto)
+        cabeceras = {"Authorization": f"Bearer {cocinero_user['token']}"}
+        client.get("/cocina/snapshot", headers=cabeceras)
+
+        client.put(f"/pedidos/{pedido['id']}", json={"estado": EstadoPedido.LISTO}, headers=cabeceras)
+        with limite_consultas(0):
+            response = client.get("/cocina/snapshot", headers=cabeceras)
+        assert response.json()["pedidos"][0]["estado"] == EstadoPedido.LISTO
+
+        nuevo = client.post(
+            f"/pedidos/{pedido['id']}/detalles/",
+            json={"producto_id": producto["id"], "cantidad": 3},
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert nuevo.status_code == status.HTTP_201_CREATED
+        with limite_consultas(0):
+            response = client.get("/cocina/snapshot", headers=cabeceras)
+        assert sorted(d["cantidad"] for d in response.json()["pedidos"][0]["detalles"]) == [1, 3]
+
+    def test_cerrar_mesa_quita_pedidos(self, client, admin_user, camarero_user, cocinero_user, mesa, producto):
+        """Probar que al cerrar la mesa sus pedidos entregados salen de la instantánea."""
+        _crear_pedido(client, camarero_user, mesa, producto)
+        cabeceras = {"Authorization": f"Bearer {cocinero_user['token']}"}
+        assert len(client.get("/cocina/snapshot", headers=cabeceras).json()["pedidos"]) == 1
+
+        response = client.put(
+            f"/mesas/{mesa['id']}",
+            json={"estado": "libre", "metodo_pago": "efectivo"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert client.get("/cocina/snapshot", headers=cabeceras).json()["pedidos"] == []
+
+    def test_cambio_de_producto_recarga_snapshot(self, client, admin_user, camarero_user, cocinero_user, mesa, producto):
+        """Probar que renombrar un producto se refleja en las líneas de los pedidos activos."""
+        _crear_pedido(client, camarero_user, mesa, producto)
+        cabeceras = {"Authorization": f"Bearer {cocinero_user['token']}"}
+        client.get("/cocina/snapshot", headers=cabeceras)
+
+        client.put(
+            f"/productos/{producto['id']}",
+            json={"nombre": "Paella valenciana"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        pedidos = client.get("/cocina/snapshot", headers=cabeceras).json()["pedidos"]
+        assert pedidos[0]["detalles"][0]["producto"]["nombre"] == "Paella valenciana"
+
+    def test_snapshot_solo_cocina(self, client, camarero_user):
+        """Probar que los camareros no pueden consultar la instantánea de cocina."""
+        response = client.get("/cocina/snapshot", headers={"Authorization": f"Bearer {camarero_user['token']}"})
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_cambio_durante_la_carga_no_se_pierde(self, client, db, camarero_user, cocinero_user, mesa, producto, monkeypatch):
+        """Probar que un cambio confirmado mientras se carga el índice obliga a recargarlo en la siguiente lectura."""
+        pedido = _crear_pedido(client, camarero_user, mesa, producto)
+        consultar = cocina_service.get_pedidos_activos
+
+        def consultar_con_cambio_concurrente(sesion):
+            pedidos = consultar(sesion)
+            # Otra petición cambia el pedido después de la consulta y antes de guardar el índice
+            sesion.query(Pedido).filter(Pedido.id == pedido["id"]).update({"estado": EstadoPedido.LISTO})
+            pedido_service._sincronizar_cocina(sesion, pedido["id"])
+            return pedidos
+
+        monkeypatch.setattr(cocina_service, "get_pedidos_activos", consultar_con_cambio_concurrente)
+        cocina_service.get_snapshot(db)
+        assert not indice_cocina.cargado
+
+        monkeypatch.setattr(cocina_service, "get_pedidos_activos", consultar)
+        response = client.get("/cocina/snapshot", headers={"Authorization": f"Bearer {cocinero_user['token']}"})
+        assert response.json()["pedidos"][0]["estado"] == EstadoPedido.LISTO
+
+    def test_evento_de_otro_proceso_invalida_el_indice(self, client, camarero_user, cocinero_user, mesa, producto):
+        """Probar que un evento de cocina recibido por el backplane invalida el índice y uno de camareros no."""
+        _crear_pedido(client, camarero_user, mesa, producto)
+        client.get("/cocina/snapshot", headers={"Authorization": f"Bearer {cocinero_user['token']}"})
+        gestor = ConnectionManager()
+        gestor.suscribir_eventos_remotos(cocina_service.invalidar_por_evento_remoto)
+
+        gestor._entregar_remoto('{"tipo": "pago_realizado"}', ["camareros"], None)
+        assert indice_cocina.cargado
+        gestor._entregar_remoto('{"tipo": "actualizacion_pedido"}', ["cocina", "camareros"], None)
+        assert not indice_cocina.cargado
+
+        # Un evento de un pedido solo para los camareros (el cocinero cambia el estado) también invalida
+        client.get("/cocina/snapshot", headers={"Authorization": f"Bearer {cocinero_user['token']}"})
+        gestor._entregar_remoto('{"tipo": "actualizacion_pedido", "pedido_id": 1}', ["camareros"], None)
+        assert not indice_cocina.cargado
+
+    def test_cambios_de_cocina_y_cierre_de_mesa_llegan_a_otro_worker(
+        self, client, db, admin_user, camarero_user, cocinero_user, mesa, producto, monkeypatch
+    ):
+        """
+        Probar que la instantánea de otro worker refleja el cambio de estado hecho por un cocinero y el
+        cierre de la mesa. La aplicación hace de worker A; el worker B tiene su propio índice y su gestor,
+        conectados al de A por un backplane en memoria.
+        """
+        indice_b = IndiceCocina()
+        monkeypatch.setattr(cocina_service, "indice_cocina", indice_b)
+        gestor_b = ConnectionManager()
+        gestor_b.suscribir_eventos_remotos(cocina_service.invalidar_por_evento_remoto)
+        red = []
+        asyncio.run(manager.iniciar_backplane(_BackplaneEnMemoria(red)))
+        asyncio.run(gestor_b.iniciar_backplane(_BackplaneEnMemoria(red)))
+
+        def en_worker_a(accion):
+            """Ejecutar una petición en el worker A y esperar a que su evento invalide el índice de B"""
+            version = indice_b.version
+            accion()
+            fin = time.monotonic() + 5
+            while indice_b.version == version and time.monotonic() < fin:
+                time.sleep(0.01)
+            assert indice_b.version != version
+
+        def snapshot_b():
+            return json.loads(cocina_service.get_snapshot(db)[0])["pedidos"]
+
+        try:
+            pedido = {}
+            en_worker_a(lambda: pedido.update(_crear_pedido(client, camarero_user, mesa, producto)))
+            assert [p["estado"] for p in snapshot_b()] == [EstadoPedido.RECIBIDO]
+
+            en_worker_a(lambda: client.put(
+                f"/pedidos/{pedido['id']}",
+                json={"estado": EstadoPedido.LISTO},
+                headers={"Authorization": f"Bearer {cocinero_user['token']}"}
+            ))
+            assert [p["estado"] for p in snapshot_b()] == [EstadoPedido.LISTO]
+
+            en_worker_a(lambda: client.put(
+                f"/mesas/{mesa['id']}",
+                json={"estado": "libre", "metodo_pago": "efectivo"},
+                headers={"Authorization": f"Bearer {admin_user['token']}"}
+            ))
+            assert snapshot_b() == []
+        finally:
+            asyncio.run(manager.detener_backplane())
+            asyncio.run(gestor_b.detener_backplane())
@@ -1,9 +1,21 @@
 """
 Tests para los endpoints de gestión de cuentas.
 """
+import json
+
 import pytest
 from fastapi import status
 from datetime import datetime, timedelta
+from sqlalchemy import Text, select, type_coerce
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.models.cuenta import Cuenta
+from app.models.mesa import Mesa
+from app.models.pedido import Pedido
+from app.models.usuario import Usuario
+from app.schemas.mesa import MesaUpdate
+from app.services import cuenta_service, mesa_service
 
 @pytest.fixture
 def mesa(client, admin_user):
@@ -129,6 +141,15 @@ class TestCuentas:
         for c in response.json():
             assert c["camarero_id"] == camarero_user["id"]
     
+    def test_listado_igual_que_el_detalle(self, client, admin_user, cuenta):
+        """Probar que el listado serializado directamente coincide con la respuesta validada de cada cuenta."""
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        listado = client.get("/cuentas/", headers=cabeceras)
+        assert listado.headers["content-type"] == "application/json"
+        for c in listado.json():
+            detalle = client.get(f"/cuentas/{c['id']}", headers=cabeceras).json()
+            assert c == detalle
+    
     def test_get_cuenta_by_id(self, client, admin_user, camarero_user, cuenta):
         """Probar la obtención de una cuenta específica por ID."""
         # Admin puede ver cualquier cuenta
@@ -147,7 +168,7 @@ class TestCuentas:
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["id"] == cuenta["id"]
     
-    def test_create_cuenta_manual(self, client, camarero_user, admin_user):
+    def test_create_cuenta_manual(self, client, db, camarero_user, admin_user):
         """Probar la creación manual de una cuenta."""
         cuenta_data = {
             "numero_mesa": 101,
@@ -175,6 +196,14 @@ class TestCuentas:
         assert response.json()["total"] == 25.99
         assert response.json()["nombre_camarero"] == "Test Camarero"
         
+        # Los detalles se guardan como lista JSON nativa, sin codificarlos dos veces
+        texto = db.execute(
+            select(type_coerce(Cuenta.detalles, Text)).where(Cuenta.id == response.json()["id"])
+        ).scalar_one()
+        assert json.loads(texto) == [
+            {**cuenta_data["detalles"][0], "producto_eliminado": False, "nombre_producto_original": None}
+        ]
+        
         # Verificar si un cocinero puede crear cuentas (no debería)
         # TODO: Agregar test para verificar que un cocinero no puede crear cuentas
     
@@ -230,4 +259,200 @@ class TestCuentas:
             "/cuentas/resumen",
             headers={"Authorization": f"Bearer {camarero_user['token']}"}
         )
-        assert response.status_code == status.HTTP_403_FORBIDDEN 
\ No newline at end of file
+        assert response.status_code == status.HTTP_403_FORBIDDEN 
+
+class TestGenerarCuenta:
+    @pytest.fixture
+    def rondas(self, client, camarero_user, mesa, producto, pedido, db):
+        """Dos rondas más sobre la mesa del pedido de prueba, una de ellas cancelada."""
+        ids = []
+        for observaciones in ("Poco hecho", None):
+            response = client.post(
+                "/pedidos/",
+                json={"mesa_id": mesa["id"], "detalles": [
+                    {"producto_id": producto["id"], "cantidad": 1, "observaciones": observaciones}
+                ]},
+                headers={"Authorization": f"Bearer {camarero_user['token']}"}
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+            ids.append(response.json()["id"])
+        db.query(Pedido).filter(Pedido.id == ids[1]).update({"estado": "cancelado"})
+        db.commit()
+        return [pedido["id"], ids[0]]
+
+    def _generar(self, client, camarero_user, mesa, **params):
+        response = client.get(
+            f"/cuentas/generar/mesa/{mesa['id']}",
+            params=params,
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    def test_una_linea_por_detalle(self, client, camarero_user, mesa, producto, rondas):
+        """Probar que cada línea de pedido es una línea de la cuenta, en orden y sin los pedidos cancelados."""
+        datos = self._generar(client, camarero_user, mesa)
+        assert [(d["pedido_id"], d["cantidad"], d["observaciones"]) for d in datos["detalles"]] == [
+            (rondas[0], 2, "Sin sal"), (rondas[1], 1, "Poco hecho")
+        ]
+        assert all(d["nombre_producto"] == producto["nombre"] for d in datos["detalles"])
+        assert datos["total"] == pytest.approx(3 * producto["precio"])
+
+    def test_agrupada_suma_productos_iguales(self, client, camarero_user, mesa, producto, rondas):
+        """Probar que el modo agrupado suma las unidades del mismo producto y conserva las observaciones."""
+        datos = self._generar(client, camarero_user, mesa, agrupar=True)
+        assert len(datos["detalles"]) == 1
+        linea = datos["detalles"][0]
+        assert (linea["pedido_id"], linea["producto_id"], linea["cantidad"]) == (rondas[0], producto["id"], 3)
+        assert linea["observaciones"] == "Sin sal; Poco hecho"
+        assert linea["subtotal"] == pytest.approx(datos["total"])
+        assert datos["total"] == pytest.approx(3 * producto["precio"])
+
+    def test_consultas_constantes(self, db, mesa, camarero_user, rondas, limite_consultas):
+        """Probar que las líneas salen de una sola consulta con join, sin una por pedido o producto."""
+        with limite_consultas(3) as consultas:
+            datos = cuenta_service.generar_cuenta_desde_pedidos(db, mesa["id"], camarero_user["id"])
+        assert len(datos["detalles"]) == 2
+        assert "JOIN productos" in consultas[-1]
+
+class TestCierreMesa:
+    @pytest.fixture
+    def mesa_ocupada(self, client, camarero_user, mesa, producto, pedido):
+        """Mesa ocupada con tres pedidos del producto de prueba (4 unidades)."""
+        for cantidad in (1, 1):
+            response = client.post(
+                "/pedidos/",
+                json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": cantidad}]},
+                headers={"Authorization": f"Bearer {camarero_user['token']}"}
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+        response = client.put(
+            f"/mesas/{mesa['id']}",
+            json={"estado": "ocupada"},
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return mesa
+
+    def _cuentas_mesa(self, db, mesa):
+        return db.query(Cuenta).filter(Cuenta.mesa_id == mesa["id"]).all()
+
+    def test_cierre_registra_cuenta_y_entrega_pedidos(
+        self, client, db, camarero_user, producto, mesa_ocupada, limite_consultas
+    ):
+        """Probar que el cierre registra la cuenta y cierra los pedidos con un único UPDATE."""
+        with limite_consultas(20) as consultas:
+            response = client.put(
+                f"/mesas/{mesa_ocupada['id']}",
+                json={"estado": "libre", "metodo_pago": "tarjeta"},
+                headers={"Authorization": f"Bearer {camarero_user['token']}"}
+            )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["estado"] == "libre"
+        assert len([c for c in consultas if c.startswith("UPDATE pedidos")]) == 1
+
+        cuentas = self._cuentas_mesa(db, mesa_ocupada)
+        assert len(cuentas) == 1
+        detalles = cuenta_service.process_detalles_field(cuentas[0].detalles)
+        assert [item["cantidad"] for item in detalles] == [2, 1, 1]
+        assert cuentas[0].total == pytest.approx(4 * producto["precio"])
+        assert cuentas[0].metodo_pago == "tarjeta"
+        assert db.query(Pedido).filter(Pedido.mesa_id == mesa_ocupada["id"]).count() == 0
+
+    def test_doble_cierre_una_sola_cuenta(self, client, db, camarero_user, mesa_ocupada):
+        """Probar que dos cierres simultáneos de la misma mesa registran una sola cuenta."""
+        # Otra sesión sobre la misma conexión, como la petición de un segundo dispositivo
+        tableta = Session(bind=db.get_bind(), autoflush=False)
+        # La segunda tableta ya ha leído la mesa ocupada cuando la primera la cierra
+        assert tableta.get(Mesa, mesa_ocupada["id"]).estado == "ocupada"
+        response = client.put(
+            f"/mesas/{mesa_ocupada['id']}",
+            json={"estado": "libre"},
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        db_mesa = mesa_service.update_mesa(
+            tableta, mesa_ocupada["id"], MesaUpdate(estado="libre"), tableta.get(Usuario, camarero_user["id"])
+        )
+        assert db_mesa.estado == "libre"
+        tableta.close()
+        assert len(self._cuentas_mesa(db, mesa_ocupada)) == 1
+
+class TestResumenCuentas:
+    @pytest.fixture
+    def cuentas_periodo(self, db, camarero_user):
+        """Insertar cuentas cobradas en días, horas y métodos de pago distintos."""
+        filas = [
+            # (fecha de cobro, camarero_id, nombre, total, método de pago)
+            (datetime(2026, 1, 10, 13, 15), camarero_user["id"], "Camarero Uno", 20.0, "efectivo"),
+            (datetime(2026, 1, 10, 13, 45), camarero_user["id"], "Camarero Uno", 30.0, "tarjeta"),
+            (datetime(2026, 1, 10, 21, 5), None, "Camarero Antiguo", 15.5, None),
+            (datetime(2026, 1, 11, 21, 30), camarero_user["id"], "Camarero Uno", 34.5, "tarjeta"),
+            # Fuera del período consultado
+            (datetime(2026, 1, 20, 12, 0), camarero_user["id"], "Camarero Uno", 999.0, "efectivo"),
+        ]
+        db.add_all([
+            Cuenta(
+                numero_mesa=1, camarero_id=camarero_id, nombre_camarero=nombre, fecha_cobro=fecha,
+                total=total, metodo_pago=metodo, detalles=[]
+            )
+            for fecha, camarero_id, nombre, total, metodo in filas
+        ])
+        db.commit()
+
+    def _resumen(self, client, admin_user):
+        response = client.get(
+            "/cuentas/resumen",
+            params={"fecha_inicio": "2026-01-10T00:00:00", "fecha_fin": "2026-01-12T00:00:00"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    def test_totales_y_desgloses(self, client, admin_user, camarero_user, cuentas_periodo):
+        """Probar los totales y los desgloses por camarero, día, hora y método de pago."""
+        resumen = self._resumen(client, admin_user)
+        assert resumen["total_cuentas"] == 4
+        assert resumen["total_ingresos"] == 100.0
+        assert resumen["promedio_por_cuenta"] == 25.0
+
+        assert resumen["ingresos_por_camarero"] == {
+            "Camarero Uno": {"camarero_id": camarero_user["id"], "total": 84.5, "cuentas": 3, "promedio": 28.17},
+            "Camarero Antiguo": {"camarero_id": None, "total": 15.5, "cuentas": 1, "promedio": 15.5},
+        }
+        assert resumen["ingresos_por_dia"] == {
+            "2026-01-10": {"total": 65.5, "cuentas": 3, "promedio": 21.83},
+            "2026-01-11": {"total": 34.5, "cuentas": 1, "promedio": 34.5},
+        }
+        assert resumen["ingresos_por_hora"] == {
+            "13": {"total": 50.0, "cuentas": 2, "promedio": 25.0},
+            "21": {"total": 50.0, "cuentas": 2, "promedio": 25.0},
+        }
+        assert resumen["ingresos_por_metodo_pago"] == {
+            "efectivo": {"total": 20.0, "cuentas": 1, "promedio": 20.0},
+            "tarjeta": {"total": 64.5, "cuentas": 2, "promedio": 32.25},
+            "sin_especificar": {"total": 15.5, "cuentas": 1, "promedio": 15.5},
+        }
+
+    def test_periodo_sin_cuentas(self, client, admin_user):
+        """Probar que un período sin cuentas devuelve totales a cero y desgloses vacíos."""
+        resumen = self._resumen(client, admin_user)
+        assert resumen["total_cuentas"] == 0
+        assert resumen["total_ingresos"] == 0
+        assert resumen["promedio_por_cuenta"] == 0
+        assert resumen["ingresos_por_camarero"] == {}
+        assert resumen["ingresos_por_dia"] == {}
+
+    def test_resumen_agrega_en_una_consulta(self, client, admin_user, cuentas_periodo, limite_consultas):
+        """Probar que el resumen no carga las cuentas: una única consulta agregada."""
+        with limite_consultas(1) as consultas:
+            self._resumen(client, admin_user)
+        assert "GROUP BY" in consultas[0]
+        assert "detalles" not in consultas[0]
+
+    def test_dia_y_hora_en_postgresql(self):
+        """Probar que en PostgreSQL el día y la hora se formatean con to_char y no con strftime."""
+        dia, hora = cuenta_service._DIA_Y_HORA["postgresql"](Cuenta.fecha_cobro)
+        sql = [str(e.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})) for e in (dia, hora)]
+        assert sql == ["to_char(cuentas.fecha_cobro, 'YYYY-MM-DD')", "to_char(cuentas.fecha_cobro, 'HH24')"]
@@ -0,0 +1,71 @@
+"""
+Tests para la ejecución de servicios sobre sesiones síncronas y asíncronas.
+"""
+import asyncio
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base, ejecutar_en_sesion
+from app.models.categoria import Categoria
+from app.models.producto import Producto
+from app.schemas.producto import ProductoDetallado
+from app.services import producto_service
+from app.core.enums import TipoProducto
+
+
+def _crear_producto(url):
+    """Crear el esquema y un producto con categoría en una base de datos nueva"""
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        categoria = Categoria(nombre="Bebidas")
+        db.add(categoria)
+        db.flush()
+        producto = Producto(nombre="Agua", precio=1.5, tiempo_preparacion=1,
+                            categoria_id=categoria.id, tipo=TipoProducto.BEBIDA)
+        db.add(producto)
+        db.commit()
+        producto_id = producto.id
+    engine.dispose()
+    return producto_id
+
+
+class TestEjecutarEnSesion:
+    def test_sesion_asincrona_serializa_relaciones(self, tmp_path):
+        """Probar que con AsyncSession las relaciones perezosas se serializan sin errores."""
+        ruta = tmp_path / "async.db"
+        producto_id = _crear_producto(f"sqlite:///{ruta}")
+
+        async def consultar():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}")
+            async with async_sessionmaker(engine)() as db:
+                resultado = await ejecutar_en_sesion(
+                    db, producto_service.get_producto_by_id, producto_id=producto_id, esquema=ProductoDetallado
+                )
+            await engine.dispose()
+            return resultado
+
+        producto = asyncio.run(consultar())
+        assert isinstance(producto, ProductoDetallado)
+        assert producto.categoria.nombre == "Bebidas"
+
+    def test_sesion_sincrona_no_bloquea_el_bucle(self, tmp_path):
+        """Probar que con una Session síncrona el servicio se ejecuta fuera del hilo del bucle."""
+        url = f"sqlite:///{tmp_path / 'sync.db'}"
+        producto_id = _crear_producto(url)
+        hilos = []
+
+        def servicio(db, producto_id):
+            hilos.append(threading.get_ident())
+            return producto_service.get_producto_by_id(db, producto_id)
+
+        async def consultar():
+            with sessionmaker(bind=create_engine(url))() as db:
+                return await ejecutar_en_sesion(db, servicio, producto_id, esquema=ProductoDetallado)
+
+        producto = asyncio.run(consultar())
+        assert producto.nombre == "Agua"
+        assert hilos and hilos[0] != threading.get_ident()
@@ -0,0 +1,177 @@
+"""
+Tests de la exportación en streaming del historial de cuentas.
+"""
+import csv
+import io
+import json
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import status
+
+from app.models.cuenta import Cuenta
+
+BASE = datetime(2026, 3, 1, 12, 0)
+RAIZ = Path(__file__).resolve().parents[2]
+
+# Crecimiento máximo de la memoria del proceso al exportar 2M de cuentas (~600 MB de NDJSON)
+FILAS_MEMORIA = 2_000_000
+TECHO_MEMORIA_MB = 64
+
+def _detalle(producto_id, nombre, cantidad=1, precio=2.5):
+    return {
+        "pedido_id": 1, "producto_id": producto_id, "nombre_producto": nombre, "cantidad": cantidad,
+        "precio_unitario": precio, "subtotal": cantidad * precio
+    }
+
+def _crear_cuentas(db, camarero_id, n=3, detalles=None):
+    """Crear n cuentas con una hora de diferencia, insertadas en orden inverso de cobro"""
+    cuentas = [
+        Cuenta(numero_mesa=i + 1, camarero_id=camarero_id, nombre_camarero="Camarero",
+               fecha_cobro=BASE + timedelta(hours=i), total=5.0, metodo_pago="tarjeta",
+               detalles=detalles if detalles is not None else [_detalle(1, "Café"), _detalle(2, "Tostada")])
+        for i in reversed(range(n))
+    ]
+    db.add_all(cuentas)
+    db.commit()
+    return cuentas
+
+def _exportar(client, token, **params):
+    response = client.get("/cuentas/exportar", params=params, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_200_OK
+    return response
+
+def _ndjson(response):
+    return [json.loads(linea) for linea in response.text.splitlines()]
+
+def _csv(response):
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+def _medir_exportacion(ruta: str, filas: int):
+    """
+    Se ejecuta en un proceso aparte para que el pico de memoria no dependa de los tests anteriores:
+    inserta las cuentas con SQL, las exporta e imprime las líneas, los bytes y el crecimiento del pico.
+    """
+    import resource
+    from types import SimpleNamespace
+
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+
+    from app.db.database import Base
+    from app.services import cuenta_service
+    from app.core.enums import FormatoExportacion, RolUsuario
+    import app.models  # noqa: F401  (registrar todos los modelos)
+
+    engine = create_engine(f"sqlite:///{ruta}")
+    Base.metadata.create_all(bind=engine)
+    detalles = json.dumps([_detalle(1, "Café"), _detalle(2, "Tostada")])
+    with engine.begin() as conexion:
+        conexion.execute(text("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :filas)
+            INSERT INTO cuentas (numero_mesa, camarero_id, nombre_camarero, fecha_cobro, total, metodo_pago, detalles)
+            SELECT i % 20 + 1, 1, 'Camarero', datetime('2026-01-01', '+' || i || ' seconds'), 5.0, 'tarjeta', :detalles
+            FROM n
+        """), {"filas": filas, "detalles": detalles})
+
+    admin = SimpleNamespace(id=1, rol=RolUsuario.ADMIN)
+    pico_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    lineas = octetos = 0
+    with Session(engine) as db:
+        for trozo in cuenta_service.exportar_cuentas(db, formato=FormatoExportacion.NDJSON, current_user=admin):
+            lineas += trozo.count("\n")
+            octetos += len(trozo)
+    crecimiento_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - pico_inicial
+    print(json.dumps({"lineas": lineas, "octetos": octetos, "crecimiento_mb": crecimiento_kb / 1024}))
+
+class TestExportacionCuentas:
+    def test_exportar_ndjson(self, client, db, admin_user):
+        """Probar que el NDJSON tiene una línea por cuenta, en orden de cobro y con sus productos."""
+        _crear_cuentas(db, admin_user["id"])
+        response = _exportar(client, admin_user["token"])
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "cuentas.ndjson" in response.headers["content-disposition"]
+
+        cuentas = _ndjson(response)
+        assert len(cuentas) == 3
+        assert [c["numero_mesa"] for c in cuentas] == [1, 2, 3]
+        assert cuentas[0]["fecha_cobro"] == BASE.isoformat()
+        assert [d["nombre_producto"] for d in cuentas[0]["detalles"]] == ["Café", "Tostada"]
+
+    def test_exportar_csv(self, client, db, admin_user):
+        """Probar que el CSV tiene cabecera y la lista de productos como JSON en una columna."""
+        _crear_cuentas(db, admin_user["id"], n=2)
+        response = _exportar(client, admin_user["token"], formato="csv")
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "cuentas.csv" in response.headers["content-disposition"]
+
+        filas = _csv(response)
+        assert len(filas) == 2
+        assert filas[0]["total"] == "5.0"
+        assert len(json.loads(filas[0]["detalles"])) == 2
+
+    def test_exportar_desglosado(self, client, db, admin_user):
+        """Probar que al desglosar hay una línea por producto, y una sin producto para las cuentas vacías."""
+        _crear_cuentas(db, admin_user["id"], n=2)
+        _crear_cuentas(db, admin_user["id"], n=1, detalles=[])
+
+        lineas = _ndjson(_exportar(client, admin_user["token"], desglosar=True))
+        assert len(lineas) == 5
+        assert sum(1 for linea in lineas if linea["producto_id"] is None) == 1
+        assert {linea["nombre_producto"] for linea in lineas} == {"Café", "Tostada", None}
+        assert "detalles" not in lineas[0]
+
+        filas = _csv(_exportar(client, admin_user["token"], formato="csv", desglosar=True))
+        assert len(filas) == 5
+        assert {fila["subtotal"] for fila in filas} == {"2.5", ""}
+
+    def test_exportar_vacio(self, client, db, admin_user):
+        """Probar que sin cuentas el NDJSON está vacío y el CSV solo tiene la cabecera."""
+        assert _exportar(client, admin_user["token"]).text == ""
+        cabecera = _exportar(client, admin_user["token"], formato="csv").text.splitlines()
+        assert len(cabecera) == 1
+        assert cabecera[0].startswith("id,mesa_id,numero_mesa")
+
+    def test_camarero_solo_exporta_sus_cuentas(self, client, db, admin_user, camarero_user):
+        """Probar que un camarero solo exporta sus cuentas aunque pida las de otro camarero."""
+        _crear_cuentas(db, admin_user["id"], n=2)
+        _crear_cuentas(db, camarero_user["id"], n=3)
+        cuentas = _ndjson(_exportar(client, camarero_user["token"], camarero_id=admin_user["id"]))
+        assert len(cuentas) == 3
+        assert {c["camarero_id"] for c in cuentas} == {camarero_user["id"]}
+
+    def test_exportar_por_fechas(self, client, db, admin_user):
+        """Probar que la exportación respeta el rango de fechas."""
+        _crear_cuentas(db, admin_user["id"], n=5)
+        cuentas = _ndjson(_exportar(
+            client, admin_user["token"],
+            fecha_inicio=(BASE + timedelta(hours=1)).isoformat(),
+            fecha_fin=(BASE + timedelta(hours=3)).isoformat()
+        ))
+        assert [c["numero_mesa"] for c in cuentas] == [2, 3, 4]
+
+    def test_formato_no_valido(self, client, admin_user):
+        """Probar que un formato desconocido se rechaza con 422."""
+        response = client.get(
+            "/cuentas/exportar", params={"formato": "xml"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_memoria_constante_con_2m_cuentas(self, tmp_path):
+        """Probar que exportar 2M de cuentas no hace crecer la memoria más allá de un techo fijo."""
+        resultado = subprocess.run(
+            [
+                sys.executable, "-c",
+                "from app.tests.test_exportacion import _medir_exportacion; "
+                f"_medir_exportacion({str(tmp_path / 'exportacion.db')!r}, {FILAS_MEMORIA})"
+            ],
+            cwd=RAIZ, capture_output=True, text=True, check=True
+        )
+        medida = json.loads(resultado.stdout.splitlines()[-1])
+        assert medida["lineas"] == FILAS_MEMORIA
+        # La salida completa es mucho mayor que el techo: no puede haberse acumulado en memoria
+        assert medida["octetos"] > 10 * TECHO_MEMORIA_MB * 1024 * 1024
+        assert medida["crecimiento_mb"] < TECHO_MEMORIA_MB
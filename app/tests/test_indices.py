@@ -0,0 +1,342 @@
+"""
+Tests de los índices y de las migraciones del esquema.
+
+Las comprobaciones de planes de consulta no insertan un millón de filas: cargan en sqlite_stat1
+estadísticas equivalentes a tablas de 1M de filas, que es lo que el planificador de SQLite usa
+para elegir entre recorrer la tabla o usar un índice.
+"""
+import json
+import re
+import threading
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+from app.db import migrations
+from app.db.migrations import MIGRACIONES, aplicar_migraciones, get_version_actual, migraciones_pendientes
+from app.core.enums import EstadoPedido, EstadoReserva, RolUsuario
+from app.core.paginacion import codificar_cursor
+from app.schemas.cuenta import CuentaResponse
+from app.schemas.reserva import ReservaCreate
+from app.services import pedido_service, reserva_service, cuenta_service, producto_service
+
+FILAS = 1_000_000
+
+# Número aproximado de valores distintos por columna (el resto se consideran casi únicos)
+VALORES_DISTINTOS = {
+    "estado": 5,
+    "mesa_id": 50,
+    "camarero_id": 20,
+    "producto_id": 200,
+    "pedido_id": FILAS // 3,
+}
+
+TABLAS_GRANDES = ("pedidos", "detalles_pedido", "reservas", "cuentas", "cuentas_productos")
+
+def _estadistica(filas, columnas):
+    """Construir la cadena de sqlite_stat1 para un índice: filas totales y filas por prefijo"""
+    valores = [str(filas)]
+    distintos = 1
+    for columna in columnas:
+        distintos *= VALORES_DISTINTOS.get(columna, filas)
+        valores.append(str(max(1, filas // distintos)))
+    return " ".join(valores)
+
+@pytest.fixture
+def db_un_millon(tmp_path):
+    """Base de datos con el esquema completo y estadísticas de 1M de filas en las tablas filtradas"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'indices.db'}")
+    Base.metadata.create_all(bind=engine)
+    aplicar_migraciones(engine)
+    inspector = inspect(engine)
+    with engine.begin() as conexion:
+        conexion.execute(text("ANALYZE"))
+        conexion.execute(text("DELETE FROM sqlite_stat1"))
+        for tabla in TABLAS_GRANDES:
+            conexion.execute(text("INSERT INTO sqlite_stat1 VALUES (:t, NULL, :s)"), {"t": tabla, "s": str(FILAS)})
+            for indice in inspector.get_indexes(tabla):
+                conexion.execute(
+                    text("INSERT INTO sqlite_stat1 VALUES (:t, :i, :s)"),
+                    {"t": tabla, "i": indice["name"], "s": _estadistica(FILAS, indice["column_names"])}
+                )
+        # Datos mínimos que algunos servicios necesitan encontrar
+        conexion.execute(text("INSERT INTO mesas (id, numero, capacidad, estado) VALUES (1, 1, 4, 'libre')"))
+        conexion.execute(text("INSERT INTO categorias (id, nombre) VALUES (1, 'General')"))
+        conexion.execute(text(
+            "INSERT INTO productos (id, nombre, precio, tiempo_preparacion, categoria_id, tipo, disponible) "
+            "VALUES (1, 'Agua', 1.5, 1, 1, 'bebida', 1)"
+        ))
+    engine.dispose()
+    # Las conexiones nuevas cargan las estadísticas de sqlite_stat1
+    engine = create_engine(f"sqlite:///{tmp_path / 'indices.db'}")
+    with sessionmaker(bind=engine)() as db:
+        yield db
+    engine.dispose()
+
+def _planes(db, funcion):
+    """Ejecutar una función de servicio y devolver el plan de cada SELECT, UPDATE o DELETE que emite"""
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")) and not executemany:
+            sentencias.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        try:
+            funcion(db)
+        except HTTPException:
+            pass
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    planes = []
+    conexion = db.connection()
+    for sentencia, parametros in sentencias:
+        filas = conexion.exec_driver_sql(f"EXPLAIN QUERY PLAN {sentencia}", parametros).fetchall()
+        planes.append((sentencia, [fila[-1] for fila in filas]))
+    return planes
+
+def _recorridos_completos(planes, tablas):
+    """Pasos del plan que recorren una tabla grande entera sin índice"""
+    patron = re.compile(r"^SCAN (%s)\b(?!.*USING)" % "|".join(tablas))
+    return [(sentencia, paso) for sentencia, pasos in planes for paso in pasos if patron.search(paso)]
+
+_camarero = SimpleNamespace(id=3, rol=RolUsuario.CAMARERO)
+_admin = SimpleNamespace(id=1, rol=RolUsuario.ADMIN)
+_ahora = datetime.now(UTC)
+# Cursor a mitad del historial: (fecha, id) de una fila cualquiera
+_cursor = codificar_cursor([_ahora.replace(tzinfo=None), FILAS // 2])
+
+CONSULTAS = {
+    "get_pedidos": lambda db: pedido_service.get_pedidos(db),
+    "get_pedidos_estado": lambda db: pedido_service.get_pedidos(db, estado=EstadoPedido.RECIBIDO),
+    "get_pedidos_camarero": lambda db: pedido_service.get_pedidos(db, current_user=_camarero),
+    "get_pedidos_mesa": lambda db: pedido_service.get_pedidos(db, mesa_id=1),
+    "get_pedidos_detallados": lambda db: pedido_service.get_pedidos(db, estrategia_carga="selectin"),
+    "get_pedidos_cursor": lambda db: pedido_service.get_pedidos(db, cursor=_cursor),
+    "get_pedidos_estado_cursor": lambda db: pedido_service.get_pedidos(
+        db, estado=EstadoPedido.RECIBIDO, cursor=_cursor
+    ),
+    "get_pedido_by_id": lambda db: pedido_service.get_pedido_by_id(db, 1),
+    "get_reservas": lambda db: reserva_service.get_reservas(db),
+    "get_reservas_estado": lambda db: reserva_service.get_reservas(db, estado=EstadoReserva.CONFIRMADA),
+    "get_reservas_mesa": lambda db: reserva_service.get_reservas(db, mesa_id=1),
+    "get_reservas_cursor": lambda db: reserva_service.get_reservas(db, cursor=_cursor),
+    "get_reserva_activa_mesa": lambda db: reserva_service.get_reserva_activa_mesa(db, 1),
+    "conflicto_reservas": lambda db: reserva_service.create_reserva(db, ReservaCreate(
+        cliente_nombre="Ana", cliente_apellido="Pérez", cliente_telefono="600000000",
+        fecha=_ahora + timedelta(days=1), num_personas=2, mesa_id=1
+    )),
+    "get_cuentas": lambda db: cuenta_service.get_cuentas(db, current_user=_admin),
+    "get_cuentas_camarero": lambda db: cuenta_service.get_cuentas(db, current_user=_camarero),
+    "get_cuentas_mesa": lambda db: cuenta_service.get_cuentas(db, mesa_id=1, current_user=_admin),
+    "get_cuentas_fechas": lambda db: cuenta_service.get_cuentas(
+        db, fecha_inicio=_ahora - timedelta(days=1), fecha_fin=_ahora, current_user=_admin
+    ),
+    "get_cuentas_cursor": lambda db: cuenta_service.get_cuentas(db, current_user=_admin, cursor=_cursor),
+    "get_cuentas_camarero_cursor": lambda db: cuenta_service.get_cuentas(db, current_user=_camarero, cursor=_cursor),
+    "listar_cuentas_json_cursor": lambda db: cuenta_service.listar_cuentas_json(db, current_user=_admin, cursor=_cursor),
+    "get_resumen_cuentas": lambda db: cuenta_service.get_resumen_cuentas(db, current_user=_admin),
+}
+
+class TestIndicesConsultas:
+    @pytest.mark.parametrize("nombre", sorted(CONSULTAS))
+    def test_consulta_usa_indice(self, db_un_millon, nombre):
+        """Probar que la consulta del servicio no recorre ninguna tabla grande entera con 1M de filas."""
+        planes = _planes(db_un_millon, CONSULTAS[nombre])
+        assert planes, "El servicio no ejecutó ninguna consulta"
+        assert _recorridos_completos(planes, TABLAS_GRANDES) == []
+
+    @pytest.mark.parametrize("nombre", sorted(n for n in CONSULTAS if n.endswith("_cursor")))
+    def test_pagina_por_cursor_sin_ordenar(self, db_un_millon, nombre):
+        """Probar que una página por cursor salta a su posición en el índice y lo lee en orden, sin ordenar."""
+        _, pasos = _planes(db_un_millon, CONSULTAS[nombre])[0]
+        assert any(paso.startswith("SEARCH") and "<?" in paso for paso in pasos), pasos
+        assert not any("TEMP B-TREE" in paso for paso in pasos), pasos
+
+    def test_delete_producto_busca_detalles_por_indice(self, db_un_millon):
+        """Probar que eliminar un producto localiza sus líneas de pedido y sus cuentas por índice."""
+        planes = _planes(db_un_millon, lambda db: producto_service.delete_producto(db, 1))
+        assert _recorridos_completos(planes, ("detalles_pedido", "cuentas", "cuentas_productos")) == []
+        assert any("ix_cuentas_productos_producto_id" in paso for _, pasos in planes for paso in pasos)
+
+    def test_resumen_cuentas_solo_lee_el_indice(self, db_un_millon):
+        """Probar que el resumen de ingresos se resuelve con el índice cubriente, sin leer las filas."""
+        planes = _planes(db_un_millon, lambda db: cuenta_service.get_resumen_cuentas(db, current_user=_admin))
+        assert len(planes) == 1
+        assert any("COVERING INDEX ix_cuentas_resumen" in paso for paso in planes[0][1])
+
+class TestMigraciones:
+    def test_migracion_crea_los_indices_de_los_modelos(self, tmp_path):
+        """Probar que una base de datos existente sin índices queda igual que una creada desde los modelos."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'existente.db'}")
+        Base.metadata.create_all(bind=engine)
+        esperados = {
+            tabla: {i["name"] for i in inspect(engine).get_indexes(tabla)} for tabla in TABLAS_GRANDES
+        }
+        # Simular una base de datos anterior a los índices
+        with engine.begin() as conexion:
+            for tabla, nombres in esperados.items():
+                for nombre in nombres - {f"ix_{tabla}_id"}:
+                    conexion.execute(text(f"DROP INDEX {nombre}"))
+
+        assert aplicar_migraciones(engine) == [version for version, _, _ in MIGRACIONES]
+        inspector = inspect(engine)
+        for tabla, nombres in esperados.items():
+            assert {i["name"] for i in inspector.get_indexes(tabla)} == nombres
+        engine.dispose()
+
+    def test_migraciones_idempotentes(self, tmp_path):
+        """Probar que las migraciones se registran en schema_version y no se repiten."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'idempotente.db'}")
+        Base.metadata.create_all(bind=engine)
+        assert get_version_actual(engine) == 0
+        aplicar_migraciones(engine)
+        assert get_version_actual(engine) == MIGRACIONES[-1][0]
+        assert aplicar_migraciones(engine) == []
+        engine.dispose()
+
+    def test_migracion_detalles_json_nativo(self, tmp_path, monkeypatch):
+        """Probar que los detalles pasan a lista nativa con los valores por defecto y que los completos no cambian."""
+        monkeypatch.setattr(migrations, "TAMANO_LOTE_MIGRACION", 2)
+        engine = create_engine(f"sqlite:///{tmp_path / 'detalles.db'}")
+        Base.metadata.create_all(bind=engine)
+        item = {"pedido_id": 1, "producto_id": 2, "nombre_producto": "Café", "cantidad": 1,
+                "precio_unitario": 1.5, "subtotal": 1.5, "observaciones": None}
+        completo = {**item, "producto_eliminado": False, "nombre_producto_original": None}
+        guardados = [
+            json.dumps(json.dumps([item])),  # lista codificada dos veces (create_cuenta anterior)
+            json.dumps(json.dumps(item)),  # un único producto codificado dos veces
+            json.dumps([item], ensure_ascii=False),  # ya nativa, sin los valores por defecto
+            json.dumps("no es JSON"),
+            json.dumps(""),
+            json.dumps([completo], ensure_ascii=False),  # ya nativa y completa
+        ]
+        with engine.begin() as conexion:
+            for texto in guardados:
+                conexion.execute(text(
+                    "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, detalles) "
+                    "VALUES (1, 'Camarero', '2026-01-01 12:00:00', 1.5, :detalles)"
+                ), {"detalles": texto})
+
+        aplicar_migraciones(engine)
+        with engine.connect() as conexion:
+            filas = conexion.execute(text("SELECT detalles FROM cuentas ORDER BY id")).scalars().all()
+        assert [json.loads(f) for f in filas] == [[completo], [completo], [completo], [], [], [completo]]
+        assert filas[5] == guardados[5]
+        engine.dispose()
+
+    def test_listado_igual_al_detalle_de_una_cuenta_antigua(self, tmp_path):
+        """Probar que, tras migrar, GET /cuentas/ devuelve las mismas líneas que GET /cuentas/{id} para una cuenta antigua."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'antigua.db'}")
+        Base.metadata.create_all(bind=engine)
+        linea = {"pedido_id": 3, "producto_id": 2, "nombre_producto": "Café", "cantidad": 2,
+                 "precio_unitario": 1.5, "subtotal": 3.0}
+        with engine.begin() as conexion:
+            conexion.execute(text(
+                "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, detalles) "
+                "VALUES (1, 'Camarero', '2026-01-01 12:00:00', 3.0, :detalles)"
+            ), {"detalles": json.dumps(json.dumps([linea]))})
+
+        aplicar_migraciones(engine)
+        with sessionmaker(bind=engine)() as db:
+            cuerpo, _ = cuenta_service.listar_cuentas_json(db, current_user=_admin)
+            detalle = CuentaResponse.model_validate(cuenta_service.get_cuenta_by_id(db, 1, _admin)).model_dump(mode="json")
+        assert json.loads(cuerpo) == [detalle]
+        assert detalle["detalles"][0]["producto_eliminado"] is False
+        engine.dispose()
+
+    def test_migracion_rellena_indice_productos(self, tmp_path, monkeypatch):
+        """Probar que la migración rellena el índice inverso con un producto distinto por fila y cuenta, sin SQL propio de SQLite."""
+        monkeypatch.setattr(migrations, "TAMANO_LOTE_MIGRACION", 2)
+        engine = create_engine(f"sqlite:///{tmp_path / 'indice_productos.db'}")
+        Base.metadata.create_all(bind=engine)
+        productos_por_cuenta = [[1, 2, 1], [], [2], [3, 4]]
+        with engine.begin() as conexion:
+            for productos in productos_por_cuenta:
+                lineas = [{"producto_id": p, "nombre_producto": f"P{p}", "cantidad": 1, "subtotal": 1.5} for p in productos]
+                conexion.execute(text(
+                    "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, detalles) "
+                    "VALUES (1, 'Camarero', '2026-01-01 12:00:00', 1.5, :detalles)"
+                ), {"detalles": json.dumps(lineas)})
+        sentencias = []
+        event.listen(engine, "before_cursor_execute", lambda *args: sentencias.append(args[2]))
+
+        aplicar_migraciones(engine)
+        with engine.connect() as conexion:
+            filas = conexion.execute(text(
+                "SELECT cuenta_id, producto_id FROM cuentas_productos ORDER BY cuenta_id, producto_id"
+            )).all()
+        assert [tuple(f) for f in filas] == [(1, 1), (1, 2), (3, 2), (4, 3), (4, 4)]
+        assert not [s for s in sentencias if "json_" in s or "OR IGNORE" in s]
+        engine.dispose()
+
+    def test_migraciones_concurrentes_se_aplican_una_vez(self, tmp_path):
+        """Probar que dos procesos que migran a la vez se reparten las versiones sin repetir ninguna."""
+        ruta = tmp_path / "concurrente.db"
+        engine = create_engine(f"sqlite:///{ruta}")
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+        motores = [create_engine(f"sqlite:///{ruta}", connect_args={"timeout": 30}) for _ in range(2)]
+        resultados, errores = [], []
+
+        def migrar(motor):
+            try:
+                resultados.append(aplicar_migraciones(motor))
+            except Exception as error:
+                errores.append(error)
+
+        hilos = [threading.Thread(target=migrar, args=(motor,)) for motor in motores]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert errores == []
+        assert sorted(resultados[0] + resultados[1]) == [version for version, _, _ in MIGRACIONES]
+        assert migraciones_pendientes(motores[0]) == []
+        for motor in motores:
+            motor.dispose()
+
+    def test_migracion_toma_el_bloqueo_de_escritura(self, tmp_path):
+        """Probar que mientras una migración tiene el bloqueo, otro proceso no puede empezar a migrar."""
+        ruta = tmp_path / "bloqueo.db"
+        engine = create_engine(f"sqlite:///{ruta}")
+        otro = create_engine(f"sqlite:///{ruta}", connect_args={"timeout": 0.1})
+        Base.metadata.create_all(bind=engine)
+        assert migraciones_pendientes(engine) == [version for version, _, _ in MIGRACIONES]
+        with engine.connect() as conexion:
+            migrations._bloquear(conexion)
+            with pytest.raises(OperationalError, match="locked"):
+                aplicar_migraciones(otro)
+            conexion.rollback()
+        assert aplicar_migraciones(otro) == [version for version, _, _ in MIGRACIONES]
+        engine.dispose()
+        otro.dispose()
+
+    def test_rellenos_confirman_cada_lote(self, tmp_path, monkeypatch):
+        """Probar que los rellenos de datos confirman por lotes en lugar de en una sola transacción."""
+        monkeypatch.setattr(migrations, "TAMANO_LOTE_MIGRACION", 2)
+        engine = create_engine(f"sqlite:///{tmp_path / 'lotes.db'}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conexion:
+            for _ in range(6):
+                conexion.execute(text(
+                    "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, detalles) "
+                    "VALUES (1, 'Camarero', '2026-01-01 12:00:00', 1.5, '[]')"
+                ))
+        confirmaciones = []
+        event.listen(engine, "commit", lambda conexion: confirmaciones.append(1))
+
+        aplicar_migraciones(engine)
+        # m001 y m002: una transacción cada una; m003, m004 y m005: al menos una por lote de 2 cuentas
+        assert len(confirmaciones) >= 2 + 3 * 3
+        engine.dispose()
@@ -0,0 +1,149 @@
+"""
+Tests de la paginación por cursor (keyset) de los listados.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import status
+
+from app.core.enums import RolUsuario, TipoProducto
+from app.core.paginacion import CABECERA_CURSOR
+from app.models.categoria import Categoria
+from app.models.cuenta import Cuenta
+from app.models.pedido import Pedido
+from app.models.producto import Producto
+from app.models.reserva import Reserva
+from app.models.usuario import Usuario
+
+BASE = datetime(2026, 3, 1, 12, 0)
+
+def _fechas(n):
+    """Fechas con empates, para comprobar el desempate por id"""
+    return [BASE + timedelta(minutes=i // 2) for i in range(n)]
+
+def _crear_pedidos(db, camarero_id, n=7):
+    db.add_all([Pedido(camarero_id=camarero_id, fecha_creacion=fecha) for fecha in _fechas(n)])
+    db.commit()
+
+def _crear_cuentas(db, camarero_id, n=7):
+    db.add_all([
+        Cuenta(numero_mesa=1, camarero_id=camarero_id, nombre_camarero="Camarero", fecha_cobro=fecha,
+               total=10.0, detalles=[])
+        for fecha in _fechas(n)
+    ])
+    db.commit()
+
+def _crear_reservas(db, camarero_id, n=7):
+    db.add_all([
+        Reserva(cliente_nombre=f"Cliente {i}", cliente_apellido="Test", cliente_telefono="600000000",
+                fecha=fecha, num_personas=2)
+        for i, fecha in enumerate(_fechas(n))
+    ])
+    db.commit()
+
+def _crear_productos(db, camarero_id, n=7):
+    categoria = Categoria(nombre="Paginación")
+    db.add(categoria)
+    db.flush()
+    db.add_all([
+        Producto(nombre=f"Producto {i}", precio=1.0, tiempo_preparacion=5, categoria_id=categoria.id,
+                 tipo=TipoProducto.COMIDA)
+        for i in range(n)
+    ])
+    db.commit()
+
+def _crear_usuarios(db, camarero_id, n=7):
+    db.add_all([
+        Usuario(username=f"usuario{i}", email=f"usuario{i}@example.com", hashed_password="x",
+                nombre="Usuario", apellido=str(i), rol=RolUsuario.COCINERO)
+        for i in range(n)
+    ])
+    db.commit()
+
+LISTADOS = {
+    "/pedidos/": _crear_pedidos,
+    "/cuentas/": _crear_cuentas,
+    "/reservas/": _crear_reservas,
+    "/productos/": _crear_productos,
+    "/usuarios/": _crear_usuarios,
+}
+
+def _get(client, token, ruta, **params):
+    response = client.get(ruta, params=params, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_200_OK
+    return response
+
+def _recorrer(client, token, ruta, limit):
+    """Recorrer un listado página a página siguiendo X-Next-Cursor; devuelve los ids de cada página"""
+    paginas = []
+    cursor = None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = _get(client, token, ruta, **params)
+        paginas.append([fila["id"] for fila in response.json()])
+        cursor = response.headers.get(CABECERA_CURSOR)
+        if cursor is None:
+            return paginas
+
+class TestPaginacionCursor:
+    @pytest.mark.parametrize("ruta", sorted(LISTADOS))
+    def test_recorrido_por_cursor_igual_que_offset(self, client, db, admin_user, ruta):
+        """Probar que recorrer con cursor devuelve las mismas filas, en el mismo orden, que el listado completo."""
+        LISTADOS[ruta](db, admin_user["id"])
+        completo = [fila["id"] for fila in _get(client, admin_user["token"], ruta, limit=1000).json()]
+        assert len(completo) >= 7
+
+        paginas = _recorrer(client, admin_user["token"], ruta, limit=3)
+        assert [i for pagina in paginas for i in pagina] == completo
+        assert all(len(pagina) == 3 for pagina in paginas[:-1])
+
+    def test_orden_con_empates_de_fecha(self, client, db, admin_user):
+        """Probar que los pedidos con la misma fecha se ordenan por id, de más reciente a más antiguo."""
+        _crear_pedidos(db, admin_user["id"])
+        pedidos = _get(client, admin_user["token"], "/pedidos/").json()
+        claves = [(p["fecha_creacion"], p["id"]) for p in pedidos]
+        assert claves == sorted(claves, reverse=True)
+
+    def test_inserciones_no_desplazan_las_paginas(self, client, db, admin_user):
+        """Probar que un pedido nuevo entre dos páginas no repite filas en la página siguiente."""
+        _crear_pedidos(db, admin_user["id"], n=6)
+        primera = _get(client, admin_user["token"], "/pedidos/", limit=3)
+        db.add(Pedido(camarero_id=admin_user["id"], fecha_creacion=BASE + timedelta(days=1)))
+        db.commit()
+
+        por_cursor = _get(
+            client, admin_user["token"], "/pedidos/", limit=3, cursor=primera.headers[CABECERA_CURSOR]
+        ).json()
+        por_offset = _get(client, admin_user["token"], "/pedidos/", limit=3, skip=3).json()
+        vistos = {p["id"] for p in primera.json()}
+        assert not vistos & {p["id"] for p in por_cursor}
+        assert vistos & {p["id"] for p in por_offset}
+
+    def test_cursor_respeta_filtros(self, client, db, admin_user, camarero_user):
+        """Probar que las páginas por cursor mantienen los filtros y permisos del listado."""
+        _crear_cuentas(db, admin_user["id"], n=4)
+        _crear_cuentas(db, camarero_user["id"], n=5)
+        paginas = _recorrer(client, camarero_user["token"], "/cuentas/", limit=2)
+        ids = [i for pagina in paginas for i in pagina]
+        assert len(ids) == 5
+        propias = _get(client, camarero_user["token"], "/cuentas/").json()
+        assert {c["camarero_id"] for c in propias} == {camarero_user["id"]}
+
+    def test_ultima_pagina_sin_cursor(self, client, db, admin_user):
+        """Probar que una página incompleta no devuelve cursor y que el modo offset sigue funcionando."""
+        _crear_pedidos(db, admin_user["id"], n=5)
+        response = _get(client, admin_user["token"], "/pedidos/", limit=10)
+        assert len(response.json()) == 5
+        assert CABECERA_CURSOR not in response.headers
+
+        response = _get(client, admin_user["token"], "/pedidos/", skip=2, limit=2)
+        assert len(response.json()) == 2
+        assert CABECERA_CURSOR in response.headers
+
+    @pytest.mark.parametrize("cursor", ["no-es-base64!", "WzFd", "eyJhIjoxfQ"])
+    def test_cursor_no_valido(self, client, admin_user, cursor):
+        """Probar que un cursor manipulado o de otro listado se rechaza con 400."""
+        response = client.get(
+            "/pedidos/", params={"cursor": cursor}, headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
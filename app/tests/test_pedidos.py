@@ -1,9 +1,16 @@
 """
 Tests para los endpoints de gestión de pedidos.
 """
+from datetime import datetime, UTC
+from typing import List
+
 import pytest
 from fastapi import status
+from pydantic import TypeAdapter
+
 from app.core.enums import EstadoPedido, TipoProducto
+from app.schemas.pedido import PedidoDetallado
+from app.services import pedido_service
 
 @pytest.fixture
 def mesa(client, admin_user):
@@ -106,6 +113,18 @@ class TestPedidos:
         assert response.json()["detalles"][0]["producto_id"] == producto["id"]
         assert "id" in response.json()
 
+    def test_fechas_del_pedido_son_las_de_su_creacion(self, client, camarero_user, mesa, producto):
+        """Probar que las fechas se calculan al insertar el pedido y no al importar el modelo."""
+        antes = datetime.now(UTC).replace(tzinfo=None, microsecond=0)
+        response = client.post(
+            "/pedidos/",
+            json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 1}]},
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        for campo in ("fecha_creacion", "fecha_actualizacion"):
+            assert datetime.fromisoformat(response.json()[campo]).replace(tzinfo=None) >= antes
+
     def test_create_pedido_mesa_inexistente(self, client, camarero_user, producto):
         """Probar la creación de un pedido con una mesa inexistente."""
         pedido_data = {
@@ -142,6 +161,62 @@ class TestPedidos:
         )
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
+    def test_create_pedido_producto_inexistente_no_deja_restos(self, client, admin_user, camarero_user, mesa, producto):
+        """Probar que un pedido con una línea inválida no crea nada ni ocupa la mesa."""
+        pedido_data = {
+            "mesa_id": mesa["id"],
+            "detalles": [
+                {
+                    "producto_id": producto["id"],
+                    "cantidad": 1
+                },
+                {
+                    "producto_id": 999999,  # ID no existente
+                    "cantidad": 1
+                }
+            ]
+        }
+        response = client.post(
+            "/pedidos/",
+            json=pedido_data,
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        
+        # No debe quedar ningún pedido registrado
+        response = client.get(
+            f"/pedidos/?mesa_id={mesa['id']}",
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+        
+        # La mesa no debe haberse marcado como ocupada
+        response = client.get(
+            f"/mesas/{mesa['id']}",
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.json()["estado"] == "libre"
+
+    def test_create_pedido_varias_lineas(self, client, camarero_user, mesa, producto):
+        """Probar la creación de un pedido con varias líneas del mismo producto."""
+        pedido_data = {
+            "mesa_id": mesa["id"],
+            "detalles": [
+                {"producto_id": producto["id"], "cantidad": 1},
+                {"producto_id": producto["id"], "cantidad": 3, "observaciones": "Sin hielo"}
+            ]
+        }
+        response = client.post(
+            "/pedidos/",
+            json=pedido_data,
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.json()["detalles"]) == 2
+        assert response.json()["total"] == pytest.approx(producto["precio"] * 4)
+        assert response.json()["detalles"][1]["observaciones"] == "Sin hielo"
+
     def test_create_pedido_unauthorized(self, client, cocinero_user, mesa, producto):
         """Probar que los cocineros no pueden crear pedidos."""
         pedido_data = {
@@ -382,4 +457,137 @@ class TestPedidos:
             headers={"Authorization": f"Bearer {camarero_user['token']}"}
         )
         detalles_ids = [d["id"] for d in get_response.json()["detalles"]]
-        assert detalle_id not in detalles_ids 
\ No newline at end of file
+        assert detalle_id not in detalles_ids
+
+
+def _crear_pedido_varios_productos(client, admin_user, camarero_user, mesa, categoria, lineas):
+    """Crear un pedido con una línea por producto distinto y devolver sus datos."""
+    detalles = []
+    for i in range(lineas):
+        response = client.post(
+            "/productos/",
+            json={
+                "nombre": f"Producto {i}",
+                "precio": 2.0 + i,
+                "tiempo_preparacion": 5,
+                "categoria_id": categoria["id"],
+                "tipo": TipoProducto.COMIDA,
+                "disponible": True
+            },
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        detalles.append({"producto_id": response.json()["id"], "cantidad": 1})
+    response = client.post(
+        "/pedidos/",
+        json={"mesa_id": mesa["id"], "detalles": detalles},
+        headers={"Authorization": f"Bearer {camarero_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+class TestPresupuestoConsultasPedidos:
+    def test_get_pedido_by_id_consultas_constantes(
+        self, client, admin_user, camarero_user, mesa, categoria, limite_consultas
+    ):
+        """Probar que el detalle de un pedido se construye en 3 consultas sin importar el número de líneas."""
+        pedido = _crear_pedido_varios_productos(client, admin_user, camarero_user, mesa, categoria, lineas=6)
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        client.get("/usuarios/me", headers=cabeceras)  # calentar la caché de usuarios
+
+        with limite_consultas(3):
+            response = client.get(f"/pedidos/{pedido['id']}", headers=cabeceras)
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["mesa"]["id"] == mesa["id"]
+        assert data["camarero"]["username"] == "camarero"
+        assert sorted(d["producto"]["nombre"] for d in data["detalles"]) == [f"Producto {i}" for i in range(6)]
+
+    def test_listado_de_pedidos_una_consulta(self, client, admin_user, pedido, limite_consultas):
+        """Probar que el listado plano de pedidos no dispara cargas perezosas."""
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        client.get("/usuarios/me", headers=cabeceras)
+
+        with limite_consultas(1):
+            response = client.get("/pedidos/", headers=cabeceras)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+
+    @pytest.mark.parametrize("estrategia,presupuesto", [("selectin", 3), ("joined", 1)])
+    def test_get_pedidos_con_estrategia_de_carga(
+        self, client, db, admin_user, camarero_user, mesa, categoria, limite_consultas, estrategia, presupuesto
+    ):
+        """Probar que get_pedidos construye el grafo completo de varios pedidos en un número fijo de consultas."""
+        _crear_pedido_varios_productos(client, admin_user, camarero_user, mesa, categoria, lineas=3)
+        _crear_pedido_varios_productos(client, admin_user, camarero_user, mesa, categoria, lineas=4)
+
+        with limite_consultas(presupuesto):
+            pedidos = pedido_service.get_pedidos(db, estrategia_carga=estrategia)
+            detallados = TypeAdapter(List[PedidoDetallado]).validate_python(pedidos, from_attributes=True)
+
+        assert sorted(len(p.detalles) for p in detallados) == [3, 4]
+        assert all(d.producto.nombre.startswith("Producto") for p in detallados for d in p.detalles)
+
+
+class TestCanalesNotificaciones:
+    def test_eventos_del_pedido_llevan_sus_canales(self, client, camarero_user, mesa, producto, monkeypatch):
+        """Probar que las notificaciones de un pedido van a los canales de su mesa, su camarero y sus tipos."""
+        enviados = []
+        monkeypatch.setattr(
+            pedido_service, "safe_broadcast",
+            lambda mensaje, grupos, canales=(): enviados.append((mensaje["tipo"], set(canales)))
+        )
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        response = client.post(
+            "/pedidos/",
+            json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 1}]},
+            headers=cabeceras
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        client.put(f"/pedidos/{response.json()['id']}", json={"estado": EstadoPedido.EN_PREPARACION}, headers=cabeceras)
+
+        canales = {f"mesa:{mesa['numero']}", f"camarero:{camarero_user['id']}", "tipo:comida"}
+        assert enviados == [("nuevo_pedido", canales), ("actualizacion_pedido", canales)]
+
+
+
+class TestMenuPedidos:
+    def test_lineas_validadas_con_el_menu(self, client, admin_user, camarero_user, mesa, producto, limite_consultas):
+        """Probar que, con el menú cargado, las líneas se validan sin consultar productos disponibles."""
+        client.get("/productos/")
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+
+        with limite_consultas(20) as consultas:
+            response = client.post(
+                "/pedidos/",
+                json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 2}]},
+                headers=cabeceras
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["total"] == producto["precio"] * 2
+        # La respuesta (PedidoDetallado) sí carga el producto de sus líneas; la validación no
+        assert not [consulta for consulta in consultas if "productos.disponible =" in consulta]
+
+    def test_cambios_del_producto_se_aplican_al_momento(self, client, admin_user, camarero_user, mesa, producto):
+        """Probar que un cambio de precio o de disponibilidad se aplica al siguiente pedido."""
+        admin = {"Authorization": f"Bearer {admin_user['token']}"}
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        pedido = {"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 1}]}
+        primero = client.post("/pedidos/", json=pedido, headers=cabeceras)
+        assert primero.status_code == status.HTTP_201_CREATED
+
+        client.put(f"/productos/{producto['id']}", json={"precio": 3.25}, headers=admin)
+        response = client.post("/pedidos/", json=pedido, headers=cabeceras)
+        assert response.json()["detalles"][0]["precio_unitario"] == 3.25
+
+        client.put(f"/productos/{producto['id']}", json={"disponible": False}, headers=admin)
+        response = client.post("/pedidos/", json=pedido, headers=cabeceras)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.post(
+            f"/pedidos/{primero.json()['id']}/detalles/",
+            json={"producto_id": producto["id"], "cantidad": 1},
+            headers=cabeceras
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
\ No newline at end of file
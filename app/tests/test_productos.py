@@ -1,9 +1,17 @@
 """
 Tests para los endpoints de gestión de productos.
 """
+import asyncio
+import time
+
 import pytest
 from fastapi import status
 from app.core.enums import TipoProducto
+from app.core.menu import MenuCache
+from app.core.websockets import ConnectionManager, manager
+from app.models.cuenta import Cuenta, CuentaProducto
+from app.services import menu_service
+from app.tests.test_backplane import _BackplaneEnMemoria
 
 @pytest.fixture
 def categoria(client, admin_user):
@@ -203,10 +211,137 @@ class TestProductos:
         )
         assert get_response.status_code == status.HTTP_404_NOT_FOUND
 
+    def test_delete_producto_marca_historial(self, client, db, admin_user, categoria, producto):
+        """Probar que eliminar un producto marca sus líneas en las cuentas que lo contienen y no toca el resto."""
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        otro = client.post("/productos/", json={
+            "nombre": "Otro Producto", "precio": 2.5, "tiempo_preparacion": 5,
+            "categoria_id": categoria["id"], "tipo": TipoProducto.BEBIDA
+        }, headers=cabeceras).json()
+
+        def linea(p):
+            return {"pedido_id": 1, "producto_id": p["id"], "nombre_producto": p["nombre"], "cantidad": 1,
+                    "precio_unitario": p["precio"], "subtotal": p["precio"]}
+
+        cuentas = []
+        for productos in ([producto, otro, producto], [otro]):
+            response = client.post("/cuentas/", json={
+                "numero_mesa": 1, "nombre_camarero": "Admin", "total": sum(p["precio"] for p in productos),
+                "detalles": [linea(p) for p in productos]
+            }, headers=cabeceras)
+            assert response.status_code == status.HTTP_201_CREATED
+            cuentas.append(response.json()["id"])
+        # El índice inverso tiene una fila por producto distinto de cada cuenta
+        assert db.query(CuentaProducto).filter(CuentaProducto.producto_id == producto["id"]).count() == 1
+
+        response = client.delete(f"/productos/{producto['id']}", headers=cabeceras)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        db.expire_all()
+        con_producto, sin_producto = (db.get(Cuenta, cuenta_id).detalles for cuenta_id in cuentas)
+        assert [(d["producto_eliminado"], d.get("nombre_producto_original")) for d in con_producto] == [
+            (True, producto["nombre"]), (False, None), (True, producto["nombre"])
+        ]
+        assert sin_producto == [
+            {**linea(otro), "observaciones": None, "producto_eliminado": False, "nombre_producto_original": None}
+        ]
+        assert db.query(CuentaProducto).filter(CuentaProducto.producto_id == producto["id"]).count() == 0
+
     def test_delete_producto_unauthorized(self, client, camarero_user, producto):
         """Probar que los usuarios no administradores no pueden eliminar productos."""
         response = client.delete(
             f"/productos/{producto['id']}",
             headers={"Authorization": f"Bearer {camarero_user['token']}"}
         )
-        assert response.status_code == status.HTTP_403_FORBIDDEN 
\ No newline at end of file
+        assert response.status_code == status.HTTP_403_FORBIDDEN 
+
+class TestMenuEnMemoria:
+    def test_listado_etag_304(self, client, admin_user, producto):
+        """Probar que el listado sin cambios devuelve 304 y que modificar un producto genera un ETag nuevo."""
+        etag = client.get("/productos/").headers["ETag"]
+
+        response = client.get("/productos/", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+
+        client.put(
+            f"/productos/{producto['id']}",
+            json={"precio": 12.5},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        response = client.get("/productos/", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] != etag
+        assert response.json()[0]["precio"] == 12.5
+
+    def test_listado_sin_consultas(self, client, admin_user, categoria, producto, limite_consultas):
+        """Probar que, con el menú cargado, los listados filtrados no consultan la base de datos."""
+        client.post(
+            "/productos/",
+            json={
+                "nombre": "Caña", "precio": 2.0, "tiempo_preparacion": 1, "categoria_id": categoria["id"],
+                "tipo": TipoProducto.BEBIDA, "disponible": False
+            },
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        client.get("/productos/")
+
+        with limite_consultas(0):
+            por_categoria = client.get(f"/productos/?categoria_id={categoria['id']}&disponible=true").json()
+            por_tipo = client.get(f"/productos/?tipo={TipoProducto.BEBIDA.value}").json()
+            categorias = client.get("/categorias/").json()
+
+        assert [p["id"] for p in por_categoria] == [producto["id"]]
+        assert [p["nombre"] for p in por_tipo] == ["Caña"]
+        assert [c["id"] for c in categorias] == [categoria["id"]]
+
+    def test_cambios_del_menu_llegan_a_otro_worker(self, client, db, admin_user, categoria, producto, monkeypatch):
+        """
+        Probar que otro worker deja de aceptar el precio y la disponibilidad anteriores de un producto.
+        La aplicación hace de worker A; el worker B tiene su propio menú y su gestor, conectados al de A
+        por un backplane en memoria.
+        """
+        menu_b = MenuCache()
+        monkeypatch.setattr(menu_service, "menu", menu_b)
+        gestor_b = ConnectionManager()
+        gestor_b.suscribir_eventos_remotos(menu_service.invalidar_por_evento_remoto)
+        red = []
+        asyncio.run(manager.iniciar_backplane(_BackplaneEnMemoria(red)))
+        asyncio.run(gestor_b.iniciar_backplane(_BackplaneEnMemoria(red)))
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+
+        def en_worker_a(accion):
+            """Ejecutar una petición en el worker A y esperar a que su evento invalide el menú de B"""
+            version = menu_b.version
+            accion()
+            fin = time.monotonic() + 5
+            while menu_b.version == version and time.monotonic() < fin:
+                time.sleep(0.01)
+            assert menu_b.version != version
+
+        def disponibles_en_b():
+            return menu_service.get_productos_disponibles(db, [producto["id"]])
+
+        try:
+            assert disponibles_en_b()[producto["id"]]["precio"] == 9.99
+
+            en_worker_a(lambda: client.put(f"/productos/{producto['id']}", json={"precio": 12.5}, headers=cabeceras))
+            assert disponibles_en_b()[producto["id"]]["precio"] == 12.5
+
+            en_worker_a(lambda: client.put(f"/productos/{producto['id']}", json={"disponible": False}, headers=cabeceras))
+            assert disponibles_en_b() == {}
+
+            # Los cambios de categorías solo se avisan a los demás procesos, sin numerarlos como eventos
+            seq = gestor_b.seq
+            en_worker_a(lambda: client.put(f"/categorias/{categoria['id']}", json={"nombre": "Postres"}, headers=cabeceras))
+            assert [c["nombre"] for c in menu_service.get_menu(db).categorias()] == ["Postres"]
+            assert gestor_b.seq == seq
+        finally:
+            asyncio.run(manager.detener_backplane())
+            asyncio.run(gestor_b.detener_backplane())
+
+    def test_delete_producto_sale_del_menu(self, client, admin_user, producto):
+        """Probar que un producto eliminado deja de aparecer en el listado."""
+        assert len(client.get("/productos/").json()) == 1
+        client.delete(f"/productos/{producto['id']}", headers={"Authorization": f"Bearer {admin_user['token']}"})
+        assert client.get("/productos/").json() == []
@@ -1,8 +1,18 @@
 """
 Tests para los endpoints de gestión de usuarios.
 """
+import asyncio
+import time
+
 import pytest
 from fastapi import status
+from sqlalchemy import event
+
+from app.core import usuarios
+from app.core.metrics import reiniciar_metricas
+from app.core.websockets import ConnectionManager, EventoWebSocket, manager
+from app.models.usuario import Usuario
+from app.tests.test_backplane import _BackplaneEnMemoria
 
 class TestUsuarios:
     def test_create_usuario(self, client, admin_user):
@@ -203,4 +213,129 @@ class TestUsuarios:
             f"/usuarios/{admin_user['id']}",
             headers={"Authorization": f"Bearer {admin_user['token']}"}
         )
-        assert response.status_code == status.HTTP_400_BAD_REQUEST 
\ No newline at end of file
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestCacheUsuarioActual:
+    def test_peticiones_autenticadas_no_consultan_usuarios(self, client, db, admin_user):
+        """Probar que, con la caché caliente, autenticar no ejecuta ninguna consulta a usuarios."""
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        client.get("/usuarios/me", headers=cabeceras)
+
+        consultas = []
+
+        def registrar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+
+        engine = db.get_bind().engine
+        event.listen(engine, "before_cursor_execute", registrar)
+        try:
+            for _ in range(3):
+                response = client.get("/usuarios/me", headers=cabeceras)
+                assert response.status_code == status.HTTP_200_OK
+                assert response.json()["username"] == "admin"
+        finally:
+            event.remove(engine, "before_cursor_execute", registrar)
+
+        assert not [c for c in consultas if "FROM usuarios" in c]
+
+    def test_contadores_de_aciertos_y_fallos(self, client, admin_user):
+        """Probar que la caché publica sus aciertos y fallos en /metricas."""
+        reiniciar_metricas()
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        client.get("/usuarios/me", headers=cabeceras)
+        client.get("/usuarios/me", headers=cabeceras)
+
+        metricas = client.get("/metricas/", headers=cabeceras).json()
+        assert metricas["cache_usuarios_fallos"] == 1
+        # Segunda petición a /usuarios/me y la propia petición a /metricas
+        assert metricas["cache_usuarios_aciertos"] == 2
+
+    def test_desactivar_usuario_invalida_cache(self, client, admin_user, camarero_user):
+        """Probar que desactivar a un usuario surte efecto en su siguiente petición."""
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        assert client.get("/usuarios/me", headers=cabeceras).status_code == status.HTTP_200_OK
+
+        response = client.put(
+            f"/usuarios/{camarero_user['id']}",
+            json={"activo": False},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get("/usuarios/me", headers=cabeceras)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cambiar_rol_invalida_cache(self, client, admin_user, camarero_user):
+        """Probar que un cambio de rol se aplica sin esperar a que caduque la caché."""
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        assert client.get("/usuarios/", headers=cabeceras).status_code == status.HTTP_403_FORBIDDEN
+
+        client.put(
+            f"/usuarios/{camarero_user['id']}",
+            json={"rol": "admin"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+
+        assert client.get("/usuarios/", headers=cabeceras).status_code == status.HTTP_200_OK
+
+    def test_eliminar_usuario_invalida_cache(self, client, admin_user, camarero_user):
+        """Probar que el token de un usuario eliminado deja de ser válido inmediatamente."""
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        assert client.get("/usuarios/me", headers=cabeceras).status_code == status.HTTP_200_OK
+
+        response = client.delete(
+            f"/usuarios/{camarero_user['id']}",
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        response = client.get("/usuarios/me", headers=cabeceras)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_invalidacion_llega_a_otros_workers(self, client, db, admin_user, camarero_user):
+        """
+        Probar que un cambio de usuario se avisa a los demás workers y que el aviso de otro worker
+        vacía la caché de este. La aplicación hace de worker A; los demás gestores están conectados
+        al de A por un backplane en memoria.
+        """
+        recibidos = []
+        gestor_b = ConnectionManager()
+        gestor_b.suscribir_eventos_remotos(lambda datos, grupos: recibidos.append((datos, grupos)))
+        gestor_c = ConnectionManager()
+        gestor_c.suscribir_eventos_remotos(usuarios.invalidar_por_evento_remoto)
+        red = []
+        asyncio.run(manager.iniciar_backplane(_BackplaneEnMemoria(red)))
+        asyncio.run(gestor_b.iniciar_backplane(_BackplaneEnMemoria(red)))
+        asyncio.run(gestor_c.iniciar_backplane(_BackplaneEnMemoria(red)))
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        aviso = ({"tipo": "usuario_actualizado", "username": "camarero"}, [])
+
+        try:
+            # El worker A avisa a los demás sin numerar el aviso como evento
+            seq = gestor_b.seq
+            response = client.put(
+                f"/usuarios/{camarero_user['id']}",
+                json={"activo": False},
+                headers={"Authorization": f"Bearer {admin_user['token']}"}
+            )
+            assert response.status_code == status.HTTP_200_OK
+            fin = time.monotonic() + 5
+            while aviso not in recibidos and time.monotonic() < fin:
+                time.sleep(0.01)
+            assert aviso in recibidos
+            assert gestor_b.seq == seq
+
+            # Otro worker reactiva al usuario: la caché de este proceso lo conserva desactivado
+            # hasta que llega su aviso
+            assert client.get("/usuarios/me", headers=cabeceras).status_code == status.HTTP_400_BAD_REQUEST
+            db.query(Usuario).filter(Usuario.username == "camarero").update({"activo": True})
+            db.commit()
+            assert client.get("/usuarios/me", headers=cabeceras).status_code == status.HTTP_400_BAD_REQUEST
+
+            gestor_b.difundir(EventoWebSocket(aviso[0]), ())
+            assert client.get("/usuarios/me", headers=cabeceras).status_code == status.HTTP_200_OK
+        finally:
+            asyncio.run(manager.detener_backplane())
+            asyncio.run(gestor_b.detener_backplane())
+            asyncio.run(gestor_c.detener_backplane())
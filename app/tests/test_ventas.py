@@ -0,0 +1,240 @@
+"""
+Tests para los agregados de ingresos y los informes de ventas.
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, text
+
+from app.db.database import Base
+from app.db.migrations import aplicar_migraciones
+from app.models.cuenta import Cuenta
+from app.models.venta import IngresoAgregado
+from app.services.venta_service import reconstruir_agregados
+
+def _crear_cuenta(client, camarero_user, numero_mesa=5, metodo_pago="efectivo", lineas=((1, "Café", 2, 1.5),)):
+    """Crear una cuenta manual con líneas (producto_id, nombre, cantidad, precio) y devolver sus datos."""
+    detalles = [
+        {
+            "pedido_id": 1,
+            "producto_id": producto_id,
+            "nombre_producto": nombre,
+            "cantidad": cantidad,
+            "precio_unitario": precio,
+            "subtotal": cantidad * precio
+        }
+        for producto_id, nombre, cantidad, precio in lineas
+    ]
+    response = client.post(
+        "/cuentas/",
+        json={
+            "numero_mesa": numero_mesa,
+            "nombre_camarero": "Camarero Test",
+            "total": sum(d["subtotal"] for d in detalles),
+            "metodo_pago": metodo_pago,
+            "detalles": detalles
+        },
+        headers={"Authorization": f"Bearer {camarero_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+def _ventas(client, admin_user, ruta, **params):
+    response = client.get(
+        f"/ventas/{ruta}",
+        params=params,
+        headers={"Authorization": f"Bearer {admin_user['token']}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+def _agregados(db):
+    """Contenido de la tabla de agregados, comparable entre ejecuciones"""
+    db.expire_all()
+    return sorted(
+        (a.dimension, a.granularidad, a.periodo, a.clave, a.nombre, a.cuentas, a.unidades, round(a.total, 2))
+        for a in db.query(IngresoAgregado).all()
+    )
+
+class TestAgregadosIncrementales:
+    def test_crear_cuenta_actualiza_agregados(self, client, admin_user, camarero_user):
+        """Probar que crear cuentas suma en los agregados por camarero, mesa, producto y método de pago."""
+        _crear_cuenta(client, camarero_user, lineas=((1, "Café", 2, 1.5), (2, "Tostada", 1, 3.0)))
+        _crear_cuenta(client, camarero_user, numero_mesa=6, metodo_pago="tarjeta", lineas=((1, "Café", 1, 1.5),))
+
+        camareros = _ventas(client, admin_user, "camarero", granularidad="hora")
+        assert len(camareros) == 1
+        assert camareros[0]["clave"] == str(camarero_user["id"])
+        assert camareros[0]["nombre"] == "Camarero Test"
+        assert (camareros[0]["cuentas"], camareros[0]["unidades"], camareros[0]["total"]) == (2, 4, 7.5)
+
+        mesas = _ventas(client, admin_user, "mesa/totales")
+        assert [(m["clave"], m["nombre"], m["total"]) for m in mesas] == [("5", "Mesa 5", 6.0), ("6", "Mesa 6", 1.5)]
+
+        productos = {p["clave"]: p for p in _ventas(client, admin_user, "producto")}
+        assert (productos["1"]["nombre"], productos["1"]["cuentas"], productos["1"]["unidades"]) == ("Café", 2, 3)
+        assert productos["1"]["total"] == 4.5
+        assert productos["2"]["total"] == 3.0
+
+        periodo = datetime.fromisoformat(camareros[0]["periodo"])
+        assert (periodo.minute, periodo.second) == (0, 0)
+        dia = datetime.fromisoformat(_ventas(client, admin_user, "camarero")[0]["periodo"])
+        assert (dia.hour, dia.minute) == (0, 0)
+
+    def test_actualizar_metodo_pago_mueve_agregados(self, client, admin_user, camarero_user):
+        """Probar que cambiar el método de pago mueve la cuenta entre agregados sin tocar el resto."""
+        cuenta = _crear_cuenta(client, camarero_user, metodo_pago="efectivo")
+        response = client.put(
+            f"/cuentas/{cuenta['id']}",
+            json={"metodo_pago": "tarjeta"},
+            headers={"Authorization": f"Bearer {camarero_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        metodos = _ventas(client, admin_user, "metodo_pago")
+        assert [(m["clave"], m["cuentas"], m["total"]) for m in metodos] == [("tarjeta", 1, 3.0)]
+        assert _ventas(client, admin_user, "camarero")[0]["cuentas"] == 1
+
+    def test_eliminar_cuenta_resta_agregados(self, client, admin_user, camarero_user, db):
+        """Probar que eliminar una cuenta la resta y elimina los agregados que quedan vacíos."""
+        conservada = _crear_cuenta(client, camarero_user, lineas=((1, "Café", 1, 1.5),))
+        eliminada = _crear_cuenta(client, camarero_user, lineas=((2, "Tostada", 1, 3.0),))
+        response = client.delete(
+            f"/cuentas/{eliminada['id']}",
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        )
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        assert [p["clave"] for p in _ventas(client, admin_user, "producto")] == ["1"]
+        assert _ventas(client, admin_user, "camarero")[0]["total"] == conservada["total"]
+        assert all(a[5] > 0 for a in _agregados(db))
+
+    def test_cerrar_mesa_actualiza_agregados(self, client, admin_user, camarero_user):
+        """Probar que la cuenta generada al cerrar una mesa también se suma a los agregados."""
+        mesa = client.post(
+            "/mesas/",
+            json={"numero": 12, "capacidad": 4, "ubicacion": "Interior"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        ).json()
+        categoria = client.post(
+            "/categorias/",
+            json={"nombre": "Bebidas"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        ).json()
+        producto = client.post(
+            "/productos/",
+            json={"nombre": "Agua", "precio": 2.0, "tiempo_preparacion": 1, "categoria_id": categoria["id"], "tipo": "bebida"},
+            headers={"Authorization": f"Bearer {admin_user['token']}"}
+        ).json()
+        cabeceras = {"Authorization": f"Bearer {camarero_user['token']}"}
+        client.put(f"/mesas/{mesa['id']}", json={"estado": "ocupada"}, headers=cabeceras)
+        client.post(
+            "/pedidos/",
+            json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 3}]},
+            headers=cabeceras
+        )
+        client.put(f"/mesas/{mesa['id']}", json={"estado": "libre", "metodo_pago": "bizum"}, headers=cabeceras)
+
+        mesas = _ventas(client, admin_user, "mesa/totales")
+        assert [(m["clave"], m["unidades"], m["total"]) for m in mesas] == [("12", 3, 6.0)]
+
+class TestConsultasVentas:
+    def test_consultas_solo_leen_agregados(self, client, admin_user, camarero_user, limite_consultas):
+        """Probar que los informes no consultan la tabla de cuentas."""
+        _crear_cuenta(client, camarero_user)
+        for ruta, params in (("producto", {"granularidad": "hora"}), ("producto/totales", {})):
+            with limite_consultas(1) as consultas:
+                _ventas(client, admin_user, ruta, **params)
+            assert "ingresos_agregados" in consultas[0]
+            assert "cuentas." not in consultas[0]
+
+    def test_filtros_clave_y_periodo(self, client, admin_user, camarero_user):
+        """Probar el filtro por clave y que un periodo sin ventas devuelve una lista vacía."""
+        _crear_cuenta(client, camarero_user, lineas=((1, "Café", 1, 1.5), (2, "Tostada", 1, 3.0)))
+        assert [p["clave"] for p in _ventas(client, admin_user, "producto", clave="2")] == ["2"]
+        assert _ventas(
+            client, admin_user, "producto", fecha_inicio="2020-01-01T00:00:00", fecha_fin="2020-01-31T00:00:00"
+        ) == []
+
+    def test_ventas_solo_admin(self, client, camarero_user):
+        """Probar que los camareros no pueden consultar los informes de ventas."""
+        response = client.get("/ventas/camarero", headers={"Authorization": f"Bearer {camarero_user['token']}"})
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_dimension_desconocida(self, client, admin_user):
+        """Probar que una dimensión no válida se rechaza."""
+        response = client.get("/ventas/cliente", headers={"Authorization": f"Bearer {admin_user['token']}"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+class TestReconstruccionAgregados:
+    def test_reconstruir_coincide_con_incremental(self, client, admin_user, camarero_user, db):
+        """Probar que reconstruir por lotes desde el historial da los mismos agregados que las actualizaciones."""
+        _crear_cuenta(client, camarero_user, lineas=((1, "Café", 2, 1.5),))
+        _crear_cuenta(client, camarero_user, numero_mesa=6, metodo_pago=None, lineas=((1, "Café", 1, 1.5), (3, "Zumo", 1, 2.5)))
+        _crear_cuenta(client, camarero_user, numero_mesa=7, metodo_pago="tarjeta", lineas=((2, "Tostada", 4, 3.0),))
+        incrementales = _agregados(db)
+
+        assert reconstruir_agregados(db, tamano_lote=2) == 3
+        db.commit()
+        assert _agregados(db) == incrementales
+
+    def test_eliminar_camarero_y_despues_su_cuenta(self, client, admin_user, camarero_user, db):
+        """Probar que tras eliminar al camarero, eliminar una de sus cuentas deja los agregados como al reconstruir."""
+        _crear_cuenta(client, camarero_user, lineas=((1, "Café", 2, 1.5),))
+        eliminada = _crear_cuenta(client, camarero_user, numero_mesa=6, lineas=((2, "Tostada", 1, 3.0),))
+        cabeceras = {"Authorization": f"Bearer {admin_user['token']}"}
+        response = client.delete(f"/usuarios/{camarero_user['id']}", headers=cabeceras)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert [c["clave"] for c in _ventas(client, admin_user, "camarero")] == ["Camarero Test"]
+
+        response = client.delete(f"/cuentas/{eliminada['id']}", headers=cabeceras)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        incrementales = _agregados(db)
+
+        reconstruir_agregados(db)
+        db.commit()
+        assert _agregados(db) == incrementales
+
+    def test_reconstruir_incluye_historial(self, db):
+        """Probar que la reconstrucción incorpora cuentas anteriores a los agregados."""
+        db.add_all([
+            Cuenta(
+                numero_mesa=3, camarero_id=None, nombre_camarero="Camarero Antiguo",
+                fecha_cobro=datetime(2025, 12, 31, 22, 30), total=10.0, metodo_pago="efectivo",
+                detalles=[{"pedido_id": 1, "producto_id": 9, "nombre_producto": "Menú", "cantidad": 1,
+                           "precio_unitario": 10.0, "subtotal": 10.0}]
+            ),
+            Cuenta(
+                numero_mesa=3, camarero_id=None, nombre_camarero="Camarero Antiguo",
+                fecha_cobro=datetime(2025, 12, 31, 23, 10), total=5.0, metodo_pago="efectivo", detalles="[]"
+            ),
+        ])
+        db.commit()
+
+        assert reconstruir_agregados(db, tamano_lote=1) == 2
+        db.commit()
+        agregados = _agregados(db)
+        assert ("camarero", "dia", datetime(2025, 12, 31), "Camarero Antiguo", "Camarero Antiguo", 2, 1, 15.0) in agregados
+        assert ("producto", "hora", datetime(2025, 12, 31, 22), "9", "Menú", 1, 1, 10.0) in agregados
+        assert [a[2].hour for a in agregados if a[:2] == ("mesa", "hora")] == [22, 23]
+
+    def test_migracion_rellena_agregados(self, tmp_path):
+        """Probar que la migración crea la tabla de agregados en una base de datos existente y la rellena."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'existente.db'}")
+        Base.metadata.create_all(
+            bind=engine, tables=[t for t in Base.metadata.sorted_tables if t.name != "ingresos_agregados"]
+        )
+        with engine.begin() as conexion:
+            conexion.execute(text(
+                "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, metodo_pago, detalles) "
+                "VALUES (4, 'Camarero Antiguo', '2025-06-01 12:30:00', 8.5, 'efectivo', '[]')"
+            ))
+
+        aplicar_migraciones(engine)
+        with engine.connect() as conexion:
+            filas = conexion.execute(text(
+                "SELECT clave, cuentas, total FROM ingresos_agregados WHERE dimension = 'mesa' ORDER BY granularidad"
+            )).all()
+        assert [tuple(f) for f in filas] == [("4", 1, 8.5), ("4", 1, 8.5)]
+        engine.dispose()
@@ -0,0 +1,756 @@
+"""
+Tests del gestor de conexiones WebSocket: envío concurrente, colas acotadas y expulsión de conexiones.
+"""
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import status
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.enums import CodificacionWebSocket, PoliticaDesbordamiento
+from app.core.metrics import obtener_metricas, reiniciar_metricas
+from app.core import websockets as modulo_websockets
+from app.core.enums import EstadoPedido, TipoProducto
+from app.core.websockets import (
+    ConnectionManager, DespachadorEventos, EventoWebSocket, clave_coalescencia, crear_canales, manager,
+    numerar_trama, safe_broadcast
+)
+
+msgpack = modulo_websockets.msgpack
+requiere_msgpack = pytest.mark.skipif(msgpack is None, reason="msgpack no está instalado")
+
+class _WebSocketFalso:
+    """WebSocket mínimo que registra los mensajes recibidos, con un retraso o un bloqueo opcionales"""
+
+    def __init__(self, retraso: float = 0.0, fallar: bool = False):
+        self.retraso = retraso
+        self.fallar = fallar
+        self.mensajes = []
+        self.instantes = []
+        self.cierre = None
+        self.bloqueo = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, mensaje: str):
+        if self.fallar:
+            raise ConnectionResetError("socket cerrado")
+        if self.bloqueo is not None:
+            await self.bloqueo.wait()
+        if self.retraso:
+            await asyncio.sleep(self.retraso)
+        self.mensajes.append(mensaje)
+        self.instantes.append(time.perf_counter())
+
+    async def send_bytes(self, mensaje: bytes):
+        await self.send_text(mensaje)
+
+    async def close(self, code: int = 1000):
+        self.cierre = code
+
+async def _esperar(condicion, limite: float = 2.0):
+    """Ceder el bucle hasta que se cumpla la condición"""
+    fin = time.perf_counter() + limite
+    while not condicion():
+        assert time.perf_counter() < fin, "la condición no se cumplió a tiempo"
+        await asyncio.sleep(0.001)
+
+def _conectados(gestor, client_type="cocina"):
+    return list(gestor.active_connections[client_type])
+
+@pytest.fixture(autouse=True)
+def metricas_limpias():
+    reiniciar_metricas()
+    yield
+    reiniciar_metricas()
+
+class TestConnectionManager:
+    def test_cliente_lento_no_retrasa_a_los_demas(self):
+        """Probar que un cliente lento no retrasa la entrega a los clientes rápidos."""
+        gestor = ConnectionManager()
+        lento = _WebSocketFalso(retraso=0.5)
+        rapidos = [_WebSocketFalso() for _ in range(20)]
+
+        async def escenario():
+            await gestor.connect(lento, "cocina")
+            for ws in rapidos:
+                await gestor.connect(ws, "cocina")
+            inicio = time.perf_counter()
+            await gestor.broadcast('{"tipo": "nuevo_pedido"}', "cocina")
+            await _esperar(lambda: all(ws.mensajes for ws in rapidos))
+            return time.perf_counter() - inicio
+
+        assert asyncio.run(escenario()) < 0.1
+        assert not lento.mensajes
+
+    def test_conexion_muerta_se_expulsa(self):
+        """Probar que un socket que falla se expulsa y los demás siguen recibiendo."""
+        gestor = ConnectionManager()
+        muerto, vivo = _WebSocketFalso(fallar=True), _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(muerto, "cocina")
+            await gestor.connect(vivo, "cocina")
+            await gestor.broadcast("uno", "cocina")
+            await _esperar(lambda: muerto.cierre is not None)
+            await gestor.broadcast("dos", "cocina")
+            await _esperar(lambda: len(vivo.mensajes) == 2)
+
+        asyncio.run(escenario())
+        assert _conectados(gestor) == [vivo]
+        assert muerto.cierre == status.WS_1013_TRY_AGAIN_LATER
+        metricas = obtener_metricas()
+        assert metricas["websocket_conexiones_expulsadas"] == 1
+        assert metricas["websocket_conexiones"] == 1
+
+    def test_envio_bloqueado_se_expulsa_por_tiempo(self):
+        """Probar que un envío que no termina dentro del tiempo máximo expulsa la conexión."""
+        gestor = ConnectionManager(timeout_envio=0.05)
+        colgado = _WebSocketFalso()
+        colgado.bloqueo = asyncio.Event()
+
+        async def escenario():
+            await gestor.connect(colgado, "cocina")
+            await gestor.broadcast("uno", "cocina")
+            await _esperar(lambda: not _conectados(gestor))
+
+        asyncio.run(escenario())
+        assert obtener_metricas()["websocket_conexiones_expulsadas"] == 1
+
+    @pytest.mark.parametrize("politica, esperados", [
+        (PoliticaDesbordamiento.DESCARTAR_ANTIGUOS, ["m0", "m3", "m4", "m5"]),
+        (PoliticaDesbordamiento.DESCARTAR_NUEVOS, ["m0", "m1", "m2", "m3"]),
+    ])
+    def test_cola_llena_descarta_segun_politica(self, politica, esperados):
+        """Probar que con la cola llena se descartan los mensajes más antiguos o los nuevos según la política."""
+        gestor = ConnectionManager(tamano_cola=3, politica=politica)
+        lento = _WebSocketFalso()
+        lento.bloqueo = asyncio.Event()
+
+        async def escenario():
+            await gestor.connect(lento, "cocina")
+            await gestor.broadcast("m0", "cocina")
+            await asyncio.sleep(0)  # la tarea escritora toma m0 y se bloquea enviándolo
+            for i in range(1, 6):
+                await gestor.broadcast(f"m{i}", "cocina")
+            lento.bloqueo.set()
+            await _esperar(lambda: len(lento.mensajes) == 4)
+
+        asyncio.run(escenario())
+        assert lento.mensajes == esperados
+        assert obtener_metricas()["websocket_mensajes_descartados"] == 2
+
+    def test_cola_llena_desconecta_segun_politica(self):
+        """Probar que con la política de desconectar, un cliente con la cola llena se expulsa."""
+        gestor = ConnectionManager(tamano_cola=2, politica=PoliticaDesbordamiento.DESCONECTAR)
+        lento, rapido = _WebSocketFalso(), _WebSocketFalso()
+        lento.bloqueo = asyncio.Event()
+
+        async def escenario():
+            await gestor.connect(lento, "cocina")
+            await gestor.connect(rapido, "cocina")
+            for i in range(4):
+                await gestor.broadcast(f"m{i}", "cocina")
+                await asyncio.sleep(0.01)
+            await _esperar(lambda: lento.cierre is not None and len(rapido.mensajes) == 4)
+
+        asyncio.run(escenario())
+        assert _conectados(gestor) == [rapido]
+
+    def test_mensajes_con_la_misma_clave_se_coalescen(self):
+        """Probar que una actualización del mismo pedido sustituye a la pendiente de un cliente lento."""
+        gestor = ConnectionManager()
+        lento = _WebSocketFalso()
+        lento.bloqueo = asyncio.Event()
+
+        async def escenario():
+            await gestor.connect(lento, "camareros")
+            await gestor.broadcast("inicio", "camareros")
+            await asyncio.sleep(0)
+            await gestor.broadcast("pedido 1 en preparación", "camareros", clave="actualizacion_pedido:1")
+            await gestor.broadcast("pedido 2 listo", "camareros", clave="actualizacion_pedido:2")
+            await gestor.broadcast("pedido 1 listo", "camareros", clave="actualizacion_pedido:1")
+            await gestor.broadcast("nuevo pedido", "camareros")
+            lento.bloqueo.set()
+            await _esperar(lambda: len(lento.mensajes) == 4)
+
+        asyncio.run(escenario())
+        assert lento.mensajes == ["inicio", "pedido 2 listo", "pedido 1 listo", "nuevo pedido"]
+        assert obtener_metricas()["websocket_mensajes_coalescidos"] == 1
+
+    def test_coalescencia_conserva_el_orden_de_seq(self):
+        """Probar que un evento que sustituye a otro pendiente no adelanta a los posteriores: los seq llegan en orden."""
+        gestor = ConnectionManager()
+        lento = _WebSocketFalso()
+        lento.bloqueo = asyncio.Event()
+
+        async def escenario():
+            await gestor.connect(lento, "camareros")
+            await gestor.broadcast("inicio", "camareros")
+            await asyncio.sleep(0)
+            for pedido_id in (1, 2, 1, 3, 2):
+                gestor.difundir(
+                    EventoWebSocket({"tipo": "actualizacion_pedido", "pedido_id": pedido_id}), ("camareros",)
+                )
+            lento.bloqueo.set()
+            await _esperar(lambda: len(lento.mensajes) == 4)
+
+        asyncio.run(escenario())
+        eventos = [json.loads(m) for m in lento.mensajes[1:]]
+        assert [(e["seq"], e["pedido_id"]) for e in eventos] == [(3, 1), (4, 3), (5, 2)]
+
+    def test_clave_coalescencia(self):
+        """Probar que solo las actualizaciones de estado de una entidad se coalescen."""
+        assert clave_coalescencia({"tipo": "actualizacion_pedido", "pedido_id": 7}) == "actualizacion_pedido:7"
+        assert clave_coalescencia({"tipo": "actualizacion_detalle", "pedido_id": 7, "detalle_id": 3}) == "actualizacion_detalle:3"
+        assert clave_coalescencia({"tipo": "nuevo_pedido", "pedido_id": 7}) is None
+        assert clave_coalescencia({"tipo": "actualizacion_pedido"}) is None
+
+class TestCodificacionEventos:
+    def test_evento_a_varios_grupos_se_codifica_una_vez(self, monkeypatch):
+        """Probar que un evento para camareros y cocina se codifica una vez y todos reciben la misma trama."""
+        gestor = ConnectionManager()
+        monkeypatch.setattr(modulo_websockets, "despachador", modulo_websockets.DespachadorEventos(gestor))
+        codificaciones = []
+        codificar = modulo_websockets.codificar_evento
+        monkeypatch.setattr(modulo_websockets, "codificar_evento", lambda datos: codificaciones.append(datos) or codificar(datos))
+        # El registro en el log no debe volver a decodificar la trama
+        monkeypatch.setattr(json, "loads", lambda *args, **kwargs: pytest.fail("la trama se ha vuelto a decodificar"))
+        clientes = {tipo: [_WebSocketFalso() for _ in range(3)] for tipo in ("camareros", "cocina", "admin")}
+
+        async def escenario():
+            for tipo, sockets in clientes.items():
+                for ws in sockets:
+                    await gestor.connect(ws, tipo)
+            safe_broadcast({"tipo": "actualizacion_menu", "accion": "crear", "producto_id": 5}, ("camareros", "cocina"))
+            await _esperar(lambda: all(ws.mensajes for tipo in ("camareros", "cocina") for ws in clientes[tipo]))
+
+        asyncio.run(escenario())
+        assert len(codificaciones) == 1
+        tramas = [ws.mensajes[0] for tipo in ("camareros", "cocina") for ws in clientes[tipo]]
+        assert tramas[0].startswith(f'{{"seq": 1, "epoca": "{gestor.epoca}", ')
+        assert all(trama is tramas[0] for trama in tramas)
+        assert not any(ws.mensajes for ws in clientes["admin"])
+
+    @pytest.mark.parametrize("con_orjson", [True, False])
+    def test_trama_json_con_y_sin_orjson(self, monkeypatch, con_orjson):
+        """Probar que la trama es el mismo JSON con orjson y con la biblioteca estándar."""
+        if not con_orjson:
+            monkeypatch.setattr(modulo_websockets, "orjson", None)
+        elif modulo_websockets.orjson is None:
+            pytest.skip("orjson no está instalado")
+        datos = {"tipo": "actualizacion_pedido", "pedido_id": 3, "estado": EstadoPedido.LISTO, "mesa": 4}
+        evento = EventoWebSocket(datos)
+        assert json.loads(evento.trama) == {**datos, "estado": "listo"}
+        assert evento.trama is evento.trama
+        assert evento.tipo == "actualizacion_pedido"
+        assert evento.clave == "actualizacion_pedido:3"
+
+def _evento(pedido_id: int) -> EventoWebSocket:
+    return EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": pedido_id})
+
+class TestReenvioEventos:
+    def test_reconexion_recibe_los_eventos_perdidos(self):
+        """Probar que al reconectar con ?since se reenvían, en orden, solo los eventos posteriores del mismo grupo."""
+        gestor = ConnectionManager()
+        nuevo = _WebSocketFalso()
+
+        async def escenario():
+            for pedido_id in range(1, 4):
+                gestor.difundir(_evento(pedido_id), ("cocina",))
+            gestor.difundir(EventoWebSocket({"tipo": "actualizacion_menu"}), ("camareros",))
+            await gestor.connect(nuevo, "cocina", since=1, epoca=gestor.epoca)
+            await _esperar(lambda: len(nuevo.mensajes) == 2)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(escenario())
+        eventos = [json.loads(m) for m in nuevo.mensajes]
+        assert eventos == [
+            {"seq": 2, "epoca": gestor.epoca, "tipo": "nuevo_pedido", "pedido_id": 2},
+            {"seq": 3, "epoca": gestor.epoca, "tipo": "nuevo_pedido", "pedido_id": 3},
+        ]
+        assert obtener_metricas()["websocket_eventos_reenviados"] == 2
+
+    @pytest.mark.parametrize("since,misma_epoca", [(1, True), (99, True), (4, False), (4, None)])
+    def test_hueco_demasiado_antiguo_pide_resincronizar(self, since, misma_epoca):
+        """Probar que se pide resincronizar si el hueco ya no está en el historial o la época no es la de este gestor."""
+        gestor = ConnectionManager(tamano_historial=2)
+        nuevo = _WebSocketFalso()
+        epoca = {True: gestor.epoca, False: "otro-proceso", None: None}[misma_epoca]
+
+        async def escenario():
+            for pedido_id in range(1, 6):
+                gestor.difundir(_evento(pedido_id), ("cocina",))
+            await gestor.connect(nuevo, "cocina", since=since, epoca=epoca)
+            await _esperar(lambda: nuevo.mensajes)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(escenario())
+        assert [json.loads(m) for m in nuevo.mensajes] == [{"tipo": "resync_requerido", "seq": 5, "epoca": gestor.epoca}]
+        assert obtener_metricas()["websocket_resync_requeridos"] == 1
+
+    def test_historial_justo_en_el_limite(self):
+        """Probar que se reenvía si todos los eventos posteriores a since siguen en el historial."""
+        gestor = ConnectionManager(tamano_historial=2)
+        assert gestor.eventos_desde("cocina", 0, epoca=gestor.epoca) == []
+
+        async def escenario():
+            for pedido_id in range(1, 6):
+                gestor.difundir(_evento(pedido_id), ("cocina",))
+
+        asyncio.run(escenario())
+        assert [json.loads(t)["seq"] for t in gestor.eventos_desde("cocina", 3, epoca=gestor.epoca)] == [4, 5]
+        assert gestor.eventos_desde("cocina", 2, epoca=gestor.epoca) is None
+        assert gestor.eventos_desde("cocina", 5, epoca=gestor.epoca) == []
+        assert gestor.eventos_desde("cocina", 5) is None
+
+    def test_eventos_en_directo_llevan_seq(self):
+        """Probar que los clientes conectados reciben los eventos numerados con la misma trama."""
+        gestor = ConnectionManager()
+        cocina, camareros = _WebSocketFalso(), _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(cocina, "cocina")
+            await gestor.connect(camareros, "camareros")
+            gestor.difundir(_evento(7), ("cocina", "camareros"))
+            await _esperar(lambda: cocina.mensajes and camareros.mensajes)
+
+        asyncio.run(escenario())
+        assert cocina.mensajes[0] is camareros.mensajes[0]
+        assert json.loads(cocina.mensajes[0]) == {"seq": 1, "epoca": gestor.epoca, "tipo": "nuevo_pedido", "pedido_id": 7}
+        assert numerar_trama(3, "{}") == '{"seq": 3}'
+        assert numerar_trama(3, "{}", "ab12") == '{"seq": 3, "epoca": "ab12"}'
+
+class TestLatidoYLimites:
+    def test_ping_y_cierre_de_conexiones_inactivas(self):
+        """Probar que el latido envía ping a las conexiones activas y cierra las que no dan señales."""
+        gestor = ConnectionManager(intervalo_ping=0, timeout_inactividad=10)
+        activa, muda = _WebSocketFalso(), _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(activa, "camareros")
+            await gestor.connect(muda, "camareros")
+            gestor.active_connections["camareros"][muda].ultima_actividad -= 20
+            gestor.latir()
+            gestor.latir()  # el segundo ping sustituye al primero si aún no se ha enviado
+            await _esperar(lambda: activa.mensajes and muda.cierre is not None)
+
+        asyncio.run(escenario())
+        assert [json.loads(m) for m in activa.mensajes] == [{"tipo": "ping"}]
+        assert muda.cierre == status.WS_1001_GOING_AWAY
+        assert _conectados(gestor, "camareros") == [activa]
+        assert obtener_metricas()["websocket_conexiones_inactivas"] == 1
+
+    def test_latido_periodico_cierra_conexion_medio_abierta(self):
+        """Probar que la tarea de latido cierra por sí sola una conexión que no responde a los ping."""
+        gestor = ConnectionManager(intervalo_ping=0.01, timeout_inactividad=0.05)
+        muda = _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(muda, "cocina")
+            await _esperar(lambda: muda.cierre is not None)
+            await _esperar(lambda: gestor._latido.done())
+
+        asyncio.run(escenario())
+        assert muda.mensajes and all(json.loads(m) == {"tipo": "ping"} for m in muda.mensajes)
+        assert not _conectados(gestor)
+
+    def test_limite_de_conexiones_por_usuario(self):
+        """Probar que al superar el máximo de conexiones de un usuario se cierra su conexión más antigua."""
+        gestor = ConnectionManager(max_conexiones_usuario=2)
+        ana = [_WebSocketFalso() for _ in range(3)]
+        luis = _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(luis, "camareros", usuario="luis")
+            for ws in ana:
+                await gestor.connect(ws, "camareros", usuario="ana")
+            await _esperar(lambda: ana[0].cierre is not None)
+
+        asyncio.run(escenario())
+        assert ana[0].cierre == status.WS_1008_POLICY_VIOLATION
+        assert set(_conectados(gestor, "camareros")) == {luis, ana[1], ana[2]}
+        assert [c.websocket for c in gestor._por_usuario["ana"]] == ana[1:]
+
+    def test_medidores_por_grupo_y_canal(self):
+        """Probar que hay un medidor de conexiones vivas por tipo de cliente y por canal."""
+        gestor = ConnectionManager()
+        sockets = [_WebSocketFalso() for _ in range(3)]
+
+        async def escenario():
+            await gestor.connect(sockets[0], "camareros", canales=crear_canales(mesas=[3]))
+            await gestor.connect(sockets[1], "camareros", canales=crear_canales(mesas=[3, 4]))
+            await gestor.connect(sockets[2], "cocina")
+            gestor.disconnect(sockets[1], "camareros")
+
+        asyncio.run(escenario())
+        metricas = obtener_metricas()
+        assert metricas["websocket_conexiones_camareros"] == 1
+        assert metricas["websocket_conexiones_camareros_mesa:3"] == 1
+        assert metricas["websocket_conexiones_camareros_mesa:4"] == 0
+        assert metricas["websocket_conexiones_cocina"] == 1
+
+@requiere_msgpack
+class TestCodificacionMsgpack:
+    def test_clientes_json_y_msgpack_reciben_el_mismo_evento(self, monkeypatch):
+        """Probar que los clientes MessagePack reciben bytes con los mismos datos, convertidos una sola vez."""
+        gestor = ConnectionManager()
+        conversiones = []
+        convertir = modulo_websockets.codificar_msgpack
+        monkeypatch.setattr(modulo_websockets, "codificar_msgpack", lambda trama: conversiones.append(trama) or convertir(trama))
+        texto = _WebSocketFalso()
+        binarios = [_WebSocketFalso() for _ in range(3)]
+
+        async def escenario():
+            await gestor.connect(texto, "cocina")
+            for ws in binarios:
+                await gestor.connect(ws, "cocina", codificacion=CodificacionWebSocket.MSGPACK)
+            gestor.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": 4, "mesa": 2}), ("cocina",))
+            await _esperar(lambda: texto.mensajes and all(ws.mensajes for ws in binarios))
+
+        asyncio.run(escenario())
+        esperado = {"seq": 1, "epoca": gestor.epoca, "tipo": "nuevo_pedido", "pedido_id": 4, "mesa": 2}
+        assert json.loads(texto.mensajes[0]) == esperado
+        assert all(msgpack.unpackb(ws.mensajes[0]) == esperado for ws in binarios)
+        assert binarios[0].mensajes[0] is binarios[1].mensajes[0]
+        assert len(conversiones) == 1
+        assert len(binarios[0].mensajes[0]) < len(texto.mensajes[0].encode())
+
+    def test_reenvio_y_ping_en_msgpack(self):
+        """Probar que los eventos reenviados al reconectar y el ping también llegan en MessagePack."""
+        gestor = ConnectionManager(intervalo_ping=0)
+        binario = _WebSocketFalso()
+
+        async def escenario():
+            gestor.difundir(_evento(1), ("cocina",))
+            await gestor.connect(
+                binario, "cocina", since=0, codificacion=CodificacionWebSocket.MSGPACK, epoca=gestor.epoca
+            )
+            gestor.latir()
+            await _esperar(lambda: len(binario.mensajes) == 2)
+
+        asyncio.run(escenario())
+        assert [msgpack.unpackb(m) for m in binario.mensajes] == [
+            {"seq": 1, "epoca": gestor.epoca, "tipo": "nuevo_pedido", "pedido_id": 1}, {"tipo": "ping"}
+        ]
+
+class TestSuscripciones:
+    def test_cada_conexion_recibe_solo_sus_canales(self):
+        """Probar que camareros y puestos de cocina con filtros solo reciben los eventos de sus canales."""
+        gestor = ConnectionManager()
+        mesa_3, camarero_5, todos_camareros = _WebSocketFalso(), _WebSocketFalso(), _WebSocketFalso()
+        barra, cocina = _WebSocketFalso(), _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(mesa_3, "camareros", canales=crear_canales(mesas=[3]))
+            await gestor.connect(camarero_5, "camareros", canales=crear_canales(camareros=[5]))
+            await gestor.connect(todos_camareros, "camareros")
+            await gestor.connect(barra, "cocina", canales=crear_canales(tipos=[TipoProducto.BEBIDA]))
+            await gestor.connect(cocina, "cocina")
+
+            cafe = crear_canales(mesas=[3], camareros=[8], tipos=["bebida"])
+            tarta = crear_canales(mesas=[4], camareros=[5], tipos=["postre"])
+            assert gestor.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": 1}, cafe), ("camareros", "cocina")) == 4
+            assert gestor.difundir(EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": 2}, tarta), ("camareros", "cocina")) == 3
+            # Un evento sin canales llega a todo el grupo
+            gestor.difundir(EventoWebSocket({"tipo": "actualizacion_menu"}), ("camareros", "cocina"))
+            await asyncio.sleep(0.01)
+
+        asyncio.run(escenario())
+        recibidos = lambda ws: [json.loads(m).get("pedido_id") for m in ws.mensajes]
+        assert recibidos(mesa_3) == [1, None]
+        assert recibidos(camarero_5) == [2, None]
+        assert recibidos(todos_camareros) == [1, 2, None]
+        assert recibidos(barra) == [1, None]
+        assert recibidos(cocina) == [1, 2, None]
+
+    def test_coste_proporcional_a_los_interesados(self, monkeypatch):
+        """Probar que un evento de una mesa solo toca las conexiones suscritas, no todas las del grupo."""
+        gestor = ConnectionManager()
+        encolados = []
+        encolar = modulo_websockets.ConexionWebSocket.encolar
+
+        def contar(conexion, *args, **kwargs):
+            encolados.append(conexion)
+            return encolar(conexion, *args, **kwargs)
+
+        async def escenario():
+            for mesa in range(500):
+                await gestor.connect(_WebSocketFalso(), "camareros", canales=crear_canales(mesas=[mesa]))
+            monkeypatch.setattr(modulo_websockets.ConexionWebSocket, "encolar", contar)
+            assert gestor.difundir(EventoWebSocket({"tipo": "nuevo_pedido"}, crear_canales(mesas=[7])), ("camareros",)) == 1
+            for conexion in list(gestor.active_connections["camareros"].values()):
+                gestor.disconnect(conexion.websocket, "camareros")
+
+        asyncio.run(escenario())
+        assert len(encolados) == 1
+        assert gestor.suscripciones["camareros"] == {}
+
+    def test_reenvio_respeta_los_filtros(self):
+        """Probar que al reconectar solo se reenvían los eventos de los canales de la conexión."""
+        gestor = ConnectionManager()
+        barra = _WebSocketFalso()
+
+        async def escenario():
+            for pedido_id, tipo in enumerate(["bebida", "comida", "bebida"], start=1):
+                evento = EventoWebSocket({"tipo": "nuevo_pedido", "pedido_id": pedido_id}, crear_canales(tipos=[tipo]))
+                gestor.difundir(evento, ("cocina",))
+            await gestor.connect(barra, "cocina", since=0, canales=crear_canales(tipos=["bebida"]), epoca=gestor.epoca)
+            await _esperar(lambda: len(barra.mensajes) == 2)
+
+        asyncio.run(escenario())
+        assert [json.loads(m)["pedido_id"] for m in barra.mensajes] == [1, 3]
+
+class TestDespachadorEventos:
+    def test_eventos_publicados_desde_hilos_llegan_en_orden(self):
+        """Probar que los eventos publicados desde hilos sin bucle se entregan todos y en orden por hilo."""
+        gestor = ConnectionManager(tamano_cola=1000)
+        despachador = DespachadorEventos(gestor, tamano_lote=16)
+        cliente = _WebSocketFalso()
+
+        def producir(hilo: int):
+            for i in range(50):
+                despachador.publicar(EventoWebSocket({"tipo": "nuevo_pedido", "hilo": hilo, "i": i}), ("cocina",))
+
+        async def escenario():
+            await gestor.connect(cliente, "cocina")
+            await despachador.iniciar()
+            await asyncio.gather(*(asyncio.to_thread(producir, hilo) for hilo in range(4)))
+            await _esperar(lambda: len(cliente.mensajes) == 200)
+            await despachador.detener()
+
+        asyncio.run(escenario())
+        eventos = [json.loads(m) for m in cliente.mensajes]
+        for hilo in range(4):
+            assert [e["i"] for e in eventos if e["hilo"] == hilo] == list(range(50))
+        metricas = obtener_metricas()
+        assert metricas["websocket_despacho_retraso"]["cuenta"] == 200
+        assert metricas["websocket_despacho_pendientes"] == 0
+
+    def test_detener_entrega_los_pendientes(self):
+        """Probar que al detener el despachador se entregan los eventos que aún estaban en la cola."""
+        gestor = ConnectionManager()
+        despachador = DespachadorEventos(gestor)
+        cliente = _WebSocketFalso()
+
+        async def escenario():
+            await gestor.connect(cliente, "cocina")
+            await despachador.iniciar()
+            for pedido_id in range(10):
+                despachador.publicar(_evento(pedido_id), ("cocina",))
+            # Publicar solo encola: nada se ha difundido aún
+            assert despachador.pendientes == 10
+            await despachador.detener()
+            await _esperar(lambda: len(cliente.mensajes) == 10)
+
+        asyncio.run(escenario())
+        assert [json.loads(m)["pedido_id"] for m in cliente.mensajes] == list(range(10))
+
+    def test_cola_llena_y_sin_bucle_se_descartan(self):
+        """Probar que se descartan, contados, los eventos que superan la capacidad o que no tienen bucle."""
+        despachador = DespachadorEventos(ConnectionManager(), capacidad=2)
+        despachador.publicar(_evento(1), ("cocina",))
+        assert obtener_metricas()["websocket_despacho_descartados"] == 1
+
+        async def escenario():
+            await despachador.iniciar()
+            for pedido_id in range(3):
+                despachador.publicar(_evento(pedido_id), ("cocina",))
+            assert despachador.pendientes == 2
+            await despachador.detener()
+
+        asyncio.run(escenario())
+        assert obtener_metricas()["websocket_despacho_descartados"] == 2
+
+def _cambio_detalle(pedido_id: int, detalle_id: int) -> EventoWebSocket:
+    return EventoWebSocket({
+        "tipo": "actualizacion_detalle", "pedido_id": pedido_id, "detalle_id": detalle_id, "estado": EstadoPedido.LISTO
+    })
+
+class TestAgrupacionEventos:
+    def _escenario(self, despachador, publicar, esperar):
+        cliente = _WebSocketFalso()
+
+        async def escenario():
+            await despachador.gestor.connect(cliente, "camareros")
+            await despachador.iniciar()
+            await publicar()
+            await _esperar(lambda: esperar(cliente), limite=5)
+            await despachador.detener()
+
+        asyncio.run(escenario())
+        return [json.loads(m) for m in cliente.mensajes]
+
+    def test_rafaga_de_un_pedido_en_una_trama(self):
+        """Probar que 8 líneas marcadas como listas seguidas llegan en una sola trama con todos los cambios."""
+        despachador = DespachadorEventos(ConnectionManager(), ventana_agrupacion_ms=50, latencia_maxima_agrupacion_ms=500)
+
+        async def publicar():
+            for detalle_id in range(8):
+                despachador.publicar(_cambio_detalle(1, detalle_id), ("camareros",))
+                await asyncio.sleep(0)
+            despachador.publicar(_cambio_detalle(2, 99), ("camareros",))
+
+        tramas = self._escenario(despachador, publicar, lambda cliente: len(cliente.mensajes) == 2)
+        lote, suelto = sorted(tramas, key=lambda t: t["pedido_id"])
+        assert lote["tipo"] == "lote_pedido"
+        assert [c["detalle_id"] for c in lote["cambios"]] == list(range(8))
+        assert lote["cambios"][0] == {"tipo": "actualizacion_detalle", "pedido_id": 1, "detalle_id": 0, "estado": "listo"}
+        # Un cambio solo en su ventana se envía tal cual
+        assert suelto["tipo"] == "actualizacion_detalle"
+        assert obtener_metricas()["websocket_eventos_agrupados"] == 8
+
+    def test_latencia_maxima_de_la_ventana(self):
+        """Probar que un flujo continuo de cambios se envía al menos cada latencia máxima."""
+        despachador = DespachadorEventos(ConnectionManager(), ventana_agrupacion_ms=30, latencia_maxima_agrupacion_ms=50)
+        publicados = 20
+
+        async def publicar():
+            for detalle_id in range(publicados):
+                despachador.publicar(_cambio_detalle(1, detalle_id), ("camareros",))
+                await asyncio.sleep(0.01)
+
+        def recibidos(cliente):
+            tramas = [json.loads(m) for m in cliente.mensajes]
+            return sum(len(t.get("cambios", [t])) for t in tramas) == publicados
+
+        tramas = self._escenario(despachador, publicar, recibidos)
+        # 200 ms de cambios cada 10 ms: la ventana nunca se cierra por inactividad, pero sí por la latencia máxima
+        assert 3 <= len(tramas) < publicados
+        cambios = [c["detalle_id"] for t in tramas for c in t.get("cambios", [t])]
+        assert cambios == list(range(publicados))
+
+    def test_evento_no_agrupable_no_adelanta_a_los_cambios(self):
+        """Probar que eliminar el pedido cierra antes su ventana, para que los cambios no lleguen después."""
+        despachador = DespachadorEventos(ConnectionManager(), ventana_agrupacion_ms=1000, latencia_maxima_agrupacion_ms=1000)
+
+        async def publicar():
+            despachador.publicar(_cambio_detalle(1, 1), ("camareros",))
+            despachador.publicar(_cambio_detalle(1, 2), ("camareros",))
+            despachador.publicar(EventoWebSocket({"tipo": "pedido_eliminado", "pedido_id": 1}), ("camareros",))
+
+        tramas = self._escenario(despachador, publicar, lambda cliente: len(cliente.mensajes) == 2)
+        assert [t["tipo"] for t in tramas] == ["lote_pedido", "pedido_eliminado"]
+
+    def test_lineas_de_varios_tipos_en_una_ventana(self):
+        """Probar que los cambios de líneas de distinto tipo de producto de un pedido van en una sola trama."""
+        despachador = DespachadorEventos(ConnectionManager(), ventana_agrupacion_ms=50, latencia_maxima_agrupacion_ms=500)
+        todos, barra, fogones = _WebSocketFalso(), _WebSocketFalso(), _WebSocketFalso()
+        tipos = [TipoProducto.COMIDA, TipoProducto.BEBIDA, TipoProducto.COMIDA]
+
+        async def escenario():
+            gestor = despachador.gestor
+            await gestor.connect(todos, "cocina")
+            await gestor.connect(barra, "cocina", canales=crear_canales(tipos=[TipoProducto.BEBIDA]))
+            await gestor.connect(fogones, "cocina", canales=crear_canales(tipos=[TipoProducto.COMIDA]))
+            await despachador.iniciar()
+            for detalle_id, tipo in enumerate(tipos):
+                evento = _cambio_detalle(1, detalle_id)
+                despachador.publicar(EventoWebSocket(evento.datos, crear_canales(mesas=[4], tipos=[tipo])), ("cocina",))
+                await asyncio.sleep(0)
+            await _esperar(lambda: todos.mensajes and barra.mensajes and fogones.mensajes, limite=5)
+            await asyncio.sleep(0.1)
+            await despachador.detener()
+
+        asyncio.run(escenario())
+        for cliente in (todos, barra, fogones):
+            tramas = [json.loads(m) for m in cliente.mensajes]
+            assert [t["tipo"] for t in tramas] == ["lote_pedido"]
+            assert [c["detalle_id"] for c in tramas[0]["cambios"]] == [0, 1, 2]
+
+    def test_sin_ventana_no_se_agrupa(self):
+        """Probar que sin ventana de agrupación cada cambio se envía en su propia trama."""
+        despachador = DespachadorEventos(ConnectionManager())
+
+        async def publicar():
+            for detalle_id in range(8):
+                despachador.publicar(_cambio_detalle(1, detalle_id), ("camareros",))
+
+        tramas = self._escenario(despachador, publicar, lambda cliente: len(cliente.mensajes) == 8)
+        assert {t["tipo"] for t in tramas} == {"actualizacion_detalle"}
+
+class TestWebSocketEndpoints:
+    def test_conexion_registrada_y_eliminada(self, client, cocinero_user):
+        """Probar que el endpoint registra la conexión, no devuelve el eco de los mensajes y la elimina al desconectar."""
+        with client.websocket_connect(f"/ws/cocina?token={cocinero_user['token']}") as websocket:
+            (conexion,) = manager.active_connections["cocina"].values()
+            assert conexion.usuario == "cocinero"
+            inicio = conexion.ultima_actividad
+            websocket.send_text("pong")
+            fin = time.perf_counter() + 2
+            while conexion.ultima_actividad == inicio and time.perf_counter() < fin:
+                time.sleep(0.01)
+            assert conexion.ultima_actividad > inicio
+            # Lo primero que recibe el cliente es el ping, no un eco de su mensaje
+            client.portal.call(manager.latir)
+            assert websocket.receive_json() == {"tipo": "ping"}
+        # El endpoint quita la conexión al recibir el cierre, que puede llegar justo después de salir del bloque
+        fin = time.perf_counter() + 2
+        while manager.active_connections["cocina"] and time.perf_counter() < fin:
+            time.sleep(0.01)
+        assert not manager.active_connections["cocina"]
+
+    def test_since_de_otro_proceso_pide_resincronizar(self, client, cocinero_user):
+        """Probar que el endpoint acepta ?since y ?epoca y pide resincronizar si la época no es la de este proceso."""
+        url = f"/ws/cocina?token={cocinero_user['token']}&since={manager.seq}&epoca=otro-proceso"
+        with client.websocket_connect(url) as websocket:
+            assert websocket.receive_json() == {"tipo": "resync_requerido", "seq": manager.seq, "epoca": manager.epoca}
+
+    def test_filtros_de_suscripcion_por_query(self, client, camarero_user, cocinero_user):
+        """Probar que los parámetros mesas, camarero_id y tipos se registran como canales de la conexión."""
+        url = f"/ws/camareros?token={camarero_user['token']}&mesas=3&mesas=7&camarero_id={camarero_user['id']}"
+        with client.websocket_connect(url):
+            (conexion,) = [c for c in manager.active_connections["camareros"].values() if c.canales]
+            assert conexion.canales == {"mesa:3", "mesa:7", f"camarero:{camarero_user['id']}"}
+        with client.websocket_connect(f"/ws/cocina?token={cocinero_user['token']}&tipos=bebida&tipos=postre"):
+            (conexion,) = [c for c in manager.active_connections["cocina"].values() if c.canales]
+            assert conexion.canales == {"tipo:bebida", "tipo:postre"}
+
+    def test_pedido_creado_en_el_threadpool_llega_a_la_cocina(self, client, admin_user, camarero_user, cocinero_user):
+        """Probar que la notificación de un servicio síncrono (threadpool) llega a los clientes conectados."""
+        admin = {"Authorization": f"Bearer {admin_user['token']}"}
+        mesa = client.post("/mesas/", json={"numero": 12, "capacidad": 4}, headers=admin).json()
+        categoria = client.post("/categorias/", json={"nombre": "Bebidas"}, headers=admin).json()
+        producto = client.post("/productos/", json={
+            "nombre": "Caña", "precio": 2.0, "tiempo_preparacion": 1, "categoria_id": categoria["id"],
+            "tipo": TipoProducto.BEBIDA
+        }, headers=admin).json()
+
+        with client.websocket_connect(f"/ws/cocina?token={cocinero_user['token']}&tipos=bebida") as websocket:
+            response = client.post(
+                "/pedidos/",
+                json={"mesa_id": mesa["id"], "detalles": [{"producto_id": producto["id"], "cantidad": 2}]},
+                headers={"Authorization": f"Bearer {camarero_user['token']}"}
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+            # Puede llegar antes el aviso de la creación del producto, si aún estaba en la cola
+            evento = websocket.receive_json()
+            while evento["tipo"] != "nuevo_pedido":
+                evento = websocket.receive_json()
+            assert evento["pedido_id"] == response.json()["id"]
+            assert evento["mesa"] == 12
+
+    @requiere_msgpack
+    def test_codificacion_msgpack_negociada(self, client, cocinero_user):
+        """Probar que con ?codificacion=msgpack las tramas son binarias y el cliente puede responder en binario."""
+        with client.websocket_connect(f"/ws/cocina?token={cocinero_user['token']}&codificacion=msgpack") as websocket:
+            (conexion,) = [c for c in manager.active_connections["cocina"].values() if c.binaria]
+            inicio = conexion.ultima_actividad
+            websocket.send_bytes(msgpack.packb({"tipo": "pong"}))
+            fin = time.perf_counter() + 2
+            while conexion.ultima_actividad == inicio and time.perf_counter() < fin:
+                time.sleep(0.01)
+            assert conexion.ultima_actividad > inicio
+            client.portal.call(manager.latir)
+            assert msgpack.unpackb(websocket.receive_bytes()) == {"tipo": "ping"}
+
+    def test_msgpack_no_disponible(self, client, cocinero_user, monkeypatch):
+        """Probar que sin msgpack instalado se rechaza la conexión que lo pide."""
+        monkeypatch.setattr(modulo_websockets, "msgpack", None)
+        with pytest.raises(WebSocketDisconnect) as error:
+            with client.websocket_connect(f"/ws/cocina?token={cocinero_user['token']}&codificacion=msgpack"):
+                pass
+        assert error.value.code == status.WS_1003_UNSUPPORTED_DATA
@@ -0,0 +1,139 @@
+"""
+Benchmark del borrado de un producto (DELETE /productos/{id}) con un historial de cuentas grande.
+
+Antes, delete_producto cargaba como objetos ORM todas las cuentas del historial para buscar el
+producto en sus detalles, y anotaba las líneas históricas de los pedidos una a una. Ahora las
+cuentas afectadas se localizan con el índice inverso cuentas_productos, se reescriben por lotes
+y las notas de los pedidos se añaden con un solo UPDATE, todo en una transacción.
+
+Cada borrado se mide dentro de una transacción que se deshace al terminar, así que ambos
+recorridos ven el mismo historial.
+
+Uso:
+    python benchmarks/bench_borrar_producto.py [cuentas]
+"""
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from comun import crear_engine_temporal, ContadorConsultas
+
+from app.core.enums import EstadoPedido
+from app.models.cuenta import Cuenta
+from app.models.pedido import DetallePedido, Pedido
+from app.models.producto import Producto
+from app.services import producto_service
+
+LOTE = 20_000
+PRODUCTOS = 200
+# Producto poco pedido: aparece en una fracción pequeña del historial
+PRODUCTO_BORRADO = PRODUCTOS
+
+
+def poblar(engine, total_cuentas):
+    """Cuentas con entre 2 y 8 líneas; el producto borrado aparece en ~1 de cada 200 cuentas"""
+    rnd = random.Random(42)
+    ahora = datetime.now(UTC).replace(tzinfo=None)
+    with engine.begin() as conexion:
+        conexion.execute(text("INSERT INTO categorias (id, nombre) VALUES (1, 'Carta')"))
+        conexion.execute(text(
+            "INSERT INTO productos (id, nombre, precio, categoria_id, tipo, disponible) "
+            "VALUES (:id, :nombre, 9.5, 1, 'comida', 1)"
+        ), [{"id": i, "nombre": f"Producto {i}"} for i in range(1, PRODUCTOS + 1)])
+        cuenta_id = 0
+        for inicio in range(0, total_cuentas, LOTE):
+            cuentas, indice = [], []
+            for _ in range(min(LOTE, total_cuentas - inicio)):
+                cuenta_id += 1
+                productos = [rnd.randint(1, PRODUCTOS - 1) for _ in range(rnd.randint(2, 8))]
+                if rnd.random() < 0.005:
+                    productos[0] = PRODUCTO_BORRADO
+                lineas = [{
+                    "producto_id": producto_id, "nombre_producto": f"Producto {producto_id}", "cantidad": 1,
+                    "precio_unitario": 9.5, "subtotal": 9.5, "observaciones": None, "producto_eliminado": False
+                } for producto_id in productos]
+                cuentas.append({
+                    "id": cuenta_id, "numero_mesa": rnd.randint(1, 40), "nombre_camarero": "Camarero",
+                    "fecha_cobro": ahora - timedelta(seconds=rnd.randint(0, 30 * 24 * 3600)),
+                    "total": round(9.5 * len(lineas), 2), "detalles": json.dumps(lineas)
+                })
+                indice.extend({"cuenta_id": cuenta_id, "producto_id": p} for p in dict.fromkeys(productos))
+            conexion.execute(text(
+                "INSERT INTO cuentas (id, numero_mesa, nombre_camarero, fecha_cobro, total, detalles) "
+                "VALUES (:id, :numero_mesa, :nombre_camarero, :fecha_cobro, :total, :detalles)"
+            ), cuentas)
+            conexion.execute(text(
+                "INSERT INTO cuentas_productos (cuenta_id, producto_id) VALUES (:cuenta_id, :producto_id)"
+            ), indice)
+
+
+def borrado_anterior(db, producto_id):
+    """Borrado anterior: todas las cuentas como objetos ORM y las líneas históricas una a una"""
+    db_producto = db.get(Producto, producto_id)
+    detalles_historicos = db.query(DetallePedido).join(Pedido).filter(
+        DetallePedido.producto_id == producto_id,
+        Pedido.estado.in_([EstadoPedido.ENTREGADO, EstadoPedido.CANCELADO, EstadoPedido.LISTO])
+    ).all()
+    for detalle in detalles_historicos:
+        detalle.observaciones = f"{detalle.observaciones or ''}\n[Producto eliminado: {db_producto.nombre}]".strip()
+    afectadas = 0
+    for cuenta in db.query(Cuenta).all():
+        modificado = False
+        for detalle in cuenta.detalles or []:
+            if isinstance(detalle, dict) and detalle.get("producto_id") == producto_id:
+                detalle["producto_eliminado"] = True
+                detalle["nombre_producto_original"] = db_producto.nombre
+                modificado = True
+        if modificado:
+            flag_modified(cuenta, "detalles")
+            afectadas += 1
+    db.flush()
+    db.delete(db_producto)
+    db.flush()
+    return afectadas
+
+
+def borrado_actual(db, producto_id):
+    return producto_service.delete_producto(db, producto_id)
+
+
+def medir(engine, contador, borrar):
+    """Consultas y tiempo de un borrado; la transacción externa se deshace al terminar"""
+    with engine.connect() as conexion:
+        transaccion = conexion.begin()
+        db = Session(bind=conexion, join_transaction_mode="create_savepoint")
+        with contextlib.redirect_stdout(io.StringIO()), contador.medir() as medicion:
+            inicio = time.perf_counter()
+            borrar(db, PRODUCTO_BORRADO)
+            duracion = (time.perf_counter() - inicio) * 1000
+        afectadas = conexion.execute(text(
+            "SELECT count(*) FROM cuentas WHERE detalles LIKE '%\"producto_eliminado\": true%'"
+        )).scalar()
+        db.close()
+        transaccion.rollback()
+    return medicion["consultas"], duracion, afectadas
+
+
+def main():
+    total_cuentas = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    engine, _ = crear_engine_temporal()
+    poblar(engine, total_cuentas)
+    contador = ContadorConsultas(engine)
+    print(f"{total_cuentas} cuentas en el historial\n")
+
+    print(f"{'borrado':<28} {'consultas':>10} {'cuentas':>8} {'tiempo (ms)':>12}")
+    for nombre, borrar in (("anterior (todas las cuentas)", borrado_anterior), ("actual (índice inverso)", borrado_actual)):
+        consultas, duracion, afectadas = medir(engine, contador, borrar)
+        print(f"{nombre:<28} {consultas:>10} {afectadas:>8} {duracion:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark del cierre de mesa (PUT /mesas/{id} de ocupada a libre) según el número de líneas.
+
+Compara mesa_service.update_mesa, que cierra la mesa en una transacción (UPDATE condicional de la
+mesa, consulta única de las líneas, INSERT de la cuenta y un UPDATE de todos los pedidos), con el
+cierre anterior: cuenta generada con una consulta por línea, DetalleCuentaItem reserializados con
+json.dumps en create_cuenta (con su propio commit) y los pedidos desvinculados uno a uno.
+
+Uso:
+    python benchmarks/bench_cierre_mesa.py [repeticiones]
+"""
+import contextlib
+import io
+import random
+import sys
+import time
+
+from sqlalchemy import update
+
+from comun import crear_engine_temporal, ContadorConsultas, percentil
+from bench_generar_cuenta import generar_por_pedido
+
+from app.core.enums import EstadoMesa, EstadoPedido, TipoProducto
+from app.models.categoria import Categoria
+from app.models.mesa import Mesa
+from app.models.pedido import Pedido, DetallePedido
+from app.models.producto import Producto
+from app.models.usuario import Usuario
+from app.schemas.cuenta import CuentaCreate, DetalleCuentaItem
+from app.schemas.mesa import MesaUpdate
+from app.services import mesa_service
+from app.services.cuenta_service import create_cuenta
+
+LINEAS = [1, 10, 50, 100, 200]
+LINEAS_POR_PEDIDO = 8
+PRODUCTOS = 60
+
+
+def poblar(SessionLocal):
+    """Una mesa por tamaño, con sus líneas repartidas en pedidos de LINEAS_POR_PEDIDO líneas"""
+    rnd = random.Random(42)
+    with SessionLocal() as db:
+        camarero = Usuario(username="camarero", email="c@example.com", nombre="Camarero", apellido="Uno", rol="camarero")
+        categoria = Categoria(nombre="Carta")
+        db.add_all([camarero, categoria])
+        db.flush()
+        productos = [
+            Producto(nombre=f"Producto {i}", precio=round(rnd.uniform(1.5, 25.0), 2),
+                     categoria_id=categoria.id, tipo=rnd.choice(list(TipoProducto)))
+            for i in range(PRODUCTOS)
+        ]
+        db.add_all(productos)
+        db.flush()
+        mesas = {}
+        for total_lineas in LINEAS:
+            mesa = Mesa(numero=total_lineas, capacidad=40)
+            db.add(mesa)
+            pedidos = []
+            for inicio in range(0, total_lineas, LINEAS_POR_PEDIDO):
+                pedido = Pedido(mesa=mesa, camarero_id=camarero.id)
+                for _ in range(min(LINEAS_POR_PEDIDO, total_lineas - inicio)):
+                    producto = rnd.choice(productos)
+                    cantidad = rnd.randint(1, 4)
+                    pedido.detalles.append(DetallePedido(
+                        producto_id=producto.id, cantidad=cantidad, precio_unitario=producto.precio,
+                        subtotal=round(cantidad * producto.precio, 2)
+                    ))
+                pedidos.append(pedido)
+            db.add_all(pedidos)
+            db.flush()
+            mesas[total_lineas] = (mesa.id, [pedido.id for pedido in pedidos])
+        db.commit()
+        return camarero.id, mesas
+
+
+def reabrir(SessionLocal, mesa_id, pedido_ids):
+    """Volver a sentar la mesa con los mismos pedidos para repetir el cierre"""
+    with SessionLocal() as db:
+        db.execute(update(Mesa).where(Mesa.id == mesa_id).values(estado=EstadoMesa.OCUPADA))
+        db.execute(update(Pedido).where(Pedido.id.in_(pedido_ids)).values(mesa_id=mesa_id, estado=EstadoPedido.RECIBIDO))
+        db.commit()
+
+
+def cierre_anterior(db, mesa_id, camarero):
+    """Cierre anterior: cuenta por pedido, create_cuenta con su commit y pedidos uno a uno"""
+    db_mesa = mesa_service.get_mesa_by_id(db, mesa_id)
+    db_mesa.estado = EstadoMesa.LIBRE
+    datos = generar_por_pedido(db, mesa_id, camarero.id)
+    detalles = [DetalleCuentaItem(**item) for item in datos["detalles"]]
+    if datos["total"] > 0:
+        create_cuenta(db, CuentaCreate(
+            mesa_id=mesa_id, numero_mesa=datos["numero_mesa"], nombre_camarero=datos["nombre_camarero"],
+            total=datos["total"], detalles=detalles
+        ), camarero_id=camarero.id)
+    pedidos = db.query(Pedido).filter(Pedido.mesa_id == mesa_id, Pedido.estado != EstadoPedido.CANCELADO).all()
+    for pedido in pedidos:
+        pedido.estado = EstadoPedido.ENTREGADO
+        pedido.mesa_id = None
+    db.commit()
+
+
+def cierre_actual(db, mesa_id, camarero):
+    mesa_service.update_mesa(db, mesa_id, MesaUpdate(estado=EstadoMesa.LIBRE), camarero)
+
+
+def medir(SessionLocal, contador, cerrar, mesa_id, pedido_ids, camarero_id, repeticiones):
+    """p50/p99 del cierre en ms y consultas de un cierre; cada repetición en una sesión nueva"""
+    tiempos = []
+    for _ in range(repeticiones):
+        reabrir(SessionLocal, mesa_id, pedido_ids)
+        with SessionLocal() as db, contextlib.redirect_stdout(io.StringIO()):
+            camarero = db.get(Usuario, camarero_id)
+            with contador.medir() as medicion:
+                inicio = time.perf_counter()
+                cerrar(db, mesa_id, camarero)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+    return percentil(tiempos, 50), percentil(tiempos, 99), medicion["consultas"]
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    engine, SessionLocal = crear_engine_temporal()
+    camarero_id, mesas = poblar(SessionLocal)
+    contador = ContadorConsultas(engine)
+
+    print(f"{'líneas':>7} {'cierre':<10} {'consultas':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for total_lineas, (mesa_id, pedido_ids) in mesas.items():
+        for nombre, cerrar in (("anterior", cierre_anterior), ("actual", cierre_actual)):
+            p50, p99, consultas = medir(SessionLocal, contador, cerrar, mesa_id, pedido_ids, camarero_id, repeticiones)
+            print(f"{total_lineas:>7} {nombre:<10} {consultas:>10} {p50:>10.2f} {p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
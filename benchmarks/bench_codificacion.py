@@ -0,0 +1,96 @@
+"""
+Benchmark de codificación de tramas WebSocket: bytes y CPU por evento.
+
+Compara las tramas JSON de texto actuales con MessagePack, con y sin permessage-deflate, sobre una
+mezcla realista de eventos de pedidos (claves repetidas y marcas de tiempo ISO completas).
+
+- CPU del evento: lo que el servidor hace una vez por evento para todos los clientes (codificar a
+  JSON y numerar; en MessagePack, además, convertir la trama).
+- CPU de deflate: lo que cuesta comprimir la trama para una conexión. permessage-deflate mantiene
+  un contexto de compresión por conexión (context takeover), así que este coste se paga una vez
+  por cliente y evento; lo hace el servidor ASGI, no la aplicación.
+
+Uso:
+    python benchmarks/bench_codificacion.py [eventos]
+"""
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, UTC
+
+import comun  # noqa: F401  (añade la raíz del proyecto a sys.path)
+
+from app.core.enums import EstadoPedido
+from app.core.websockets import codificar_evento, codificar_msgpack, msgpack, numerar_trama
+
+# Cola que permessage-deflate quita de cada mensaje comprimido (RFC 7692)
+COLA_DEFLATE = b"\x00\x00\xff\xff"
+
+
+def generar_eventos(n: int):
+    """Mezcla de eventos como la que ve una pantalla de cocina en servicio"""
+    aleatorio = random.Random(7)
+    productos = ["Paella", "Caña", "Tarta de queso", "Croquetas", "Café con leche", "Ensalada mixta"]
+    hora = datetime(2026, 5, 1, 13, 0, tzinfo=UTC)
+    eventos = []
+    for i in range(n):
+        hora += timedelta(milliseconds=aleatorio.randrange(50, 2000))
+        pedido_id = 1000 + i // 6
+        tipo = aleatorio.choice(["nuevo_pedido", "actualizacion_pedido", "actualizacion_detalle", "nuevo_detalle"])
+        datos = {"tipo": tipo, "pedido_id": pedido_id, "mesa": aleatorio.randrange(1, 40), "hora": hora.isoformat()}
+        if tipo == "nuevo_pedido":
+            datos["camarero"] = "Lucía Fernández"
+        elif tipo == "actualizacion_pedido":
+            datos["estado"] = aleatorio.choice(list(EstadoPedido))
+        else:
+            datos.update(detalle_id=pedido_id * 10 + aleatorio.randrange(6), producto=aleatorio.choice(productos))
+            if tipo == "actualizacion_detalle":
+                datos["estado"] = aleatorio.choice(list(EstadoPedido))
+            else:
+                datos["cantidad"] = aleatorio.randrange(1, 4)
+        eventos.append(datos)
+    return eventos
+
+
+def comprimir(tramas):
+    """Bytes y tiempo de comprimir las tramas con un contexto de conexión, como permessage-deflate"""
+    compresor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    octetos = 0
+    inicio = time.perf_counter()
+    for trama in tramas:
+        datos = compresor.compress(trama) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        octetos += len(datos) - len(COLA_DEFLATE)
+    return octetos, time.perf_counter() - inicio
+
+
+def medir(eventos, binario: bool):
+    inicio = time.perf_counter()
+    tramas = []
+    for seq, datos in enumerate(eventos, start=1):
+        trama = numerar_trama(seq, codificar_evento(datos))
+        tramas.append(codificar_msgpack(trama) if binario else trama.encode("utf-8"))
+    cpu_evento = time.perf_counter() - inicio
+    octetos = sum(len(trama) for trama in tramas)
+    octetos_deflate, cpu_deflate = comprimir(tramas)
+    return octetos, cpu_evento, octetos_deflate, cpu_deflate
+
+
+def main():
+    n_eventos = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    eventos = generar_eventos(n_eventos)
+    modos = [("json", False)] + ([("msgpack", True)] if msgpack is not None else [])
+
+    print(f"{n_eventos} eventos\n")
+    print(f"{'codificación':<22} {'bytes/evento':>13} {'µs/evento':>10} {'µs/evento/cliente':>18}")
+    for nombre, binario in modos:
+        octetos, cpu_evento, octetos_deflate, cpu_deflate = medir(eventos, binario)
+        print(f"{nombre:<22} {octetos / n_eventos:>13.1f} {cpu_evento / n_eventos * 1e6:>10.2f} {0:>18.2f}")
+        print(f"{nombre + ' + deflate':<22} {octetos_deflate / n_eventos:>13.1f} "
+              f"{cpu_evento / n_eventos * 1e6:>10.2f} {cpu_deflate / n_eventos * 1e6:>18.2f}")
+    if msgpack is None:
+        print("\nmsgpack no está instalado: solo se mide JSON")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark de creación de pedidos: round-trips a la base de datos y latencia p99
+para pedidos de 1, 10 y 50 líneas.
+
+Uso:
+    python benchmarks/bench_create_pedido.py [repeticiones]
+"""
+import sys
+
+from comun import crear_engine_temporal, ContadorConsultas, medir_latencias
+
+from app.models.usuario import Usuario
+from app.models.mesa import Mesa
+from app.models.categoria import Categoria
+from app.models.producto import Producto
+from app.schemas.pedido import PedidoCreate, DetallePedidoCreate
+from app.services import pedido_service
+from app.core.enums import RolUsuario, EstadoMesa, TipoProducto
+
+TAMANOS = [1, 10, 50]
+
+
+def preparar_datos(db):
+    """Crear un camarero, una mesa y 50 productos disponibles"""
+    camarero = Usuario(
+        username="bench", email="bench@example.com", hashed_password="x",
+        nombre="Bench", apellido="Mark", rol=RolUsuario.CAMARERO, activo=True
+    )
+    mesa = Mesa(numero=1, capacidad=4, estado=EstadoMesa.LIBRE)
+    categoria = Categoria(nombre="Bench")
+    db.add_all([camarero, mesa, categoria])
+    db.flush()
+    productos = [
+        Producto(nombre=f"Producto {i}", precio=1.0 + i, categoria_id=categoria.id,
+                 tipo=TipoProducto.COMIDA, disponible=True)
+        for i in range(max(TAMANOS))
+    ]
+    db.add_all(productos)
+    db.commit()
+    return camarero.id, mesa.id, [p.id for p in productos]
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    engine, SessionLocal = crear_engine_temporal()
+    contador = ContadorConsultas(engine)
+
+    with SessionLocal() as db:
+        camarero_id, mesa_id, producto_ids = preparar_datos(db)
+
+    print(f"{'líneas':>7} {'consultas':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for lineas in TAMANOS:
+        pedido = PedidoCreate(
+            mesa_id=mesa_id,
+            detalles=[DetallePedidoCreate(producto_id=pid, cantidad=2) for pid in producto_ids[:lineas]]
+        )
+
+        def crear():
+            with SessionLocal() as db:
+                # Simular el estado de la sesión de un request: el camarero ya está cargado
+                camarero = db.get(Usuario, camarero_id)
+                pedido_service.create_pedido(db, pedido, camarero_id)
+
+        with contador.medir() as medicion:
+            crear()
+        latencias = medir_latencias(crear, repeticiones)
+        print(f"{lineas:>7} {medicion['consultas'] - 1:>10} {latencias['p50_ms']:>10.2f} {latencias['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
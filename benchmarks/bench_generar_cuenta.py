@@ -0,0 +1,109 @@
+"""
+Benchmark de la generación de la cuenta de una mesa (/cuentas/generar/mesa/{id} y cierre de mesa).
+
+Simula una mesa de banquete con muchas rondas: compara la consulta única con join del servicio,
+línea a línea y agrupada, con el cálculo anterior, que cargaba los detalles de cada pedido por
+separado y hacía un SELECT del producto por cada línea.
+
+Uso:
+    python benchmarks/bench_generar_cuenta.py [lineas] [lineas_por_pedido]
+"""
+import contextlib
+import io
+import random
+import sys
+
+from comun import crear_engine_temporal, ContadorConsultas, medir_latencias
+
+from app.core.enums import EstadoPedido, TipoProducto
+from app.models.categoria import Categoria
+from app.models.mesa import Mesa
+from app.models.pedido import Pedido, DetallePedido
+from app.models.producto import Producto
+from app.models.usuario import Usuario
+from app.services import cuenta_service
+
+PRODUCTOS = 60
+REPETICIONES = 50
+
+
+def poblar(SessionLocal, total_lineas, lineas_por_pedido):
+    """Una mesa con total_lineas líneas repartidas en pedidos de lineas_por_pedido líneas"""
+    rnd = random.Random(42)
+    with SessionLocal() as db:
+        camarero = Usuario(username="camarero", email="c@example.com", nombre="Camarero", apellido="Uno", rol="camarero")
+        categoria = Categoria(nombre="Carta")
+        mesa = Mesa(numero=1, capacidad=40)
+        db.add_all([camarero, categoria, mesa])
+        db.flush()
+        productos = [
+            Producto(nombre=f"Producto {i}", precio=round(rnd.uniform(1.5, 25.0), 2),
+                     categoria_id=categoria.id, tipo=rnd.choice(list(TipoProducto)))
+            for i in range(PRODUCTOS)
+        ]
+        db.add_all(productos)
+        db.flush()
+        for inicio in range(0, total_lineas, lineas_por_pedido):
+            pedido = Pedido(mesa_id=mesa.id, camarero_id=camarero.id, estado=EstadoPedido.ENTREGADO)
+            for _ in range(min(lineas_por_pedido, total_lineas - inicio)):
+                producto = rnd.choice(productos)
+                cantidad = rnd.randint(1, 4)
+                pedido.detalles.append(DetallePedido(
+                    producto_id=producto.id, cantidad=cantidad, precio_unitario=producto.precio,
+                    subtotal=round(cantidad * producto.precio, 2)
+                ))
+            db.add(pedido)
+        db.commit()
+        return mesa.id, camarero.id
+
+
+def generar_por_pedido(db, mesa_id, camarero_id):
+    """Cálculo anterior: detalles de cada pedido por separado y un SELECT por producto"""
+    mesa = db.query(Mesa).filter(Mesa.id == mesa_id).first()
+    camarero = db.query(Usuario).filter(Usuario.id == camarero_id).first()
+    pedidos = db.query(Pedido).filter(Pedido.mesa_id == mesa_id, Pedido.estado != "cancelado").all()
+    total = 0
+    detalles = []
+    for pedido in pedidos:
+        for detalle in pedido.detalles:
+            producto = db.query(Producto).filter(Producto.id == detalle.producto_id).first()
+            if producto:
+                detalles.append({
+                    "pedido_id": pedido.id, "producto_id": producto.id, "nombre_producto": producto.nombre,
+                    "cantidad": detalle.cantidad, "precio_unitario": detalle.precio_unitario,
+                    "subtotal": detalle.subtotal, "observaciones": detalle.observaciones
+                })
+                total += detalle.subtotal
+    return {"numero_mesa": mesa.numero, "nombre_camarero": f"{camarero.nombre} {camarero.apellido}",
+            "total": total, "detalles": detalles}
+
+
+def main():
+    total_lineas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lineas_por_pedido = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    engine, SessionLocal = crear_engine_temporal()
+    mesa_id, camarero_id = poblar(SessionLocal, total_lineas, lineas_por_pedido)
+    contador = ContadorConsultas(engine)
+
+    print(f"mesa con {total_lineas} líneas en {-(-total_lineas // lineas_por_pedido)} pedidos\n")
+    print(f"{'cálculo':<22} {'consultas':>10} {'líneas':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    casos = [
+        ("por pedido (ORM)", lambda db: generar_por_pedido(db, mesa_id, camarero_id)),
+        ("join", lambda db: cuenta_service.generar_cuenta_desde_pedidos(db, mesa_id, camarero_id)),
+        ("join agrupada", lambda db: cuenta_service.generar_cuenta_desde_pedidos(db, mesa_id, camarero_id, agrupar=True)),
+    ]
+    for nombre, generar in casos:
+        def ejecutar():
+            # Sesión nueva en cada repetición, como en una petición (sin objetos en el identity map)
+            with SessionLocal() as db, contextlib.redirect_stdout(io.StringIO()):
+                return generar(db)
+
+        with contador.medir() as medicion:
+            datos = ejecutar()
+        latencias = medir_latencias(ejecutar, REPETICIONES)
+        print(f"{nombre:<22} {medicion['consultas']:>10} {len(datos['detalles']):>8} "
+              f"{latencias['p50_ms']:>10.2f} {latencias['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark del listado de cuentas (GET /cuentas/) antes y después de guardar los detalles como JSON nativo.
+
+Antes, create_cuenta guardaba en la columna JSON una cadena con json.dumps (doble codificación):
+cada fila del listado se decodificaba dos veces (columna JSON y process_detalles_field), se
+validaba con CuentaResponse y se volvía a serializar. Ahora los detalles son una lista JSON nativa
+y listar_cuentas_json los copia como texto en la respuesta.
+
+Inserta las cuentas en el formato anterior, mide el listado, aplica la migración 4 (en streaming,
+por lotes) midiendo su tiempo y el crecimiento del pico de memoria, y vuelve a medir.
+
+Uso:
+    python benchmarks/bench_listado_cuentas.py [cuentas] [repeticiones]
+"""
+import json
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import text
+
+from comun import crear_engine_temporal, medir_latencias
+
+from app.core.enums import RolUsuario
+from app.core.paginacion import paginar
+from app.db.migrations import aplicar_migraciones, get_version_actual, MIGRACIONES
+from app.models.cuenta import Cuenta
+from app.schemas.cuenta import CuentaResponse
+from app.services import cuenta_service
+
+LOTE = 20_000
+PAGINAS = [100, 1000]
+METODOS_PAGO = ["efectivo", "tarjeta", "bizum", None]
+
+
+def _detalles(rnd):
+    """Entre 2 y 8 líneas con todos los campos de DetalleCuentaItem, como las guarda create_cuenta"""
+    lineas = []
+    for i in range(rnd.randint(2, 8)):
+        cantidad = rnd.randint(1, 4)
+        precio = round(rnd.uniform(1.5, 25.0), 2)
+        lineas.append({
+            "pedido_id": rnd.randint(1, 10_000), "producto_id": rnd.randint(1, 200),
+            "nombre_producto": f"Producto {i}", "cantidad": cantidad, "precio_unitario": precio,
+            "subtotal": round(cantidad * precio, 2), "observaciones": None, "producto_eliminado": False
+        })
+    return lineas
+
+
+def poblar(engine, total_cuentas):
+    """Insertar las cuentas con los detalles codificados dos veces, como los guardaba create_cuenta"""
+    rnd = random.Random(42)
+    ahora = datetime.now(UTC).replace(tzinfo=None)
+    with engine.begin() as conexion:
+        for inicio in range(0, total_cuentas, LOTE):
+            filas = []
+            for _ in range(min(LOTE, total_cuentas - inicio)):
+                detalles = _detalles(rnd)
+                filas.append({
+                    "numero_mesa": rnd.randint(1, 40), "nombre_camarero": f"Camarero {rnd.randint(1, 20)}",
+                    "fecha_cobro": ahora - timedelta(seconds=rnd.randint(0, 30 * 24 * 3600)),
+                    "total": round(sum(linea["subtotal"] for linea in detalles), 2),
+                    "metodo_pago": rnd.choice(METODOS_PAGO), "detalles": json.dumps(json.dumps(detalles))
+                })
+            conexion.execute(text(
+                "INSERT INTO cuentas (numero_mesa, nombre_camarero, fecha_cobro, total, metodo_pago, detalles) "
+                "VALUES (:numero_mesa, :nombre_camarero, :fecha_cobro, :total, :metodo_pago, :detalles)"
+            ), filas)
+
+
+def listado_anterior(db, admin, limit):
+    """Listado anterior: objetos ORM, detalles decodificados por fila, validación y serialización"""
+    cuentas = paginar(db.query(Cuenta), cuenta_service.CLAVE_PAGINACION, 0, limit).all()
+    for cuenta in cuentas:
+        cuenta.detalles = cuenta_service.process_detalles_field(cuenta.detalles)
+    adaptador = TypeAdapter(List[CuentaResponse])
+    cuerpo = adaptador.dump_json(adaptador.validate_python(cuentas, from_attributes=True))
+    db.rollback()  # descartar las asignaciones a detalles
+    return cuerpo
+
+
+def listado_actual(db, admin, limit):
+    cuerpo, _ = cuenta_service.listar_cuentas_json(db, limit=limit, current_user=admin)
+    return cuerpo
+
+
+def medir_listados(SessionLocal, listar, nombre, admin, repeticiones):
+    with SessionLocal() as db:
+        for limit in PAGINAS:
+            def consultar():
+                listar(db, admin, limit)
+                db.expunge_all()
+
+            latencias = medir_latencias(consultar, repeticiones)
+            print(f"{nombre:<22} {limit:>8} {latencias['p50_ms']:>10.2f} {latencias['p99_ms']:>10.2f}")
+
+
+def main():
+    total_cuentas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    engine, SessionLocal = crear_engine_temporal()
+    # Base de datos anterior a la migración 4: detalles codificados dos veces
+    with engine.begin() as conexion:
+        conexion.execute(text(
+            "CREATE TABLE schema_version (version INTEGER PRIMARY KEY, descripcion VARCHAR NOT NULL, "
+            "fecha_aplicacion TIMESTAMP NOT NULL)"
+        ))
+        for version, descripcion, _ in MIGRACIONES:
+            if version < 4:
+                conexion.execute(
+                    text("INSERT INTO schema_version VALUES (:v, :d, :f)"),
+                    {"v": version, "d": descripcion, "f": datetime.now(UTC)}
+                )
+    poblar(engine, total_cuentas)
+    print(f"{total_cuentas} cuentas insertadas (versión de esquema {get_version_actual(engine)})\n")
+    admin = SimpleNamespace(id=1, rol=RolUsuario.ADMIN)
+
+    print(f"{'listado':<22} {'página':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    medir_listados(SessionLocal, listado_anterior, "anterior (doble JSON)", admin, repeticiones)
+
+    # Pico de memoria del proceso (ru_maxrss): la migración no debe hacerlo crecer con el historial
+    pico_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    aplicar_migraciones(engine)
+    duracion = time.perf_counter() - inicio
+    crecimiento = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - pico_inicial
+
+    medir_listados(SessionLocal, listado_actual, "actual (JSON nativo)", admin, repeticiones)
+    print(f"\nmigración 4: {duracion:.1f} s, crecimiento del pico de memoria {crecimiento / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
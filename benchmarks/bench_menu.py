@@ -0,0 +1,107 @@
+"""
+Benchmark del menú en memoria: listado de productos (GET /productos/) y validación de las líneas
+de un pedido, frente a consultar la base de datos en cada petición.
+
+- listado anterior: consulta de productos, validación con ProductoResponse y serialización.
+- listado actual: cuerpo y ETag ya calculados para la versión del menú; con If-None-Match el
+  endpoint responde 304 con el mismo coste en el servidor y sin cuerpo.
+- recarga: la primera lectura tras un cambio del menú (invalidar + cargar + serializar).
+- validación: resolver los productos disponibles de un pedido de 10 líneas.
+
+Uso:
+    python benchmarks/bench_menu.py [productos] [repeticiones]
+"""
+import random
+import sys
+from typing import List
+
+from pydantic import TypeAdapter
+
+from comun import crear_engine_temporal, ContadorConsultas, medir_latencias
+
+from app.core.enums import TipoProducto
+from app.core.menu import menu
+from app.models.categoria import Categoria
+from app.models.producto import Producto
+from app.schemas.producto import ProductoResponse
+from app.services import menu_service, producto_service
+
+CATEGORIAS = 15
+LINEAS_PEDIDO = 10
+ADAPTADOR = TypeAdapter(List[ProductoResponse])
+
+
+def poblar(SessionLocal, total_productos):
+    """Carta con total_productos productos repartidos en CATEGORIAS categorías"""
+    rnd = random.Random(42)
+    with SessionLocal() as db:
+        categorias = [Categoria(nombre=f"Categoría {i}", descripcion="Platos de la casa") for i in range(CATEGORIAS)]
+        db.add_all(categorias)
+        db.flush()
+        productos = [
+            Producto(nombre=f"Producto {i}", descripcion="Descripción del plato para la carta",
+                     precio=round(rnd.uniform(1.5, 25.0), 2), tiempo_preparacion=rnd.randint(1, 30),
+                     categoria_id=rnd.choice(categorias).id, tipo=rnd.choice(list(TipoProducto)),
+                     imagen_url=f"/imagenes/{i}.jpg", disponible=rnd.random() > 0.1)
+            for i in range(total_productos)
+        ]
+        db.add_all(productos)
+        db.commit()
+        return [producto.id for producto in productos]
+
+
+def listado_anterior(db):
+    productos = producto_service.get_productos(db, limit=1000)
+    return ADAPTADOR.dump_json(ADAPTADOR.validate_python(productos, from_attributes=True))
+
+
+def listado_actual(db):
+    return menu_service.listar_productos_json(db, limit=1000)[0]
+
+
+def recarga(db):
+    menu.invalidar()
+    return menu_service.listar_productos_json(db, limit=1000)[0]
+
+
+def validacion_anterior(db, producto_ids):
+    """Validación anterior: una consulta IN (...) de los productos disponibles por pedido"""
+    productos = db.query(Producto).filter(Producto.id.in_(set(producto_ids)), Producto.disponible == True).all()
+    return {producto.id: producto for producto in productos}
+
+
+def main():
+    total_productos = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    engine, SessionLocal = crear_engine_temporal()
+    producto_ids = poblar(SessionLocal, total_productos)
+    pedido = random.Random(7).sample(producto_ids, LINEAS_PEDIDO)
+    contador = ContadorConsultas(engine)
+
+    print(f"carta de {total_productos} productos; pedido de {LINEAS_PEDIDO} líneas\n")
+    print(f"{'operación':<24} {'consultas':>10} {'bytes':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    casos = [
+        ("listado anterior", listado_anterior),
+        ("listado actual", listado_actual),
+        ("recarga tras cambio", recarga),
+        ("validación anterior", lambda db: validacion_anterior(db, pedido)),
+        ("validación actual", lambda db: menu_service.get_productos_disponibles(db, pedido)),
+    ]
+    for nombre, operacion in casos:
+        def ejecutar():
+            # Sesión nueva en cada repetición, como en una petición
+            with SessionLocal() as db:
+                return operacion(db)
+
+        ejecutar()
+        with contador.medir() as medicion:
+            resultado = ejecutar()
+        latencias = medir_latencias(ejecutar, repeticiones)
+        octetos = len(resultado) if isinstance(resultado, bytes) else 0
+        print(f"{nombre:<24} {medicion['consultas']:>10} {octetos:>8} "
+              f"{latencias['p50_ms']:>10.3f} {latencias['p99_ms']:>10.3f}")
+    print("\ncon If-None-Match y el menú sin cambios: coste del listado actual y 0 bytes de cuerpo (304)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark de paginación: latencia de la página 1 frente a la página 10.000 del historial de
+pedidos y de cuentas, con offset (skip) y con cursor (keyset).
+
+Con offset, SQLite recorre y descarta todas las filas anteriores, así que el coste crece con la
+profundidad de la página; con cursor la consulta salta a la posición en el índice y el coste es plano.
+
+Uso:
+    python benchmarks/bench_paginacion.py [tamaño_pagina] [repeticiones]
+"""
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+from sqlalchemy import insert
+
+from comun import crear_engine_temporal, medir_latencias
+
+from app.db.migrations import aplicar_migraciones
+from app.models.cuenta import Cuenta
+from app.models.pedido import Pedido
+from app.services import cuenta_service, pedido_service
+from app.core.enums import EstadoPedido, RolUsuario
+from app.core.paginacion import codificar_cursor
+
+PAGINA_PROFUNDA = 10_000
+LOTE = 50_000
+
+
+def poblar(SessionLocal, filas):
+    """Insertar pedidos y cuentas con una fila por segundo hacia atrás desde ahora"""
+    ahora = datetime.now(UTC)
+    with SessionLocal() as db:
+        for inicio in range(0, filas, LOTE):
+            fechas = [ahora - timedelta(seconds=i) for i in range(inicio, min(inicio + LOTE, filas))]
+            db.execute(insert(Pedido), [
+                {"camarero_id": 1, "estado": EstadoPedido.ENTREGADO, "fecha_creacion": fecha,
+                 "fecha_actualizacion": fecha, "total": 10.0}
+                for fecha in fechas
+            ])
+            db.execute(insert(Cuenta), [
+                {"numero_mesa": 1, "camarero_id": 1, "nombre_camarero": "Bench", "fecha_cobro": fecha,
+                 "total": 10.0, "metodo_pago": "efectivo", "detalles": []}
+                for fecha in fechas
+            ])
+            db.commit()
+
+
+def main():
+    tamano = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    filas = tamano * (PAGINA_PROFUNDA + 1)
+    engine, SessionLocal = crear_engine_temporal()
+    aplicar_migraciones(engine)
+
+    inicio = time.perf_counter()
+    poblar(SessionLocal, filas)
+    print(f"{filas} pedidos y {filas} cuentas insertados en {time.perf_counter() - inicio:.1f} s")
+    print(f"Páginas de {tamano} filas\n")
+
+    admin = SimpleNamespace(id=1, rol=RolUsuario.ADMIN)
+    listados = {
+        "pedidos": (lambda db, **kw: pedido_service.get_pedidos(db, current_user=admin, **kw),
+                    pedido_service.CLAVE_PAGINACION),
+        "cuentas": (lambda db, **kw: cuenta_service.get_cuentas(db, current_user=admin, **kw),
+                    cuenta_service.CLAVE_PAGINACION),
+    }
+
+    print(f"{'listado':<9} {'modo':<7} {'página':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    with SessionLocal() as db:
+        for nombre, (listar, clave) in listados.items():
+            # Cursor de la página profunda: la clave de la última fila de la página anterior
+            anterior = listar(db, skip=(PAGINA_PROFUNDA - 2) * tamano, limit=tamano)
+            cursor_profundo = codificar_cursor([getattr(anterior[-1], c.key) for c in clave])
+            casos = [
+                ("offset", 1, {"skip": 0}),
+                ("offset", PAGINA_PROFUNDA, {"skip": (PAGINA_PROFUNDA - 1) * tamano}),
+                ("cursor", 1, {}),
+                ("cursor", PAGINA_PROFUNDA, {"cursor": cursor_profundo}),
+            ]
+            for modo, pagina, parametros in casos:
+                def consultar():
+                    filas_pagina = listar(db, limit=tamano, **parametros)
+                    assert len(filas_pagina) == tamano
+                    db.expunge_all()
+
+                latencias = medir_latencias(consultar, repeticiones)
+                print(f"{nombre:<9} {modo:<7} {pagina:>8} {latencias['p50_ms']:>10.2f} {latencias['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark del resumen de ingresos (/cuentas/resumen) sobre una tabla de cuentas grande.
+
+Compara la agregación en SQL del servicio con el cálculo anterior en Python, que cargaba
+todas las cuentas del período como objetos ORM. Mide latencia y pico de memoria (tracemalloc).
+
+Uso:
+    python benchmarks/bench_resumen_cuentas.py [cuentas] [--sin-referencia]
+"""
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+from sqlalchemy import insert
+
+from comun import crear_engine_temporal, ContadorConsultas
+
+from app.db.migrations import aplicar_migraciones
+from app.models.cuenta import Cuenta
+from app.services import cuenta_service
+from app.core.enums import RolUsuario
+
+LOTE = 20_000
+DIAS = 30
+CAMAREROS = 20
+METODOS_PAGO = ["efectivo", "tarjeta", "bizum", None]
+
+
+def _detalles(rnd):
+    """Detalle JSON de una cuenta con entre 2 y 8 líneas, como las que genera el servicio"""
+    lineas = []
+    for i in range(rnd.randint(2, 8)):
+        cantidad = rnd.randint(1, 4)
+        precio = round(rnd.uniform(1.5, 25.0), 2)
+        lineas.append({
+            "pedido_id": rnd.randint(1, 10_000), "producto_id": rnd.randint(1, 200),
+            "nombre_producto": f"Producto {i}", "cantidad": cantidad, "precio_unitario": precio,
+            "subtotal": round(cantidad * precio, 2), "observaciones": None
+        })
+    return lineas
+
+
+def poblar(SessionLocal, total_cuentas):
+    """Insertar las cuentas en lotes con executemany, repartidas en los últimos DIAS días"""
+    rnd = random.Random(42)
+    ahora = datetime.now(UTC)
+    segundos = DIAS * 24 * 3600
+    with SessionLocal() as db:
+        for inicio in range(0, total_cuentas, LOTE):
+            filas = []
+            for _ in range(min(LOTE, total_cuentas - inicio)):
+                detalles = _detalles(rnd)
+                camarero = rnd.randint(1, CAMAREROS)
+                filas.append({
+                    "mesa_id": None, "numero_mesa": rnd.randint(1, 40),
+                    "camarero_id": None, "nombre_camarero": f"Camarero {camarero}",
+                    "fecha_cobro": ahora - timedelta(seconds=rnd.randint(0, segundos)),
+                    "total": round(sum(linea["subtotal"] for linea in detalles), 2),
+                    "metodo_pago": rnd.choice(METODOS_PAGO), "detalles": detalles
+                })
+            db.execute(insert(Cuenta), filas)
+            db.commit()
+
+
+def resumen_en_python(db, fecha_inicio, fecha_fin):
+    """Cálculo anterior: cargar todas las cuentas del período y agrupar en Python"""
+    query = db.query(Cuenta).filter(Cuenta.fecha_cobro >= fecha_inicio, Cuenta.fecha_cobro <= fecha_fin)
+    total_ingresos = sum(cuenta.total for cuenta in query.all())
+    total_cuentas = query.count()
+    ingresos_por_camarero = {}
+    for cuenta in query.all():
+        datos = ingresos_por_camarero.setdefault(cuenta.nombre_camarero, {"total": 0, "cuentas": 0})
+        datos["total"] += cuenta.total
+        datos["cuentas"] += 1
+    return total_ingresos, total_cuentas, ingresos_por_camarero
+
+
+def medir(nombre, funcion, contador):
+    """Ejecutar una vez midiendo tiempo, consultas y pico de memoria"""
+    tracemalloc.start()
+    with contador.medir() as medicion:
+        inicio = time.perf_counter()
+        funcion()
+        duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<22} {duracion * 1000:>10.0f} {medicion['consultas']:>10} {pico / 1024 / 1024:>12.1f}")
+
+
+def main():
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    total_cuentas = int(argumentos[0]) if argumentos else 1_000_000
+    engine, SessionLocal = crear_engine_temporal()
+    aplicar_migraciones(engine)
+
+    inicio = time.perf_counter()
+    poblar(SessionLocal, total_cuentas)
+    print(f"{total_cuentas} cuentas insertadas en {time.perf_counter() - inicio:.1f} s\n")
+
+    contador = ContadorConsultas(engine)
+    admin = SimpleNamespace(id=1, rol=RolUsuario.ADMIN)
+    fecha_fin = datetime.now(UTC)
+    fecha_inicio = fecha_fin - timedelta(days=DIAS)
+
+    print(f"{'cálculo':<22} {'ms':>10} {'consultas':>10} {'pico (MiB)':>12}")
+    with SessionLocal() as db:
+        medir("SQL (GROUP BY)", lambda: cuenta_service.get_resumen_cuentas(
+            db, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, current_user=admin
+        ), contador)
+        # Ventana de un día: el coste es proporcional a las cuentas del período, no a la tabla
+        medir("SQL (1 día)", lambda: cuenta_service.get_resumen_cuentas(
+            db, fecha_inicio=fecha_fin - timedelta(days=1), fecha_fin=fecha_fin, current_user=admin
+        ), contador)
+    if "--sin-referencia" not in sys.argv:
+        with SessionLocal() as db:
+            medir("Python (ORM)", lambda: resumen_en_python(db, fecha_inicio, fecha_fin), contador)
+
+
+if __name__ == "__main__":
+    main()
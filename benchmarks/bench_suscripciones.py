@@ -0,0 +1,89 @@
+"""
+Benchmark de suscripciones WebSocket: tramas enviadas y coste de un broadcast con y sin filtros.
+
+Simula una sala con camareros que atienden cada uno unas pocas mesas y varios puestos de cocina.
+Sin filtros cada evento llega a todo su grupo; con filtros solo a los camareros de la mesa y a los
+puestos de sus tipos de producto, y el coste de resolver los destinatarios depende de cuántos
+clientes están interesados, no del total de conexiones.
+
+Uso:
+    python benchmarks/bench_suscripciones.py [camareros] [mesas] [eventos]
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+
+import comun  # noqa: F401  (añade la raíz del proyecto a sys.path)
+
+from app.core.enums import TipoProducto
+from app.core.websockets import ConnectionManager, EventoWebSocket, crear_canales, logger
+
+PUESTOS = [[TipoProducto.COMIDA, TipoProducto.ENTRADA], [TipoProducto.BEBIDA], [TipoProducto.POSTRE, TipoProducto.COMPLEMENTO]]
+
+
+class ClienteFalso:
+    """WebSocket en memoria que descarta las tramas"""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, mensaje: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def escenario(filtrar: bool, n_camareros: int, n_mesas: int, n_eventos: int):
+    aleatorio = random.Random(42)
+    gestor = ConnectionManager(tamano_historial=1)
+    for camarero_id in range(n_camareros):
+        # Cada camarero atiende un bloque de mesas consecutivas
+        mesas = [m for m in range(n_mesas) if m * n_camareros // n_mesas == camarero_id]
+        await gestor.connect(ClienteFalso(), "camareros", canales=crear_canales(mesas=mesas) if filtrar else ())
+    for tipos in PUESTOS:
+        await gestor.connect(ClienteFalso(), "cocina", canales=crear_canales(tipos=tipos) if filtrar else ())
+
+    eventos = [
+        EventoWebSocket(
+            {"tipo": "actualizacion_pedido", "pedido_id": i, "estado": "listo"},
+            crear_canales(mesas=[aleatorio.randrange(n_mesas)], tipos=aleatorio.sample(list(TipoProducto), 2))
+        )
+        for i in range(n_eventos)
+    ]
+    tramas = 0
+    duracion = 0.0
+    for evento in eventos:
+        inicio = time.perf_counter()
+        tramas += gestor.difundir(evento, ("camareros", "cocina"))
+        duracion += time.perf_counter() - inicio
+        # Dejar que las tareas escritoras vacíen las colas antes del siguiente evento
+        await asyncio.sleep(0)
+
+    for client_type, conexiones in gestor.active_connections.items():
+        for websocket in list(conexiones):
+            gestor.disconnect(websocket, client_type)
+    return {
+        "tramas_por_evento": tramas / n_eventos,
+        "us_por_evento": duracion / n_eventos * 1e6,
+    }
+
+
+def main():
+    n_camareros = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    n_mesas = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    n_eventos = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    logger.setLevel(logging.WARNING)
+
+    print(f"{n_camareros} camareros, {n_mesas} mesas, {len(PUESTOS)} puestos de cocina, {n_eventos} eventos\n")
+    print(f"{'modo':<12} {'tramas/evento':>14} {'µs/evento':>10}")
+    for filtrar in (False, True):
+        resultado = asyncio.run(escenario(filtrar, n_camareros, n_mesas, n_eventos))
+        modo = "filtrado" if filtrar else "sin filtros"
+        print(f"{modo:<12} {resultado['tramas_por_evento']:>14.1f} {resultado['us_por_evento']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark de broadcast WebSocket: latencia de entrega con 500 clientes, 10 de ellos lentos.
+
+Compara el envío secuencial anterior (un await send_text por socket, en orden) con el gestor actual
+(una cola acotada y una tarea escritora por conexión). La latencia de un mensaje es el tiempo desde
+el broadcast hasta que lo ha recibido el último cliente rápido.
+
+Uso:
+    python benchmarks/bench_websockets.py [clientes] [lentos] [retraso_lento_ms] [mensajes]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from comun import percentil
+
+from app.core.websockets import ConnectionManager, logger
+
+INTERVALO = 0.02  # un broadcast cada 20 ms
+
+
+class ClienteFalso:
+    """WebSocket en memoria; los clientes lentos tardan un tiempo fijo en aceptar cada mensaje"""
+
+    def __init__(self, retraso: float = 0.0):
+        self.retraso = retraso
+        self.recibidos = {}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, mensaje: str):
+        if self.retraso:
+            await asyncio.sleep(self.retraso)
+        self.recibidos[mensaje] = time.perf_counter()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def broadcast_secuencial(clientes, mensaje: str):
+    """Implementación anterior: cada envío espera al anterior"""
+    for cliente in clientes:
+        await cliente.send_text(mensaje)
+
+
+async def escenario(modo: str, n_clientes: int, n_lentos: int, retraso: float, n_mensajes: int):
+    # Los clientes lentos se reparten entre los rápidos, como tablets con mala cobertura
+    paso = max(1, n_clientes // max(1, n_lentos))
+    clientes = [ClienteFalso(retraso if i % paso == 0 and i // paso < n_lentos else 0.0) for i in range(n_clientes)]
+    rapidos = [cliente for cliente in clientes if not cliente.retraso]
+
+    gestor = ConnectionManager()
+    if modo == "concurrente":
+        for cliente in clientes:
+            await gestor.connect(cliente, "cocina")
+
+    enviados = {}
+    inicio = time.perf_counter()
+    for i in range(n_mensajes):
+        mensaje = json.dumps({"tipo": "nuevo_pedido", "pedido_id": i})
+        enviados[mensaje] = time.perf_counter()
+        if modo == "concurrente":
+            await gestor.broadcast(mensaje, "cocina")
+        else:
+            await broadcast_secuencial(clientes, mensaje)
+        await asyncio.sleep(INTERVALO)
+    # Esperar a que los clientes rápidos reciban el último mensaje
+    while not all(mensaje in cliente.recibidos for cliente in rapidos):
+        await asyncio.sleep(0.001)
+    duracion = time.perf_counter() - inicio
+
+    latencias = [
+        (max(cliente.recibidos[mensaje] for cliente in rapidos) - enviado) * 1000
+        for mensaje, enviado in enviados.items()
+    ]
+    for conexion in list(gestor.active_connections["cocina"]):
+        gestor.disconnect(conexion, "cocina")
+    return {
+        "p50_ms": percentil(latencias, 50),
+        "p99_ms": percentil(latencias, 99),
+        "duracion_s": duracion,
+    }
+
+
+def main():
+    n_clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_lentos = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    retraso = (float(sys.argv[3]) if len(sys.argv) > 3 else 50) / 1000
+    n_mensajes = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+    logger.setLevel(logging.WARNING)
+
+    print(f"{n_clientes} clientes, {n_lentos} lentos ({retraso * 1000:.0f} ms por mensaje), "
+          f"{n_mensajes} broadcasts cada {INTERVALO * 1000:.0f} ms\n")
+    print(f"{'modo':<12} {'p50 (ms)':>10} {'p99 (ms)':>10} {'duración (s)':>13}")
+    for modo in ("secuencial", "concurrente"):
+        resultado = asyncio.run(escenario(modo, n_clientes, n_lentos, retraso, n_mensajes))
+        print(f"{modo:<12} {resultado['p50_ms']:>10.2f} {resultado['p99_ms']:>10.2f} {resultado['duracion_s']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
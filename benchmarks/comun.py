@@ -0,0 +1,69 @@
+"""
+Utilidades compartidas por los scripts de benchmark.
+"""
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+import app.models  # noqa: F401  (registrar todos los modelos en Base.metadata)
+
+
+def crear_engine_temporal():
+    """Crear un motor SQLite sobre un fichero temporal con todas las tablas"""
+    directorio = tempfile.mkdtemp(prefix="bench_restaurante_")
+    url = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL (round-trips) emitidas por un motor"""
+
+    def __init__(self, engine):
+        self.total = 0
+        event.listen(engine, "before_cursor_execute", self._contar)
+
+    def _contar(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += 1
+
+    @contextmanager
+    def medir(self):
+        """Devuelve un diccionario con el número de consultas ejecutadas en el bloque"""
+        resultado = {"consultas": 0}
+        inicio = self.total
+        try:
+            yield resultado
+        finally:
+            resultado["consultas"] = self.total - inicio
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def medir_latencias(funcion: Callable[[], None], repeticiones: int) -> Dict[str, float]:
+    """Ejecuta una función varias veces y devuelve p50/p99 en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "p50_ms": percentil(tiempos, 50),
+        "p99_ms": percentil(tiempos, 99),
+    }
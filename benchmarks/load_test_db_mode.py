@@ -0,0 +1,122 @@
+"""
+Prueba de carga que compara el modo síncrono (threadpool) y el asíncrono (AsyncSession)
+del acceso a base de datos.
+
+Para cada modo arranca un servidor uvicorn con DB_MODE=sync|async sobre una base de datos
+temporal y lanza peticiones concurrentes simulando tablets de camareros que consultan
+mesas y pedidos.
+
+Uso:
+    python benchmarks/load_test_db_mode.py [clientes] [peticiones_por_cliente]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from comun import percentil
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre() -> int:
+    """Obtener un puerto TCP libre"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def preparar_base_datos(url: str):
+    """Crear tablas y un usuario administrador en la base de datos temporal"""
+    codigo = (
+        "from app.db.database import Base, engine, SessionLocal\n"
+        "import app.models\n"
+        "from app.models.usuario import Usuario\n"
+        "from app.models.mesa import Mesa\n"
+        "from app.core.security import get_password_hash\n"
+        "Base.metadata.create_all(bind=engine)\n"
+        "db = SessionLocal()\n"
+        "db.add(Usuario(username='admin', email='admin@example.com', nombre='Admin', apellido='Load',\n"
+        "               hashed_password=get_password_hash('admin123'), rol='admin', activo=True))\n"
+        "db.add_all([Mesa(numero=i, capacidad=4) for i in range(1, 61)])\n"
+        "db.commit()\n"
+    )
+    subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, check=True,
+                   env={**os.environ, "DATABASE_URL": url}, stdout=subprocess.DEVNULL)
+
+
+async def esperar_servidor(base_url: str):
+    """Esperar a que el servidor responda al health check"""
+    async with httpx.AsyncClient() as cliente:
+        for _ in range(100):
+            try:
+                await cliente.get(f"{base_url}/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("El servidor no arrancó")
+
+
+async def lanzar_carga(base_url: str, clientes: int, peticiones: int):
+    """Lanzar la carga concurrente y devolver latencias y duración total"""
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=60) as cliente:
+        respuesta = await cliente.post("/login", json={"username": "admin", "password": "admin123"})
+        cabeceras = {"Authorization": f"Bearer {respuesta.json()['access_token']}"}
+        latencias = []
+        errores = 0
+
+        async def tablet():
+            nonlocal errores
+            for i in range(peticiones):
+                ruta = "/mesas/" if i % 2 == 0 else "/pedidos/"
+                inicio = time.perf_counter()
+                r = await cliente.get(ruta, headers=cabeceras)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                if r.status_code != 200:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(tablet() for _ in range(clientes)))
+        return latencias, time.perf_counter() - inicio, errores
+
+
+def ejecutar_modo(modo: str, clientes: int, peticiones: int):
+    """Arrancar el servidor en un modo y medir la carga"""
+    directorio = tempfile.mkdtemp(prefix="load_restaurante_")
+    url = f"sqlite:///{os.path.join(directorio, 'load.db')}"
+    preparar_base_datos(url)
+    puerto = puerto_libre()
+    entorno = {**os.environ, "DATABASE_URL": url, "DB_MODE": modo}
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f"http://127.0.0.1:{puerto}"
+        asyncio.run(esperar_servidor(base_url))
+        latencias, duracion, errores = asyncio.run(lanzar_carga(base_url, clientes, peticiones))
+    finally:
+        servidor.terminate()
+        servidor.wait()
+    total = len(latencias)
+    print(f"{modo:>6} {total:>9} {total / duracion:>10.1f} {percentil(latencias, 50):>9.1f} "
+          f"{percentil(latencias, 99):>9.1f} {errores:>7}")
+
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    peticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{clientes} clientes concurrentes x {peticiones} peticiones")
+    print(f"{'modo':>6} {'peticiones':>9} {'req/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errores':>7}")
+    for modo in ("sync", "async"):
+        ejecutar_modo(modo, clientes, peticiones)
+
+
+if __name__ == "__main__":
+    main()
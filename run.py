@@ -4,10 +4,15 @@ Script de ejecución para el Sistema de Gestión de Restaurante con FastAPI
 import uvicorn
 from app.core.config import SQLALCHEMY_DATABASE_URL, create_tables
 from app.db.database import engine
+from app.db.migrations import aplicar_migraciones
+import app.models  # noqa: F401  (registrar todos los modelos)
 
 if __name__ == "__main__":
     # Crear tablas antes de iniciar la aplicación
     create_tables()
+
+    # Aplicar las migraciones pendientes una sola vez, antes de arrancar el servidor
+    aplicar_migraciones(engine)
     
     # Ejecutar la aplicación FastAPI
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file